@@ -135,8 +135,12 @@ man_pages = [
      u'Glance Cache Pre-fetcher', [u'OpenStack'], 1),
     ('man/glancecachepruner', 'glance-cache-pruner', u'Glance Cache Pruner',
      [u'OpenStack'], 1),
+    ('man/glancecachewarmer', 'glance-cache-warmer', u'Glance Cache Warmer',
+     [u'OpenStack'], 1),
     ('man/glancecontrol', 'glance-control', u'Glance Daemon Control Helper ',
      [u'OpenStack'], 1),
+    ('man/glancededup', 'glance-dedup',
+     u'Glance Filesystem Store Deduplicator', [u'OpenStack'], 1),
     ('man/glancemanage', 'glance-manage', u'Glance Management Utility',
      [u'OpenStack'], 1),
     ('man/glanceregistry', 'glance-registry', u'Glance Registry Server',
@@ -89,9 +89,26 @@ class Controller(controller.BaseController):
         Queues an image for caching. We do not check to see if
         the image is in the registry here. That is done by the
         prefetcher...
+
+        An optional integer `priority` query parameter sets the order
+        in which queued images are prefetched, highest first.
+        """
+        self._enforce(req)
+        try:
+            priority = int(req.params.get('priority', 0))
+        except ValueError:
+            msg = _("priority param must be an integer")
+            raise webob.exc.HTTPBadRequest(explanation=msg)
+        self.cache.queue_image(image_id, priority)
+
+    def get_prefetch_status(self, req):
+        """
+        GET /prefetch_status
+
+        Returns the progress last reported by the prefetcher.
         """
         self._enforce(req)
-        self.cache.queue_image(image_id)
+        return dict(prefetch_status=self.cache.get_prefetch_status())
 
     def delete_queued_image(self, req, image_id):
         """
@@ -13,8 +13,11 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import base64
+import binascii
 import errno
 
+from glance.common import exception
 from glance.openstack.common import log as logging
 
 LOG = logging.getLogger(__name__)
@@ -77,3 +80,57 @@ def image_send_notification(bytes_written, expected_size, image_meta, request,
         msg = _("An error occurred during image.send"
                 " notification: %(err)s") % locals()
         LOG.error(msg)
+
+
+def get_byte_range(request, size):
+    """
+    Returns the byte range of an image of the given size that a GET
+    request's Range header asks for, as a (start, end) tuple where end is
+    exclusive, or None if it asks for the whole image. Requests for
+    several ranges, or for ranges beyond the image, get the whole image.
+    """
+    if request.method != 'GET' or not size or request.range is None:
+        return None
+    byte_range = request.range.range_for_length(size)
+    if byte_range is None or byte_range == (0, size):
+        return None
+    return byte_range
+
+
+def range_iter(image_iter, start, end):
+    """
+    Returns an iterator over bytes start to end, exclusive, of the data of
+    an image iterator. Iterators that can read a range themselves, like
+    the filesystem store's, are asked to; others are read from the start.
+    """
+    if hasattr(image_iter, 'iter_range'):
+        for chunk in image_iter.iter_range(start, end):
+            yield chunk
+        return
+
+    pos = 0
+    for chunk in image_iter:
+        chunk_end = pos + len(chunk)
+        if chunk_end > start:
+            yield chunk[max(start - pos, 0):end - pos]
+        pos = chunk_end
+        if pos >= end:
+            break
+
+
+def parse_content_md5(value):
+    """
+    Returns the hex MD5 checksum given by the value of a Content-MD5
+    header, the base64 encoded MD5 digest as RFC 1864 defines it.
+
+    :raises exception.Invalid if the value is not a base64 MD5 digest
+    """
+    value = value.strip()
+    try:
+        digest = base64.b64decode(value)
+    except TypeError:
+        digest = None
+    if digest is None or len(digest) != 16 or \
+            base64.b64encode(digest) != value:
+        raise exception.Invalid(_("Invalid Content-MD5: %s") % value)
+    return binascii.hexlify(digest)
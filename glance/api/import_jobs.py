@@ -0,0 +1,242 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Background import jobs, which copy image data from an external source
+into a Glance store after the API request that asked for it has returned
+"""
+
+import datetime
+import time
+import urlparse
+
+import eventlet
+from eventlet import semaphore
+
+from glance.common import exception
+from glance.common import wsgi
+from glance.openstack.common import cfg
+import glance.openstack.common.log as logging
+from glance.openstack.common import timeutils
+
+LOG = logging.getLogger(__name__)
+
+import_opts = [
+    cfg.IntOpt('import_workers', default=4),
+    cfg.IntOpt('import_source_concurrency', default=2),
+    cfg.IntOpt('import_retries', default=3),
+    cfg.IntOpt('import_retry_delay', default=10),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(import_opts)
+
+# Finished jobs are forgotten after this many seconds
+JOB_TTL = 3600
+
+# Errors that another attempt will not fix
+PERMANENT_ERRORS = (exception.Duplicate,
+                    exception.Forbidden,
+                    exception.Invalid,
+                    exception.ImageSizeLimitExceeded,
+                    exception.NotFound,
+                    exception.StorageFull,
+                    exception.StorageWriteDenied,
+                    exception.UnknownScheme,
+                    exception.BadStoreUri)
+
+
+def is_enabled():
+    """Returns whether copy-from requests are run as import jobs."""
+    return CONF.import_workers > 0
+
+
+def is_valid_source(source):
+    """
+    Returns whether image data may be copied from a source. Only remote
+    stores are allowed; notably not file://, see LP bug #942118.
+    """
+    return any(source.lower().startswith(scheme)
+               for scheme in ('s3', 'swift', 'http'))
+
+
+def get_source_key(source):
+    """
+    Returns the key under which concurrent imports from a source are
+    limited: its scheme and host, without any credentials.
+    """
+    pieces = urlparse.urlparse(source)
+    return '%s://%s' % (pieces.scheme, pieces.netloc.rsplit('@', 1)[-1])
+
+
+class ImportJob(object):
+
+    """The state of the import of one image's data."""
+
+    def __init__(self, image_id, source):
+        self.image_id = image_id
+        self.source = source
+        self.status = 'pending'
+        self.attempts = 0
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        # The location, size and checksum of the data once an attempt has
+        # stored it, so that a retry only activates the image
+        self.stored = None
+
+    def to_dict(self):
+        def isotime(at):
+            if at is None:
+                return None
+            return timeutils.isotime(datetime.datetime.utcfromtimestamp(at))
+
+        # Sources may contain credentials, so only their key is shown
+        return {'image_id': self.image_id,
+                'source': get_source_key(self.source),
+                'status': self.status,
+                'attempts': self.attempts,
+                'error': self.error,
+                'created_at': isotime(self.created_at),
+                'finished_at': isotime(self.finished_at)}
+
+
+class Importer(object):
+
+    """
+    A bounded pool of greenthreads running import jobs.
+
+    At most `import_workers` jobs run at once in an API server process, and
+    at most `import_source_concurrency` of those copy from the same source
+    host. A job that fails with an error another attempt might fix is
+    retried up to `import_retries` times, `import_retry_delay` seconds
+    apart.
+    """
+
+    def __init__(self, workers=None, source_concurrency=None, retries=None,
+                 retry_delay=None):
+        self.pool = eventlet.GreenPool(workers or CONF.import_workers)
+        self.source_concurrency = (source_concurrency or
+                                   CONF.import_source_concurrency)
+        self.retries = CONF.import_retries if retries is None else retries
+        self.retry_delay = (CONF.import_retry_delay if retry_delay is None
+                            else retry_delay)
+        self.jobs = {}
+        self.source_limits = {}
+
+    def _get_source_limit(self, source):
+        key = get_source_key(source)
+        if key not in self.source_limits:
+            self.source_limits[key] = semaphore.Semaphore(
+                    self.source_concurrency)
+        return self.source_limits[key]
+
+    def _forget_finished(self):
+        expired = time.time() - JOB_TTL
+        for image_id, job in self.jobs.items():
+            if job.finished_at and job.finished_at < expired:
+                del self.jobs[image_id]
+
+    def submit(self, image_id, source, import_func, failure_func):
+        """
+        Queue the import of an image's data.
+
+        :param image_id: Image ID
+        :param source: URI the data is copied from
+        :param import_func: Called with the job to make an attempt at the
+                            import; raises on failure
+        :param failure_func: Called with the job and the exception once
+                             the import has failed for good
+        :retval The `ImportJob`
+        """
+        self._forget_finished()
+        job = ImportJob(image_id, source)
+        self.jobs[image_id] = job
+        self.pool.spawn_n(self._run, job, import_func, failure_func)
+        return job
+
+    def get(self, image_id):
+        """Returns the job importing an image, or None."""
+        return self.jobs.get(image_id)
+
+    def _run(self, job, import_func, failure_func):
+        source_limit = self._get_source_limit(job.source)
+        while True:
+            job.attempts += 1
+            try:
+                with source_limit:
+                    job.status = 'running'
+                    import_func(job)
+            except Exception, e:
+                job.error = '%s: %s' % (e.__class__.__name__, e)
+                if (isinstance(e, PERMANENT_ERRORS) or
+                    job.attempts > self.retries):
+                    LOG.error(_("Import of image %(image_id)s failed after "
+                                "%(attempts)d attempts: %(error)s") %
+                              job.__dict__)
+                    job.status = 'failed'
+                    job.finished_at = time.time()
+                    try:
+                        failure_func(job, e)
+                    except Exception, e:
+                        LOG.exception(_("Failed to clean up after import "
+                                        "of image %s") % job.image_id)
+                    return
+                LOG.warn(_("Import of image %(image_id)s failed, retrying: "
+                           "%(error)s") % job.__dict__)
+                job.status = 'retrying'
+                eventlet.sleep(self.retry_delay)
+            else:
+                job.status = 'succeeded'
+                job.error = None
+                job.finished_at = time.time()
+                return
+
+
+def get_status(image_id, image_status):
+    """
+    Returns the status of the import of an image's data, or None if it is
+    not being imported.
+
+    Jobs are only known to the API server process that runs them, so when
+    another process is asked, the status is derived from the image's.
+
+    :param image_id: Image ID
+    :param image_status: The image's status
+    """
+    job = get_importer().get(image_id)
+    if job:
+        return job.to_dict()
+    status = {'saving': 'running',
+              'active': 'succeeded',
+              'killed': 'failed'}.get(image_status)
+    if status:
+        return {'image_id': image_id, 'status': status}
+
+
+_importer = None
+
+
+def get_importer():
+    """Returns the import job pool of this process."""
+    global _importer
+    if _importer is None:
+        _importer = Importer()
+        # Imports are only known to this process, so one being replaced
+        # finishes them rather than leaving their images saving
+        wsgi.add_background_pool(_importer.pool)
+    return _importer
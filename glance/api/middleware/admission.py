@@ -0,0 +1,196 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Limits the requests a server process runs at once, with separate limits
+for requests transferring image data and for the rest, so that streaming
+images cannot starve metadata requests. Requests over a limit wait in a
+bounded queue for a turn, and are refused with 503 Service Unavailable if
+the queue is full or their turn does not come in time. It goes after the
+version negotiation middleware in the pipeline, so that requests are
+refused before they are authenticated.
+"""
+
+import time
+
+import eventlet
+from eventlet import semaphore
+import webob.exc
+
+from glance.common import metrics
+from glance.common import wsgi
+from glance.openstack.common import cfg
+import glance.openstack.common.log as logging
+
+LOG = logging.getLogger(__name__)
+
+admission_opts = [
+    cfg.IntOpt('admission_data_limit', default=100),
+    cfg.IntOpt('admission_metadata_limit', default=500),
+    cfg.IntOpt('admission_queue_size', default=100),
+    cfg.IntOpt('admission_queue_timeout', default=10),
+    cfg.IntOpt('admission_retry_after', default=5),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(admission_opts)
+
+# Routes transferring image data. Creating or updating an image in v1
+# only does with a request body.
+DATA_ROUTES = frozenset([
+    'GET.v1.images.id',
+    'POST.v1.images',
+    'PUT.v1.images.id',
+    'PUT.v1.images.id.upload',
+    'POST.v1.images.id.upload',
+    'GET.v2.images.id.file',
+    'PUT.v2.images.id.file',
+    'PUT.v2.images.id.upload',
+    'POST.v2.images.id.upload',
+])
+
+
+class Budget(object):
+
+    """
+    A number of requests which may run at once, and of requests which may
+    wait for their turn when that many are running. A limit of 0 lets any
+    number run.
+    """
+
+    def __init__(self, name, limit, queue_size, timeout):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.semaphore = semaphore.Semaphore(limit)
+        self.running = 0
+        self.waiting = 0
+
+    def acquire(self):
+        """
+        Takes a turn, waiting for one if need be.
+
+        :returns: whether a turn was taken
+        """
+        if not self.limit:
+            return True
+        if not self.semaphore.acquire(blocking=False):
+            if self.waiting >= self.queue_size:
+                metrics.increment('admission.%s.rejected' % self.name)
+                return False
+            metrics.increment('admission.%s.queued' % self.name)
+            if not self._wait():
+                metrics.increment('admission.%s.rejected' % self.name)
+                return False
+        self.running += 1
+        metrics.increment('admission.%s.admitted' % self.name)
+        metrics.gauge('admission.%s.running' % self.name, self.running)
+        return True
+
+    def _wait(self):
+        self.waiting += 1
+        metrics.gauge('admission.%s.waiting' % self.name, self.waiting)
+        start = time.time()
+        acquired = False
+        try:
+            with eventlet.Timeout(self.timeout, False):
+                acquired = self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+            metrics.gauge('admission.%s.waiting' % self.name, self.waiting)
+            metrics.timing('admission.%s.wait' % self.name,
+                           (time.time() - start) * 1000)
+        return acquired
+
+    def release(self):
+        if not self.limit:
+            return
+        self.running -= 1
+        metrics.gauge('admission.%s.running' % self.name, self.running)
+        self.semaphore.release()
+
+
+class AdmissionMiddleware(wsgi.Middleware):
+
+    def __init__(self, app):
+        self.data = Budget('data', CONF.admission_data_limit,
+                           CONF.admission_queue_size,
+                           CONF.admission_queue_timeout)
+        self.metadata = Budget('metadata', CONF.admission_metadata_limit,
+                               CONF.admission_queue_size,
+                               CONF.admission_queue_timeout)
+        super(AdmissionMiddleware, self).__init__(app)
+
+    def _budget(self, environ):
+        """Returns the budget the request runs under."""
+        method = environ['REQUEST_METHOD']
+        name = metrics.route_name(method, environ.get('PATH_INFO', ''))
+        if name not in DATA_ROUTES:
+            return self.metadata
+        if (method == 'GET' or name.endswith('.upload') or
+            environ.get('CONTENT_LENGTH') not in (None, '', '0') or
+            environ.get('HTTP_TRANSFER_ENCODING') == 'chunked'):
+            return self.data
+        return self.metadata
+
+    def __call__(self, environ, start_response):
+        budget = self._budget(environ)
+        if not budget.acquire():
+            LOG.debug(_("Refusing %(method)s %(path)s: too many %(budget)s "
+                        "requests running") %
+                      {'method': environ['REQUEST_METHOD'],
+                       'path': environ.get('PATH_INFO'),
+                       'budget': budget.name})
+            resp = webob.exc.HTTPServiceUnavailable(
+                    _("The server is busy, please retry later"),
+                    headers=[('Retry-After',
+                              str(CONF.admission_retry_after))])
+            return resp(environ, start_response)
+
+        try:
+            app_iter = self.application(environ, start_response)
+        except Exception:
+            budget.release()
+            raise
+        return Turn(budget, app_iter)
+
+
+class Turn(object):
+
+    """
+    Passes on a response body, ending the request's turn once the server
+    closes it, after sending it all or losing the client, as streaming
+    image data is what the limits are for.
+    """
+
+    def __init__(self, budget, app_iter):
+        self.budget = budget
+        self.app_iter = app_iter
+        self.ended = False
+
+    def __iter__(self):
+        return iter(self.app_iter)
+
+    def close(self):
+        try:
+            if hasattr(self.app_iter, 'close'):
+                self.app_iter.close()
+        finally:
+            if not self.ended:
+                self.ended = True
+                self.budget.release()
@@ -28,9 +28,11 @@ import re
 
 import webob
 
+from glance.api import common
 from glance.api.v1 import images
+from glance.common import compression
 from glance.common import exception
-from glance.common import utils
+from glance.common import metrics
 from glance.common import wsgi
 import glance.db
 from glance import image_cache
@@ -46,6 +48,12 @@ PATTERNS = {
     ('v2', 'DELETE'): re.compile(r'^/v2/images/([^\/]+)$')
 }
 
+# The routes of the requests served from the cache, to name their metrics
+ROUTE_PATHS = {
+    'v1': '/v1/images/{id}',
+    'v2': '/v2/images/{id}/file',
+}
+
 
 class CacheFilter(wsgi.Middleware):
 
@@ -98,6 +106,7 @@ class CacheFilter(wsgi.Middleware):
             return None
 
         LOG.debug(_("Cache hit for image '%s'"), image_id)
+        request.environ[metrics.ROUTE_PATH] = ROUTE_PATHS[version]
         image_iterator = self.get_from_cache(image_id)
         method = getattr(self, '_process_%s_request' % version)
 
@@ -117,10 +126,15 @@ class CacheFilter(wsgi.Middleware):
             # file size, see LP Bug #900959
             image_meta['size'] = self.cache.get_image_size(image_id)
 
+        byte_range = common.get_byte_range(request, int(image_meta['size']))
+        if byte_range:
+            image_iterator = common.range_iter(image_iterator, *byte_range)
+
         response = webob.Response(request=request)
         raw_response = {
             'image_iterator': image_iterator,
             'image_meta': image_meta,
+            'image_range': byte_range,
         }
         return self.serializer.show(response, raw_response)
 
@@ -164,6 +178,10 @@ class CacheFilter(wsgi.Middleware):
         return resp
 
     def _process_GET_response(self, resp, image_id):
+        if self.get_status_code(resp) == 206:
+            # Only part of the image is being sent
+            return resp
+
         image_checksum = resp.headers.get('Content-MD5', None)
 
         if not image_checksum:
@@ -189,6 +207,6 @@ class CacheFilter(wsgi.Middleware):
     def get_from_cache(self, image_id):
         """Called if cache hit"""
         with self.cache.open_for_read(image_id) as cache_file:
-            chunks = utils.chunkiter(cache_file)
+            chunks = compression.chunkiter(cache_file)
             for chunk in chunks:
                 yield chunk
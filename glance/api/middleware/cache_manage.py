@@ -68,6 +68,11 @@ class CacheManageFilter(wsgi.Middleware):
                       action="delete_queued_images",
                       conditions=dict(method=["DELETE"]))
 
+        mapper.connect("/v1/prefetch_status",
+                      controller=resource,
+                      action="get_prefetch_status",
+                      conditions=dict(method=["GET"]))
+
         self._mapper = mapper
         self._resource = resource
 
@@ -15,10 +15,14 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import hashlib
 import json
+import time
 
 import webob.exc
 
+from glance.common import metrics
 from glance.common import wsgi
 import glance.context
 from glance.openstack.common import cfg
@@ -29,6 +33,8 @@ context_opts = [
     cfg.BoolOpt('owner_is_tenant', default=True),
     cfg.StrOpt('admin_role', default='admin'),
     cfg.BoolOpt('allow_anonymous_access', default=False),
+    cfg.IntOpt('context_cache_size', default=1000),
+    cfg.IntOpt('context_cache_ttl', default=300),
     ]
 
 CONF = cfg.CONF
@@ -48,7 +54,76 @@ class BaseContextMiddleware(wsgi.Middleware):
         return resp
 
 
+def parse_service_catalog(header):
+    """Returns the list of services of an X-Service-Catalog header."""
+    with metrics.timer('context.catalog.parse'):
+        try:
+            return json.loads(header)
+        except ValueError:
+            raise webob.exc.HTTPInternalServerError(
+                _('Invalid service catalog json.'))
+
+
+class Identity(object):
+
+    """The attributes of a request context parsed from its headers."""
+
+    def __init__(self, headers):
+        user, tenant, roles_header, catalog_header = headers
+        self.headers = headers
+        self.user = user
+        self.tenant = tenant
+        #NOTE(bcwaldon): X-Roles is a csv string, but we need to parse
+        # it into a list to be useful
+        self.roles = [r.strip().lower() for r in roles_header.split(',')]
+        self.service_catalog = None
+        if catalog_header is not None:
+            self.service_catalog = parse_service_catalog(catalog_header)
+
+
+class IdentityCache(object):
+
+    """
+    The identities of the most recently used tokens, keyed by a hash of the
+    token, as clients such as compute nodes make many requests with one.
+    Identities expire after `context_cache_ttl` seconds, and the least
+    recently used are dropped to keep at most `context_cache_size`. An
+    identity is only used for requests whose headers it was parsed from,
+    so that a token's roles changing is seen at once.
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.identities = collections.OrderedDict()
+
+    def get(self, token, headers):
+        """
+        Returns the identity of a request with the given token and identity
+        headers, parsing the headers unless they are cached.
+        """
+        if not self.size or not self.ttl or token is None:
+            return Identity(headers)
+        key = hashlib.sha1(token).hexdigest()
+        now = time.time()
+        identity, expires = self.identities.pop(key, (None, 0))
+        if identity is None or identity.headers != headers or expires < now:
+            metrics.increment('context.cache.misses')
+            identity, expires = Identity(headers), now + self.ttl
+        else:
+            metrics.increment('context.cache.hits')
+        self.identities[key] = (identity, expires)
+        while len(self.identities) > self.size:
+            self.identities.popitem(last=False)
+        return identity
+
+
 class ContextMiddleware(BaseContextMiddleware):
+    def __init__(self, app):
+        self.identities = IdentityCache(CONF.context_cache_size,
+                                        CONF.context_cache_ttl)
+        super(ContextMiddleware, self).__init__(app)
+
     def process_request(self, req):
         """Convert authentication information into a request context
 
@@ -62,7 +137,8 @@ class ContextMiddleware(BaseContextMiddleware):
                                             anonymous access is disallowed
         """
         if req.headers.get('X-Identity-Status') == 'Confirmed':
-            req.context = self._get_authenticated_context(req)
+            with metrics.timer('context.parse'):
+                req.context = self._get_authenticated_context(req)
         elif CONF.allow_anonymous_access:
             req.context = self._get_anonymous_context()
         else:
@@ -79,31 +155,24 @@ class ContextMiddleware(BaseContextMiddleware):
         return glance.context.RequestContext(**kwargs)
 
     def _get_authenticated_context(self, req):
-        #NOTE(bcwaldon): X-Roles is a csv string, but we need to parse
-        # it into a list to be useful
-        roles_header = req.headers.get('X-Roles', '')
-        roles = [r.strip().lower() for r in roles_header.split(',')]
-
         #NOTE(bcwaldon): This header is deprecated in favor of X-Auth-Token
         deprecated_token = req.headers.get('X-Storage-Token')
+        auth_tok = req.headers.get('X-Auth-Token', deprecated_token)
 
-        service_catalog = None
-        if req.headers.get('X-Service-Catalog') is not None:
-            try:
-                catalog_header = req.headers.get('X-Service-Catalog')
-                service_catalog = json.loads(catalog_header)
-            except ValueError:
-                raise webob.exc.HTTPInternalServerError(
-                    _('Invalid service catalog json.'))
+        headers = (req.headers.get('X-User-Id'),
+                   req.headers.get('X-Tenant-Id'),
+                   req.headers.get('X-Roles', ''),
+                   req.headers.get('X-Service-Catalog'))
+        identity = self.identities.get(auth_tok, headers)
 
         kwargs = {
-            'user': req.headers.get('X-User-Id'),
-            'tenant': req.headers.get('X-Tenant-Id'),
-            'roles': roles,
-            'is_admin': CONF.admin_role.strip().lower() in roles,
-            'auth_tok': req.headers.get('X-Auth-Token', deprecated_token),
+            'user': identity.user,
+            'tenant': identity.tenant,
+            'roles': list(identity.roles),
+            'is_admin': CONF.admin_role.strip().lower() in identity.roles,
+            'auth_tok': auth_tok,
             'owner_is_tenant': CONF.owner_is_tenant,
-            'service_catalog': service_catalog,
+            'service_catalog': identity.service_catalog,
         }
 
         return glance.context.RequestContext(**kwargs)
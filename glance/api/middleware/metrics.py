@@ -0,0 +1,96 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Records the latency, status and bytes of requests by the route the
+router matched them to, and serves the metrics recorded by the server
+process at /metrics to admins. It goes after the context middleware in
+the pipeline.
+"""
+
+import json
+import time
+
+import webob
+import webob.exc
+
+from glance.common import metrics
+from glance.common import wsgi
+import glance.openstack.common.log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+class MetricsMiddleware(wsgi.Middleware):
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO') == '/metrics':
+            return self.show_metrics(environ, start_response)
+
+        start = time.time()
+        statuses = []
+
+        def _start_response(status, headers, exc_info=None):
+            statuses.append(status)
+            return start_response(status, headers, exc_info)
+
+        try:
+            app_iter = self.application(environ, _start_response)
+        except Exception:
+            self._record(environ, '500', 0, start)
+            raise
+        return self._iter_body(environ, app_iter, statuses, start)
+
+    def _iter_body(self, environ, app_iter, statuses, start):
+        """
+        Passes on the response body, recording the request once it has
+        all been sent, so that the latency of streamed image data counts.
+        """
+        sent = 0
+        try:
+            for chunk in app_iter:
+                sent += len(chunk)
+                yield chunk
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+            status = statuses[-1] if statuses else '500'
+            self._record(environ, status, sent, start)
+
+    def _record(self, environ, status, sent, start):
+        # The router has matched the request to a route by now
+        name = 'request.%s' % metrics.request_name(environ)
+        metrics.timing(name, (time.time() - start) * 1000)
+        metrics.increment('%s.status.%sxx' % (name, status[0]))
+        metrics.increment('%s.bytes_out' % name, sent)
+        received = environ.get('CONTENT_LENGTH')
+        if received:
+            metrics.increment('%s.bytes_in' % name, int(received))
+
+    def show_metrics(self, environ, start_response):
+        req = wsgi.Request(environ)
+        context = getattr(req, 'context', None)
+        if req.method != 'GET':
+            resp = webob.exc.HTTPMethodNotAllowed(
+                    headers=[('Allow', 'GET')])
+        elif context is None or not context.is_admin:
+            resp = webob.exc.HTTPForbidden(
+                    _("Metrics may only be read by admins"))
+        else:
+            resp = webob.Response(content_type='application/json')
+            resp.body = json.dumps(metrics.snapshot())
+        return resp(environ, start_response)
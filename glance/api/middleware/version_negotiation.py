@@ -46,6 +46,10 @@ class VersionNegotiationFilter(wsgi.Middleware):
         if req.path_info_peek() == "versions":
             return self.versions_app
 
+        # The metrics of the server are not versioned
+        if req.path_info == "/metrics":
+            return None
+
         accept = str(req.accept)
         if accept.startswith('application/vnd.openstack.images-'):
             LOG.debug(_("Using media-type versioning"))
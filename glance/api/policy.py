@@ -21,6 +21,7 @@ import json
 import os.path
 
 from glance.common import exception
+from glance.common import metrics
 from glance.openstack.common import cfg
 import glance.openstack.common.log as logging
 from glance.openstack.common import policy
@@ -99,5 +100,6 @@ class Enforcer(object):
             'tenant': context.tenant,
         }
 
-        policy.enforce(match_list, target, credentials,
-                       exception.Forbidden, action=action)
+        with metrics.timer('policy.enforce'):
+            policy.enforce(match_list, target, credentials,
+                           exception.Forbidden, action=action)
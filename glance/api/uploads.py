@@ -0,0 +1,344 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Resumable uploads, which stage an image's data on local disk in parts
+addressed by byte offset, so that an interrupted upload carries on from
+the bytes the server already has rather than starting over. The staged
+data is added to a store in one go once every byte of it is committed.
+
+Only the servers staging into the same `upload_staging_dir` see an
+upload's parts, so API servers behind a load balancer have to share the
+directory, or have every request for an upload routed to one of them.
+"""
+
+import contextlib
+import errno
+import fcntl
+import json
+import os
+import re
+import time
+
+from glance.common import exception
+from glance.common import utils
+from glance.openstack.common import cfg
+import glance.openstack.common.log as logging
+
+LOG = logging.getLogger(__name__)
+
+upload_opts = [
+    cfg.StrOpt('upload_staging_dir'),
+    cfg.IntOpt('upload_staging_max_age', default=86400),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(upload_opts)
+
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+CHUNKSIZE = 65536
+
+
+def is_enabled():
+    """Returns whether resumable uploads are accepted."""
+    return bool(CONF.upload_staging_dir)
+
+
+def parse_content_range(value, content_length=None):
+    """
+    Returns the start, exclusive end and total size of a part from its
+    `Content-Range: bytes <first>-<last>/<total>` header. The total may be
+    `*` while it is not yet known, when None is returned for it. Without
+    a header the part is the whole image, of unknown size.
+
+    :raises exception.Invalid if the header is malformed or does not
+            match the Content-Length of the part
+    """
+    if not value:
+        end = content_length or None
+        return 0, end, end
+    match = CONTENT_RANGE.match(value.strip())
+    if not match:
+        raise exception.Invalid(_("Invalid Content-Range: %s") % value)
+    start, last, total = match.groups()
+    start, end = int(start), int(last) + 1
+    total = None if total == '*' else int(total)
+    if (end <= start or (total is not None and end > total) or
+        (content_length is not None and content_length != end - start)):
+        raise exception.Invalid(_("Invalid Content-Range: %s") % value)
+    return start, end, total
+
+
+def _merge(ranges, start, end):
+    """Adds the range start to end to a sorted list of disjoint ranges."""
+    merged = []
+    for range_start, range_end in ranges:
+        if range_end < start or range_start > end:
+            merged.append([range_start, range_end])
+        else:
+            start, end = min(start, range_start), max(end, range_end)
+    merged.append([start, end])
+    return sorted(merged)
+
+
+class Upload(object):
+
+    """
+    The parts of an image's data staged so far: a sparse file holding
+    each part at its offset, and a record of the ranges of it that are
+    committed, that is written to disk, alongside.
+    """
+
+    def __init__(self, image_id, staging_dir=None):
+        self.image_id = image_id
+        staging_dir = staging_dir or CONF.upload_staging_dir
+        self.path = os.path.join(staging_dir, image_id)
+        self.state_path = self.path + '.json'
+        utils.safe_mkdirs(staging_dir)
+
+    def exists(self):
+        return os.path.exists(self.state_path)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Serialises updates of the committed ranges across workers."""
+        with open(self.path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self):
+        try:
+            with open(self.state_path) as state_file:
+                return json.load(state_file)
+        except IOError, e:
+            if e.errno != errno.ENOENT:
+                raise
+            return {'size': None, 'committed': []}
+
+    def _save(self, state):
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as state_file:
+            json.dump(state, state_file)
+            state_file.flush()
+            os.fsync(state_file.fileno())
+        os.rename(tmp_path, self.state_path)
+
+    def _set_size(self, state, size):
+        if size is None:
+            return
+        if state['size'] is not None and state['size'] != size:
+            msg = _("Image size %(size)d differs from the %(expected)d "
+                    "bytes of the upload") % {'size': size,
+                                              'expected': state['size']}
+            raise exception.Invalid(msg)
+        committed = state['committed']
+        if committed and committed[-1][1] > size:
+            msg = _("Image size %d is less than the bytes already "
+                    "uploaded") % size
+            raise exception.Invalid(msg)
+        state['size'] = size
+
+    def write_part(self, data, start, end=None, size=None):
+        """
+        Writes a part of the image data, read from a file-like object, at
+        its offset in the staging file and commits it. If reading the part
+        fails, the bytes received before the failure are still committed,
+        so the part can be resumed from there.
+
+        :param data: File-like object the part is read from
+        :param start: Offset of the part in the image data
+        :param end: Exclusive end of the part, or None to read to the end
+                    of the data
+        :param size: Size of the whole image data, if known
+
+        :retval The status of the upload, see `status`
+        :raises exception.Invalid if the part does not fit the image
+        :raises exception.ImageSizeLimitExceeded if the image is larger
+                than `image_size_cap`
+        """
+        if max(end or start, size or 0) > CONF.image_size_cap:
+            raise exception.ImageSizeLimitExceeded()
+        if size is not None:
+            with self._locked():
+                state = self._load()
+                self._set_size(state, size)
+                self._save(state)
+        else:
+            state = self._load()
+        limit = state['size']
+        if limit is None:
+            limit = CONF.image_size_cap
+        to_end = end is None
+        if to_end:
+            end = limit
+        if end > limit:
+            raise exception.Invalid(_("Part ends beyond the image data"))
+
+        written = 0
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0600)
+        with os.fdopen(fd, 'r+b') as image_file:
+            image_file.seek(start)
+            try:
+                while start + written < end:
+                    chunk = data.read(min(CHUNKSIZE, end - start - written))
+                    if not chunk:
+                        break
+                    image_file.write(chunk)
+                    written += len(chunk)
+            except IOError, e:
+                LOG.info(_("Part of image %(image_id)s interrupted after "
+                           "%(written)d bytes: %(e)s"),
+                         {'image_id': self.image_id, 'written': written,
+                          'e': e})
+                self._commit(image_file, start, start + written)
+                raise
+            if data.read(1):
+                self._commit(image_file, start, start + written)
+                raise exception.Invalid(_("Part ends beyond the image data"))
+            # The data ran out, so the image ends with this part
+            if to_end and start + written < end:
+                size = start + written
+            self._commit(image_file, start, start + written, size)
+        return self.status()
+
+    def _commit(self, image_file, start, end, size=None):
+        """
+        Records bytes start to end, exclusive, as committed once they are
+        written to disk, and the size of the image if it is now known.
+        """
+        image_file.flush()
+        os.fsync(image_file.fileno())
+        with self._locked():
+            state = self._load()
+            self._set_size(state, size)
+            if end > start:
+                state['committed'] = _merge(state['committed'], start, end)
+            self._save(state)
+
+    def status(self):
+        """
+        Returns a mapping of the image's size, if known, the bytes
+        committed, the committed ranges as inclusive byte offsets and the
+        offset up to which all the data is committed, which is where a
+        sequential upload resumes.
+        """
+        state = self._load()
+        committed = state['committed']
+        offset = committed[0][1] if committed and committed[0][0] == 0 else 0
+        return {'image_id': self.image_id,
+                'size': state['size'],
+                'committed': sum(end - start for start, end in committed),
+                'ranges': [[start, end - 1] for start, end in committed],
+                'offset': offset,
+                'complete': self.is_complete(state)}
+
+    def is_complete(self, state=None):
+        """Returns whether every byte of the image data is committed."""
+        state = state or self._load()
+        size = state['size']
+        if size is None:
+            return False
+        return size == 0 or state['committed'] == [[0, size]]
+
+    def open(self):
+        """
+        Returns the staged image data, opened for reading, and its size.
+
+        :raises exception.Invalid unless every byte of it is committed
+        """
+        state = self._load()
+        if not self.is_complete(state):
+            raise exception.Invalid(_("Image data has not all been "
+                                      "uploaded"))
+        if state['size'] == 0:
+            with open(self.path, 'ab'):
+                pass
+        return open(self.path, 'rb'), state['size']
+
+    def last_modified(self):
+        """
+        Returns when a part of the data was last written, or None if
+        nothing is staged.
+        """
+        times = []
+        for path in (self.state_path, self.path):
+            try:
+                times.append(os.path.getmtime(path))
+            except OSError, e:
+                if e.errno != errno.ENOENT:
+                    raise
+        return max(times) if times else None
+
+    def delete(self):
+        """Discards the staged data."""
+        for path in (self.state_path, self.state_path + '.tmp', self.path,
+                     self.path + '.lock'):
+            try:
+                os.unlink(path)
+            except OSError, e:
+                if e.errno != errno.ENOENT:
+                    raise
+
+
+def get_upload(image_id):
+    """Returns the resumable upload of an image's data."""
+    return Upload(image_id)
+
+
+def discard(image_id):
+    """Discards any staged data of an image, e.g. when it is deleted."""
+    if is_enabled():
+        Upload(image_id).delete()
+
+
+def reap(max_age=None):
+    """
+    Discards the data of uploads that have not had a part written for
+    longer than `upload_staging_max_age` seconds, as their clients have
+    given up on them.
+
+    :param max_age: Overrides `upload_staging_max_age`; 0 keeps every
+                    upload
+    :retval The number of uploads discarded
+    """
+    if max_age is None:
+        max_age = CONF.upload_staging_max_age
+    if not is_enabled() or max_age <= 0 or \
+            not os.path.isdir(CONF.upload_staging_dir):
+        return 0
+
+    image_ids = set(name.split('.', 1)[0]
+                    for name in os.listdir(CONF.upload_staging_dir))
+    reaped = 0
+    for image_id in sorted(image_ids):
+        upload = Upload(image_id)
+        with upload._locked():
+            # Checked under the lock, so that a part being committed
+            # meanwhile keeps the upload
+            last_modified = upload.last_modified()
+            if last_modified is not None and \
+                    last_modified + max_age > time.time():
+                continue
+            LOG.info(_("Discarding upload of image %(image_id)s, abandoned "
+                       "for more than %(max_age)d seconds") % locals())
+            upload.delete()
+            reaped += 1
+    return reaped
@@ -63,12 +63,22 @@ class BaseController(object):
                     msg, request=request, content_type='text/plain')
         return image
 
-    def update_store_acls(self, req, image_id, location_uri, public=False):
+    def update_store_acls(self, req, image_id, location_uri, public=False,
+                          members=None):
+        """
+        Applies the image's visibility and memberships to its data in the
+        backend store.
+
+        :param members: The image's members, if already known, saving
+                        a registry request
+        """
         if location_uri:
             try:
                 read_tenants = []
                 write_tenants = []
-                members = registry.get_image_members(req.context, image_id)
+                if members is None:
+                    members = registry.get_image_members(req.context,
+                                                         image_id)
                 if members:
                     for member in members:
                         if member['can_share']:
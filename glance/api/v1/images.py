@@ -32,7 +32,9 @@ from webob.exc import (HTTPError,
                       )
 
 from glance.api import common
+from glance.api import import_jobs
 from glance.api import policy
+from glance.api import uploads
 import glance.api.v1
 from glance import context
 from glance.api.v1 import controller
@@ -44,7 +46,9 @@ from glance import notifier
 from glance.openstack.common import cfg
 import glance.openstack.common.log as logging
 from glance import registry
+import glance.store
 from glance.store import (create_stores,
+                          delete_from_backend,
                           get_from_backend,
                           get_size_from_backend,
                           schedule_delete_from_backend,
@@ -56,13 +60,7 @@ LOG = logging.getLogger(__name__)
 SUPPORTED_PARAMS = glance.api.v1.SUPPORTED_PARAMS
 SUPPORTED_FILTERS = glance.api.v1.SUPPORTED_FILTERS
 
-
-# Defined at module level due to _is_opt_registered
-# identity check (not equality).
-default_store_opt = cfg.StrOpt('default_store', default='file')
-
 CONF = cfg.CONF
-CONF.register_opt(default_store_opt)
 
 
 class Controller(controller.BaseController):
@@ -227,9 +225,8 @@ class Controller(controller.BaseController):
         If the above constraint is violated, we reject with 400 "Bad Request".
         """
         if source:
-            for scheme in ['s3', 'swift', 'http']:
-                if source.lower().startswith(scheme):
-                    return source
+            if import_jobs.is_valid_source(source):
+                return source
             msg = _("External sourcing not supported for store %s") % source
             LOG.error(msg)
             raise HTTPBadRequest(explanation=msg,
@@ -267,37 +264,50 @@ class Controller(controller.BaseController):
         self._enforce(req, 'get_image')
         image_meta = self.get_active_image_meta_or_404(req, id)
 
+        byte_range = None
         if image_meta.get('size') == 0:
             image_iterator = iter([])
         else:
             image_iterator, size = self._get_from_store(req.context,
                                                         image_meta['location'])
-            image_iterator = utils.cooperative_iter(image_iterator)
             image_meta['size'] = size or image_meta['size']
+            byte_range = common.get_byte_range(req, int(image_meta['size']))
+            if byte_range:
+                image_iterator = common.range_iter(image_iterator,
+                                                   *byte_range)
+            image_iterator = utils.cooperative_iter(image_iterator)
 
         del image_meta['location']
         return {
             'image_iterator': image_iterator,
             'image_meta': image_meta,
+            'image_range': byte_range,
         }
 
-    def _reserve(self, req, image_meta):
+    def _reserve(self, req, image_meta, uploading=False):
         """
         Adds the image metadata to the registry and assigns
         an image identifier if one is not supplied in the request
-        headers. Sets the image's status to `queued`.
+        headers. Sets the image's status to `queued`, or straight to
+        `saving` if its data is being uploaded or copied along with it.
 
         :param req: The WSGI/Webob Request object
         :param id: The opaque image identifier
         :param image_meta: The image metadata
+        :param uploading: Whether the image data is being uploaded or
+                          copied from an external source
 
         :raises HTTPConflict if image already exists
         :raises HTTPBadRequest if image metadata is not valid
         """
         location = self._external_source(image_meta, req)
 
-        image_meta['status'] = ('active' if image_meta.get('size') == 0
-                                else 'queued')
+        if image_meta.get('size') == 0:
+            image_meta['status'] = 'active'
+        elif uploading:
+            image_meta['status'] = 'saving'
+        else:
+            image_meta['status'] = 'queued'
 
         if location:
             store = get_store_from_location(location)
@@ -338,7 +348,7 @@ class Controller(controller.BaseController):
                                 request=req,
                                 content_type="text/plain")
 
-    def _upload(self, req, image_meta):
+    def _upload(self, req, image_meta, image_data=None):
         """
         Uploads the payload of the request to a backend store in
         Glance. If the `x-image-meta-store` header is set, Glance
@@ -347,17 +357,30 @@ class Controller(controller.BaseController):
 
         :param req: The WSGI/Webob Request object
         :param image_meta: Mapping of metadata about image
+        :param image_data: File-like object to upload instead of the
+                           payload, such as the data of a resumable upload
 
         :raises HTTPConflict if image already exists
-        :retval The location where the image was stored
+        :retval A tuple of the location where the image was stored, its
+                size and its checksum
         """
 
+        # The staged data of a resumable upload is kept when storing it
+        # fails, along with the queued image, for the upload to be
+        # completed again
+        staged = image_data is not None
         copy_from = self._copy_from(req)
-        if copy_from:
-            image_data, image_size = self._get_from_store(req.context,
-                                                          copy_from)
+        if image_data is None and copy_from:
+            try:
+                image_data, image_size = self._get_from_store(req.context,
+                                                              copy_from)
+            except Exception:
+                # Nothing has been stored, so the image may be given its
+                # data again
+                self._safe_requeue(req, image_meta['id'])
+                raise
             image_meta['size'] = image_size or image_meta['size']
-        else:
+        elif image_data is None:
             try:
                 req.get_content_type('application/octet-stream')
             except exception.InvalidContentType:
@@ -369,62 +392,64 @@ class Controller(controller.BaseController):
             image_data = req.body_file
 
         scheme = req.headers.get('x-image-meta-store', CONF.default_store)
-
-        store = self.get_store_or_400(req, scheme)
+        store = self._get_destination_store(req)
 
         image_id = image_meta['id']
-        LOG.debug(_("Setting image %s to status 'saving'"), image_id)
-        registry.update_image_metadata(req.context, image_id,
-                                       {'status': 'saving'})
+        if image_meta.get('status') != 'saving':
+            LOG.debug(_("Setting image %s to status 'saving'"), image_id)
+            registry.update_image_metadata(req.context, image_id,
+                                           {'status': 'saving'})
 
         LOG.debug(_("Uploading image data for image %(image_id)s "
                     "to %(scheme)s store"), locals())
 
+        def fail():
+            if staged:
+                self._safe_requeue(req, image_id)
+            else:
+                self._safe_kill(req, image_id)
+
         try:
-            location, size, checksum = store.add(
-                image_meta['id'],
-                utils.CooperativeReader(image_data),
-                image_meta['size'])
+            with glance.store.timer(store, 'add'):
+                location, size, checksum = store.add(
+                    image_meta['id'],
+                    utils.CooperativeReader(image_data),
+                    image_meta['size'])
 
             # Verify any supplied checksum value matches checksum
             # returned from store when adding image
             supplied_checksum = image_meta.get('checksum')
             if supplied_checksum and supplied_checksum != checksum:
-                msg = _("Supplied checksum (%(supplied_checksum)s) and "
-                       "checksum generated from uploaded image "
-                       "(%(checksum)s) did not match. Setting image "
-                       "status to 'killed'.") % locals()
+                if staged:
+                    # Parts may be uploaded again to correct the data
+                    self._safe_delete_stored(req, image_id, location)
+                    msg = _("Supplied checksum (%(supplied_checksum)s) and "
+                            "checksum generated from uploaded image "
+                            "(%(checksum)s) did not match.") % locals()
+                else:
+                    msg = _("Supplied checksum (%(supplied_checksum)s) and "
+                           "checksum generated from uploaded image "
+                           "(%(checksum)s) did not match. Setting image "
+                           "status to 'killed'.") % locals()
                 LOG.error(msg)
-                self._safe_kill(req, image_id)
+                fail()
                 raise HTTPBadRequest(explanation=msg,
                                      content_type="text/plain",
                                      request=req)
 
-            # Update the database with the checksum returned
-            # from the backend store
-            LOG.debug(_("Updating image %(image_id)s data. "
-                      "Checksum set to %(checksum)s, size set "
-                      "to %(size)d"), locals())
-            update_data = {'checksum': checksum,
-                           'size': size}
-            image_meta = registry.update_image_metadata(req.context,
-                                                        image_id,
-                                                        update_data)
-            self.notifier.info('image.upload', image_meta)
-
-            return location
+            return location, size, checksum
 
         except exception.Duplicate, e:
             msg = _("Attempt to upload duplicate image: %s") % e
             LOG.error(msg)
-            self._safe_kill(req, image_id)
+            fail()
             self.notifier.error('image.upload', msg)
             raise HTTPConflict(explanation=msg, request=req)
 
         except exception.Forbidden, e:
             msg = _("Forbidden upload attempt: %s") % e
             LOG.error(msg)
-            self._safe_kill(req, image_id)
+            fail()
             self.notifier.error('image.upload', msg)
             raise HTTPForbidden(explanation=msg,
                                 request=req,
@@ -433,7 +458,7 @@ class Controller(controller.BaseController):
         except exception.StorageFull, e:
             msg = _("Image storage media is full: %s") % e
             LOG.error(msg)
-            self._safe_kill(req, image_id)
+            fail()
             self.notifier.error('image.upload', msg)
             raise HTTPRequestEntityTooLarge(explanation=msg, request=req,
                                             content_type='text/plain')
@@ -441,19 +466,19 @@ class Controller(controller.BaseController):
         except exception.StorageWriteDenied, e:
             msg = _("Insufficient permissions on image storage media: %s") % e
             LOG.error(msg)
-            self._safe_kill(req, image_id)
+            fail()
             self.notifier.error('image.upload', msg)
             raise HTTPServiceUnavailable(explanation=msg, request=req,
                                          content_type='text/plain')
 
         except exception.ImageSizeLimitExceeded, e:
             msg = _("Denying attempt to upload image larger than %d.")
-            self._safe_kill(req, image_id)
+            fail()
             raise HTTPBadRequest(explanation=msg % CONF.image_size_cap,
                                  request=req, content_type='text/plain')
 
         except HTTPError, e:
-            self._safe_kill(req, image_id)
+            fail()
             self.notifier.error('image.upload', e.explanation)
             raise
 
@@ -461,7 +486,7 @@ class Controller(controller.BaseController):
             tb_info = traceback.format_exc()
             LOG.error(tb_info)
 
-            self._safe_kill(req, image_id)
+            fail()
 
             msg = _("Error uploading image: (%(class_name)s): "
                     "%(exc)s") % ({'class_name': e.__class__.__name__,
@@ -470,18 +495,27 @@ class Controller(controller.BaseController):
             self.notifier.error('image.upload', msg)
             raise HTTPBadRequest(explanation=msg, request=req)
 
-    def _activate(self, req, image_id, location):
+    def _activate(self, req, image_id, location, size=None, checksum=None):
         """
         Sets the image status to `active` and the image's location
-        attribute.
+        attribute, along with the size and checksum of uploaded data,
+        in a single registry update.
 
         :param req: The WSGI/Webob Request object
         :param image_id: Opaque image identifier
         :param location: Location of where Glance stored this image
+        :param size: Size of the image data stored, if uploaded
+        :param checksum: Checksum of the image data stored, if uploaded
         """
         image_meta = {}
         image_meta['location'] = location
         image_meta['status'] = 'active'
+        if size is not None:
+            LOG.debug(_("Updating image %(image_id)s data. "
+                        "Checksum set to %(checksum)s, size set "
+                        "to %(size)d"), locals())
+            image_meta['size'] = size
+            image_meta['checksum'] = checksum
 
         try:
             return registry.update_image_metadata(req.context,
@@ -524,6 +558,39 @@ class Controller(controller.BaseController):
                         "%(exc)s") % ({'id': image_id,
                         'exc': repr(e)}))
 
+    def _safe_requeue(self, req, image_id):
+        """
+        Mark image queued again, after a failed attempt to store the data
+        of its resumable upload or to read its copy-from source, without
+        raising exceptions if it fails.
+
+        :param req: The WSGI/Webob Request object
+        :param image_id: Opaque image identifier
+        """
+        try:
+            registry.update_image_metadata(req.context, image_id,
+                                           {'status': 'queued'})
+        except Exception, e:
+            LOG.error(_("Unable to requeue image %(id)s: "
+                        "%(exc)s") % ({'id': image_id,
+                        'exc': repr(e)}))
+
+    def _safe_delete_stored(self, req, image_id, location):
+        """
+        Delete image data that was stored but will not be used, leaving
+        the image itself alone, without raising exceptions if it fails.
+
+        :param req: The WSGI/Webob Request object
+        :param image_id: Opaque image identifier
+        :param location: Location the data was stored at
+        """
+        try:
+            delete_from_backend(req.context, location)
+        except Exception, e:
+            LOG.error(_("Unable to delete the stored data of image %(id)s: "
+                        "%(exc)s") % ({'id': image_id,
+                        'exc': repr(e)}))
+
     def _upload_and_activate(self, req, image_meta):
         """
         Safely uploads the image data in the request payload
@@ -540,16 +607,246 @@ class Controller(controller.BaseController):
         # See: https://bitbucket.org/ianb/webob/
         # issue/12/fix-for-issue-6-broke-chunked-transfer
         req.is_body_readable = True
-        location = self._upload(req, image_meta)
-        return self._activate(req, image_id, location)
+        location, size, checksum = self._upload(req, image_meta)
+        image_meta = self._activate(req, image_id, location, size, checksum)
+
+        # The location may contain credentials
+        payload = dict(image_meta)
+        payload.pop('location', None)
+        self.notifier.info('image.upload', payload)
+        return image_meta
 
     def _get_size(self, context, image_meta, location):
         # retrieve the image size from remote store (if not provided)
         return image_meta.get('size', 0) or get_size_from_backend(context,
                                                                   location)
 
+    def _import(self, req, image_meta):
+        """
+        Queues a job to copy the image data from the copy-from source
+        into a backend store, and returns as soon as the image is in the
+        `saving` status. The job activates the image once the data is
+        stored, or kills it if the copy fails for good.
+
+        :param req: The WSGI/Webob Request object
+        :param image_meta: Mapping of metadata about image
+
+        :retval Mapping of updated image data
+        """
+        image_id = image_meta['id']
+        copy_from = self._copy_from(req)
+        scheme = req.headers.get('x-image-meta-store', CONF.default_store)
+        store = self._get_destination_store(req)
+
+        if image_meta.get('status') != 'saving':
+            LOG.debug(_("Setting image %s to status 'saving'"), image_id)
+            image_meta = registry.update_image_metadata(
+                    req.context, image_id, {'status': 'saving'})
+
+        def store_data():
+            LOG.debug(_("Importing image data for image %(image_id)s "
+                        "to %(scheme)s store"), locals())
+            image_data, image_size = get_from_backend(req.context, copy_from)
+            with glance.store.timer(store, 'add'):
+                location, size, checksum = store.add(
+                        image_id, utils.CooperativeReader(image_data),
+                        image_size or image_meta['size'])
+
+            supplied_checksum = image_meta.get('checksum')
+            if supplied_checksum and supplied_checksum != checksum:
+                # The data has been stored, but will never be used
+                schedule_delete_from_backend(location, req.context, image_id)
+                msg = _("Supplied checksum (%(supplied_checksum)s) and "
+                        "checksum generated from imported image "
+                        "(%(checksum)s) did not match.") % locals()
+                raise exception.Invalid(msg)
+            return location, size, checksum
+
+        def import_data(job):
+            if job.stored is None:
+                job.stored = store_data()
+            location, size, checksum = job.stored
+            activated_meta = registry.update_image_metadata(
+                    req.context, image_id, {'checksum': checksum,
+                                            'size': size,
+                                            'location': location,
+                                            'status': 'active'})
+            self.update_store_acls(req, image_id, location,
+                                   public=activated_meta.get('is_public'))
+            activated_meta.pop('location', None)
+            self.notifier.info('image.upload', activated_meta)
+
+        def import_failed(job, e):
+            self._safe_kill(req, image_id)
+            if job.stored is not None:
+                # The image could not be activated with the stored data
+                schedule_delete_from_backend(job.stored[0], req.context,
+                                             image_id)
+            msg = _("Error importing image %(image_id)s from %(source)s: "
+                    "%(error)s") % {'image_id': image_id,
+                                    'source': import_jobs.get_source_key(
+                                            copy_from),
+                                    'error': job.error}
+            self.notifier.error('image.upload', msg)
+
+        import_jobs.get_importer().submit(image_id, copy_from, import_data,
+                                          import_failed)
+        return image_meta
+
+    def import_status(self, req, id):
+        """
+        Returns the status of the job importing an image's data from its
+        copy-from source.
+
+        :param req: The WSGI/Webob Request object
+        :param id: The opaque image identifier
+
+        :raises HTTPNotFound if image is not available to user, or its
+                data is not being imported
+        """
+        self._enforce(req, 'get_image')
+        image_meta = self.get_image_meta_or_404(req, id)
+        status = import_jobs.get_status(id, image_meta['status'])
+        if status is None:
+            msg = _("Image %s is not being imported") % id
+            raise HTTPNotFound(explanation=msg, request=req,
+                               content_type="text/plain")
+        return {'import': status}
+
+    def _get_upload(self, req, id):
+        """
+        Returns the metadata of a queued image whose data the request may
+        upload, and the resumable upload of its data.
+
+        :raises HTTPServiceUnavailable if resumable uploads are disabled
+        :raises HTTPNotFound if image is not available to user
+        :raises HTTPConflict if image is not queued
+        :raises HTTPForbidden if image is not the user's
+        """
+        self._enforce(req, 'modify_image')
+        if not uploads.is_enabled():
+            msg = _("Resumable uploads are disabled")
+            raise HTTPServiceUnavailable(explanation=msg, request=req,
+                                         content_type="text/plain")
+        image_meta = self.get_image_meta_or_404(req, id)
+        if image_meta['status'] != 'queued':
+            raise HTTPConflict(_("Cannot upload to an unqueued image"))
+        if not (req.context.is_admin or
+                (image_meta['owner'] is not None and
+                 image_meta['owner'] == req.context.owner)):
+            msg = _("Forbidden to upload image data.")
+            raise HTTPForbidden(explanation=msg, request=req,
+                                content_type="text/plain")
+        return image_meta, uploads.get_upload(id)
+
+    @utils.mutating
+    def upload_part(self, req, id, image_data, byte_range):
+        """
+        Stages a part of a queued image's data, at the offset given by the
+        Content-Range header of the request. The bytes of a part that is
+        interrupted are kept, so it may be resumed where it stopped.
+
+        :param req: The WSGI/Webob Request object
+        :param id: The opaque image identifier
+        :param image_data: The part of the image data
+        :param byte_range: The start, exclusive end and total size of the
+                           image data, if known, of the part
+
+        :retval The status of the upload
+        """
+        image_meta, upload = self._get_upload(req, id)
+        start, end, size = byte_range
+        try:
+            return {'upload': upload.write_part(image_data, start, end,
+                                                size)}
+        except exception.ImageSizeLimitExceeded:
+            msg = _("Denying attempt to upload image larger than %d.")
+            raise HTTPBadRequest(explanation=msg % CONF.image_size_cap,
+                                 request=req, content_type='text/plain')
+        except exception.Invalid, e:
+            raise HTTPBadRequest(explanation=unicode(e), request=req,
+                                 content_type='text/plain')
+        except IOError, e:
+            msg = _("Upload of image data interrupted: %s") % e
+            raise HTTPBadRequest(explanation=msg, request=req,
+                                 content_type='text/plain')
+
+    def upload_status(self, req, id):
+        """
+        Returns the status of the resumable upload of an image's data,
+        notably the ranges of it that have been committed.
+
+        :raises HTTPNotFound if no image data has been staged
+        """
+        image_meta, upload = self._get_upload(req, id)
+        if not upload.exists():
+            msg = _("Image %s has no data uploaded") % id
+            raise HTTPNotFound(explanation=msg, request=req,
+                               content_type="text/plain")
+        return {'upload': upload.status()}
+
+    @utils.mutating
+    def complete_upload(self, req, id):
+        """
+        Adds the staged data of a queued image to a backend store, once
+        every part of it is uploaded, and activates the image. The data
+        is checked against the `x-image-meta-checksum` header, if given,
+        or the checksum the image was registered with.
+
+        :raises HTTPConflict if part of the image data is missing
+        :retval Mapping of updated image data
+        """
+        image_meta, upload = self._get_upload(req, id)
+        try:
+            image_data, size = upload.open()
+        except exception.Invalid, e:
+            raise HTTPConflict(explanation=unicode(e), request=req,
+                               content_type="text/plain")
+
+        image_meta['size'] = size
+        checksum = req.headers.get('x-image-meta-checksum')
+        if checksum:
+            image_meta['checksum'] = checksum
+        # The staged data is kept until the image is activated, so that
+        # the upload can be completed again if storing or activating fails
+        with image_data:
+            location, size, checksum = self._upload(req, image_meta,
+                                                    image_data)
+        try:
+            image_meta = self._activate(req, id, location, size, checksum)
+        except Exception:
+            exc_info = sys.exc_info()
+            self._safe_delete_stored(req, id, location)
+            self._safe_requeue(req, id)
+            raise exc_info[0], exc_info[1], exc_info[2]
+        upload.delete()
+
+        payload = dict(image_meta)
+        payload.pop('location', None)
+        self.notifier.info('image.upload', payload)
+
+        self.update_store_acls(req, id, image_meta['location'],
+                               public=image_meta.get('is_public'))
+        image_meta.pop('location', None)
+        return {'image_meta': image_meta}
+
+    @utils.mutating
+    def abort_upload(self, req, id):
+        """Discards the data staged by a resumable upload."""
+        image_meta, upload = self._get_upload(req, id)
+        upload.delete()
+
+    def _importing(self, req):
+        """
+        Returns whether the request copies image data from an external
+        source in a background import job.
+        """
+        return bool(self._copy_from(req)) and import_jobs.is_enabled()
+
     def _handle_source(self, req, image_id, image_meta, image_data):
-        if image_data or self._copy_from(req):
+        if self._importing(req):
+            image_meta = self._import(req, image_meta)
+        elif image_data or self._copy_from(req):
             image_meta = self._upload_and_activate(req, image_meta)
         else:
             location = image_meta.get('location')
@@ -605,20 +902,27 @@ class Controller(controller.BaseController):
         if is_public:
             self._enforce(req, 'publicize_image')
 
-        image_meta = self._reserve(req, image_meta)
+        uploading = image_data is not None or bool(self._copy_from(req))
+        if uploading:
+            # Check the destination before the image is reserved as saving
+            self._get_destination_store(req)
+        image_meta = self._reserve(req, image_meta, uploading=uploading)
         id = image_meta['id']
 
+        importing = self._importing(req)
         image_meta = self._handle_source(req, id, image_meta, image_data)
 
         location_uri = image_meta.get('location')
         if location_uri:
-            self.update_store_acls(req, id, location_uri, public=is_public)
+            # The image was created by this request, so has no members
+            self.update_store_acls(req, id, location_uri, public=is_public,
+                                   members=[])
 
         # Prevent client from learning the location, as it
         # could contain security credentials
         image_meta.pop('location', None)
 
-        return {'image_meta': image_meta}
+        return {'image_meta': image_meta, 'importing': importing}
 
     @utils.mutating
     def update(self, req, id, image_meta, image_data):
@@ -660,6 +964,7 @@ class Controller(controller.BaseController):
         location = self._external_source(image_meta, req)
         reactivating = orig_status != 'queued' and location
         activating = orig_status == 'queued' and (location or image_data)
+        importing = activating and self._importing(req)
 
         # Make image public in the backend store (if implemented)
         orig_or_updated_loc = location or orig_image_meta.get('location', None)
@@ -678,6 +983,12 @@ class Controller(controller.BaseController):
             if location:
                 image_meta['size'] = self._get_size(req.context, image_meta,
                                                     location)
+            if activating and (image_data is not None or
+                               self._copy_from(req)):
+                # Save a registry round trip before the data is stored,
+                # once the destination is known to exist
+                self._get_destination_store(req)
+                image_meta['status'] = 'saving'
 
             image_meta = registry.update_image_metadata(req.context,
                                                         id,
@@ -720,7 +1031,7 @@ class Controller(controller.BaseController):
         # could contain security credentials
         image_meta.pop('location', None)
 
-        return {'image_meta': image_meta}
+        return {'image_meta': image_meta, 'importing': importing}
 
     @utils.mutating
     def delete(self, req, id):
@@ -754,6 +1065,7 @@ class Controller(controller.BaseController):
                 schedule_delete_from_backend(image['location'],
                                              req.context, id)
             registry.delete_image_metadata(req.context, id)
+            uploads.discard(id)
         except exception.NotFound, e:
             msg = ("Failed to find image to delete: %(e)s" % locals())
             for line in msg.split('\n'):
@@ -792,6 +1104,17 @@ class Controller(controller.BaseController):
                                  request=request,
                                  content_type='text/plain')
 
+    def _get_destination_store(self, req):
+        """
+        Returns the store image data uploaded or copied by a request is to
+        be added to, that of its `x-image-meta-store` header or else the
+        default store.
+
+        :raises HTTPBadRequest if the store does not exist
+        """
+        scheme = req.headers.get('x-image-meta-store', CONF.default_store)
+        return self.get_store_or_400(req, scheme)
+
     def verify_scheme_or_exit(self, scheme):
         """
         Verifies availability of the storage backend for the
@@ -856,6 +1179,20 @@ class ImageDeserializer(wsgi.JSONRequestDeserializer):
     def update(self, request):
         return self._deserialize(request)
 
+    def upload_part(self, request):
+        try:
+            request.get_content_type('application/octet-stream')
+        except exception.InvalidContentType:
+            msg = _("Content-Type must be application/octet-stream")
+            raise HTTPBadRequest(explanation=msg, request=request)
+        try:
+            byte_range = uploads.parse_content_range(
+                    request.headers.get('Content-Range'),
+                    request.content_length)
+        except exception.Invalid, e:
+            raise HTTPBadRequest(explanation=unicode(e), request=request)
+        return {'image_data': request.body_file, 'byte_range': byte_range}
+
 
 class ImageSerializer(wsgi.JSONResponseSerializer):
     """Handles serialization of specific controller method responses."""
@@ -893,6 +1230,7 @@ class ImageSerializer(wsgi.JSONResponseSerializer):
 
     def meta(self, response, result):
         image_meta = result['image_meta']
+        response.headers['Accept-Ranges'] = 'bytes'
         self._inject_image_meta_headers(response, image_meta)
         self._inject_location_header(response, image_meta)
         self._inject_checksum_header(response, image_meta)
@@ -905,11 +1243,20 @@ class ImageSerializer(wsgi.JSONResponseSerializer):
         image_iter = result['image_iterator']
         # image_meta['size'] is a str
         expected_size = int(image_meta['size'])
+        byte_range = result.get('image_range')
+        if byte_range:
+            start, end = byte_range
+            response.status = 206
+            response.headers['Content-Range'] = ('bytes %d-%d/%d' %
+                                                 (start, end - 1,
+                                                  expected_size))
+            expected_size = end - start
         response.app_iter = common.size_checked_iter(
                 response, image_meta, expected_size, image_iter, self.notifier)
         # Using app_iter blanks content-length, so we set it here...
-        response.headers['Content-Length'] = image_meta['size']
+        response.headers['Content-Length'] = str(expected_size)
         response.headers['Content-Type'] = 'application/octet-stream'
+        response.headers['Accept-Ranges'] = 'bytes'
 
         self._inject_image_meta_headers(response, image_meta)
         self._inject_location_header(response, image_meta)
@@ -919,15 +1266,26 @@ class ImageSerializer(wsgi.JSONResponseSerializer):
 
     def update(self, response, result):
         image_meta = result['image_meta']
+        if result.get('importing'):
+            # The image data is being imported in the background
+            response.status = 202
         response.body = self.to_json(dict(image=image_meta))
         response.headers['Content-Type'] = 'application/json'
         self._inject_location_header(response, image_meta)
         self._inject_checksum_header(response, image_meta)
         return response
 
+    def complete_upload(self, response, result):
+        return self.update(response, result)
+
+    def abort_upload(self, response, result):
+        response.status = 204
+        return response
+
     def create(self, response, result):
         image_meta = result['image_meta']
-        response.status = 201
+        # The image data may still be being imported in the background
+        response.status = 202 if result.get('importing') else 201
         response.headers['Content-Type'] = 'application/json'
         response.body = self.to_json(dict(image=image_meta))
         self._inject_location_header(response, image_meta)
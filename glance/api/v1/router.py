@@ -33,6 +33,15 @@ class API(wsgi.Router):
         mapper.connect("/", controller=images_resource, action="index")
         mapper.connect("/images/{id}", controller=images_resource,
                        action="meta", conditions=dict(method=["HEAD"]))
+        mapper.connect("/images/{id}/import", controller=images_resource,
+                       action="import_status",
+                       conditions=dict(method=["GET"]))
+        for action, method in (("upload_status", "GET"),
+                               ("upload_part", "PUT"),
+                               ("complete_upload", "POST"),
+                               ("abort_upload", "DELETE")):
+            mapper.connect("/images/{id}/upload", controller=images_resource,
+                           action=action, conditions=dict(method=[method]))
 
         members_resource = members.create_resource()
 
@@ -13,17 +13,28 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import json
+import sys
+
 import webob.exc
 
 from glance.api import common
+from glance.api import import_jobs
+from glance.api import uploads
 import glance.api.v2 as v2
 from glance.common import exception
 from glance.common import utils
 from glance.common import wsgi
 import glance.db
 import glance.notifier
+from glance.openstack.common import cfg
+import glance.openstack.common.log as logging
 import glance.store
 
+LOG = logging.getLogger(__name__)
+
+CONF = cfg.CONF
+
 
 class ImageDataController(object):
     def __init__(self, db_api=None, store_api=None):
@@ -52,6 +63,163 @@ class ImageDataController(object):
         values = {'location': location, 'size': size, 'checksum': checksum}
         self.db_api.image_update(req.context, image_id, values)
 
+    @utils.mutating
+    def import_image(self, req, image_id, copy_from):
+        """
+        Queue a job to copy a queued image's data from an external source,
+        returning the job's status. The image is `saving` until the job
+        activates it, or kills it if the copy fails for good.
+        """
+        ctx = req.context
+        image = self._get_image(ctx, image_id)
+        if not self.db_api.is_image_mutable(ctx, image):
+            raise webob.exc.HTTPForbidden(
+                    _("Forbidden to import image data"))
+        if image['status'] != 'queued':
+            raise webob.exc.HTTPConflict(
+                    _("Cannot import data into an unqueued image"))
+        if not import_jobs.is_enabled():
+            raise webob.exc.HTTPServiceUnavailable(
+                    _("Image data imports are disabled"))
+
+        self.db_api.image_update(ctx, image_id, {'status': 'saving'})
+        notifier = glance.notifier.Notifier()
+
+        def import_data(job):
+            if job.stored is None:
+                data, size = self.store_api.get_from_backend(ctx, copy_from)
+                job.stored = self.store_api.add_to_backend(
+                        ctx, CONF.default_store, image_id,
+                        utils.CooperativeReader(data), size)
+            location, size, checksum = job.stored
+            values = {'location': location, 'size': size,
+                      'checksum': checksum, 'status': 'active'}
+            image = self.db_api.image_update(ctx, image_id, values)
+            v2.update_image_read_acl(req, self.db_api, image)
+            notifier.info('image.upload', {'id': image_id, 'size': size,
+                                           'checksum': checksum})
+
+        def import_failed(job, e):
+            self.db_api.image_update(ctx, image_id, {'status': 'killed'})
+            if job.stored is not None:
+                # The image could not be activated with the stored data
+                self.store_api.schedule_delete_from_backend(
+                        job.stored[0], ctx, image_id)
+            msg = _("Error importing image %(image_id)s: %(error)s") % {
+                    'image_id': image_id, 'error': job.error}
+            notifier.error('image.upload', msg)
+
+        job = import_jobs.get_importer().submit(image_id, copy_from,
+                                                import_data, import_failed)
+        return job.to_dict()
+
+    def _get_upload(self, context, image_id):
+        """
+        Returns the resumable upload of the data of an image without any,
+        which the context may modify.
+        """
+        if not uploads.is_enabled():
+            raise webob.exc.HTTPServiceUnavailable(
+                    _("Resumable uploads are disabled"))
+        image = self._get_image(context, image_id)
+        if not self.db_api.is_image_mutable(context, image):
+            raise webob.exc.HTTPForbidden(
+                    _("Forbidden to upload image data"))
+        if image['location']:
+            raise webob.exc.HTTPConflict(
+                    _("Image data has already been uploaded"))
+        return uploads.get_upload(image_id)
+
+    @utils.mutating
+    def upload_part(self, req, image_id, data, byte_range):
+        """
+        Stages a part of an image's data at the offset given by the
+        Content-Range header of the request, returning the status of
+        the upload. An interrupted part may be resumed where it stopped.
+        """
+        upload = self._get_upload(req.context, image_id)
+        start, end, size = byte_range
+        try:
+            return upload.write_part(data, start, end, size)
+        except exception.ImageSizeLimitExceeded:
+            raise webob.exc.HTTPRequestEntityTooLarge(
+                    _("Image is larger than %d bytes") % CONF.image_size_cap)
+        except exception.Invalid, e:
+            raise webob.exc.HTTPBadRequest(explanation=unicode(e))
+        except IOError, e:
+            raise webob.exc.HTTPBadRequest(
+                    explanation=_("Upload of image data interrupted: %s") % e)
+
+    def upload_status(self, req, image_id):
+        upload = self._get_upload(req.context, image_id)
+        if not upload.exists():
+            raise webob.exc.HTTPNotFound(_("Image has no data uploaded"))
+        return upload.status()
+
+    @utils.mutating
+    def complete_upload(self, req, image_id, checksum=None):
+        """
+        Adds the staged data of an image to the store once every part of
+        it is uploaded, checking it against the given MD5 checksum.
+        """
+        ctx = req.context
+        upload = self._get_upload(ctx, image_id)
+        try:
+            data, size = upload.open()
+        except exception.Invalid, e:
+            raise webob.exc.HTTPConflict(explanation=unicode(e))
+
+        # The staged data is kept until the image has its data, so that
+        # the upload can be completed again if storing or updating fails
+        try:
+            with data:
+                location, size, stored_checksum = (
+                        self.store_api.add_to_backend(
+                                ctx, 'file', image_id,
+                                utils.CooperativeReader(data), size))
+        except exception.Duplicate:
+            raise webob.exc.HTTPConflict()
+
+        try:
+            if checksum and checksum != stored_checksum:
+                # Parts may be uploaded again to correct the data
+                msg = _("Supplied checksum (%(checksum)s) and checksum "
+                        "generated from uploaded image (%(stored)s) did not "
+                        "match.") % {'checksum': checksum,
+                                     'stored': stored_checksum}
+                raise webob.exc.HTTPBadRequest(explanation=msg)
+
+            image = self._get_image(ctx, image_id)
+            v2.update_image_read_acl(req, self.db_api, image)
+            values = {'location': location, 'size': size,
+                      'checksum': stored_checksum}
+            self.db_api.image_update(ctx, image_id, values)
+        except Exception:
+            exc_info = sys.exc_info()
+            self._safe_delete_stored(ctx, image_id, location)
+            raise exc_info[0], exc_info[1], exc_info[2]
+        upload.delete()
+
+    def _safe_delete_stored(self, context, image_id, location):
+        """Deletes image data that was stored but will not be used."""
+        try:
+            self.store_api.delete_from_backend(context, location)
+        except Exception, e:
+            LOG.error(_("Unable to delete the stored data of image %(id)s: "
+                        "%(exc)s") % {'id': image_id, 'exc': repr(e)})
+
+    @utils.mutating
+    def abort_upload(self, req, image_id):
+        self._get_upload(req.context, image_id).delete()
+
+    def import_status(self, req, image_id):
+        image = self._get_image(req.context, image_id)
+        status = import_jobs.get_status(image_id, image['status'])
+        if status is None:
+            raise webob.exc.HTTPNotFound(_("Image data is not being "
+                                           "imported"))
+        return status
+
     def download(self, req, image_id):
         ctx = req.context
         image = self._get_image(ctx, image_id)
@@ -80,6 +248,43 @@ class RequestDeserializer(wsgi.JSONRequestDeserializer):
         image_size = request.content_length or None
         return {'size': image_size, 'data': request.body_file}
 
+    def upload_part(self, request):
+        try:
+            request.get_content_type('application/octet-stream')
+        except exception.InvalidContentType:
+            raise webob.exc.HTTPUnsupportedMediaType()
+
+        try:
+            byte_range = uploads.parse_content_range(
+                    request.headers.get('Content-Range'),
+                    request.content_length)
+        except exception.Invalid, e:
+            raise webob.exc.HTTPBadRequest(explanation=unicode(e))
+        return {'data': request.body_file, 'byte_range': byte_range}
+
+    def complete_upload(self, request):
+        content_md5 = request.headers.get('Content-MD5')
+        if not content_md5:
+            return {}
+        try:
+            return {'checksum': common.parse_content_md5(content_md5)}
+        except exception.Invalid, e:
+            raise webob.exc.HTTPBadRequest(explanation=unicode(e))
+
+    def import_image(self, request):
+        try:
+            body = self.default(request).get('body')
+        except ValueError:
+            body = None
+        if not isinstance(body, dict) or not body.get('copy_from'):
+            msg = _("Body expected in request, with a copy_from source.")
+            raise webob.exc.HTTPBadRequest(explanation=msg)
+        copy_from = body['copy_from']
+        if not import_jobs.is_valid_source(copy_from):
+            msg = _("External sourcing not supported for store %s")
+            raise webob.exc.HTTPBadRequest(explanation=msg % copy_from)
+        return {'copy_from': copy_from}
+
 
 class ResponseSerializer(wsgi.JSONResponseSerializer):
     def download(self, response, result):
@@ -96,6 +301,28 @@ class ResponseSerializer(wsgi.JSONResponseSerializer):
     def upload(self, response, result):
         response.status_int = 201
 
+    def upload_part(self, response, result):
+        response.body = json.dumps({'upload': result})
+        response.content_type = 'application/json'
+
+    def upload_status(self, response, result):
+        self.upload_part(response, result)
+
+    def complete_upload(self, response, result):
+        response.status_int = 204
+
+    def abort_upload(self, response, result):
+        response.status_int = 204
+
+    def import_image(self, response, result):
+        response.status_int = 202
+        response.body = json.dumps({'import': result})
+        response.content_type = 'application/json'
+
+    def import_status(self, response, result):
+        response.body = json.dumps({'import': result})
+        response.content_type = 'application/json'
+
 
 def create_resource():
     """Image data resource factory method"""
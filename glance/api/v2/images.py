@@ -21,6 +21,7 @@ import urllib
 import webob.exc
 
 from glance.api import policy
+from glance.api import uploads
 import glance.api.v2 as v2
 from glance.common import exception
 from glance.common import utils
@@ -178,6 +179,7 @@ class ImagesController(object):
             self.db_api.image_destroy(req.context, image_id)
         except (exception.NotFound, exception.Forbidden):
             raise webob.exc.HTTPNotFound()
+        uploads.discard(image_id)
 
 
 class RequestDeserializer(wsgi.JSONRequestDeserializer):
@@ -289,9 +291,20 @@ class RequestDeserializer(wsgi.JSONRequestDeserializer):
 
 
 class ResponseSerializer(wsgi.JSONResponseSerializer):
+
+    # Image attributes shown at the top level of the image view
+    _ATTRIBUTES = ('id', 'name', 'disk_format', 'container_format', 'size',
+                   'status', 'checksum', 'tags', 'protected', 'created_at',
+                   'updated_at', 'min_ram', 'min_disk')
+    _DATETIME_ATTRIBUTES = ('created_at', 'updated_at')
+    # Keys the image view derives from the image rather than copies
+    _DERIVED = ('direct_url', 'visibility', 'self', 'file', 'schema')
+
     def __init__(self, schema=None):
         super(ResponseSerializer, self).__init__()
         self.schema = schema or get_schema()
+        self._plan = None
+        self._plan_revision = None
 
     def _get_image_href(self, image, subcollection=''):
         base_href = '/v2/images/%s' % image['id']
@@ -306,38 +319,62 @@ class ResponseSerializer(wsgi.JSONResponseSerializer):
             {'rel': 'describedby', 'href': '/v2/schemas/image'},
         ]
 
-    def _format_image(self, image):
+    def _get_plan(self):
+        """
+        Returns the keys of the image properties shown, or None to show
+        them all, the image attributes shown, as (name, is_datetime) pairs,
+        and the derived keys hidden. The plan is worked out once for each
+        revision of the schema rather than for each image serialized.
+        """
+        if self._plan_revision != self.schema.revision:
+            keys = self.schema.filter_keys()
+            attributes = tuple((key, key in self._DATETIME_ATTRIBUTES)
+                               for key in self._ATTRIBUTES
+                               if keys is None or key in keys)
+            hidden = tuple(key for key in self._DERIVED
+                           if keys is not None and key not in keys)
+            self._plan = (keys, attributes, hidden)
+            self._plan_revision = self.schema.revision
+        return self._plan
+
+    def _format_image(self, image, plan=None, show_direct_url=None):
         #NOTE(bcwaldon): merge the contained properties dict with the
-        # top-level image object
-        image_view = image['properties']
-        attributes = ['id', 'name', 'disk_format', 'container_format',
-                      'size', 'status', 'checksum', 'tags', 'protected',
-                      'created_at', 'updated_at', 'min_ram', 'min_disk']
-        for key in attributes:
-            image_view[key] = image[key]
+        # top-level image object, keeping only what the schema allows
+        keys, attributes, hidden = plan or self._get_plan()
+        if show_direct_url is None:
+            show_direct_url = CONF.show_image_direct_url
+        image_view = {}
+        for key, value in image['properties'].iteritems():
+            if value is not None and (keys is None or key in keys):
+                if isinstance(value, datetime.datetime):
+                    value = timeutils.isotime(value)
+                image_view[key] = value
+
+        for key, is_datetime in attributes:
+            value = image[key]
+            if value is None:
+                image_view.pop(key, None)
+            elif is_datetime and isinstance(value, datetime.datetime):
+                image_view[key] = timeutils.isotime(value)
+            else:
+                image_view[key] = value
 
         location = image['location']
-        if CONF.show_image_direct_url and location is not None:
+        if show_direct_url and location is not None:
             image_view['direct_url'] = location
 
-        visibility = 'public' if image['is_public'] else 'private'
-        image_view['visibility'] = visibility
-
-        image_view['self'] = self._get_image_href(image)
-        image_view['file'] = self._get_image_href(image, 'file')
+        image_view['visibility'] = ('public' if image['is_public']
+                                    else 'private')
+        image_href = self._get_image_href(image)
+        image_view['self'] = image_href
+        image_view['file'] = image_href + '/file'
         image_view['schema'] = '/v2/schemas/image'
 
-        self._serialize_datetimes(image_view)
-        image_view = self.schema.filter(image_view)
+        for key in hidden:
+            image_view.pop(key, None)
 
         return image_view
 
-    @staticmethod
-    def _serialize_datetimes(image):
-        for (key, value) in image.iteritems():
-            if isinstance(value, datetime.datetime):
-                image[key] = timeutils.isotime(value)
-
     def create(self, response, image):
         response.status_int = 201
         response.body = json.dumps(self._format_image(image))
@@ -356,8 +393,11 @@ class ResponseSerializer(wsgi.JSONResponseSerializer):
         params = dict(response.request.params)
         params.pop('marker', None)
         query = urllib.urlencode(params)
+        plan = self._get_plan()
+        show_direct_url = CONF.show_image_direct_url
         body = {
-               'images': [self._format_image(i) for i in result['images']],
+               'images': [self._format_image(i, plan, show_direct_url)
+                          for i in result['images']],
                'first': '/v2/images',
                'schema': '/v2/schemas/images',
         }
@@ -70,6 +70,30 @@ class API(wsgi.Router):
                        controller=image_data_resource,
                        action='upload',
                        conditions={'method': ['PUT']})
+        mapper.connect('/images/{image_id}/upload',
+                       controller=image_data_resource,
+                       action='upload_status',
+                       conditions={'method': ['GET']})
+        mapper.connect('/images/{image_id}/upload',
+                       controller=image_data_resource,
+                       action='upload_part',
+                       conditions={'method': ['PUT']})
+        mapper.connect('/images/{image_id}/upload',
+                       controller=image_data_resource,
+                       action='complete_upload',
+                       conditions={'method': ['POST']})
+        mapper.connect('/images/{image_id}/upload',
+                       controller=image_data_resource,
+                       action='abort_upload',
+                       conditions={'method': ['DELETE']})
+        mapper.connect('/images/{image_id}/import',
+                       controller=image_data_resource,
+                       action='import_image',
+                       conditions={'method': ['POST']})
+        mapper.connect('/images/{image_id}/import',
+                       controller=image_data_resource,
+                       action='import_status',
+                       conditions={'method': ['GET']})
 
         image_tags_resource = image_tags.create_resource()
         mapper.connect('/images/{image_id}/tags/{tag_value}',
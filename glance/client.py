@@ -23,12 +23,15 @@ import errno
 import httplib
 import json
 import os
+import Queue
 import socket
 import sys
+import threading
 import warnings
 
 import glance.api.v1
 from glance.common import animation
+from glance.common import checksum as checksum_utils
 from glance.common import client as base_client
 from glance.common import exception
 from glance.common import utils
@@ -41,6 +44,31 @@ warn_msg = ("The 'glance.client' module is deprecated in favor of the "
             "http://github.com/openstack/python-glanceclient).")
 warnings.warn(warn_msg, stacklevel=2)
 
+# Images are not split into ranges smaller than this by download_image
+MIN_RANGE_SIZE = 8 * 1024 * 1024
+
+# Bytes in each part sent by upload_image
+UPLOAD_PART_SIZE = 64 * 1024 * 1024
+
+# Errors after which a range of image data is retried where it stopped
+RETRY_ERRORS = (exception.ClientConnectionError,
+                exception.ServerError,
+                exception.ServiceUnavailable,
+                httplib.HTTPException,
+                IOError,
+                socket.error)
+
+
+def _committed_end(ranges, pos):
+    """
+    Returns the end, exclusive, of the committed range of an upload that
+    holds byte pos, or pos if it is not committed.
+    """
+    for first, last in ranges:
+        if first <= pos <= last:
+            return last + 1
+    return pos
+
 
 class V1Client(base_client.BaseClient):
 
@@ -96,6 +124,124 @@ class V1Client(base_client.BaseClient):
         image = utils.get_image_meta_from_headers(res)
         return image, base_client.ImageBodyIterator(res)
 
+    def download_image(self, image_id, path, streams=4, range_size=None,
+                       retries=3):
+        """
+        Downloads an image's data to a file, fetching byte ranges of it on
+        several connections at once and writing each at its offset in the
+        file. A range whose download fails is retried, from where it
+        stopped, while the others carry on. The MD5 checksum of the file is
+        then checked against the image's ETag.
+
+        Servers that do not support ranges are downloaded from on one
+        connection.
+
+        :param image_id: The opaque image identifier
+        :param path: Path of the file to write the image data to
+        :param streams: Number of connections to download on at once
+        :param range_size: Bytes in each range. By default the image is
+                           split into one range per stream, each at least
+                           MIN_RANGE_SIZE bytes
+        :param retries: Number of times a range is retried
+
+        :retval The image's metadata
+        :raises exception.NotFound if image is not found
+        :raises exception.ChecksumMismatch if the downloaded data is not
+                the image's
+        """
+        res = self.do_request("HEAD", "/images/%s" % image_id)
+        headers = dict((name.lower(), value)
+                       for name, value in base_client.get_headers(res))
+        image_meta = utils.get_image_meta_from_headers(res)
+        size = image_meta.get('size') or 0
+
+        if range_size is None:
+            range_size = max(MIN_RANGE_SIZE, -(-size // max(streams, 1)))
+        if headers.get('accept-ranges') != 'bytes':
+            range_size = size
+        ranges = Queue.Queue()
+        for start in xrange(0, size, max(range_size, 1)):
+            ranges.put((start, min(start + range_size, size)))
+
+        with open(path, 'wb') as image_file:
+            image_file.truncate(size)
+
+        errors = []
+
+        def download_ranges():
+            with open(path, 'r+b') as image_file:
+                while not errors:
+                    try:
+                        start, end = ranges.get_nowait()
+                    except Queue.Empty:
+                        return
+                    try:
+                        self._download_range(image_id, image_file, start,
+                                             end, size, retries)
+                    except Exception, e:
+                        errors.append(e)
+
+        workers = min(streams, ranges.qsize())
+        if workers > 1:
+            threads = [threading.Thread(target=download_ranges)
+                       for i in xrange(workers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        else:
+            download_ranges()
+        if errors:
+            raise errors[0]
+
+        expected = (headers.get('etag') or image_meta.get('checksum') or
+                    '').strip('"')
+        if expected:
+            checksum = checksum_utils.Checksum(
+                    [checksum_utils.IMAGE_CHECKSUM], thread_min_size=0)
+            with open(path, 'rb') as image_file:
+                for chunk in utils.chunkreadable(image_file):
+                    checksum.update(chunk)
+            if checksum.hexdigest() != expected:
+                raise exception.ChecksumMismatch(image_id=image_id,
+                                                 checksum=checksum.hexdigest(),
+                                                 expected=expected)
+        return image_meta
+
+    def _download_range(self, image_id, image_file, start, end, size,
+                        retries):
+        """
+        Downloads bytes start to end, exclusive, of an image's data into
+        the same place in a file, retrying from where a failed attempt
+        stopped.
+        """
+        pos = start
+        attempts = 0
+        while pos < end:
+            headers = {}
+            if (pos, end) != (0, size):
+                headers['Range'] = 'bytes=%d-%d' % (pos, end - 1)
+            try:
+                res = self.do_request("GET", "/images/%s" % image_id,
+                                      headers=headers)
+                if headers and self.get_status_code(res) != 206:
+                    raise exception.UnexpectedStatus(
+                            status=self.get_status_code(res),
+                            body=_("Expected a range of the image"))
+                image_file.seek(pos)
+                for chunk in base_client.ImageBodyIterator(res):
+                    chunk = chunk[:end - pos]
+                    image_file.write(chunk)
+                    pos += len(chunk)
+                if pos < end:
+                    raise IOError(errno.EPIPE,
+                                  _("Connection closed after %d bytes") %
+                                  (pos - start))
+            except RETRY_ERRORS:
+                attempts += 1
+                if attempts > retries:
+                    raise
+
     def get_image_meta(self, image_id):
         """
         Returns a mapping of image metadata from Registry
@@ -200,6 +346,89 @@ class V1Client(base_client.BaseClient):
         data = json.loads(res.read())
         return data['image']
 
+    def upload_image(self, image_id, image_data, part_size=None,
+                     retries=3):
+        """
+        Uploads the data of a queued image in parts, with the server's
+        resumable upload protocol. A part that fails is resumed from the
+        last byte the server committed rather than sent again, and parts
+        the server already has, from an earlier upload of the image that
+        was interrupted, are skipped. The server checks the data against
+        its MD5 checksum before the image is activated.
+
+        :param image_id: The opaque image identifier
+        :param image_data: Seekable file-like object to read the image
+                           data from
+        :param part_size: Bytes in each part, UPLOAD_PART_SIZE by default
+        :param retries: Number of times a part is retried
+
+        :retval The activated image's metadata
+        :raises exception.Invalid if the image data is not seekable
+        """
+        size = self._get_image_size(image_data)
+        if size is None:
+            raise exception.Invalid(_("Resumable uploads need a seekable "
+                                      "file of image data"))
+        part_size = part_size or UPLOAD_PART_SIZE
+        path = "/images/%s/upload" % image_id
+        try:
+            ranges = self._get_upload_ranges(path)
+        except exception.NotFound:
+            ranges = []
+
+        checksum = checksum_utils.Checksum([checksum_utils.IMAGE_CHECKSUM],
+                                           thread_min_size=0)
+        image_data.seek(0)
+        for start in xrange(0, size, part_size):
+            part = image_data.read(min(part_size, size - start))
+            checksum.update(part)
+            if _committed_end(ranges, start) < start + len(part):
+                ranges = self._upload_part(path, part, start, size, retries)
+
+        headers = {'x-image-meta-checksum': checksum.hexdigest()}
+        res = self.do_request("POST", path, headers=headers)
+        data = json.loads(res.read())
+        return data['image']
+
+    def _get_upload_ranges(self, path):
+        res = self.do_request("GET", path)
+        return json.loads(res.read())['upload']['ranges']
+
+    def _upload_part(self, path, part, start, size, retries):
+        """
+        Sends a part of an image's data, starting at byte start, resuming
+        from the last byte the server committed after a failure. Returns
+        the ranges of the image data committed.
+        """
+        pos = start
+        end = start + len(part)
+        attempts = 0
+        while True:
+            headers = {'content-type': 'application/octet-stream',
+                       'content-range': 'bytes %d-%d/%d' % (pos, end - 1,
+                                                            size)}
+            error = None
+            try:
+                res = self.do_request("PUT", path, part[pos - start:],
+                                      headers)
+                ranges = json.loads(res.read())['upload']['ranges']
+            except RETRY_ERRORS, e:
+                error = e
+                try:
+                    ranges = self._get_upload_ranges(path)
+                except (exception.NotFound,) + RETRY_ERRORS:
+                    ranges = []
+            pos = max(pos, _committed_end(ranges, pos))
+            if pos >= end:
+                return ranges
+            attempts += 1
+            if attempts > retries:
+                if error is not None:
+                    raise error
+                msg = _("Bytes %(pos)d-%(last)d of the image were not "
+                        "committed") % {'pos': pos, 'last': end - 1}
+                raise exception.ClientConnectionError(msg)
+
     def delete_image(self, image_id):
         """
         Deletes Glance's information about an image
@@ -239,13 +468,27 @@ class V1Client(base_client.BaseClient):
         num_deleted = data['num_deleted']
         return num_deleted
 
-    def queue_image_for_caching(self, image_id):
+    def queue_image_for_caching(self, image_id, priority=None):
         """
         Queue an image for prefetching into cache
+
+        :param priority: Optional prefetch priority, higher values are
+                         fetched first
         """
-        self.do_request("PUT", "/queued_images/%s" % image_id)
+        params = {}
+        if priority is not None:
+            params['priority'] = priority
+        self.do_request("PUT", "/queued_images/%s" % image_id, params=params)
         return True
 
+    def get_prefetch_status(self):
+        """
+        Returns the progress last reported by the cache prefetcher
+        """
+        res = self.do_request("GET", "/prefetch_status")
+        data = json.loads(res.read())['prefetch_status']
+        return data
+
     def delete_queued_image(self, image_id):
         """
         Delete a specified image from the cache queue
@@ -0,0 +1,132 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Checksums of image data, computing several digests in a single pass
+"""
+
+import hashlib
+
+import eventlet
+from eventlet import tpool
+
+from glance.common import exception
+from glance.openstack.common import cfg
+
+checksum_opts = [
+    cfg.IntOpt('checksum_thread_min_size', default=1048576),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(checksum_opts)
+
+# The digest Glance stores as an image's checksum
+IMAGE_CHECKSUM = 'md5'
+
+
+def get_algorithms(algorithms=None):
+    """
+    Returns the names of the digests to compute, the image checksum's
+    first, checking that hashlib supports each of them.
+    """
+    names = [IMAGE_CHECKSUM]
+    for name in algorithms or []:
+        name = name.strip().lower()
+        if name and name not in names:
+            names.append(name)
+    for name in names:
+        try:
+            hashlib.new(name)
+        except ValueError:
+            msg = _("Unsupported checksum algorithm: %s") % name
+            raise exception.Invalid(msg)
+    return names
+
+
+class Checksum(object):
+
+    """
+    Computes digests of data, always including its MD5 image checksum, in
+    one pass over it.
+
+    It is a drop-in replacement for `hashlib.md5()`: update() takes the
+    data in order and hexdigest() returns the MD5 digest by default.
+
+    hashlib releases the GIL while hashing large buffers, so data is handed
+    to eventlet's native thread pool in batches of at least
+    `checksum_thread_min_size` bytes, smaller updates being buffered until
+    there are enough of them that the hand-off costs little next to the
+    hashing. update() returns as soon as the previous batch has been
+    hashed, so a batch is hashed while the caller reads or writes the next
+    one, and other greenthreads keep running meanwhile.
+    """
+
+    def __init__(self, algorithms=None, thread_min_size=None):
+        self.hashes = [(name, hashlib.new(name))
+                       for name in get_algorithms(algorithms)]
+        if thread_min_size is None:
+            thread_min_size = CONF.checksum_thread_min_size
+        self.thread_min_size = thread_min_size
+        self._batch = []
+        self._batch_size = 0
+        self._pending = None
+
+    def _update(self, data):
+        for _name, hash in self.hashes:
+            hash.update(data)
+
+    def _wait(self):
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            pending.wait()
+
+    def _take_batch(self):
+        batch = self._batch
+        self._batch = []
+        self._batch_size = 0
+        if len(batch) == 1:
+            return batch[0]
+        return ''.join(batch)
+
+    def update(self, data):
+        if self.thread_min_size <= 0:
+            self._update(data)
+            return
+        self._batch.append(data)
+        self._batch_size += len(data)
+        if self._batch_size >= self.thread_min_size:
+            batch = self._take_batch()
+            self._wait()
+            self._pending = eventlet.spawn(tpool.execute, self._update, batch)
+            # Let it hand the data to a native thread before we carry on
+            eventlet.sleep(0)
+
+    def hexdigest(self, algorithm=IMAGE_CHECKSUM):
+        """Returns the hex digest of the data computed by an algorithm."""
+        return self.hexdigests()[algorithm]
+
+    def hexdigests(self):
+        """Returns a dict of the hex digests of the data by algorithm."""
+        self._wait()
+        if self._batch:
+            self._update(self._take_batch())
+        return dict((name, hash.hexdigest()) for name, hash in self.hashes)
+
+    def __str__(self):
+        digests = self.hexdigests()
+        return ', '.join('%s:%s' % (name, digests[name])
+                         for name, _hash in self.hashes)
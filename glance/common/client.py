@@ -28,6 +28,7 @@ import re
 import select
 import urllib
 import urlparse
+import zlib
 
 try:
     from eventlet.green import socket, ssl
@@ -114,6 +115,62 @@ class ImageBodyIterator(object):
                 break
 
 
+def get_headers(response):
+    """
+    Returns the (name, value) pairs of the headers of a response, which
+    can be either a Webob.Response (used in testing) or httplib.Response
+    """
+    if hasattr(response, 'getheaders'):
+        return response.getheaders()
+    return response.headers.items()
+
+
+class GzipResponse(object):
+
+    """
+    Wraps an HTTP response whose body is gzipped, decompressing the body
+    as it is read. The response's headers describe the decompressed body.
+    """
+
+    HIDDEN_HEADERS = ('content-encoding', 'content-length')
+
+    def __init__(self, response):
+        self.response = response
+        self.headers = [(name, value)
+                        for name, value in get_headers(response)
+                        if name.lower() not in self.HIDDEN_HEADERS]
+        self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.buffer = ''
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
+
+    def getheader(self, name, default=None):
+        for header, value in self.headers:
+            if header.lower() == name.lower():
+                return value
+        return default
+
+    def getheaders(self):
+        return list(self.headers)
+
+    def read(self, amt=None):
+        if amt is None:
+            data = (self.buffer +
+                    self.decompressor.decompress(self.response.read()) +
+                    self.decompressor.flush())
+            self.buffer = ''
+            return data
+        while len(self.buffer) < amt:
+            chunk = self.response.read(amt)
+            if not chunk:
+                self.buffer += self.decompressor.flush()
+                break
+            self.buffer += self.decompressor.decompress(chunk)
+        data, self.buffer = self.buffer[:amt], self.buffer[amt:]
+        return data
+
+
 class SendFileIterator:
     """
     Emulate iterator pattern over sendfile, in order to allow
@@ -217,6 +274,7 @@ class BaseClient(object):
         httplib.CREATED,
         httplib.ACCEPTED,
         httplib.NO_CONTENT,
+        httplib.PARTIAL_CONTENT,
     )
 
     REDIRECT_RESPONSE_CODES = (
@@ -499,6 +557,10 @@ class BaseClient(object):
             if 'x-auth-token' not in headers and self.auth_tok:
                 headers['x-auth-token'] = self.auth_tok
 
+            if not any(header.lower() == 'accept-encoding'
+                       for header in headers):
+                headers['Accept-Encoding'] = 'gzip'
+
             c = connection_type(url.hostname, url.port, **self.connect_kwargs)
 
             def _pushing(method):
@@ -557,6 +619,10 @@ class BaseClient(object):
             def _retry(res):
                 return res.getheader('Retry-After')
 
+            if any(name.lower() == 'content-encoding' and value == 'gzip'
+                   for name, value in get_headers(res)):
+                res = GzipResponse(res)
+
             status_code = self.get_status_code(res)
             if status_code in self.OK_RESPONSE_CODES:
                 return res
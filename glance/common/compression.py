@@ -0,0 +1,331 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Compression of image files at rest
+
+A compressed image file is a header, the image data compressed in
+independent blocks, an index of the blocks and a trailer recording the
+size and MD5 checksum of the original data. Any byte range of the data
+can be read by decompressing only the blocks that hold it.
+
+Image data can look just like a compressed file, so whether a file was
+written compressed is never guessed from its contents: whoever writes it
+records that outside the file and passes it to `open_reader`.
+"""
+
+import binascii
+import bisect
+import os
+import struct
+import time
+import zlib
+
+from glance.common import checksum as checksum_utils
+from glance.common import exception
+from glance.common import utils
+from glance.openstack.common import cfg
+import glance.openstack.common.log as logging
+
+LOG = logging.getLogger(__name__)
+
+compression_opts = [
+    cfg.IntOpt('compression_block_size', default=256 * 1024),
+    cfg.IntOpt('compression_level', default=1),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(compression_opts)
+
+MAGIC = '\x89GLZ\r\n\x1a\n'
+
+# Each block is its codec and length, then its data
+BLOCK_HEADER = struct.Struct('>BI')
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+
+# Each index entry is the file offset of a block and the offset of its
+# data in the original data
+INDEX_ENTRY = struct.Struct('>QQ')
+
+# The offset of the index, the original size, the number of blocks, the
+# raw MD5 digest of the original data and the magic again
+TRAILER = struct.Struct('>QQI16s8s')
+
+
+class CompressedWriter(object):
+    """
+    Wraps a file opened for writing, compressing the data written to it.
+    The index and trailer are written when it is flushed or closed;
+    writing more afterwards overwrites them.
+    """
+    def __init__(self, fp, checksum=None, name=None, block_size=None,
+                 level=None):
+        """
+        :param fp: Underlying file object, opened for writing
+        :param checksum: A `glance.common.checksum.Checksum` the caller
+                         updates with the same data, so that it is not
+                         hashed twice
+        :param name: What is being compressed, for the log
+        """
+        self.fp = fp
+        self.own_checksum = checksum is None
+        if self.own_checksum:
+            checksum = checksum_utils.Checksum(
+                    [checksum_utils.IMAGE_CHECKSUM])
+        self.checksum = checksum
+        self.name = name
+        self.block_size = block_size or CONF.compression_block_size
+        self.level = CONF.compression_level if level is None else level
+        self.buffer = []
+        self.buffered = 0
+        self.index = []
+        self.offset = len(MAGIC)
+        self.size = 0
+        self.compressed_size = 0
+        self.compress_time = 0.0
+        self.finished = False
+        self.fp.write(MAGIC)
+
+    def _write_block(self, data):
+        start = time.time()
+        compressed = zlib.compress(data, self.level)
+        self.compress_time += time.time() - start
+        if len(compressed) < len(data):
+            codec = CODEC_ZLIB
+        else:
+            codec, compressed = CODEC_NONE, data
+        self.index.append((self.offset, self.size))
+        self.fp.write(BLOCK_HEADER.pack(codec, len(compressed)))
+        self.fp.write(compressed)
+        self.offset += BLOCK_HEADER.size + len(compressed)
+        self.size += len(data)
+        self.compressed_size += len(compressed)
+
+    def write(self, chunk):
+        if self.finished:
+            # Carry on from where the blocks ended
+            self.fp.seek(self.offset)
+            self.fp.truncate()
+            self.finished = False
+        if self.own_checksum:
+            self.checksum.update(chunk)
+        self.buffer.append(chunk)
+        self.buffered += len(chunk)
+        while self.buffered >= self.block_size:
+            data = ''.join(self.buffer)
+            self._write_block(data[:self.block_size])
+            data = data[self.block_size:]
+            self.buffer = [data] if data else []
+            self.buffered = len(data)
+
+    def flush(self):
+        if not self.finished:
+            if self.buffered:
+                self._write_block(''.join(self.buffer))
+                self.buffer = []
+                self.buffered = 0
+            for entry in self.index:
+                self.fp.write(INDEX_ENTRY.pack(*entry))
+            digest = binascii.unhexlify(self.checksum.hexdigest())
+            self.fp.write(TRAILER.pack(self.offset, self.size,
+                                       len(self.index), digest, MAGIC))
+            self.finished = True
+            LOG.info(_("Compressed %(name)s from %(size)d to "
+                       "%(compressed_size)d bytes (%(ratio).2f:1) in "
+                       "%(compress_ms).1fms") % self.stats())
+        self.fp.flush()
+
+    def close(self):
+        self.flush()
+        self.fp.close()
+
+    def stats(self):
+        """Returns the sizes, ratio and time taken by the compression."""
+        return {'name': self.name,
+                'size': self.size,
+                'compressed_size': self.compressed_size,
+                'ratio': float(self.size) / max(self.compressed_size, 1),
+                'compress_ms': self.compress_time * 1000}
+
+
+def _corrupt(reason):
+    return exception.CorruptCompressedFile(reason=reason)
+
+
+class CompressedReader(object):
+    """
+    Wraps a compressed file opened for reading as a file of the original
+    data. Use `open_reader` rather than creating one.
+
+    The index is checked against the file before any block is read, and
+    a block is never decompressed to more than the size the index gives
+    it, so a corrupt file cannot expand to more data than it records.
+    """
+    def __init__(self, fp, trailer, file_size):
+        self.fp = fp
+        self.index_offset, self.size, blocks, digest, _magic = trailer
+        self.checksum = binascii.hexlify(digest)
+        if (self.index_offset < len(MAGIC) or
+            self.index_offset + INDEX_ENTRY.size * blocks + TRAILER.size !=
+                file_size):
+            raise _corrupt(_("index does not fit the file"))
+        self.fp.seek(self.index_offset)
+        index = self.fp.read(INDEX_ENTRY.size * blocks)
+        entries = [INDEX_ENTRY.unpack_from(index, i * INDEX_ENTRY.size)
+                   for i in xrange(blocks)]
+        self.block_offsets = [offset for offset, _start in entries]
+        self.block_starts = [start for _offset, start in entries]
+
+        self.block_sizes = []
+        self.block_ends = []
+        self._check_index()
+        self.pos = 0
+        self.last_block = (None, None)
+
+    def _check_index(self):
+        """
+        Checks that the blocks follow each other from the header to the
+        index and together hold the original data, in order, and records
+        the size of each block's data and where each block ends.
+        """
+        offset, start = len(MAGIC), 0
+        blocks = zip(self.block_offsets, self.block_starts)
+        for i, (block_offset, block_start) in enumerate(blocks):
+            if block_offset != offset or block_start != start:
+                raise _corrupt(_("block %d is not where indexed") % i)
+            if i + 1 < len(blocks):
+                offset, start = blocks[i + 1]
+            else:
+                offset, start = self.index_offset, self.size
+            if offset - block_offset < BLOCK_HEADER.size or \
+                    start <= block_start:
+                raise _corrupt(_("block %d is not where indexed") % i)
+            self.block_ends.append(offset)
+            self.block_sizes.append(start - block_start)
+        if offset != self.index_offset or start != self.size:
+            raise _corrupt(_("blocks do not fill the file"))
+
+    def _read_block(self, i):
+        if self.last_block[0] == i:
+            return self.last_block[1]
+        offset, size = self.block_offsets[i], self.block_sizes[i]
+        self.fp.seek(offset)
+        codec, length = BLOCK_HEADER.unpack(self.fp.read(BLOCK_HEADER.size))
+        if offset + BLOCK_HEADER.size + length != self.block_ends[i]:
+            raise _corrupt(_("block %d has the wrong length") % i)
+        data = self.fp.read(length)
+        if codec == CODEC_ZLIB:
+            decompressor = zlib.decompressobj()
+            try:
+                data = decompressor.decompress(data, size)
+            except zlib.error, e:
+                raise _corrupt(_("block %(i)d: %(e)s") % locals())
+            if decompressor.unconsumed_tail:
+                raise _corrupt(_("block %d is larger than indexed") % i)
+        elif codec != CODEC_NONE:
+            raise _corrupt(_("block %(i)d has unknown codec %(codec)d") %
+                           locals())
+        if len(data) != size:
+            raise _corrupt(_("block %d is not the size indexed") % i)
+        self.last_block = (i, data)
+        return data
+
+    def iter_chunks(self, start=0, end=None):
+        """
+        Returns an iterator over the original data from byte start up to,
+        but not including, byte end, a block at a time.
+        """
+        if end is None or end > self.size:
+            end = self.size
+        if start >= end:
+            return
+        i = bisect.bisect_right(self.block_starts, start) - 1
+        while i < len(self.block_starts) and self.block_starts[i] < end:
+            block_start = self.block_starts[i]
+            data = self._read_block(i)
+            yield data[max(start - block_start, 0):end - block_start]
+            i += 1
+
+    def __iter__(self):
+        return self.iter_chunks()
+
+    def read(self, size=-1):
+        end = self.size if size is None or size < 0 else self.pos + size
+        data = ''.join(self.iter_chunks(self.pos, end))
+        self.pos += len(data)
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self.pos = max(offset, 0)
+
+    def tell(self):
+        return self.pos
+
+    def close(self):
+        self.fp.close()
+
+
+def open_reader(fp, compressed):
+    """
+    Returns a `CompressedReader` of a file opened for reading if it was
+    written compressed, or else the file itself.
+
+    :param fp: The file, at its start
+    :param compressed: Whether the file was written by `CompressedWriter`,
+                       as recorded when it was written
+    :raises `glance.common.exception.CorruptCompressedFile` if the file
+            was compressed but is not a valid compressed file
+    """
+    if not compressed:
+        return fp
+    if fp.read(len(MAGIC)) != MAGIC:
+        raise _corrupt(_("bad header"))
+    fp.seek(0, os.SEEK_END)
+    file_size = fp.tell()
+    if file_size < len(MAGIC) + TRAILER.size:
+        raise _corrupt(_("file is truncated"))
+    fp.seek(-TRAILER.size, os.SEEK_END)
+    trailer = TRAILER.unpack(fp.read(TRAILER.size))
+    if trailer[-1] != MAGIC:
+        raise _corrupt(_("bad trailer"))
+    return CompressedReader(fp, trailer, file_size)
+
+
+def chunkiter(fp, chunk_size=65536):
+    """
+    Return an iterator over the original data of a file returned by
+    `open_reader`, at the start of the file.
+    """
+    if isinstance(fp, CompressedReader):
+        return fp.iter_chunks()
+    return utils.sparse_chunkiter(fp, chunk_size)
+
+
+def get_size(path, compressed):
+    """
+    Returns the size of the original data of a file, given whether it was
+    written compressed.
+    """
+    if not compressed:
+        return os.path.getsize(path)
+    with open(path, 'rb') as fp:
+        return open_reader(fp, compressed).size
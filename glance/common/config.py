@@ -26,10 +26,7 @@ import logging.handlers
 import os
 import sys
 
-from paste import deploy
-
 from glance.openstack.common import cfg
-from glance.version import version_info as version
 
 paste_deploy_opts = [
     cfg.StrOpt('flavor'),
@@ -60,11 +57,33 @@ CONF = cfg.CONF
 CONF.register_opts(paste_deploy_opts, group='paste_deploy')
 CONF.register_opts(common_opts)
 
+# The arguments configuration was last parsed with, to re-read it on reloads
+_PARSE_ARGS = {}
+
+
+class _DeferredVersion(object):
+
+    """
+    The version printed by --version. glance.version is only imported if
+    it is printed, as it imports pkg_resources, which takes a large part
+    of the startup time of short-lived programs.
+    """
+
+    def __str__(self):
+        from glance.version import version_info
+        return "%prog " + version_info.version_string()
+
+    def replace(self, old, new):
+        # optparse expands %prog in the version with str.replace
+        return str(self).replace(old, new)
+
 
 def parse_args(args=None, usage=None, default_config_files=None):
+    _PARSE_ARGS.update(args=args, usage=usage,
+                       default_config_files=default_config_files)
     return CONF(args=args,
                 project='glance',
-                version=version.deferred_version_string(prefix="%prog "),
+                version=_DeferredVersion(),
                 usage=usage,
                 default_config_files=default_config_files)
 
@@ -166,6 +185,9 @@ def load_paste_app(app_name=None):
     :raises RuntimeError when config file cannot be located or application
             cannot be loaded from config file
     """
+    # Only the servers load paste apps, and paste.deploy is slow to import
+    from paste import deploy
+
     if app_name is None:
         app_name = CONF.prog
 
@@ -191,3 +213,14 @@ def load_paste_app(app_name=None):
         raise RuntimeError("Unable to load %(app_name)s from "
                            "configuration file %(conf_file)s."
                            "\nGot: %(e)r" % locals())
+
+
+def reload_paste_app(app_name=None):
+    """
+    Re-reads the command line and configuration files last parsed, and
+    builds the WSGI app anew from them.
+
+    :param app_name: name of the application to load
+    """
+    parse_args(**_PARSE_ARGS)
+    return load_paste_app(app_name)
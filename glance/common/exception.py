@@ -252,3 +252,12 @@ class InUseByStore(GlanceException):
 
 class ImageSizeLimitExceeded(GlanceException):
     message = _("The provided image is too large.")
+
+
+class ChecksumMismatch(GlanceException):
+    message = _("The data downloaded for image %(image_id)s has checksum "
+                "%(checksum)s, but %(expected)s was expected.")
+
+
+class CorruptCompressedFile(GlanceException):
+    message = _("Compressed image file is corrupt: %(reason)s")
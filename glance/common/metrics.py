@@ -0,0 +1,298 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Counters, gauges and timing histograms of what a Glance server does.
+
+Metrics are kept in memory by each server process, and also sent to a
+statsd server as they are recorded if `statsd_host` is set. Names are
+dotted paths, such as `store.swift.get` or `request.GET.v1.images.id`.
+"""
+
+import bisect
+import contextlib
+import functools
+import re
+import socket
+import time
+
+from eventlet import semaphore
+
+from glance.openstack.common import cfg
+import glance.openstack.common.log as logging
+
+LOG = logging.getLogger(__name__)
+
+metrics_opts = [
+    cfg.BoolOpt('metrics_enabled', default=True),
+    cfg.StrOpt('statsd_host'),
+    cfg.IntOpt('statsd_port', default=8125),
+    cfg.StrOpt('statsd_prefix', default='glance'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(metrics_opts)
+
+# Upper bounds of the buckets of timing histograms, in milliseconds
+BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+# Path segments that name a collection, so the segment after them is an
+# identifier, unless it is one of the literal sub-resources
+COLLECTIONS = ('images', 'members', 'tags', 'cached_images',
+               'queued_images', 'shared-images')
+LITERALS = ('detail',)
+
+LITERAL_SEGMENT = re.compile(r'^([a-z_-]+|v\d+)$')
+
+# Request methods that are named in metrics; requests with any other
+# method, or that match no route, are named `other`
+METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'DELETE', 'PATCH')
+OTHER = 'other'
+
+VERSION_SEGMENT = re.compile(r'^v\d+$')
+
+# Set by middleware that serves a request before it reaches the router to
+# the path of the route it served, e.g. '/v1/images/{id}'
+ROUTE_PATH = 'glance.route_path'
+
+
+class Histogram(object):
+
+    """Counts of timings in fixed buckets, and their sum, min and max."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.buckets[bisect.bisect_left(BUCKETS, value)] += 1
+
+    def percentile(self, percent):
+        """
+        Returns an upper bound of the given percentile of the timings: the
+        bound of the bucket it falls in, or the maximum if that is lower.
+        """
+        if not self.count:
+            return None
+        rank = self.count * percent / 100.0
+        seen = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        buckets = dict((str(bound), count)
+                       for bound, count in zip(BUCKETS, self.buckets))
+        buckets['inf'] = self.buckets[-1]
+        return {'count': self.count,
+                'sum': self.total,
+                'min': self.min,
+                'max': self.max,
+                'mean': self.total / self.count if self.count else None,
+                'p50': self.percentile(50),
+                'p90': self.percentile(90),
+                'p99': self.percentile(99),
+                'buckets': buckets}
+
+
+class StatsdEmitter(object):
+
+    """Sends metrics to a statsd server over UDP, dropping any it can't."""
+
+    def __init__(self, host, port, prefix):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, name, value, kind):
+        if self.prefix:
+            name = '%s.%s' % (self.prefix, name)
+        try:
+            self.sock.sendto('%s:%s|%s' % (name, value, kind), self.address)
+        except socket.error, e:
+            LOG.debug(_("Failed to send metric %(name)s to statsd: %(e)s"),
+                      locals())
+
+
+class Metrics(object):
+
+    """The metrics recorded by a process."""
+
+    def __init__(self):
+        self.lock = semaphore.Semaphore()
+        self.reset()
+        self._emitter = None
+        self._emitter_conf = None
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.gauges = {}
+            self.timers = {}
+
+    def _emit(self, name, value, kind):
+        conf = (CONF.statsd_host, CONF.statsd_port, CONF.statsd_prefix)
+        if not conf[0]:
+            return
+        if self._emitter_conf != conf:
+            self._emitter = StatsdEmitter(*conf)
+            self._emitter_conf = conf
+        self._emitter.send(name, value, kind)
+
+    def increment(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        self._emit(name, value, 'c')
+
+    def gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+        self._emit(name, value, 'g')
+
+    def timing(self, name, msecs):
+        with self.lock:
+            histogram = self.timers.get(name)
+            if histogram is None:
+                histogram = self.timers[name] = Histogram()
+            histogram.observe(msecs)
+        self._emit(name, '%.3f' % msecs, 'ms')
+
+    def snapshot(self):
+        with self.lock:
+            return {'counters': dict(self.counters),
+                    'gauges': dict(self.gauges),
+                    'timers': dict((name, histogram.to_dict())
+                                   for name, histogram
+                                   in self.timers.iteritems())}
+
+
+_METRICS = Metrics()
+
+
+def increment(name, value=1):
+    """Adds to a counter."""
+    if CONF.metrics_enabled:
+        _METRICS.increment(name, value)
+
+
+def gauge(name, value):
+    """Sets a gauge to its current value."""
+    if CONF.metrics_enabled:
+        _METRICS.gauge(name, value)
+
+
+def timing(name, msecs):
+    """Records a timing, in milliseconds."""
+    if CONF.metrics_enabled:
+        _METRICS.timing(name, msecs)
+
+
+@contextlib.contextmanager
+def timer(name):
+    """Records the time taken by the block it wraps, even if it raises."""
+    start = time.time()
+    try:
+        yield
+    finally:
+        timing(name, (time.time() - start) * 1000)
+
+
+def timed(name):
+    """Decorator recording the time taken by each call of a function."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapped(*args, **kwargs):
+            with timer(name):
+                return func(*args, **kwargs)
+        return wrapped
+    return decorator
+
+
+def snapshot():
+    """Returns the metrics recorded by this process."""
+    return _METRICS.snapshot()
+
+
+def reset():
+    """Forgets the metrics recorded by this process."""
+    _METRICS.reset()
+
+
+def route_name(method, path):
+    """
+    Returns the name of a request's route, e.g. `GET.v1.images.id` for
+    GET /v1/images/<ID>, replacing identifiers in the path so that all
+    requests for the same route share a name.
+
+    Any path gets a name, so only use it for requests Glance makes itself
+    or to look names up; name the metrics of requests it serves with
+    `request_name`, or clients could create any number of metrics.
+    """
+    segments = [method]
+    previous = None
+    for segment in path.strip('/').split('/'):
+        if not segment:
+            continue
+        if ((previous in COLLECTIONS and segment not in LITERALS) or
+            not LITERAL_SEGMENT.match(segment)):
+            segments.append('id')
+        else:
+            segments.append(segment)
+        previous = segment
+    return '.'.join(segments)
+
+
+def request_name(environ):
+    """
+    Returns the metric name of a request a router has dispatched, from
+    the route it matched rather than the path, e.g. `GET.v1.images.id` for
+    GET /v1/images/<ID>. Methods other than `METHODS`, and requests that
+    matched no route, are named `other`, so clients cannot add names.
+    """
+    method = environ.get('REQUEST_METHOD')
+    if method not in METHODS:
+        method = OTHER
+    route = environ.get('routes.route')
+    if route is not None:
+        routepath = route.routepath
+    elif ROUTE_PATH in environ:
+        routepath = environ[ROUTE_PATH]
+    else:
+        return '%s.%s' % (method, OTHER)
+
+    segments = [method]
+    # The version negotiation middleware leaves the version it was asked
+    # for in SCRIPT_NAME too, before the one the request was mapped to
+    versions = [segment
+                for segment in environ.get('SCRIPT_NAME', '').split('/')
+                if VERSION_SEGMENT.match(segment)]
+    segments.extend(versions[-1:])
+    for segment in routepath.strip('/').split('/'):
+        if segment.startswith('{') or segment.startswith(':'):
+            segments.append('id')
+        elif segment:
+            segments.append(segment)
+    return '.'.join(segments)
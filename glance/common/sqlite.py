@@ -0,0 +1,57 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+SQLite helpers shared by the image cache and the scrubber queue
+"""
+
+from __future__ import absolute_import
+
+from eventlet import sleep, timeout
+import sqlite3
+
+DEFAULT_SQL_CALL_TIMEOUT = 2
+
+
+class SqliteConnection(sqlite3.Connection):
+
+    """
+    SQLite DB Connection handler that plays well with eventlet,
+    slightly modified from Swift's similar code.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.timeout_seconds = kwargs.get('timeout', DEFAULT_SQL_CALL_TIMEOUT)
+        kwargs['timeout'] = 0
+        sqlite3.Connection.__init__(self, *args, **kwargs)
+
+    def _timeout(self, call):
+        with timeout.Timeout(self.timeout_seconds):
+            while True:
+                try:
+                    return call()
+                except sqlite3.OperationalError, e:
+                    if 'locked' not in str(e):
+                        raise
+                sleep(0.05)
+
+    def execute(self, *args, **kwargs):
+        return self._timeout(lambda: sqlite3.Connection.execute(
+                                        self, *args, **kwargs))
+
+    def commit(self):
+        return self._timeout(lambda: sqlite3.Connection.commit(self))
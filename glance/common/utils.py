@@ -38,6 +38,7 @@ import iso8601
 from webob import exc
 
 from glance.common import exception
+from glance.openstack.common import importutils
 import glance.openstack.common.log as logging
 
 
@@ -72,6 +73,96 @@ def chunkiter(fp, chunk_size=65536):
             break
 
 
+# lseek(2) whence values for finding the data and holes of sparse files,
+# which the os module does not define
+SEEK_DATA = 3
+SEEK_HOLE = 4
+
+
+def is_zeros(chunk):
+    """Returns whether a chunk of data is all zero bytes."""
+    # Most data does not start or end with a zero byte, so check those
+    # before comparing the whole chunk
+    return (not chunk or
+            (chunk[0] == '\0' and chunk[-1] == '\0' and
+             chunk == '\0' * len(chunk)))
+
+
+class SparseWriter(object):
+    """
+    Wraps a file opened for writing, seeking over chunks of data that are
+    all zeros instead of writing them, so that they become holes in a
+    sparse file. The file is extended over a trailing hole when it is
+    flushed or closed.
+    """
+    def __init__(self, fp):
+        """
+        :param fp: Underlying file object, opened for writing
+        """
+        self.fp = fp
+        self.ends_in_hole = False
+
+    def write(self, chunk):
+        if is_zeros(chunk):
+            self.fp.seek(len(chunk), os.SEEK_CUR)
+            self.ends_in_hole = bool(chunk) or self.ends_in_hole
+        else:
+            self.fp.write(chunk)
+            self.ends_in_hole = False
+
+    def flush(self):
+        if self.ends_in_hole:
+            self.fp.truncate(self.fp.tell())
+            self.ends_in_hole = False
+        self.fp.flush()
+
+    def close(self):
+        self.flush()
+        self.fp.close()
+
+
+def sparse_chunkiter(fp, chunk_size=65536):
+    """
+    Return an iterator to a file object which yields chunks of at most
+    chunk_size, producing the zeros of any holes in a sparse file
+    without reading them from disk. Falls back to reading every byte
+    where the platform or filesystem cannot find holes.
+
+    :param fp: a file object, at the start of the file
+    :param chunk_size: maximum size of chunk
+    """
+    fd = fp.fileno()
+    size = os.fstat(fd).st_size
+    pos = 0
+    zeros = '\0' * chunk_size
+    while pos < size:
+        try:
+            if not sys.platform.startswith('linux'):
+                raise OSError(errno.EINVAL, 'SEEK_DATA is not supported')
+            data = os.lseek(fd, pos, SEEK_DATA)
+            hole = os.lseek(fd, data, SEEK_HOLE)
+        except OSError, e:
+            if e.errno == errno.ENXIO:
+                # Nothing but a hole up to the end of the file
+                data = hole = size
+            elif e.errno == errno.EINVAL:
+                data, hole = pos, size
+            else:
+                raise
+        while pos < data:
+            length = min(chunk_size, data - pos)
+            yield zeros if length == chunk_size else zeros[:length]
+            pos += length
+        os.lseek(fd, pos, os.SEEK_SET)
+        while pos < hole:
+            chunk = os.read(fd, min(chunk_size, hole - pos))
+            if not chunk:
+                # The file was truncated while being read
+                return
+            yield chunk
+            pos += len(chunk)
+
+
 def cooperative_iter(iter):
     """
     Return an iterator which schedules after each
@@ -391,3 +482,21 @@ def mutating(func):
                                     content_type="text/plain")
         return func(self, req, *args, **kwargs)
     return wrapped
+
+
+class LazyModule(object):
+
+    """
+    Stands in for a module, importing it when one of its attributes is
+    first used, so that importing a store or other module does not import
+    the client library it needs until it is used.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importutils.import_module(self._name)
+        return getattr(self._module, attr)
@@ -29,17 +29,20 @@ import os
 import signal
 import sys
 import time
+import zlib
 
 import eventlet
 from eventlet.green import socket, ssl
 import eventlet.greenio
 import eventlet.wsgi
+import greenlet
 import routes
 import routes.middleware
 import webob.dec
 import webob.exc
 
 from glance.common import exception
+from glance.common import metrics
 from glance.common import utils
 from glance.openstack.common import cfg
 import glance.openstack.common.log as os_logging
@@ -60,10 +63,37 @@ socket_opts = [
 
 workers_opt = cfg.IntOpt('workers', default=0)
 
+reload_opts = [
+    cfg.IntOpt('worker_drain_timeout', default=60),
+    cfg.IntOpt('worker_respawn_max_delay', default=30),
+]
+
+gzip_opts = [
+    cfg.BoolOpt('gzip_json_responses', default=True),
+    cfg.IntOpt('gzip_min_size', default=1024),
+    ]
+
 CONF = cfg.CONF
 CONF.register_opts(bind_opts)
 CONF.register_opts(socket_opts)
 CONF.register_opt(workers_opt)
+CONF.register_opts(reload_opts)
+CONF.register_opts(gzip_opts)
+
+# zlib's default compression level, trading little size for speed
+GZIP_LEVEL = 6
+
+# Pools of greenthreads doing work that outlives the request which started
+# it, such as image imports
+_background_pools = []
+
+
+def add_background_pool(pool):
+    """
+    Has a worker that is draining wait for the greenthreads of a pool
+    to finish, as well as for its running requests, before it exits.
+    """
+    _background_pools.append(pool)
 
 
 class WritableLogger(object):
@@ -158,15 +188,25 @@ class Server(object):
 
     def __init__(self, threads=1000):
         self.threads = threads
-        self.children = []
+        # Maps the pid of each worker of the current generation to the
+        # time it was started
+        self.children = {}
+        # Workers of earlier generations, finishing their requests
+        self.draining = []
+        # The times at which dead workers are to be replaced
+        self.respawns = []
+        self.respawn_delay = 0
+        self.reload_requested = False
         self.running = True
 
-    def start(self, application, default_port):
+    def start(self, application, default_port, reloader=None):
         """
         Run a WSGI server with the given application.
 
         :param application: The application to run in the WSGI server
         :param default_port: Port to bind to if none is specified in conf
+        :param reloader: Callable re-reading the configuration and
+                         returning the application anew, on reloads
         """
         def kill_children(*args):
             """Kills the entire process group."""
@@ -183,13 +223,28 @@ class Server(object):
             self.logger.error(_('SIGHUP received'))
             signal.signal(signal.SIGHUP, signal.SIG_IGN)
             self.running = False
+            self._drain_children(self.children.keys())
+
+        def request_reload(*args):
+            """
+            Replaces the workers with ones running the application as now
+            configured, but allows running requests to complete
+            """
+            self.logger.info(_('SIGUSR1 received'))
+            if CONF.workers:
+                self.reload_requested = True
+            else:
+                self.logger.error(_('Reloading requires workers, '
+                                    'ignoring SIGUSR1'))
 
         self.application = application
+        self.reloader = reloader
         self.sock = get_socket(default_port)
 
         os.umask(027)  # ensure files are created with the correct privileges
         self.logger = os_logging.getLogger('eventlet.wsgi.server')
 
+        signal.signal(signal.SIGUSR1, request_reload)
         if CONF.workers == 0:
             # Useful for profiling, test, debug etc.
             self.pool = eventlet.GreenPool(size=self.threads)
@@ -206,19 +261,13 @@ class Server(object):
     def wait_on_children(self):
         while self.running:
             try:
-                pid, status = os.wait()
-                if os.WIFEXITED(status) or os.WIFSIGNALED(status):
-                    self.logger.error(_('Removing dead child %s') % pid)
-                    self.children.remove(pid)
-                    if os.WIFEXITED(status) and os.WEXITSTATUS(status) == 2:
-                        self.logger.error(_('Not respawning child %d, cannot '
-                                            'recover from termination') % pid)
-                        if not self.children:
-                            self.logger.error(
-                                _('All workers have terminated. Exiting'))
-                            self.running = False
-                    else:
-                        self.run_child()
+                if self.reload_requested:
+                    self.reload_requested = False
+                    self.reload()
+                self._respawn_children()
+                pid, status = self._wait_child(self._next_respawn())
+                if pid:
+                    self._child_exited(pid, status)
             except OSError, err:
                 if err.errno not in (errno.EINTR, errno.ECHILD):
                     raise
@@ -229,6 +278,112 @@ class Server(object):
         self.sock.close()
         self.logger.debug(_('Exited'))
 
+    def _wait_child(self, timeout=None):
+        """
+        Waits for a worker to exit, for at most timeout seconds if given,
+        or until a reload is requested.
+
+        :returns: the pid and status of the worker, or (0, 0) if none did
+        """
+        if timeout is None:
+            return os.wait()
+        deadline = time.time() + timeout
+        while self.running and not self.reload_requested:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError, err:
+                if err.errno != errno.ECHILD:
+                    raise
+                pid, status = 0, 0
+            if pid:
+                return pid, status
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, 0.1))
+        return 0, 0
+
+    def _child_exited(self, pid, status):
+        if not (os.WIFEXITED(status) or os.WIFSIGNALED(status)):
+            return
+        if pid in self.draining:
+            self.logger.info(_('Child %d finished draining') % pid)
+            self.draining.remove(pid)
+            return
+        if pid not in self.children:
+            return
+
+        self.logger.error(_('Removing dead child %s') % pid)
+        lifetime = time.time() - self.children.pop(pid)
+        if os.WIFEXITED(status) and os.WEXITSTATUS(status) == 2:
+            self.logger.error(_('Not respawning child %d, cannot '
+                                'recover from termination') % pid)
+            if not self.children and not self.respawns:
+                self.logger.error(_('All workers have terminated. Exiting'))
+                self.running = False
+            return
+
+        # Workers dying soon after they start are replaced ever more
+        # slowly, rather than forked in a tight loop
+        if lifetime >= CONF.worker_respawn_max_delay:
+            self.respawn_delay = 0
+        else:
+            self.respawn_delay = min(max(self.respawn_delay * 2, 1),
+                                     CONF.worker_respawn_max_delay)
+        if self.respawn_delay:
+            self.logger.info(_('Respawning child in %d seconds')
+                             % self.respawn_delay)
+        self.respawns.append(time.time() + self.respawn_delay)
+        self.respawns.sort()
+
+    def _next_respawn(self):
+        """Returns the seconds until the next respawn, if one is due."""
+        if self.respawns:
+            return max(self.respawns[0] - time.time(), 0)
+
+    def _respawn_children(self):
+        now = time.time()
+        while self.respawns and self.respawns[0] <= now:
+            self.respawns.pop(0)
+            self.run_child()
+
+    def _drain_children(self, pids):
+        """Has workers stop accepting requests and exit once idle."""
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGHUP)
+            except OSError, err:
+                if err.errno != errno.ESRCH:
+                    raise
+
+    def reload(self):
+        """
+        Starts a new generation of workers on the same socket, running the
+        application as now configured, and has the current workers drain.
+        The current workers are kept if the application fails to load.
+        """
+        if self.reloader is not None:
+            try:
+                with metrics.timer('wsgi.reload'):
+                    self.application = self.reloader()
+            except Exception:
+                self.logger.exception(_('Unable to reload the application, '
+                                        'keeping the current workers'))
+                return
+
+        previous = self.children.keys()
+        self.children = {}
+        self.respawns = []
+        self.respawn_delay = 0
+        workers = CONF.workers or len(previous)
+        self.logger.info(_('Reloading: starting %(workers)d workers, '
+                           'draining %(previous)d')
+                         % {'workers': workers, 'previous': len(previous)})
+        while len(self.children) < workers:
+            self.run_child()
+        self._drain_children(previous)
+        self.draining.extend(previous)
+
     def wait(self):
         """Wait until all servers have completed running."""
         try:
@@ -240,22 +395,24 @@ class Server(object):
             pass
 
     def run_child(self):
+        started = time.time()
         pid = os.fork()
         if pid == 0:
             signal.signal(signal.SIGHUP, signal.SIG_DFL)
             signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGUSR1, signal.SIG_IGN)
             # ignore the interrupt signal to avoid a race whereby
             # a child worker receives the signal before the parent
             # and is respawned unneccessarily as a result
             signal.signal(signal.SIGINT, signal.SIG_IGN)
-            self.run_server()
+            self.run_server(started)
             self.logger.info(_('Child %d exiting normally') % os.getpid())
-            return
+            sys.exit(0)
         else:
             self.logger.info(_('Started child %s') % pid)
-            self.children.append(pid)
+            self.children[pid] = started
 
-    def run_server(self):
+    def run_server(self, started=None):
         """Run a WSGI server."""
         eventlet.wsgi.HttpProtocol.default_request_version = "HTTP/1.0"
         try:
@@ -265,13 +422,38 @@ class Server(object):
             raise exception.WorkerCreationFailure(reason=msg)
         eventlet.patcher.monkey_patch(all=False, socket=True)
         self.pool = eventlet.GreenPool(size=self.threads)
+        self.acceptor = eventlet.spawn(eventlet.wsgi.server, self.sock,
+                                       self.application,
+                                       log=WritableLogger(self.logger),
+                                       custom_pool=self.pool)
+        signal.signal(signal.SIGHUP, self._drain)
+        if started is not None:
+            startup = (time.time() - started) * 1000
+            metrics.timing('wsgi.worker.startup', startup)
+            self.logger.info(_('Child %(pid)d started in %(ms).1fms')
+                             % {'pid': os.getpid(), 'ms': startup})
         try:
-            eventlet.wsgi.server(self.sock, self.application,
-                    log=WritableLogger(self.logger), custom_pool=self.pool)
+            self.acceptor.wait()
+        except greenlet.GreenletExit:
+            pass  # stopped by _drain
         except socket.error, err:
             if err[0] != errno.EINVAL:
                 raise
         self.pool.waitall()
+        for pool in _background_pools:
+            pool.waitall()
+
+    def _drain(self, *args):
+        """
+        Stops accepting connections, and exits once running requests and
+        background work have completed, or worker_drain_timeout seconds
+        have passed.
+        """
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        self.logger.info(_('Child %d draining') % os.getpid())
+        if CONF.worker_drain_timeout > 0:
+            signal.alarm(CONF.worker_drain_timeout)
+        eventlet.spawn_n(self.acceptor.kill)
 
     def _single_run(self, application, sock):
         """Start a WSGI server in a new green thread."""
@@ -479,6 +661,28 @@ class JSONResponseSerializer(object):
         response.body = self.to_json(result)
 
 
+def gzip_response(request, response):
+    """
+    Compresses the body of a JSON response with gzip, if the client
+    accepts gzip and the body is at least gzip_min_size bytes.
+    """
+    if (not CONF.gzip_json_responses or
+        response.content_type != 'application/json' or
+        response.content_encoding or
+        'gzip' not in request.accept_encoding):
+        return
+    vary = list(response.vary or [])
+    if 'Accept-Encoding' not in vary:
+        response.vary = vary + ['Accept-Encoding']
+    body = response.body
+    if len(body) < CONF.gzip_min_size:
+        return
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED,
+                                  16 + zlib.MAX_WBITS)
+    response.body = compressor.compress(body) + compressor.flush()
+    response.content_encoding = 'gzip'
+
+
 class Resource(object):
     """
     WSGI app that handles (de)serialization and controller dispatch.
@@ -523,6 +727,7 @@ class Resource(object):
         try:
             response = webob.Response(request=request)
             self.dispatch(self.serializer, action, response, action_result)
+            gzip_response(request, response)
             return response
 
         # return unserializable result (typically a webob exc)
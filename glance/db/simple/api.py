@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import copy
 import datetime
 import functools
 import uuid
@@ -264,6 +265,29 @@ def image_member_delete(context, member):
     return mem
 
 
+@log_call
+def image_member_set_all(context, image_id, members):
+    global DATA
+    wanted = dict((values['member'], values.get('can_share'))
+                  for values in members)
+    for member in DATA['members']:
+        if member['image_id'] != image_id:
+            continue
+        if member['member'] not in wanted:
+            if not member['deleted']:
+                member['deleted_at'] = datetime.datetime.utcnow()
+                member['deleted'] = True
+            continue
+        can_share = wanted.pop(member['member'])
+        if member['deleted'] or can_share is not None:
+            member['can_share'] = bool(can_share)
+        member['deleted'] = False
+        member['deleted_at'] = None
+    for member, can_share in wanted.iteritems():
+        DATA['members'].append(_image_member_format(image_id, member,
+                                                    bool(can_share)))
+
+
 @log_call
 def image_create(context, image_values):
     image_id = image_values.get('id', str(uuid.uuid4()))
@@ -275,7 +299,7 @@ def image_create(context, image_values):
 
 
 @log_call
-def image_update(context, image_id, image_values):
+def image_update(context, image_id, image_values, purge_props=False):
     global DATA
     try:
         image = DATA['images'][image_id]
@@ -283,16 +307,51 @@ def image_update(context, image_id, image_values):
         raise exception.NotFound(image_id=image_id)
 
     properties = image_values.pop('properties', {})
-    properties = [{'name': k,
-                   'value': v,
-                   'deleted': False} for k, v in properties.items()]
-    image['properties'] = properties
+    orig_properties = dict((p['name'], p) for p in image['properties'])
+    for name, value in properties.iteritems():
+        orig_properties[name] = {'name': name,
+                                 'value': value,
+                                 'deleted': False}
+    if purge_props:
+        for name in orig_properties.keys():
+            if name not in properties:
+                del orig_properties[name]
+    image['properties'] = orig_properties.values()
     image['updated_at'] = timeutils.utcnow()
     image.update(image_values)
     DATA['images'][image_id] = image
     return image
 
 
+@log_call
+def image_update_all(context, images):
+    """
+    Update a batch of images so that either all of them are updated or,
+    if updating one fails, none is. Images which do not exist or may not
+    be modified by the context are skipped.
+    """
+    global DATA
+    originals = {}
+    updated = []
+    try:
+        for image_id, values in images:
+            try:
+                image = image_get(context, image_id)
+            except exception.NotFound:
+                image = None
+            if image is None or not (is_image_visible(context, image) and
+                                     is_image_mutable(context, image)):
+                LOG.info(_("Skipping update of image %s: not found or "
+                           "not modifiable") % image_id)
+                continue
+            originals.setdefault(image_id, copy.deepcopy(image))
+            updated.append(image_update(context, image_id, values))
+    except Exception:
+        DATA['images'].update(originals)
+        raise
+    return updated
+
+
 @log_call
 def image_destroy(context, image_id):
     global DATA
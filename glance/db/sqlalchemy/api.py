@@ -22,14 +22,18 @@
 Defines interface for DB access
 """
 
+import functools
+import itertools
 import logging
 import time
 
 import sqlalchemy
 import sqlalchemy.orm
+import sqlalchemy.pool
 import sqlalchemy.sql
 
 from glance.common import exception
+from glance.common import metrics
 from glance.db.sqlalchemy import migration
 from glance.db.sqlalchemy import models
 from glance.openstack.common import cfg
@@ -39,6 +43,8 @@ from glance.openstack.common import timeutils
 
 _ENGINE = None
 _MAKER = None
+_READ_MAKERS = []
+_READ_COUNTER = itertools.count()
 _MAX_RETRIES = None
 _RETRY_INTERVAL = None
 BASE = models.BASE
@@ -54,6 +60,11 @@ STATUSES = ['active', 'saving', 'queued', 'killed', 'pending_delete',
 
 db_opts = [
     cfg.IntOpt('sql_idle_timeout', default=3600),
+    cfg.ListOpt('sql_read_connections', default=[]),
+    cfg.IntOpt('sql_max_pool_size', default=10),
+    cfg.IntOpt('sql_max_overflow', default=20),
+    cfg.IntOpt('sql_pool_timeout', default=30),
+    cfg.IntOpt('sql_ping_idle_time', default=60),
     cfg.IntOpt('sql_max_retries', default=10),
     cfg.IntOpt('sql_retry_interval', default=1),
     cfg.BoolOpt('db_auto_create', default=False),
@@ -63,16 +74,56 @@ CONF = cfg.CONF
 CONF.register_opts(db_opts)
 
 
+class MeteredQueuePool(sqlalchemy.pool.QueuePool):
+
+    """
+    A QueuePool recording how long each checkout takes to get a live
+    connection, waiting for one to be returned to the pool, opening one
+    or pinging one, as the metric `db.pool.wait`, and the connections
+    checked out of it and opened beyond its size as the gauges
+    `db.pool.checked_out` and `db.pool.overflow`.
+    """
+
+    def connect(self):
+        with metrics.timer('db.pool.wait'):
+            conn = super(MeteredQueuePool, self).connect()
+        self._record_usage()
+        return conn
+
+    def unique_connection(self):
+        with metrics.timer('db.pool.wait'):
+            conn = super(MeteredQueuePool, self).unique_connection()
+        self._record_usage()
+        return conn
+
+    def _do_return_conn(self, conn):
+        super(MeteredQueuePool, self)._do_return_conn(conn)
+        self._record_usage()
+
+    def _record_usage(self):
+        metrics.gauge('db.pool.checked_out', self.checkedout())
+        metrics.gauge('db.pool.overflow', max(self.overflow(), 0))
+
+
 def ping_listener(dbapi_conn, connection_rec, connection_proxy):
 
     """
-    Ensures that MySQL connections checked out of the
-    pool are alive.
+    Ensures that MySQL connections checked out of the pool are alive.
+    Only connections idle in the pool for longer than `sql_ping_idle_time`
+    seconds are pinged, so that a busy registry does not make a round
+    trip before every query. A connection that fails the ping is replaced
+    by the pool with a new one.
 
     Borrowed from:
     http://groups.google.com/group/sqlalchemy/msg/a4ce563d802c929f
     """
 
+    checkin_time = connection_rec.info.get('checkin_time')
+    if (checkin_time is None or
+        time.time() - checkin_time <= CONF.sql_ping_idle_time):
+        return
+
+    metrics.increment('db.pool.pings')
     try:
         dbapi_conn.cursor().execute('select 1')
     except dbapi_conn.OperationalError, ex:
@@ -84,28 +135,72 @@ def ping_listener(dbapi_conn, connection_rec, connection_proxy):
             raise
 
 
+def checkin_listener(dbapi_conn, connection_rec):
+    """Notes when a connection was returned to the pool."""
+    if connection_rec is not None:
+        connection_rec.info['checkin_time'] = time.time()
+
+
+def before_execute_listener(conn, cursor, statement, parameters, context,
+                            executemany):
+    """Notes when a statement starts, for `after_execute_listener`."""
+    conn.info.setdefault('query_start', []).append(time.time())
+
+
+def after_execute_listener(conn, cursor, statement, parameters, context,
+                           executemany):
+    """
+    Records the time taken by a statement as the metric `db.<verb>`, such
+    as `db.select`.
+    """
+    start = conn.info['query_start'].pop()
+    verb = statement.split(None, 1)[0].lower() if statement else 'unknown'
+    metrics.timing('db.%s' % verb, (time.time() - start) * 1000)
+
+
+def _create_engine(sql_connection):
+    """Creates an engine for a database, with its pool and listeners."""
+    connection_dict = sqlalchemy.engine.url.make_url(sql_connection)
+    engine_args = {'pool_recycle': CONF.sql_idle_timeout,
+                   'echo': False,
+                   'convert_unicode': True
+                   }
+    # SQLite databases are not pooled by a QueuePool, and take no
+    # pool sizing arguments
+    pooled = 'sqlite' not in connection_dict.drivername
+    if pooled:
+        engine_args.update({'poolclass': MeteredQueuePool,
+                            'pool_size': CONF.sql_max_pool_size,
+                            'max_overflow': CONF.sql_max_overflow,
+                            'pool_timeout': CONF.sql_pool_timeout})
+
+    engine = sqlalchemy.create_engine(sql_connection, **engine_args)
+
+    if 'mysql' in connection_dict.drivername:
+        sqlalchemy.event.listen(engine, 'checkout', ping_listener)
+    if pooled:
+        sqlalchemy.event.listen(engine, 'checkin', checkin_listener)
+
+    sqlalchemy.event.listen(engine, 'before_cursor_execute',
+                            before_execute_listener)
+    sqlalchemy.event.listen(engine, 'after_cursor_execute',
+                            after_execute_listener)
+    return engine
+
+
 def configure_db():
     """
     Establish the database, create an engine if needed, and
     register the models.
     """
-    global _ENGINE, sa_logger, _MAX_RETRIES, _RETRY_INTERVAL
+    global _ENGINE, sa_logger, _MAX_RETRIES, _RETRY_INTERVAL, _READ_MAKERS
     if not _ENGINE:
         sql_connection = CONF.sql_connection
         _MAX_RETRIES = CONF.sql_max_retries
         _RETRY_INTERVAL = CONF.sql_retry_interval
-        connection_dict = sqlalchemy.engine.url.make_url(sql_connection)
-        engine_args = {'pool_recycle': CONF.sql_idle_timeout,
-                       'echo': False,
-                       'convert_unicode': True
-                       }
 
         try:
-            _ENGINE = sqlalchemy.create_engine(sql_connection, **engine_args)
-
-            if 'mysql' in connection_dict.drivername:
-                sqlalchemy.event.listen(_ENGINE, 'checkout', ping_listener)
-
+            _ENGINE = _create_engine(sql_connection)
             _ENGINE.connect = wrap_db_error(_ENGINE.connect)
             _ENGINE.connect()
         except Exception, err:
@@ -115,6 +210,21 @@ def configure_db():
             LOG.error(msg)
             raise
 
+        # Read replicas are not connected to until they are read from, and
+        # reads fall back to the primary database while they are down
+        _READ_MAKERS = []
+        for sql_connection in CONF.sql_read_connections:
+            try:
+                engine = _create_engine(sql_connection)
+            except Exception, err:
+                msg = _("Error configuring registry database with supplied "
+                        "sql_read_connections '%(sql_connection)s'. "
+                        "Got error:\n%(err)s") % locals()
+                LOG.error(msg)
+                raise
+            _READ_MAKERS.append(sqlalchemy.orm.sessionmaker(
+                    bind=engine, autocommit=True, expire_on_commit=False))
+
         sa_logger = logging.getLogger('sqlalchemy.engine')
         if CONF.debug:
             sa_logger.setLevel(logging.DEBUG)
@@ -154,6 +264,49 @@ def get_session(autocommit=True, expire_on_commit=False):
     return _MAKER()
 
 
+def reads(func):
+    """
+    Decorator routing a read-only DB API call that is not given a session
+    to a read replica, if any are configured, and retrying it on the
+    primary database if the replica fails.
+    """
+    @functools.wraps(func)
+    def wrapped(context, *args, **kwargs):
+        if (kwargs.get('session') is not None or not _READ_MAKERS or
+            getattr(context, 'wrote_to_db', False)):
+            return func(context, *args, **kwargs)
+
+        maker = _READ_MAKERS[_READ_COUNTER.next() % len(_READ_MAKERS)]
+        kwargs['session'] = maker()
+        try:
+            result = func(context, *args, **kwargs)
+        except sqlalchemy.exc.DBAPIError, e:
+            LOG.warn(_("Read from replica failed, retrying on the primary "
+                       "database: %s") % e)
+            metrics.increment('db.replica.fallbacks')
+            kwargs['session'] = get_session()
+            return func(context, *args, **kwargs)
+        metrics.increment('db.replica.reads')
+        return result
+    return wrapped
+
+
+def writes(func):
+    """
+    Decorator for DB API calls that write, which sends the later reads of
+    the same context to the primary database, so that they see the writes
+    whatever the lag of the replicas.
+    """
+    @functools.wraps(func)
+    def wrapped(context, *args, **kwargs):
+        try:
+            context.wrote_to_db = True
+        except AttributeError:
+            pass
+        return func(context, *args, **kwargs)
+    return wrapped
+
+
 def is_db_connection_error(args):
     """Return True if error in connecting to db."""
     # NOTE(adam_g): This is currently MySQL specific and needs to be extended
@@ -194,11 +347,13 @@ def wrap_db_error(f):
     return _wrap
 
 
+@writes
 def image_create(context, values):
     """Create an image from the values dictionary."""
     return _image_update(context, values, None, False)
 
 
+@writes
 def image_update(context, image_id, values, purge_props=False):
     """
     Set the given properties on an image and update it.
@@ -208,6 +363,34 @@ def image_update(context, image_id, values, purge_props=False):
     return _image_update(context, values, image_id, purge_props)
 
 
+@writes
+def image_update_all(context, images):
+    """
+    Update a batch of images in a single transaction, so that either all
+    of them are updated or, if one is invalid, none is.
+
+    :param images: A list of (image_id, values) pairs
+    :retval The updated images. Images which do not exist or may not be
+            modified by the context are skipped.
+    :raises Invalid if the values of any image are invalid.
+    """
+    session = get_session()
+    updated = []
+    with session.begin():
+        for image_id, values in images:
+            try:
+                image_ref = image_get(context, image_id, session=session)
+                check_mutate_authorization(context, image_ref)
+            except (exception.NotFound, exception.Forbidden):
+                LOG.info(_("Skipping update of image %s: not found or "
+                           "not modifiable") % image_id)
+                continue
+            updated.append(_image_update(context, values, image_id,
+                                         session=session))
+    return updated
+
+
+@writes
 def image_destroy(context, image_id):
     """Destroy the image or raise if it does not exist."""
     session = get_session()
@@ -228,6 +411,7 @@ def image_destroy(context, image_id):
         return image_ref
 
 
+@reads
 def image_get(context, image_id, session=None, force_show_deleted=False):
     """Get an image or raise if it does not exist."""
     session = session or get_session()
@@ -429,8 +613,9 @@ def paginate_query(query, model, limit, sort_keys, marker=None,
     return query
 
 
+@reads
 def image_get_all(context, filters=None, marker=None, limit=None,
-                  sort_key='created_at', sort_dir='desc'):
+                  sort_key='created_at', sort_dir='desc', session=None):
     """
     Get all images that match zero or more filters.
 
@@ -444,7 +629,7 @@ def image_get_all(context, filters=None, marker=None, limit=None,
     """
     filters = filters or {}
 
-    session = get_session()
+    session = session or get_session()
     query = session.query(models.Image).\
             options(sqlalchemy.orm.joinedload(models.Image.properties))
 
@@ -506,7 +691,7 @@ def image_get_all(context, filters=None, marker=None, limit=None,
 
     marker_image = None
     if marker is not None:
-        marker_image = image_get(context, marker,
+        marker_image = image_get(context, marker, session=session,
                                  force_show_deleted=showing_deleted)
 
     query = paginate_query(query, models.Image, limit,
@@ -603,16 +788,19 @@ def _update_values(image_ref, values):
             setattr(image_ref, k, values[k])
 
 
-def _image_update(context, values, image_id, purge_props=False):
+def _image_update(context, values, image_id, purge_props=False,
+                  session=None):
     """
-    Used internally by image_create and image_update
+    Used internally by image_create, image_update and image_update_all
 
     :param context: Request context
     :param values: A dict of attributes to set
     :param image_id: If None, create the image, otherwise, find and update it
+    :param session: A session whose transaction to update the image in
     """
-    session = get_session()
-    with session.begin():
+    outer_session = session
+    session = session or get_session()
+    with session.begin(subtransactions=outer_session is not None):
 
         # Remove the properties passed in the values mapping. We
         # handle properties separately from base image attributes,
@@ -669,13 +857,15 @@ def _image_update(context, values, image_id, purge_props=False):
         _set_properties_for_image(context, image_ref, properties, purge_props,
                                   session)
 
-    return image_get(context, image_ref.id)
+    return image_get(context, image_ref.id, session=outer_session)
 
 
 def _set_properties_for_image(context, image_ref, properties,
                               purge_props=False, session=None):
     """
-    Create or update a set of image_properties for a given image
+    Create or update a set of image_properties for a given image, with
+    at most one INSERT, one UPDATE and one DELETE statement whatever the
+    number of properties
 
     :param context: Request context
     :param image_ref: An Image object
@@ -686,30 +876,70 @@ def _set_properties_for_image(context, image_ref, properties,
     for prop_ref in image_ref.properties:
         orig_properties[prop_ref.name] = prop_ref
 
+    creates = []
+    updates = []
     for name, value in properties.iteritems():
-        prop_values = {'image_id': image_ref.id,
-                       'name': name,
-                       'value': value}
-        if name in orig_properties:
-            prop_ref = orig_properties[name]
-            image_property_update(context, prop_ref, prop_values,
-                                  session=session)
-        else:
-            image_property_create(context, prop_values, session=session)
-
+        prop_ref = orig_properties.get(name)
+        if prop_ref is None:
+            creates.append({'image_id': image_ref.id,
+                            'name': name,
+                            'value': value})
+        elif prop_ref.value != value or prop_ref.deleted:
+            updates.append({'_id': prop_ref.id, 'value': value})
+
+    deletes = []
     if purge_props:
-        for key in orig_properties.keys():
-            if not key in properties:
-                prop_ref = orig_properties[key]
-                image_property_delete(context, prop_ref, session=session)
+        deletes = [prop_ref.id for name, prop_ref in orig_properties.items()
+                   if name not in properties and not prop_ref.deleted]
+
+    _bulk_write(models.ImageProperty, creates, updates, deletes,
+                session=session)
+
+    if session is not None:
+        # The statements bypass the session, so have it reload the
+        # properties the next time they are read
+        for prop_ref in orig_properties.values():
+            session.expire(prop_ref)
+        session.expire(image_ref, ['properties'])
 
 
+def _bulk_write(model, creates, updates, deletes, session=None):
+    """
+    Writes rows of a model in one statement each for the rows created,
+    updated and soft-deleted, rather than one statement per row
+
+    :param model: The model class of the rows
+    :param creates: A list of dicts of the values of rows to insert
+    :param updates: A list of dicts of the values to set, including the
+                    `_id` of the row to set them on. Each must set the
+                    same columns. The rows are undeleted too.
+    :param deletes: A list of the ids of rows to mark deleted
+    :param session: A SQLAlchemy session to use (if present)
+    """
+    session = session or get_session()
+    table = model.__table__
+    if creates:
+        session.execute(table.insert(), creates)
+    if updates:
+        statement = table.update().\
+                where(table.c.id == sqlalchemy.sql.bindparam('_id')).\
+                values(deleted=False, deleted_at=None)
+        session.execute(statement, updates)
+    if deletes:
+        now = timeutils.utcnow()
+        statement = table.update().where(table.c.id.in_(deletes)).\
+                values(deleted=True, deleted_at=now)
+        session.execute(statement)
+
+
+@writes
 def image_property_create(context, values, session=None):
     """Create an ImageProperty object"""
     prop_ref = models.ImageProperty()
     return _image_property_update(context, prop_ref, values, session=session)
 
 
+@writes
 def image_property_update(context, prop_ref, values, session=None):
     """Update an ImageProperty object"""
     return _image_property_update(context, prop_ref, values, session=session)
@@ -726,6 +956,7 @@ def _image_property_update(context, prop_ref, values, session=None):
     return prop_ref
 
 
+@writes
 def image_property_delete(context, prop_ref, session=None):
     """
     Used internally by image_property_create and image_property_update
@@ -734,12 +965,14 @@ def image_property_delete(context, prop_ref, session=None):
     return prop_ref
 
 
+@writes
 def image_member_create(context, values, session=None):
     """Create an ImageMember object"""
     memb_ref = models.ImageMember()
     return _image_member_update(context, memb_ref, values, session=session)
 
 
+@writes
 def image_member_update(context, memb_ref, values, session=None):
     """Update an ImageMember object"""
     return _image_member_update(context, memb_ref, values, session=session)
@@ -755,6 +988,7 @@ def _image_member_update(context, memb_ref, values, session=None):
     return memb_ref
 
 
+@writes
 def image_member_delete(context, memb_ref, session=None):
     """Delete an ImageMember object"""
     session = session or get_session()
@@ -762,6 +996,48 @@ def image_member_delete(context, memb_ref, session=None):
     return memb_ref
 
 
+@writes
+def image_member_set_all(context, image_id, members):
+    """
+    Replace the members of an image, with at most one INSERT, one UPDATE
+    and one DELETE statement whatever the number of members
+
+    :param image_id: identifier of image entity
+    :param members: list of dicts of the `member` tenant and whether it
+                    `can_share` the image, or None to keep what an
+                    existing member has, which defaults to False
+    """
+    session = get_session()
+    with session.begin():
+        orig_members = {}
+        query = session.query(models.ImageMember).filter_by(image_id=image_id)
+        for memb_ref in query.all():
+            orig_members[memb_ref.member] = memb_ref
+
+        wanted = dict((values['member'], values.get('can_share'))
+                      for values in members)
+        creates = []
+        updates = []
+        for member, can_share in wanted.iteritems():
+            memb_ref = orig_members.get(member)
+            if memb_ref is None:
+                creates.append({'image_id': image_id,
+                                'member': member,
+                                'can_share': bool(can_share)})
+            elif memb_ref.deleted or (can_share is not None and
+                                      memb_ref.can_share != can_share):
+                # A deleted member is revived, with can_share reset
+                updates.append({'_id': memb_ref.id,
+                                'can_share': bool(can_share)})
+
+        deletes = [memb_ref.id for member, memb_ref in orig_members.items()
+                   if member not in wanted and not memb_ref.deleted]
+
+        _bulk_write(models.ImageMember, creates, updates, deletes,
+                    session=session)
+
+
+@reads
 def image_member_find(context, image_id=None, member=None, session=None):
     """Find all members that meet the given criteria
 
@@ -797,9 +1073,11 @@ def can_show_deleted(context):
     return context.get('deleted', False)
 
 
+@writes
 def image_tag_set_all(context, image_id, tags):
     session = get_session()
-    existing_tags = set(image_tag_get_all(context, image_id, session))
+    existing_tags = set(image_tag_get_all(context, image_id,
+                                          session=session))
     tags = set(tags)
 
     tags_to_create = tags - existing_tags
@@ -811,6 +1089,7 @@ def image_tag_set_all(context, image_id, tags):
         image_tag_delete(context, image_id, tag, session)
 
 
+@writes
 def image_tag_create(context, image_id, value, session=None):
     """Create an image tag."""
     session = session or get_session()
@@ -819,6 +1098,7 @@ def image_tag_create(context, image_id, value, session=None):
     return tag_ref['value']
 
 
+@writes
 def image_tag_delete(context, image_id, value, session=None):
     """Delete an image tag."""
     session = session or get_session()
@@ -834,6 +1114,7 @@ def image_tag_delete(context, image_id, value, session=None):
     tag_ref.delete(session=session)
 
 
+@reads
 def image_tag_get_all(context, image_id, session=None):
     """Get a list of tags for a specific image."""
     session = session or get_session()
@@ -19,9 +19,9 @@
 LRU Cache for Image Data
 """
 
-import hashlib
-
+from glance.common import checksum as checksum_utils
 from glance.common import exception
+from glance.common import metrics
 from glance.common import utils
 from glance.openstack.common import cfg
 import glance.openstack.common.log as logging
@@ -34,6 +34,8 @@ image_cache_opts = [
     cfg.IntOpt('image_cache_max_size', default=10 * (1024 ** 3)),  # 10 GB
     cfg.IntOpt('image_cache_stall_time', default=86400),  # 24 hours
     cfg.StrOpt('image_cache_dir'),
+    cfg.BoolOpt('image_cache_sparse', default=False),
+    cfg.BoolOpt('image_cache_compress', default=False),
     ]
 
 CONF = cfg.CONF
@@ -163,6 +165,7 @@ class ImageCache(object):
         """
         max_size = CONF.image_cache_max_size
         current_size = self.driver.get_cache_size()
+        metrics.gauge('image_cache.size', current_size)
         if max_size > current_size:
             LOG.debug(_("Image cache has free space, skipping prune..."))
             return (0, 0)
@@ -184,6 +187,7 @@ class ImageCache(object):
             total_files_pruned = total_files_pruned + 1
             current_size = current_size - size
             entry = self.driver.get_least_recently_accessed()
+        metrics.gauge('image_cache.size', current_size)
 
         LOG.debug(_("Pruning finished pruning. "
                     "Pruned %(total_files_pruned)d and "
@@ -197,7 +201,7 @@ class ImageCache(object):
         """
         self.driver.clean(stall_time)
 
-    def queue_image(self, image_id):
+    def queue_image(self, image_id, priority=0):
         """
         This adds a image to be cache to the queue.
 
@@ -205,8 +209,9 @@ class ImageCache(object):
         cached, we return False, True otherwise
 
         :param image_id: Image ID
+        :param priority: Prefetch priority, higher values are fetched first
         """
-        return self.driver.queue_image(image_id)
+        return self.driver.queue_image(image_id, priority)
 
     def get_caching_iter(self, image_id, image_checksum, image_iter):
         """
@@ -219,6 +224,7 @@ class ImageCache(object):
                                iterating over image data
         :param image_iter: Iterator that will read image contents
         """
+        metrics.increment('image_cache.misses')
         if not self.driver.is_cacheable(image_id):
             return image_iter
 
@@ -226,7 +232,8 @@ class ImageCache(object):
 
         def tee_iter(image_id):
             try:
-                current_checksum = hashlib.md5()
+                current_checksum = checksum_utils.Checksum(
+                        [checksum_utils.IMAGE_CHECKSUM])
 
                 with self.driver.open_for_write(image_id) as cache_file:
                     for chunk in image_iter:
@@ -296,6 +303,7 @@ class ImageCache(object):
 
         :param image_id: Image ID
         """
+        metrics.increment('image_cache.hits')
         return self.driver.open_for_read(image_id)
 
     def get_image_size(self, image_id):
@@ -314,3 +322,42 @@ class ImageCache(object):
         into the queue.
         """
         return self.driver.get_queued_images()
+
+    def get_queue_entries(self):
+        """
+        Returns a list of records about queued images, including the time
+        each was queued and its prefetch priority, sorted by queue time.
+        """
+        return self.driver.get_queue_entries()
+
+    def get_status(self, name):
+        """
+        Returns the status last recorded under the supplied name by one
+        of the cache applications.
+
+        :param name: Name of the status record
+        """
+        return self.driver.get_status(name)
+
+    def set_status(self, name, status):
+        """
+        Records the status of one of the cache applications.
+
+        :param name: Name of the status record
+        :param status: JSON-serializable mapping
+        """
+        self.driver.set_status(name, status)
+
+    def get_prefetch_status(self):
+        """
+        Returns the progress last reported by the prefetcher.
+        """
+        return self.get_status('prefetcher')
+
+    def set_prefetch_status(self, status):
+        """
+        Records the prefetcher's progress.
+
+        :param status: JSON-serializable mapping
+        """
+        self.set_status('prefetcher', status)
@@ -19,8 +19,10 @@
 Base attribute driver class
 """
 
+import json
 import os.path
 
+from glance.common import compression
 from glance.common import exception
 from glance.common import utils
 from glance.openstack.common import cfg
@@ -61,8 +63,10 @@ class Driver(object):
         self.incomplete_dir = os.path.join(self.base_dir, 'incomplete')
         self.invalid_dir = os.path.join(self.base_dir, 'invalid')
         self.queue_dir = os.path.join(self.base_dir, 'queue')
+        self.status_dir = os.path.join(self.base_dir, 'status')
 
-        dirs = [self.incomplete_dir, self.invalid_dir, self.queue_dir]
+        dirs = [self.incomplete_dir, self.invalid_dir, self.queue_dir,
+                self.status_dir]
 
         for path in dirs:
             utils.safe_mkdirs(path)
@@ -110,6 +114,16 @@ class Driver(object):
         """
         raise NotImplementedError
 
+    def is_compressed(self, image_id):
+        """
+        Returns True if the image with the supplied ID had its image
+        file compressed when it was cached. This is recorded outside the
+        file, as image data can look just like a compressed file.
+
+        :param image_id: Image ID
+        """
+        raise NotImplementedError
+
     def is_queued(self, image_id):
         """
         Returns True if the image identifier is in our cache queue.
@@ -148,12 +162,13 @@ class Driver(object):
         """
         raise NotImplementedError
 
-    def queue_image(self, image_id):
+    def queue_image(self, image_id, priority=0):
         """
         Puts an image identifier in a queue for caching. Return True
         on successful add to the queue, False otherwise...
 
         :param image_id: Image ID
+        :param priority: Prefetch priority, higher values are fetched first
         """
 
     def clean(self, stall_time=None):
@@ -207,7 +222,7 @@ class Driver(object):
         :param image_id: Image ID
         """
         path = self.get_image_filepath(image_id)
-        return os.path.getsize(path)
+        return compression.get_size(path, self.is_compressed(image_id))
 
     def get_queued_images(self):
         """
@@ -216,3 +231,63 @@ class Driver(object):
         into the queue.
         """
         raise NotImplementedError
+
+    def get_queue_entries(self):
+        """
+        Returns a list of records about queued images, sorted by the time
+        the image ID was inserted into the queue::
+
+            [
+                {
+                'image_id': <IMAGE_ID>,
+                'queued_at': TIMESTAMP,
+                'priority': INTEGER
+                }, ...
+            ]
+        """
+        entries = []
+        for fname in os.listdir(self.queue_dir):
+            path = os.path.join(self.queue_dir, fname)
+            if not os.path.isfile(path):
+                continue
+            try:
+                with open(path) as queue_file:
+                    priority = int(queue_file.read().strip() or 0)
+            except ValueError:
+                priority = 0
+            entries.append({'image_id': fname,
+                            'queued_at': os.path.getmtime(path),
+                            'priority': priority})
+
+        entries.sort(key=lambda entry: entry['queued_at'])
+        return entries
+
+    def get_status_path(self, name):
+        return os.path.join(self.status_dir, '%s.json' % name)
+
+    def get_status(self, name):
+        """
+        Returns the status last recorded under the supplied name by one
+        of the cache applications, or an empty mapping if there is none.
+
+        :param name: Name of the status record, e.g. 'prefetcher'
+        """
+        try:
+            with open(self.get_status_path(name)) as status_file:
+                return json.load(status_file)
+        except (IOError, ValueError):
+            return {}
+
+    def set_status(self, name, status):
+        """
+        Records the status of one of the cache applications, such as
+        the prefetcher's progress, outside of the cached image data.
+
+        :param name: Name of the status record, e.g. 'prefetcher'
+        :param status: JSON-serializable mapping
+        """
+        path = self.get_status_path(name)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as status_file:
+            json.dump(status, status_file)
+        os.rename(tmp_path, path)
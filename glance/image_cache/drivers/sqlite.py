@@ -25,10 +25,12 @@ import os
 import stat
 import time
 
-from eventlet import sleep, timeout
 import sqlite3
 
+from glance.common import compression
 from glance.common import exception
+from glance.common.sqlite import SqliteConnection
+from glance.common import utils
 from glance.image_cache.drivers import base
 from glance.openstack.common import cfg
 import glance.openstack.common.log as logging
@@ -42,38 +44,6 @@ sqlite_opts = [
 CONF = cfg.CONF
 CONF.register_opts(sqlite_opts)
 
-DEFAULT_SQL_CALL_TIMEOUT = 2
-
-
-class SqliteConnection(sqlite3.Connection):
-
-    """
-    SQLite DB Connection handler that plays well with eventlet,
-    slightly modified from Swift's similar code.
-    """
-
-    def __init__(self, *args, **kwargs):
-        self.timeout_seconds = kwargs.get('timeout', DEFAULT_SQL_CALL_TIMEOUT)
-        kwargs['timeout'] = 0
-        sqlite3.Connection.__init__(self, *args, **kwargs)
-
-    def _timeout(self, call):
-        with timeout.Timeout(self.timeout_seconds):
-            while True:
-                try:
-                    return call()
-                except sqlite3.OperationalError, e:
-                    if 'locked' not in str(e):
-                        raise
-                sleep(0.05)
-
-    def execute(self, *args, **kwargs):
-        return self._timeout(lambda: sqlite3.Connection.execute(
-                                        self, *args, **kwargs))
-
-    def commit(self):
-        return self._timeout(lambda: sqlite3.Connection.commit(self))
-
 
 def dict_factory(cur, row):
     return dict(
@@ -112,9 +82,17 @@ class Driver(base.Driver):
                     last_modified REAL DEFAULT 0.0,
                     size INTEGER DEFAULT 0,
                     hits INTEGER DEFAULT 0,
-                    checksum TEXT
+                    checksum TEXT,
+                    compressed INTEGER DEFAULT 0
                 );
             """)
+            columns = [row[1] for row in
+                       conn.execute("PRAGMA table_info(cached_images)")]
+            if 'compressed' not in columns:
+                # A cache database from before files were compressed
+                conn.execute("""ALTER TABLE cached_images
+                             ADD COLUMN compressed INTEGER DEFAULT 0""")
+                conn.commit()
             conn.close()
         except sqlite3.DatabaseError, e:
             msg = _("Failed to initialize the image cache database. "
@@ -174,6 +152,19 @@ class Driver(base.Driver):
         """
         return os.path.exists(self.get_image_filepath(image_id))
 
+    def is_compressed(self, image_id):
+        """
+        Returns True if the image with the supplied ID had its image
+        file compressed when it was cached.
+
+        :param image_id: Image ID
+        """
+        with self.get_db() as db:
+            cur = db.execute("""SELECT compressed FROM cached_images
+                             WHERE image_id = ?""", (image_id,))
+            row = cur.fetchone()
+        return bool(row and row[0])
+
     def is_cacheable(self, image_id):
         """
         Returns True if the image with the supplied ID can have its
@@ -287,6 +278,7 @@ class Driver(base.Driver):
         :param image_id: Image ID
         """
         incomplete_path = self.get_image_filepath(image_id, 'incomplete')
+        compressed = CONF.image_cache_compress
 
         def commit():
             with self.get_db() as db:
@@ -305,9 +297,10 @@ class Driver(base.Driver):
                 now = time.time()
 
                 db.execute("""INSERT INTO cached_images
-                           (image_id, last_accessed, last_modified, hits, size)
-                           VALUES (?, 0, ?, 0, ?)""",
-                           (image_id, now, filesize))
+                           (image_id, last_accessed, last_modified, hits, size,
+                            compressed)
+                           VALUES (?, 0, ?, 0, ?, ?)""",
+                           (image_id, now, filesize, int(compressed)))
                 db.commit()
 
         def rollback(e):
@@ -326,7 +319,13 @@ class Driver(base.Driver):
 
         try:
             with open(incomplete_path, 'wb') as cache_file:
+                if compressed:
+                    cache_file = compression.CompressedWriter(
+                            cache_file, name=_("cached image %s") % image_id)
+                elif CONF.image_cache_sparse:
+                    cache_file = utils.SparseWriter(cache_file)
                 yield cache_file
+                cache_file.flush()
         except Exception as e:
             rollback(e)
             raise
@@ -350,8 +349,9 @@ class Driver(base.Driver):
         :param image_id: Image ID
         """
         path = self.get_image_filepath(image_id)
+        compressed = self.is_compressed(image_id)
         with open(path, 'rb') as cache_file:
-            yield cache_file
+            yield compression.open_reader(cache_file, compressed)
         now = time.time()
         with self.get_db() as db:
             db.execute("""UPDATE cached_images
@@ -383,7 +383,7 @@ class Driver(base.Driver):
         finally:
             conn.close()
 
-    def queue_image(self, image_id):
+    def queue_image(self, image_id, priority=0):
         """
         This adds a image to be cache to the queue.
 
@@ -391,6 +391,7 @@ class Driver(base.Driver):
         cached, we return False, True otherwise
 
         :param image_id: Image ID
+        :param priority: Prefetch priority, higher values are fetched first
         """
         if self.is_cached(image_id):
             msg = _("Not queueing image '%s'. Already cached.") % image_id
@@ -410,9 +411,9 @@ class Driver(base.Driver):
 
         path = self.get_image_filepath(image_id, 'queue')
 
-        # Touch the file to add it to the queue
+        # Touch the file to add it to the queue, recording its priority
         with open(path, "w") as f:
-            pass
+            f.write(str(int(priority)))
 
         return True
 
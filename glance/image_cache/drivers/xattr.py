@@ -16,21 +16,17 @@
 #    under the License.
 
 """
-Cache driver that uses xattr file tags and requires a filesystem
-that has atimes set.
+Cache driver that uses xattr file tags.
 
 Assumptions
 ===========
 
-1. Cache data directory exists on a filesytem that updates atime on
-   reads ('noatime' should NOT be set)
-
-2. Cache data directory exists on a filesystem that supports xattrs.
+1. Cache data directory exists on a filesystem that supports xattrs.
    This is optional, but highly recommended since it allows us to
    present ops with useful information pertaining to the cache, like
    human readable filenames and statistics.
 
-3. `glance-prune` is scheduled to run as a periodic job via cron. This
+2. `glance-prune` is scheduled to run as a periodic job via cron. This
     is needed to run the LRU prune strategy to keep the cache size
     within the limits set by the config file.
 
@@ -51,27 +47,53 @@ $image_cache_dir/
   incomplete/
   invalid/
   queue/
+  status/
+    index.journal
+    index.lock
+
+The sizes, access times and hits of the cache entries are kept in an
+index in the memory of each process, which is loaded from and kept up to
+date through `index.journal`. Processes append a record to the journal
+for each image they cache, read or delete, and read the records other
+processes appended since they last looked, so that the cache directory
+only has to be walked when there is no journal yet.
 """
 
 from __future__ import absolute_import
 from contextlib import contextmanager
 import datetime
 import errno
+import fcntl
+import json
 import os
 import stat
 import time
 
 import xattr
 
+from glance.common import compression
 from glance.common import exception
+from glance.common import utils
 from glance.image_cache.drivers import base
 from glance.openstack.common import cfg
 import glance.openstack.common.log as logging
 
 LOG = logging.getLogger(__name__)
 
+xattr_opts = [
+    cfg.IntOpt('image_cache_index_reconcile_interval', default=3600),
+    ]
 
 CONF = cfg.CONF
+CONF.register_opts(xattr_opts)
+
+# In-memory indexes of cache entries, keyed by cache directory
+_indexes = {}
+
+# Records beyond this many, or beyond JOURNAL_RECORDS_PER_ENTRY per cache
+# entry, make the journal be rewritten with one record per entry
+JOURNAL_MIN_RECORDS = 1000
+JOURNAL_RECORDS_PER_ENTRY = 4
 
 
 class Driver(base.Driver):
@@ -117,15 +139,202 @@ class Driver(base.Driver):
             if os.path.exists(fake_image_filepath):
                 os.unlink(fake_image_filepath)
 
+        # Driver instances sharing a cache directory within a process
+        # share its index
+        self.index = _indexes.setdefault(self.base_dir,
+                                         {'entries': {},
+                                          'loaded_at': None,
+                                          'generation': None,
+                                          'offset': 0,
+                                          'records': 0})
+        self.journal_path = os.path.join(self.status_dir, 'index.journal')
+        self.lock_path = os.path.join(self.status_dir, 'index.lock')
+
+    def get_index(self):
+        """
+        Returns the in-memory index of cached entries, mapping image ID to
+        a dict of size, last_accessed, last_modified and hits.
+
+        The index is brought up to date with the records appended to the
+        journal since it was last read. It is rebuilt by walking the cache
+        directory when there is no journal, and every
+        `image_cache_index_reconcile_interval` seconds to pick up changes
+        made to the cache directory outside of Glance.
+        """
+        index = self.index
+        interval = CONF.image_cache_index_reconcile_interval
+        if (index['loaded_at'] is not None and
+            time.time() - index['loaded_at'] > interval):
+            self.reconcile_index()
+        elif not self._read_journal():
+            self.reconcile_index()
+        elif index['records'] > max(JOURNAL_MIN_RECORDS,
+                                    JOURNAL_RECORDS_PER_ENTRY *
+                                    len(index['entries'])):
+            self._compact_journal()
+        return index['entries']
+
+    def reconcile_index(self):
+        """
+        Rebuild the index of cached entries from the cache directory,
+        keeping the access times and hits recorded in the journal.
+        """
+        LOG.debug(_("Indexing cached image entries."))
+        with self._journal_lock(fcntl.LOCK_EX):
+            self._read_journal()
+            known = self.index['entries']
+            entries = {}
+            for path in get_all_regular_files(self.base_dir):
+                image_id = os.path.basename(path)
+                entry = self._make_index_entry(path)
+                if entry is None:
+                    continue
+                if image_id in known:
+                    entry['last_accessed'] = known[image_id]['last_accessed']
+                    entry['hits'] = known[image_id]['hits']
+                entries[image_id] = entry
+            self.index['entries'] = entries
+            self._write_journal()
+        self.index['loaded_at'] = time.time()
+
+    @contextmanager
+    def _journal_lock(self, operation):
+        """
+        Holds the journal lock. Appending to the journal takes it shared,
+        and rewriting the journal exclusively, so no record is appended to
+        a journal being replaced.
+        """
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_journal(self):
+        """
+        Applies the records appended to the journal since it was last
+        read, or all of them if the journal was rewritten since.
+
+        :retval False if there is no journal, True otherwise
+        """
+        index = self.index
+        try:
+            journal = open(self.journal_path, 'rb')
+        except IOError, e:
+            if e.errno == errno.ENOENT:
+                return False
+            raise
+        with journal:
+            header = journal.readline()
+            try:
+                generation = json.loads(header)[1]
+            except (ValueError, IndexError):
+                return False
+            if generation != index['generation']:
+                index.update(entries={}, generation=generation,
+                             offset=journal.tell(), records=0,
+                             loaded_at=time.time())
+            journal.seek(index['offset'])
+            data = journal.read()
+        # A record being appended is only read once it is complete
+        data = data[:data.rfind('\n') + 1]
+        for line in data.splitlines():
+            self._apply_record(json.loads(line))
+            index['records'] += 1
+        index['offset'] += len(data)
+        return True
+
+    def _apply_record(self, record):
+        entries = self.index['entries']
+        op, image_id = record[0], record[1]
+        if op == 'entry':
+            entries[image_id] = dict(zip(('size', 'last_accessed',
+                                          'last_modified', 'hits'),
+                                         record[2:]))
+        elif op == 'add':
+            entries[image_id] = {'size': record[2],
+                                 'last_accessed': record[3],
+                                 'last_modified': record[3],
+                                 'hits': 0}
+        elif op == 'hit' and image_id in entries:
+            entries[image_id]['hits'] += 1
+            entries[image_id]['last_accessed'] = max(
+                entries[image_id]['last_accessed'], record[2])
+        elif op == 'delete':
+            entries.pop(image_id, None)
+
+    def _append_record(self, *record):
+        """
+        Appends a record of a change to the cache to the journal, and
+        applies it and any records other processes appended before it.
+        """
+        line = json.dumps(record) + '\n'
+        with self._journal_lock(fcntl.LOCK_SH):
+            if not os.path.exists(self.journal_path):
+                # The journal is written when the index is first built
+                return
+            with open(self.journal_path, 'ab') as journal:
+                journal.write(line)
+        self._read_journal()
+
+    def _compact_journal(self):
+        with self._journal_lock(fcntl.LOCK_EX):
+            self._read_journal()
+            self._write_journal()
+
+    def _write_journal(self):
+        """
+        Replaces the journal with one record per entry of the index. Must
+        be called holding the journal lock exclusively.
+        """
+        index = self.index
+        generation = utils.generate_uuid()
+        tmp_path = self.journal_path + '.tmp'
+        with open(tmp_path, 'wb') as journal:
+            journal.write(json.dumps(['journal', generation]) + '\n')
+            for image_id, entry in index['entries'].iteritems():
+                journal.write(json.dumps(['entry', image_id, entry['size'],
+                                          entry['last_accessed'],
+                                          entry['last_modified'],
+                                          entry['hits']]) + '\n')
+            offset = journal.tell()
+        os.rename(tmp_path, self.journal_path)
+        index.update(generation=generation, offset=offset,
+                     records=len(index['entries']))
+
+    def _make_index_entry(self, path):
+        try:
+            file_info = os.stat(path)
+        except OSError:
+            return None
+        # Files not in the journal were cached outside of Glance, and are
+        # taken to have last been accessed when they were written
+        return {'size': file_info[stat.ST_SIZE],
+                'last_accessed': file_info[stat.ST_MTIME],
+                'last_modified': file_info[stat.ST_MTIME],
+                'hits': int(get_xattr(path, 'hits', default=0))}
+
+    def _index_entry(self, image_id):
+        """
+        Returns the index entry for an image, adding it to the index if
+        it was cached outside of Glance.
+        """
+        index = self.get_index()
+        entry = index.get(str(image_id))
+        if entry is None:
+            entry = self._make_index_entry(self.get_image_filepath(image_id))
+            if entry is not None:
+                self._append_record('add', str(image_id), entry['size'],
+                                    entry['last_modified'])
+                entry = self.index['entries'].get(str(image_id))
+        return entry
+
     def get_cache_size(self):
         """
         Returns the total size in bytes of the image cache.
         """
-        sizes = []
-        for path in get_all_regular_files(self.base_dir):
-            file_info = os.stat(path)
-            sizes.append(file_info[stat.ST_SIZE])
-        return sum(sizes)
+        return sum(entry['size'] for entry in self.get_index().values())
 
     def get_hit_count(self, image_id):
         """
@@ -136,8 +345,8 @@ class Driver(base.Driver):
         if not self.is_cached(image_id):
             return 0
 
-        path = self.get_image_filepath(image_id)
-        return int(get_xattr(path, 'hits', default=0))
+        entry = self._index_entry(image_id)
+        return entry['hits'] if entry else 0
 
     def get_cached_images(self):
         """
@@ -145,22 +354,17 @@ class Driver(base.Driver):
         """
         LOG.debug(_("Gathering cached image entries."))
         entries = []
-        for path in get_all_regular_files(self.base_dir):
-            image_id = os.path.basename(path)
-
+        for image_id, index_entry in sorted(self.get_index().items()):
             entry = {}
             entry['image_id'] = image_id
-
-            file_info = os.stat(path)
             entry['last_modified'] = iso8601_from_timestamp(
-                file_info[stat.ST_MTIME])
+                index_entry['last_modified'])
             entry['last_accessed'] = iso8601_from_timestamp(
-                file_info[stat.ST_ATIME])
-            entry['size'] = file_info[stat.ST_SIZE]
-            entry['hits'] = self.get_hit_count(image_id)
+                index_entry['last_accessed'])
+            entry['size'] = index_entry['size']
+            entry['hits'] = index_entry['hits']
 
             entries.append(entry)
-        entries.sort()  # Order by ID
         return entries
 
     def is_cached(self, image_id):
@@ -172,6 +376,16 @@ class Driver(base.Driver):
         """
         return os.path.exists(self.get_image_filepath(image_id))
 
+    def is_compressed(self, image_id):
+        """
+        Returns True if the image with the supplied ID had its image
+        file compressed when it was cached.
+
+        :param image_id: Image ID
+        """
+        path = self.get_image_filepath(image_id)
+        return get_xattr(path, 'compressed', default='0') == '1'
+
     def is_cacheable(self, image_id):
         """
         Returns True if the image with the supplied ID can have its
@@ -208,6 +422,7 @@ class Driver(base.Driver):
         for path in get_all_regular_files(self.base_dir):
             delete_cached_file(path)
             deleted += 1
+        self.reconcile_index()
         return deleted
 
     def delete_cached_image(self, image_id):
@@ -216,8 +431,10 @@ class Driver(base.Driver):
 
         :param image_id: Image ID
         """
+        self.get_index()
         path = self.get_image_filepath(image_id)
         delete_cached_file(path)
+        self._append_record('delete', str(image_id))
 
     def delete_all_queued_images(self):
         """
@@ -243,18 +460,12 @@ class Driver(base.Driver):
         Return a tuple containing the image_id and size of the least recently
         accessed cached file, or None if no cached files.
         """
-        stats = []
-        for path in get_all_regular_files(self.base_dir):
-            file_info = os.stat(path)
-            stats.append((file_info[stat.ST_ATIME],  # access time
-                          file_info[stat.ST_SIZE],   # size in bytes
-                          path))                     # absolute path
-
-        if not stats:
+        index = self.get_index()
+        if not index:
             return None
 
-        stats.sort()
-        return os.path.basename(stats[0][2]), stats[0][1]
+        image_id = min(index, key=lambda i: (index[i]['last_accessed'], i))
+        return image_id, index[image_id]['size']
 
     @contextmanager
     def open_for_write(self, image_id):
@@ -277,7 +488,10 @@ class Driver(base.Driver):
                         "'%(incomplete_path)s' to '%(final_path)s'"),
                          dict(incomplete_path=incomplete_path,
                               final_path=final_path))
+            self.get_index()
             os.rename(incomplete_path, final_path)
+            self._append_record('add', str(image_id),
+                                os.path.getsize(final_path), time.time())
 
             # Make sure that we "pop" the image from the queue...
             if self.is_queued(image_id):
@@ -296,7 +510,14 @@ class Driver(base.Driver):
 
         try:
             with open(incomplete_path, 'wb') as cache_file:
+                if CONF.image_cache_compress:
+                    set_attr('compressed', 1)
+                    cache_file = compression.CompressedWriter(
+                            cache_file, name=_("cached image %s") % image_id)
+                elif CONF.image_cache_sparse:
+                    cache_file = utils.SparseWriter(cache_file)
                 yield cache_file
+                cache_file.flush()
         except Exception as e:
             rollback(e)
             raise
@@ -320,12 +541,16 @@ class Driver(base.Driver):
         :param image_id: Image ID
         """
         path = self.get_image_filepath(image_id)
+        compressed = self.is_compressed(image_id)
         with open(path, 'rb') as cache_file:
-            yield cache_file
+            yield compression.open_reader(cache_file, compressed)
         path = self.get_image_filepath(image_id)
         inc_xattr(path, 'hits', 1)
 
-    def queue_image(self, image_id):
+        if self._index_entry(image_id) is not None:
+            self._append_record('hit', str(image_id), time.time())
+
+    def queue_image(self, image_id, priority=0):
         """
         This adds a image to be cache to the queue.
 
@@ -333,6 +558,7 @@ class Driver(base.Driver):
         cached, we return False, True otherwise
 
         :param image_id: Image ID
+        :param priority: Prefetch priority, higher values are fetched first
         """
         if self.is_cached(image_id):
             msg = _("Not queueing image '%s'. Already cached.") % image_id
@@ -353,9 +579,9 @@ class Driver(base.Driver):
         path = self.get_image_filepath(image_id, 'queue')
         LOG.debug(_("Queueing image '%s'."), image_id)
 
-        # Touch the file to add it to the queue
+        # Touch the file to add it to the queue, recording its priority
         with open(path, "w") as f:
-            pass
+            f.write(str(int(priority)))
 
         return True
 
@@ -19,34 +19,135 @@
 Prefetches images into the Image Cache
 """
 
+import time
+
 import eventlet
 
 from glance.common import exception
 from glance import context
 from glance.image_cache import base
+from glance.openstack.common import cfg
 import glance.openstack.common.log as logging
+from glance.openstack.common import timeutils
 from glance import registry
 import glance.store
-import glance.store.filesystem
 from glance.store import get_from_backend
-import glance.store.http
-import glance.store.rbd
-import glance.store.s3
-import glance.store.swift
 
 
 LOG = logging.getLogger(__name__)
 
+prefetcher_opts = [
+    cfg.IntOpt('image_cache_prefetch_concurrency', default=4),
+    cfg.IntOpt('image_cache_prefetch_bandwidth', default=0),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(prefetcher_opts)
+
+# Minimum number of seconds between progress reports written while
+# image data is being fetched
+PROGRESS_INTERVAL = 1.0
+
+# The outcomes of fetching a queued image, each counted in the progress
+# reports. Skipped images are left queued for a later run.
+CACHED = 'cached'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+class BandwidthLimiter(object):
+
+    """
+    Limits the aggregate rate at which image data is read by all the
+    greenthreads sharing the limiter.
+    """
+
+    def __init__(self, rate):
+        """
+        :param rate: Maximum bytes per second, or 0 for no limit
+        """
+        self.rate = rate
+        self.next_free = 0
+
+    def consume(self, nbytes):
+        """
+        Account for nbytes of data, sleeping until the limiter has the
+        capacity to have transferred them.
+        """
+        if not self.rate:
+            return
+        now = time.time()
+        start = max(now, self.next_free)
+        self.next_free = start + float(nbytes) / self.rate
+        if start > now:
+            eventlet.sleep(start - now)
+
+    def throttle(self, image_iter):
+        for chunk in image_iter:
+            self.consume(len(chunk))
+            yield chunk
+
 
 class Prefetcher(base.CacheApp):
 
-    def __init__(self):
+    def __init__(self, popularity=None):
+        """
+        :param popularity: Optional mapping of image ID to a predicted
+                           popularity score, used to order queued images
+                           of equal priority
+        """
         glance.store.create_stores()
         super(Prefetcher, self).__init__()
         registry.configure_registry_client()
         registry.configure_registry_admin_creds()
+        self.popularity = popularity or {}
+        self.concurrency = max(CONF.image_cache_prefetch_concurrency, 1)
+        self.limiter = BandwidthLimiter(CONF.image_cache_prefetch_bandwidth)
+        self.free_space = 0
+        self.status = {}
+        self.last_report = 0
+
+    def order_queue(self, entries):
+        """
+        Order queued images for fetching: highest explicit priority first,
+        then highest predicted popularity, then longest queued.
+
+        :param entries: Queue records as returned by
+                        `ImageCache.get_queue_entries`
+        :retval A list of image IDs
+        """
+        def sort_key(entry):
+            return (-entry['priority'],
+                    -self.popularity.get(entry['image_id'], 0),
+                    entry['queued_at'])
+
+        return [entry['image_id'] for entry in sorted(entries, key=sort_key)]
+
+    def _report(self, force=False):
+        now = time.time()
+        if not force and now - self.last_report < PROGRESS_INTERVAL:
+            return
+        self.last_report = now
+        self.status['updated_at'] = timeutils.isotime()
+        try:
+            self.cache.set_prefetch_status(self.status)
+        except (IOError, OSError), e:
+            LOG.warn(_("Failed to record prefetch progress: %s") % e)
+
+    def _track(self, image_id, image_iter):
+        progress = self.status['in_progress'][image_id]
+        for chunk in image_iter:
+            progress['bytes_fetched'] += len(chunk)
+            self.status['bytes_fetched'] += len(chunk)
+            self._report()
+            yield chunk
 
     def fetch_image_into_cache(self, image_id):
+        """
+        Fetch a queued image into the cache.
+
+        :retval CACHED, FAILED or SKIPPED
+        """
         ctx = context.RequestContext(is_admin=True, show_deleted=True)
 
         try:
@@ -54,20 +155,60 @@ class Prefetcher(base.CacheApp):
             if image_meta['status'] != 'active':
                 LOG.warn(_("Image '%s' is not active. Not caching."),
                          image_id)
-                return False
+                return FAILED
 
         except exception.NotFound:
             LOG.warn(_("No metadata found for image '%s'"), image_id)
-            return False
-
-        image_data, image_size = get_from_backend(ctx, image_meta['location'])
-        LOG.debug(_("Caching image '%s'"), image_id)
-        self.cache.cache_image_iter(image_id, image_data)
-        return True
+            return FAILED
+
+        if self.cache.is_cached(image_id):
+            LOG.debug(_("Image '%s' is already cached."), image_id)
+            return CACHED
+
+        image_size = image_meta.get('size') or 0
+        if image_size > self.free_space:
+            LOG.warn(_("Image '%(image_id)s' of %(image_size)d bytes does "
+                       "not fit in the %(free_space)d bytes free in the "
+                       "cache. Not caching.") %
+                     {'image_id': image_id, 'image_size': image_size,
+                      'free_space': self.free_space})
+            return SKIPPED
+
+        # Reserve the space while the image is fetched, so concurrent
+        # fetches do not overcommit the cache
+        self.free_space -= image_size
+        self.status['in_progress'][image_id] = {'size': image_size,
+                                                'bytes_fetched': 0}
+        self._report(force=True)
+        try:
+            image_data, image_size = get_from_backend(ctx,
+                                                      image_meta['location'])
+            LOG.debug(_("Caching image '%s'"), image_id)
+            image_iter = self._track(image_id,
+                                     self.limiter.throttle(image_data))
+            if self.cache.cache_image_iter(image_id, image_iter):
+                return CACHED
+            # Another process is caching the image
+            LOG.debug(_("Image '%s' is being cached. Skipping."), image_id)
+            result = SKIPPED
+        except Exception:
+            LOG.exception(_("Failed to prefetch image '%s'"), image_id)
+            result = FAILED
+        finally:
+            del self.status['in_progress'][image_id]
+
+        self.free_space += image_meta.get('size') or 0
+        return result
+
+    def _fetch(self, image_id):
+        result = self.fetch_image_into_cache(image_id)
+        self.status[result] += 1
+        self._report(force=True)
+        return result
 
     def run(self):
 
-        images = self.cache.get_queued_images()
+        images = self.order_queue(self.cache.get_queue_entries())
         if not images:
             LOG.debug(_("Nothing to prefetch."))
             return True
@@ -75,13 +216,33 @@ class Prefetcher(base.CacheApp):
         num_images = len(images)
         LOG.debug(_("Found %d images to prefetch"), num_images)
 
-        pool = eventlet.GreenPool(num_images)
-        results = pool.imap(self.fetch_image_into_cache, images)
-        successes = sum([1 for r in results if r is True])
-        if successes != num_images:
+        self.free_space = max(CONF.image_cache_max_size -
+                              self.cache.get_cache_size(), 0)
+        self.status = {'state': 'running',
+                       'started_at': timeutils.isotime(),
+                       'total': num_images,
+                       'cached': 0,
+                       'failed': 0,
+                       'skipped': 0,
+                       'bytes_fetched': 0,
+                       'in_progress': {}}
+        self._report(force=True)
+
+        pool = eventlet.GreenPool(min(self.concurrency, num_images))
+        list(pool.imap(self._fetch, images))
+
+        self.status['state'] = 'finished'
+        self._report(force=True)
+
+        if self.status['skipped']:
+            LOG.warn(_("Skipped %d queued images that do not fit in the "
+                       "cache or are being cached by another process"),
+                     self.status['skipped'])
+
+        if self.status['failed']:
             LOG.error(_("Failed to successfully cache all "
                         "images in queue."))
             return False
 
-        LOG.info(_("Successfully cached all %d images"), num_images)
+        LOG.info(_("Successfully cached %d images"), self.status['cached'])
         return True
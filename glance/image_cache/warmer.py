@@ -0,0 +1,166 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Warms the Image Cache with the images that are most popular across a set
+of API nodes
+"""
+
+from glance import client as glance_client
+from glance.image_cache import prefetcher
+from glance.openstack.common import cfg
+import glance.openstack.common.log as logging
+
+LOG = logging.getLogger(__name__)
+
+warmer_opts = [
+    cfg.ListOpt('image_cache_warmer_peers', default=[]),
+    cfg.IntOpt('image_cache_warmer_top_n', default=20),
+    cfg.IntOpt('image_cache_warmer_budget', default=0),
+    cfg.FloatOpt('image_cache_warmer_decay', default=0.5),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(warmer_opts)
+
+# Scores that have decayed below this are forgotten
+MIN_SCORE = 0.01
+
+
+class Warmer(prefetcher.Prefetcher):
+
+    """
+    Ranks images by the cache hits recorded on this node and its peers,
+    then queues and prefetches the top ranked images that fit within a
+    byte budget.
+
+    The ranking is kept between runs: each run decays the previous scores
+    and adds the hits recorded since the last run, so it is meant to be
+    run periodically, like the pruner.
+    """
+
+    def __init__(self):
+        super(Warmer, self).__init__()
+        self.peers = [peer.strip() for peer in CONF.image_cache_warmer_peers
+                      if peer.strip()]
+        self.top_n = CONF.image_cache_warmer_top_n
+        self.budget = (CONF.image_cache_warmer_budget or
+                       CONF.image_cache_max_size)
+        self.decay = CONF.image_cache_warmer_decay
+
+    def get_peer_client(self, peer):
+        host, _sep, port = peer.partition(':')
+        return glance_client.get_client(host, port=int(port or 9292),
+                                        username=CONF.admin_user,
+                                        password=CONF.admin_password,
+                                        tenant=CONF.admin_tenant_name,
+                                        auth_url=CONF.auth_url,
+                                        auth_strategy=CONF.auth_strategy,
+                                        region=CONF.auth_region,
+                                        is_silent_upload=True)
+
+    def observe(self):
+        """
+        Collect the cached image records, including hit counts, of this
+        node and each reachable peer.
+
+        :retval A mapping of source name to a list of cached image records
+        """
+        observations = {'local': self.cache.get_cached_images()}
+        for peer in self.peers:
+            try:
+                client = self.get_peer_client(peer)
+                observations[peer] = client.get_cached_images()
+            except Exception, e:
+                msg = _("Unable to get cache hits from %(peer)s: %(e)s")
+                LOG.warn(msg % {'peer': peer, 'e': e})
+        return observations
+
+    def update_ranking(self, observations):
+        """
+        Fold a round of observations into the stored popularity ranking.
+
+        :param observations: Mapping as returned by `observe`
+        :retval The updated ranking
+        """
+        ranking = self.cache.get_status('warmer')
+        sources = ranking.get('sources', {})
+        sizes = ranking.get('sizes', {})
+        scores = dict((image_id, score * self.decay)
+                      for image_id, score in ranking.get('scores', {}).items())
+
+        for source, records in observations.items():
+            seen = sources.get(source, {})
+            current = {}
+            for record in records:
+                image_id = record['image_id']
+                hits = record.get('hits') or 0
+                current[image_id] = hits
+                # A drop in hits means the entry was pruned and cached
+                # again since the last observation
+                new_hits = hits - seen.get(image_id, 0)
+                if new_hits < 0:
+                    new_hits = hits
+                scores[image_id] = scores.get(image_id, 0) + new_hits
+                if record.get('size'):
+                    sizes[image_id] = record['size']
+            sources[source] = current
+
+        scores = dict((image_id, score) for image_id, score in scores.items()
+                      if score >= MIN_SCORE)
+        sizes = dict((image_id, size) for image_id, size in sizes.items()
+                     if image_id in scores)
+        ranking = {'sources': sources, 'scores': scores, 'sizes': sizes}
+        self.cache.set_status('warmer', ranking)
+        return ranking
+
+    def select(self, ranking):
+        """
+        Pick the highest scoring images whose combined size fits within
+        the byte budget.
+
+        :param ranking: Ranking as returned by `update_ranking`
+        :retval A list of image IDs, most popular first
+        """
+        scores = ranking['scores']
+        sizes = ranking['sizes']
+        selected = []
+        total_size = 0
+        for image_id in sorted(scores, key=scores.get, reverse=True):
+            if len(selected) >= self.top_n:
+                break
+            size = sizes.get(image_id, 0)
+            if total_size + size > self.budget:
+                continue
+            selected.append(image_id)
+            total_size += size
+        return selected
+
+    def run(self):
+        ranking = self.update_ranking(self.observe())
+        self.popularity = ranking['scores']
+
+        queued = 0
+        for image_id in self.select(ranking):
+            if (self.cache.is_cached(image_id) or
+                self.cache.is_queued(image_id)):
+                continue
+            if self.cache.queue_image(image_id):
+                queued += 1
+
+        LOG.info(_("Queued %d popular images for warming"), queued)
+        return super(Warmer, self).run()
@@ -49,19 +49,34 @@ class Notifier(object):
     def __init__(self, strategy=None):
         _strategy = CONF.notifier_strategy
         try:
-            strategy = _STRATEGY_ALIASES[_strategy]
+            self.strategy_name = _STRATEGY_ALIASES[_strategy]
             msg = _('Converted strategy alias %s to %s')
-            LOG.debug(msg % (_strategy, strategy))
+            LOG.debug(msg % (_strategy, self.strategy_name))
         except KeyError:
-            strategy = _strategy
-            LOG.debug(_('No strategy alias found for %s') % strategy)
-
+            self.strategy_name = _strategy
+            LOG.debug(_('No strategy alias found for %s') % _strategy)
+            # Other strategies are imported now, so that a mistyped one is
+            # reported at startup; the aliased ones are known to exist.
+            self._import_strategy()
+        self._strategy = None
+
+    def _import_strategy(self):
         try:
-            strategy_class = importutils.import_class(strategy)
+            return importutils.import_class(self.strategy_name)
         except ImportError:
-            raise exception.InvalidNotifierStrategy(strategy=strategy)
-        else:
-            self.strategy = strategy_class()
+            raise exception.InvalidNotifierStrategy(
+                    strategy=self.strategy_name)
+
+    @property
+    def strategy(self):
+        """
+        The strategy messages are sent with, imported and created when the
+        first is, as strategies connect to their message brokers when
+        created.
+        """
+        if self._strategy is None:
+            self._strategy = self._import_strategy()()
+        return self._strategy
 
     @staticmethod
     def generate_message(event_type, priority, payload):
@@ -32,6 +32,9 @@ class API(wsgi.Router):
         mapper.resource("image", "images", controller=images_resource,
                         collection={'detail': 'GET'})
         mapper.connect("/", controller=images_resource, action="index")
+        mapper.connect("/images", controller=images_resource,
+                       action="update_all",
+                       conditions=dict(method=["PUT"]))
 
         members_resource = members.create_resource()
         mapper.resource("member", "members", controller=members_resource,
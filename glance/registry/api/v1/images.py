@@ -403,6 +403,52 @@ class Controller(object):
                                content_type='text/plain')
 
 
+    @utils.mutating
+    def update_all(self, req, body):
+        """
+        Updates a batch of existing images with the registry in a single
+        request.
+
+        :param req: wsgi Request object
+        :param body: Dictionary of the form {'images': [image_data, ...]}
+                     where each image_data mapping carries the 'id' of the
+                     image to update along with the attributes to change
+
+        :retval Returns the updated image information as a list of mappings.
+                Images that could not be found or are not visible to the
+                requester are skipped. If any image's update is invalid,
+                none of the images are updated.
+        """
+        try:
+            images_data = body['images']
+        except (KeyError, TypeError):
+            msg = _("Expected a list of images to update")
+            raise exc.HTTPBadRequest(explanation=msg)
+
+        updates = []
+        for image_data in images_data:
+            image_data = dict(image_data)
+            id = image_data.pop('id', None)
+            if not id:
+                msg = _("Each image to update must have an id")
+                raise exc.HTTPBadRequest(explanation=msg)
+
+            # Prohibit modification of 'owner'
+            if not req.context.is_admin and 'owner' in image_data:
+                del image_data['owner']
+            updates.append((id, image_data))
+
+        try:
+            updated = self.db_api.image_update_all(req.context, updates)
+        except exception.Invalid, e:
+            msg = (_("Failed to update image metadata. "
+                     "Got error: %(e)s") % locals())
+            LOG.error(msg)
+            raise exc.HTTPBadRequest(msg)
+
+        return dict(images=[make_image_dict(image) for image in updated])
+
+
 def make_image_dict(image):
     """
     Create a dict representation of an image which we can use to
@@ -74,10 +74,8 @@ class Controller(object):
         self._check_can_access_image_members(req.context)
 
         # Make sure the image exists
-        session = self.db_api.get_session()
         try:
-            image = self.db_api.image_get(req.context, image_id,
-                                          session=session)
+            image = self.db_api.image_get(req.context, image_id)
         except exception.NotFound:
             raise webob.exc.HTTPNotFound()
         except exception.Forbidden:
@@ -102,63 +100,24 @@ class Controller(object):
             msg = _("Invalid membership association: %s") % e
             raise webob.exc.HTTPBadRequest(explanation=msg)
 
-        add = []
-        existing = {}
+        members = []
         # Walk through the incoming memberships
         for memb in memb_list:
             try:
-                datum = dict(image_id=image['id'],
-                             member=memb['member_id'],
-                             can_share=None)
+                datum = dict(member=memb['member_id'], can_share=None)
             except Exception, e:
                 # Malformed entity...
                 msg = _("Invalid membership association: %s") % e
                 raise webob.exc.HTTPBadRequest(explanation=msg)
 
-            # Figure out what can_share should be
+            # Figure out what can_share should be; existing memberships
+            # keep theirs unless it is given
             if 'can_share' in memb:
                 datum['can_share'] = bool(memb['can_share'])
+            members.append(datum)
 
-            # Try to find the corresponding membership
-            members = self.db_api.image_member_find(req.context,
-                                                    image_id=datum['image_id'],
-                                                    member=datum['member'],
-                                                    session=session)
-            try:
-                member = members[0]
-            except IndexError:
-                # Default can_share
-                datum['can_share'] = bool(datum['can_share'])
-                add.append(datum)
-            else:
-                # Are we overriding can_share?
-                if datum['can_share'] is None:
-                    datum['can_share'] = members[0]['can_share']
-
-                existing[member['id']] = {
-                    'values': datum,
-                    'membership': member,
-                }
-
-        # We now have a filtered list of memberships to add and
-        # memberships to modify.  Let's start by walking through all
-        # the existing image memberships...
-        existing_members = self.db_api.image_member_find(req.context,
-                                                         image_id=image['id'])
-        for memb in existing_members:
-            if memb['id'] in existing:
-                # Just update the membership in place
-                update = existing[memb['id']]['values']
-                self.db_api.image_member_update(req.context, memb, update,
-                                                session=session)
-            else:
-                # Outdated one; needs to be deleted
-                self.db_api.image_member_delete(req.context, memb,
-                                                session=session)
-
-        # Now add the non-existant ones
-        for memb in add:
-            self.db_api.image_member_create(req.context, memb, session=session)
+        # Replace the image's memberships with those given, in one go
+        self.db_api.image_member_set_all(req.context, image['id'], members)
 
         # Make an appropriate result
         return webob.exc.HTTPNoContent()
@@ -24,6 +24,7 @@ import json
 
 from glance.common.client import BaseClient
 from glance.common import crypt
+from glance.common import metrics
 import glance.openstack.common.log as logging
 from glance.registry.api.v1 import images
 
@@ -85,8 +86,10 @@ class RegistryClient(BaseClient):
 
     def do_request(self, method, action, **kwargs):
         try:
-            res = super(RegistryClient, self).do_request(method,
-                  action, **kwargs)
+            name = 'registry.%s' % metrics.route_name(method, action)
+            with metrics.timer(name):
+                res = super(RegistryClient, self).do_request(method,
+                      action, **kwargs)
             status = res.status
             request_id = res.getheader('x-openstack-request-id')
             msg = _("Registry request %(method)s %(action)s HTTP %(status)s"\
@@ -167,6 +170,25 @@ class RegistryClient(BaseClient):
         image = data['image']
         return self.decrypt_metadata(image)
 
+    def update_images(self, images_metadata):
+        """
+        Updates Registry's information about several images in one request
+
+        :param images_metadata: list of mappings, each containing the 'id'
+                                of an image and the attributes to update
+        """
+        images_metadata = [self.encrypt_metadata(dict(image_metadata))
+                           for image_metadata in images_metadata]
+        body = json.dumps(dict(images=images_metadata))
+
+        headers = {
+            'Content-Type': 'application/json',
+        }
+
+        res = self.do_request("PUT", "/images", body=body, headers=headers)
+        data = json.loads(res.read())
+        return [self.decrypt_metadata(image) for image in data['images']]
+
     def delete_image(self, image_id):
         """
         Deletes Registry's information about an image
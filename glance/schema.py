@@ -26,23 +26,39 @@ class Schema(object):
             properties = {}
         self.properties = properties
         self.links = links
+        # Bumped whenever the properties change, so that anything compiled
+        # from the schema knows to compile it again
+        self.revision = 0
+        self._validator = None
 
     def validate(self, obj):
         try:
-            jsonschema.validate(obj, self.raw())
+            self.validator().validate(obj)
         except jsonschema.ValidationError as e:
             raise exception.InvalidObject(schema=self.name, reason=str(e))
 
+    def validator(self):
+        """
+        Returns a validator of objects against the schema, compiled, and
+        the schema itself checked, once rather than for every object.
+        """
+        if self._validator is None:
+            raw = self.raw()
+            jsonschema.Draft3Validator.check_schema(raw)
+            self._validator = jsonschema.Draft3Validator(raw)
+        return self._validator
+
     def filter(self, obj):
+        keys = self.filter_keys()
         filtered = {}
         for key, value in obj.iteritems():
-            if self._filter_func(self.properties, key) and value is not None:
+            if value is not None and (keys is None or key in keys):
                 filtered[key] = value
         return filtered
 
-    @staticmethod
-    def _filter_func(properties, key):
-        return key in properties
+    def filter_keys(self):
+        """Returns the keys `filter` keeps, or None if it keeps any key."""
+        return frozenset(self.properties)
 
     def merge_properties(self, properties):
         # Ensure custom props aren't attempting to override base props
@@ -58,6 +74,8 @@ class Schema(object):
             raise exception.SchemaLoadError(reason=reason % {'props': props})
 
         self.properties.update(properties)
+        self.revision += 1
+        self._validator = None
 
     def raw(self):
         raw = {
@@ -71,9 +89,8 @@ class Schema(object):
 
 
 class PermissiveSchema(Schema):
-    @staticmethod
-    def _filter_func(properties, key):
-        return True
+    def filter_keys(self):
+        return None
 
     def raw(self):
         raw = super(PermissiveSchema, self).raw()
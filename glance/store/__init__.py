@@ -15,21 +15,22 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import os
 import sys
 import time
 
 from glance.common import exception
-from glance.common import utils
+from glance.common import metrics
 from glance.openstack.common import cfg
 from glance.openstack.common import importutils
 import glance.openstack.common.log as logging
 from glance import registry
 from glance.store import location
+from glance.store import scrub_queue
 
 LOG = logging.getLogger(__name__)
 
 store_opts = [
+    cfg.StrOpt('default_store', default='file'),
     cfg.ListOpt('known_stores',
                 default=['glance.store.filesystem.Store',
                          'glance.store.http.Store',
@@ -46,6 +47,16 @@ store_opts = [
 CONF = cfg.CONF
 CONF.register_opts(store_opts)
 
+# The schemes of the stores Glance ships, so that they can be registered
+# without being imported until one of their schemes is first used
+STORE_SCHEMES = {
+    'glance.store.filesystem.Store': ('file', 'filesystem'),
+    'glance.store.http.Store': ('http', 'https'),
+    'glance.store.rbd.Store': ('rbd',),
+    'glance.store.s3.Store': ('s3', 's3+http', 's3+https'),
+    'glance.store.swift.Store': ('swift+https', 'swift', 'swift+http'),
+}
+
 
 class ImageAddResult(object):
 
@@ -152,10 +163,26 @@ def _get_store_class(store_entry):
     return store_cls
 
 
+def _register_lazily(store_entry):
+    """
+    Registers the schemes of one of the stores Glance ships, to be
+    imported when one of them is first used.
+    """
+    schemes = STORE_SCHEMES[store_entry]
+    LOG.debug("Registering store %s with schemes %s", store_entry, schemes)
+    # The schemes share their info, so the store is loaded once for all
+    scheme_info = {'store_entry': store_entry}
+    location.register_scheme_map(dict((scheme, scheme_info)
+                                      for scheme in schemes))
+
+
 def create_stores():
     """
     Registers all store modules and all schemes
     from the given config. Duplicates are not re-registered.
+
+    The stores Glance ships are only imported when one of their schemes
+    is first used; any other is imported and created now.
     """
     store_count = 0
     store_classes = set()
@@ -163,6 +190,14 @@ def create_stores():
         store_entry = store_entry.strip()
         if not store_entry:
             continue
+        if store_entry in STORE_SCHEMES:
+            if store_entry not in store_classes:
+                store_classes.add(store_entry)
+                _register_lazily(store_entry)
+                store_count += 1
+            else:
+                LOG.debug("Store %s already registered", store_entry)
+            continue
         store_cls = _get_store_class(store_entry)
         store_instance = store_cls()
         schemes = store_instance.get_schemes()
@@ -194,9 +229,7 @@ def get_store_from_scheme(context, scheme):
     Given a scheme, return the appropriate store object
     for handling that scheme.
     """
-    if scheme not in location.SCHEME_TO_CLS_MAP:
-        raise exception.UnknownScheme(scheme=scheme)
-    scheme_info = location.SCHEME_TO_CLS_MAP[scheme]
+    scheme_info = location.get_scheme_info(scheme)
     store = scheme_info['store_class'](context)
     return store
 
@@ -213,13 +246,80 @@ def get_store_from_uri(context, uri):
     return store
 
 
+def timer(store, operation):
+    """
+    Returns a context manager recording the time taken by an operation of
+    a store, as the metric `store.<store module>.<operation>`.
+    """
+    return metrics.timer(_metric_name(store, operation))
+
+
+def _metric_name(store, operation):
+    name = store.__class__.__module__.rsplit('.', 1)[-1]
+    return 'store.%s.%s' % (name, operation)
+
+
+class TimedIterator(object):
+
+    """
+    Wraps the data a store's get() returns, so that the time the store
+    takes to produce each chunk of it is added to the time taken to open
+    it, and recorded once the data has been iterated over. The time the
+    consumer spends between chunks is not counted. Anything else, such as
+    close(), or indexing an `Indexable`, is passed to the wrapped data
+    untimed.
+    """
+
+    def __init__(self, wrapped, name, elapsed):
+        self.wrapped = wrapped
+        self.name = name
+        self.elapsed = elapsed
+
+    def _timed(self, chunks):
+        try:
+            while True:
+                start = time.time()
+                try:
+                    chunk = chunks.next()
+                except StopIteration:
+                    return
+                finally:
+                    self.elapsed += time.time() - start
+                yield chunk
+        finally:
+            metrics.timing(self.name, self.elapsed * 1000)
+
+    def __iter__(self):
+        return self._timed(iter(self.wrapped))
+
+    def __getitem__(self, i):
+        return self.wrapped[i]
+
+    def __len__(self):
+        return len(self.wrapped)
+
+    def __getattr__(self, name):
+        attr = getattr(self.wrapped, name)
+        if name == 'iter_range':
+            # Only present when the wrapped data can read a range itself
+            return lambda start, end: self._timed(iter(attr(start, end)))
+        return attr
+
+
 def get_from_backend(context, uri, **kwargs):
     """Yields chunks of data from backend specified by uri"""
 
     store = get_store_from_uri(context, uri)
     loc = location.get_location_from_uri(uri)
 
-    return store.get(loc)
+    name = _metric_name(store, 'get')
+    start = time.time()
+    try:
+        data, size = store.get(loc)
+    except Exception:
+        metrics.timing(name, (time.time() - start) * 1000)
+        raise
+    return TimedIterator(data, name, time.time() - start), size
 
 
 def get_size_from_backend(context, uri):
@@ -228,7 +328,8 @@ def get_size_from_backend(context, uri):
     store = get_store_from_uri(context, uri)
     loc = location.get_location_from_uri(uri)
 
-    return store.get_size(loc)
+    with timer(store, 'get_size'):
+        return store.get_size(loc)
 
 
 def delete_from_backend(context, uri, **kwargs):
@@ -237,7 +338,8 @@ def delete_from_backend(context, uri, **kwargs):
     loc = location.get_location_from_uri(uri)
 
     try:
-        return store.delete(loc)
+        with timer(store, 'delete'):
+            return store.delete(loc)
     except NotImplementedError:
         raise exception.StoreDeleteNotSupported
 
@@ -274,20 +376,8 @@ def schedule_delete_from_backend(uri, context, image_id, **kwargs):
             # avoid falling through to the delayed deletion logic
             return
 
-    datadir = CONF.scrubber_datadir
     delete_time = time.time() + CONF.scrub_time
-    file_path = os.path.join(datadir, str(image_id))
-    utils.safe_mkdirs(datadir)
-
-    if os.path.exists(file_path):
-        msg = _("Image id %(image_id)s already queued for delete") % {
-                'image_id': image_id}
-        raise exception.Duplicate(msg)
-
-    with open(file_path, 'w') as f:
-        f.write('\n'.join([uri, str(int(delete_time))]))
-    os.chmod(file_path, 0600)
-    os.utime(file_path, (delete_time, delete_time))
+    scrub_queue.get_scrub_queue().add(image_id, uri, delete_time)
 
     registry.update_image_metadata(context, image_id,
                                    {'status': 'pending_delete'})
@@ -295,7 +385,8 @@ def schedule_delete_from_backend(uri, context, image_id, **kwargs):
 
 def add_to_backend(context, scheme, image_id, data, size):
     store = get_store_from_scheme(context, scheme)
-    return store.add(image_id, data, size)
+    with timer(store, 'add'):
+        return store.add(image_id, data, size)
 
 
 def set_acls(context, location_uri, public=False, read_tenants=[],
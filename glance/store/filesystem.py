@@ -20,10 +20,11 @@ A simple filesystem-backed store
 """
 
 import errno
-import hashlib
 import os
 import urlparse
 
+from glance.common import checksum as checksum_utils
+from glance.common import compression
 from glance.common import exception
 from glance.common import utils
 from glance.openstack.common import cfg
@@ -34,10 +35,30 @@ import glance.store.location
 
 LOG = logging.getLogger(__name__)
 
-datadir_opt = cfg.StrOpt('filesystem_store_datadir')
+filesystem_opts = [
+    cfg.StrOpt('filesystem_store_datadir'),
+    cfg.BoolOpt('filesystem_store_sparse', default=False),
+    cfg.BoolOpt('filesystem_store_dedup', default=False),
+    cfg.BoolOpt('filesystem_store_compress', default=False),
+    ]
 
 CONF = cfg.CONF
-CONF.register_opt(datadir_opt)
+CONF.register_opts(filesystem_opts)
+
+# Directories, inside a datadir, of the content-addressed blobs that
+# deduplicated image files are hard links to, and of the symlinks that map
+# each deduplicated image file to its blob
+BLOB_DIR = '.blobs'
+REF_DIR = '.refs'
+
+# Blobs are named by this digest of the image data and its size. Image
+# files are only linked to a blob with the same bytes, so that a digest
+# collision cannot make one image's file share another's data.
+BLOB_DIGEST = 'sha256'
+
+# Image files written compressed are named with this suffix, which is how
+# they are told apart from image data that merely looks compressed
+COMPRESSED_SUFFIX = '.glz'
 
 
 class StoreLocation(glance.store.location.StoreLocation):
@@ -79,17 +100,35 @@ class ChunkedFile(object):
 
     def __init__(self, filepath):
         self.filepath = filepath
-        self.fp = open(self.filepath, 'rb')
+        self.fp = _open_image_file(filepath)
 
     def __iter__(self):
         """Return an iterator over the image file"""
         try:
-            while True:
-                chunk = self.fp.read(ChunkedFile.CHUNKSIZE)
-                if chunk:
+            for chunk in compression.chunkiter(self.fp,
+                                               ChunkedFile.CHUNKSIZE):
+                yield chunk
+        finally:
+            self.close()
+
+    def iter_range(self, start, end):
+        """
+        Return an iterator over bytes start to end, exclusive, of the
+        image file
+        """
+        try:
+            if isinstance(self.fp, compression.CompressedReader):
+                for chunk in self.fp.iter_chunks(start, end):
                     yield chunk
-                else:
+                return
+            self.fp.seek(start)
+            pos = start
+            while pos < end:
+                chunk = self.fp.read(min(ChunkedFile.CHUNKSIZE, end - pos))
+                if not chunk:
                     break
+                yield chunk
+                pos += len(chunk)
         finally:
             self.close()
 
@@ -100,6 +139,157 @@ class ChunkedFile(object):
             self.fp = None
 
 
+def _open_image_file(filepath):
+    return compression.open_reader(open(filepath, 'rb'),
+                                   filepath.endswith(COMPRESSED_SUFFIX))
+
+
+def _get_blob_key(checksum, size):
+    return '%s-%d' % (checksum, size)
+
+
+def _get_ref_path(filepath):
+    datadir, name = os.path.split(filepath)
+    return os.path.join(datadir, REF_DIR, name)
+
+
+def _same_bytes(path, other_path, chunk_size=65536):
+    """Returns whether two files have exactly the same contents."""
+    with open(path, 'rb') as fp:
+        with open(other_path, 'rb') as other_fp:
+            if os.fstat(fp.fileno()).st_size != \
+                    os.fstat(other_fp.fileno()).st_size:
+                return False
+            while True:
+                chunk = fp.read(chunk_size)
+                if chunk != other_fp.read(chunk_size):
+                    return False
+                if not chunk:
+                    return True
+
+
+def link_to_blob(filepath, digest, size):
+    """
+    Deduplicate an image file by content: the file becomes a hard link
+    to the blob in its datadir with the same digest, size and bytes, or
+    becomes that blob if there is none yet. The blob's link count less
+    one is the number of image files sharing it.
+
+    :param filepath: Path of the image file
+    :param digest: BLOB_DIGEST hex digest of the image data
+    :param size: Size of the image data
+    :retval True if the file was replaced by a link to an existing blob
+    """
+    datadir = os.path.dirname(filepath)
+    key = _get_blob_key(digest, size)
+    blobpath = os.path.join(datadir, BLOB_DIR, key)
+    for path in (os.path.dirname(blobpath), os.path.join(datadir, REF_DIR)):
+        utils.safe_mkdirs(path)
+
+    duplicate = False
+    try:
+        os.link(filepath, blobpath)
+    except OSError, e:
+        if e.errno != errno.EEXIST:
+            raise
+        # Replace the file with a link to the existing blob. If the blob
+        # is deleted in the meantime the file just keeps its own data.
+        linkpath = filepath + '.dedup'
+        try:
+            os.link(blobpath, linkpath)
+        except OSError, e:
+            if e.errno != errno.ENOENT:
+                raise
+        else:
+            try:
+                same = _same_bytes(filepath, linkpath)
+            except Exception:
+                utils.safe_remove(linkpath)
+                raise
+            if not same:
+                # Either the digests collide or the blob was stored
+                # differently (e.g. compressed), so keep the file as is
+                utils.safe_remove(linkpath)
+                LOG.warn(_("Not deduplicating %(filepath)s: its contents "
+                           "differ from blob %(key)s") % locals())
+                return False
+            os.rename(linkpath, filepath)
+            duplicate = True
+
+    refpath = _get_ref_path(filepath)
+    utils.safe_remove(refpath)
+    os.symlink(key, refpath)
+    return duplicate
+
+
+def unlink_from_blob(filepath):
+    """
+    Release the blob a deleted image file was a link to, deleting the
+    blob once no image file links to it.
+
+    :param filepath: Path of the deleted image file
+    """
+    refpath = _get_ref_path(filepath)
+    try:
+        key = os.readlink(refpath)
+    except OSError:
+        # The image file was not deduplicated
+        return
+    utils.safe_remove(refpath)
+
+    blobpath = os.path.join(os.path.dirname(filepath), BLOB_DIR, key)
+    try:
+        if os.stat(blobpath).st_nlink == 1:
+            LOG.debug(_("Deleting unreferenced blob %s") % blobpath)
+            os.unlink(blobpath)
+    except OSError:
+        # Another delete got there first
+        pass
+
+
+def deduplicate(datadir, dry_run=False):
+    """
+    Deduplicate the existing image files in a datadir, in place.
+
+    :param datadir: The filesystem store's datadir
+    :param dry_run: Only report what would be deduplicated
+    :retval A tuple of the number of image files looked at, the number of
+            those that were duplicates, and the bytes freed
+    """
+    blobs = set()
+    files = duplicates = freed = 0
+    for name in sorted(os.listdir(datadir)):
+        filepath = os.path.join(datadir, name)
+        if name.startswith('.') or not os.path.isfile(filepath):
+            continue
+        if os.path.islink(_get_ref_path(filepath)):
+            continue
+        files += 1
+
+        info = os.stat(filepath)
+        checksum = checksum_utils.Checksum([BLOB_DIGEST])
+        size = 0
+        reader = _open_image_file(filepath)
+        try:
+            for chunk in compression.chunkiter(reader):
+                checksum.update(chunk)
+                size += len(chunk)
+        finally:
+            reader.close()
+        digest = checksum.hexdigest(BLOB_DIGEST)
+        key = _get_blob_key(digest, size)
+        blobpath = os.path.join(datadir, BLOB_DIR, key)
+        if dry_run:
+            if key in blobs or os.path.exists(blobpath):
+                duplicates += 1
+                freed += info.st_blocks * 512
+            blobs.add(key)
+        elif link_to_blob(filepath, digest, size):
+            duplicates += 1
+            freed += info.st_blocks * 512
+    return files, duplicates, freed
+
+
 class Store(glance.store.base.Store):
 
     def get_schemes(self):
@@ -170,9 +360,17 @@ class Store(glance.store.base.Store):
                 os.unlink(fn)
             except OSError:
                 raise exception.Forbidden(_("You cannot delete file %s") % fn)
+            unlink_from_blob(fn)
         else:
             raise exception.NotFound(_("Image file %s does not exist") % fn)
 
+    @staticmethod
+    def _delete_partial(filepath):
+        try:
+            os.unlink(filepath)
+        except OSError:
+            pass
+
     def add(self, image_id, image_file, image_size):
         """
         Stores an image file with supplied identifier to the backend
@@ -190,34 +388,71 @@ class Store(glance.store.base.Store):
         :note By default, the backend writes the image data to a file
               `/<DATADIR>/<ID>`, where <DATADIR> is the value of
               the filesystem_store_datadir configuration option and <ID>
-              is the supplied image ID.
+              is the supplied image ID. If filesystem_store_compress is
+              set, the data is compressed and the file named
+              `/<DATADIR>/<ID>.glz`, or else if
+              filesystem_store_sparse is set, chunks of zeros are left as
+              holes in the file rather than written. If
+              filesystem_store_dedup is set, the file is then
+              replaced by a hard link to any stored image file with the
+              same data.
         """
 
         filepath = os.path.join(self.datadir, str(image_id))
 
-        if os.path.exists(filepath):
-            raise exception.Duplicate(_("Image file %s already exists!")
-                                      % filepath)
+        for path in (filepath, filepath + COMPRESSED_SUFFIX):
+            if os.path.exists(path):
+                raise exception.Duplicate(_("Image file %s already exists!")
+                                          % path)
+
+        if CONF.filesystem_store_compress:
+            filepath += COMPRESSED_SUFFIX
 
-        checksum = hashlib.md5()
+        algorithms = None
+        if CONF.filesystem_store_dedup:
+            algorithms = [BLOB_DIGEST]
+        checksum = checksum_utils.Checksum(algorithms)
         bytes_written = 0
         try:
             with open(filepath, 'wb') as f:
+                if CONF.filesystem_store_compress:
+                    f = compression.CompressedWriter(
+                            f, checksum, name=_("image %s") % image_id)
+                elif CONF.filesystem_store_sparse:
+                    f = utils.SparseWriter(f)
                 for buf in utils.chunkreadable(image_file,
                                               ChunkedFile.CHUNKSIZE):
                     bytes_written += len(buf)
                     checksum.update(buf)
                     f.write(buf)
+                f.flush()
         except IOError as e:
+            self._delete_partial(filepath)
             if e.errno in [errno.EFBIG, errno.ENOSPC]:
                 raise exception.StorageFull()
             elif e.errno == errno.EACCES:
                 raise exception.StorageWriteDenied()
             else:
                 raise
+        except Exception:
+            # Reading the image data failed, so do not leave behind a
+            # partial file that would make another attempt a duplicate
+            self._delete_partial(filepath)
+            raise
 
         checksum_hex = checksum.hexdigest()
 
         LOG.debug(_("Wrote %(bytes_written)d bytes to %(filepath)s with "
-                    "checksum %(checksum_hex)s") % locals())
+                    "checksums %(checksum)s") % locals())
+
+        if CONF.filesystem_store_dedup:
+            try:
+                if link_to_blob(filepath, checksum.hexdigest(BLOB_DIGEST),
+                                bytes_written):
+                    LOG.info(_("Image %(image_id)s has the same data as a "
+                               "stored image, sharing it") % locals())
+            except OSError, e:
+                # The image is stored, just not deduplicated
+                LOG.error(_("Failed to deduplicate %(filepath)s: %(e)s") %
+                          locals())
         return ('file://%s' % filepath, bytes_written, checksum_hex)
@@ -43,6 +43,7 @@ import urlparse
 
 from glance.common import exception
 from glance.common import utils
+from glance.openstack.common import importutils
 import glance.openstack.common.log as logging
 
 LOG = logging.getLogger(__name__)
@@ -69,13 +70,41 @@ def get_location_from_uri(uri):
         file:///var/lib/glance/images/1
     """
     pieces = urlparse.urlparse(uri)
-    if pieces.scheme not in SCHEME_TO_CLS_MAP.keys():
-        raise exception.UnknownScheme(pieces.scheme)
-    scheme_info = SCHEME_TO_CLS_MAP[pieces.scheme]
+    scheme_info = get_scheme_info(pieces.scheme)
     return Location(pieces.scheme, uri=uri,
                     store_location_class=scheme_info['location_class'])
 
 
+def get_scheme_info(scheme):
+    """
+    Given a scheme, returns its store and location classes, importing a
+    store registered by name when one of its schemes is first used.
+
+    :raises `glance.common.exception.UnknownScheme` if the scheme is not
+            registered, or its store cannot be imported
+    """
+    if scheme not in SCHEME_TO_CLS_MAP:
+        raise exception.UnknownScheme(scheme=scheme)
+    scheme_info = SCHEME_TO_CLS_MAP[scheme]
+    if 'store_class' not in scheme_info:
+        store_entry = scheme_info['store_entry']
+        LOG.debug("Loading store %s for scheme %s", store_entry, scheme)
+        module_name = store_entry.rsplit('.', 1)[0]
+        try:
+            location_class = importutils.import_class(
+                    '%s.StoreLocation' % module_name)
+            store_class = importutils.import_class(store_entry)
+        except ImportError, e:
+            # As when the store is not configured, which it is not usable as
+            LOG.error(_("Unable to load store %(store)s for scheme "
+                        "%(scheme)s: %(error)s") %
+                      {'store': store_entry, 'scheme': scheme, 'error': e})
+            raise exception.UnknownScheme(scheme=scheme)
+        scheme_info['location_class'] = location_class
+        scheme_info['store_class'] = store_class
+    return scheme_info
+
+
 def register_scheme_map(scheme_map):
     """
     Given a mapping of 'scheme' to store_name, adds the mapping to the
@@ -20,23 +20,21 @@
 from __future__ import absolute_import
 from __future__ import with_statement
 
-import hashlib
 import math
 import urllib
 import urlparse
 
+from glance.common import checksum as checksum_utils
 from glance.common import exception
+from glance.common import utils
 from glance.openstack.common import cfg
 import glance.openstack.common.log as logging
 import glance.store
 import glance.store.base
 import glance.store.location
 
-try:
-    import rados
-    import rbd
-except ImportError:
-    pass
+rados = utils.LazyModule('rados')
+rbd = utils.LazyModule('rbd')
 
 DEFAULT_POOL = 'rbd'
 DEFAULT_CONFFILE = ''  # librados will locate the default conf file
@@ -219,7 +217,7 @@ class Store(glance.store.base.Store):
         :raises `glance.common.exception.Duplicate` if the image already
                 existed
         """
-        checksum = hashlib.md5()
+        checksum = checksum_utils.Checksum()
         image_name = str(image_id)
         with rados.Rados(conffile=self.conf_file, rados_id=self.user) as conn:
             fsid = None
@@ -247,6 +245,8 @@ class Store(glance.store.base.Store):
                         image.create_snap(location.snapshot)
                         image.protect_snap(location.snapshot)
 
+        LOG.debug(_("Wrote %(image_size)d bytes to RBD image "
+                    "%(image_name)s with checksums %(checksum)s") % locals())
         return (location.get_uri(), image_size, checksum.hexdigest())
 
     def delete(self, location):
@@ -17,13 +17,16 @@
 
 """Storage backend for S3 or Storage Servers that follow the S3 Protocol"""
 
-import hashlib
 import httplib
 import re
 import tempfile
 import urlparse
 
+from eventlet import semaphore
+
+from glance.common import checksum as checksum_utils
 from glance.common import exception
+from glance.common import metrics
 from glance.common import utils
 from glance.openstack.common import cfg
 import glance.openstack.common.log as logging
@@ -45,6 +48,14 @@ s3_opts = [
 CONF = cfg.CONF
 CONF.register_opts(s3_opts)
 
+# The S3 connections of the process to the configured store, keeping their
+# HTTP connections alive between requests, and their handles of the
+# configured bucket. Locations with other hosts, credentials or buckets,
+# which users can supply, are not cached so that they cannot grow these.
+_CONNECTIONS = {}
+_BUCKETS = {}
+_LOCK = semaphore.Semaphore()
+
 
 class StoreLocation(glance.store.location.StoreLocation):
 
@@ -284,11 +295,8 @@ class Store(glance.store.base.Store):
 
     def _retrieve_key(self, location):
         loc = location.store_location
-        from boto.s3.connection import S3Connection
-
-        s3_conn = S3Connection(loc.accesskey, loc.secretkey,
-                               host=loc.s3serviceurl,
-                               is_secure=(loc.scheme == 's3+https'))
+        s3_conn = get_connection(loc.s3serviceurl, loc.accesskey,
+                                 loc.secretkey, loc.scheme == 's3+https')
         bucket_obj = get_bucket(s3_conn, loc.bucket)
 
         key = get_key(bucket_obj, loc.key)
@@ -325,8 +333,6 @@ class Store(glance.store.base.Store):
             <BUCKET> = ``s3_store_bucket``
             <ID> = The id of the image being added
         """
-        from boto.s3.connection import S3Connection
-
         loc = StoreLocation({'scheme': self.scheme,
                              'bucket': self.bucket,
                              'key': image_id,
@@ -334,13 +340,9 @@ class Store(glance.store.base.Store):
                              'accesskey': self.access_key,
                              'secretkey': self.secret_key})
 
-        s3_conn = S3Connection(loc.accesskey, loc.secretkey,
-                               host=loc.s3serviceurl,
-                               is_secure=(loc.scheme == 's3+https'))
-
-        create_bucket_if_missing(self.bucket, s3_conn)
-
-        bucket_obj = get_bucket(s3_conn, self.bucket)
+        s3_conn = get_connection(loc.s3serviceurl, loc.accesskey,
+                                 loc.secretkey, loc.scheme == 's3+https')
+        bucket_obj = get_bucket(s3_conn, self.bucket, create_missing=True)
         obj_name = str(image_id)
 
         def _sanitize(uri):
@@ -349,7 +351,7 @@ class Store(glance.store.base.Store):
                           uri)
 
         key = bucket_obj.get_key(obj_name)
-        if key and key.exists():
+        if key:
             raise exception.Duplicate(_("S3 already has an image at "
                                       "location %s") %
                                       _sanitize(loc.get_uri()))
@@ -381,7 +383,7 @@ class Store(glance.store.base.Store):
 
         tmpdir = self.s3_store_object_buffer_dir
         temp_file = tempfile.NamedTemporaryFile(dir=tmpdir)
-        checksum = hashlib.md5()
+        checksum = checksum_utils.Checksum()
         for chunk in utils.chunkreadable(image_file, self.CHUNKSIZE):
             checksum.update(chunk)
             temp_file.write(chunk)
@@ -397,7 +399,7 @@ class Store(glance.store.base.Store):
         checksum_hex = checksum.hexdigest()
 
         LOG.debug(_("Wrote %(size)d bytes to S3 key named %(obj_name)s "
-                    "with checksum %(checksum_hex)s") % locals())
+                    "with checksums %(checksum)s") % locals())
 
         return (loc.get_uri(), size, checksum_hex)
 
@@ -412,10 +414,8 @@ class Store(glance.store.base.Store):
         :raises NotFound if image does not exist
         """
         loc = location.store_location
-        from boto.s3.connection import S3Connection
-        s3_conn = S3Connection(loc.accesskey, loc.secretkey,
-                               host=loc.s3serviceurl,
-                               is_secure=(loc.scheme == 's3+https'))
+        s3_conn = get_connection(loc.s3serviceurl, loc.accesskey,
+                                 loc.secretkey, loc.scheme == 's3+https')
         bucket_obj = get_bucket(s3_conn, loc.bucket)
 
         # Close the key when we're through.
@@ -431,21 +431,80 @@ class Store(glance.store.base.Store):
         return key.delete()
 
 
-def get_bucket(conn, bucket_id):
+def _is_configured_store(host, access_key, secret_key):
+    """Whether a host and credentials are those of the configured store."""
+    configured_host = re.sub('^https?://', '', CONF.s3_store_host or '')
+    return ((host, access_key, secret_key) ==
+            (configured_host.strip('/'),
+             (CONF.s3_store_access_key or '').encode('utf-8'),
+             (CONF.s3_store_secret_key or '').encode('utf-8')))
+
+
+def get_connection(host, access_key, secret_key, is_secure):
     """
-    Get a bucket from an s3 connection
+    Get an S3 connection for a host and credentials. The connection to the
+    configured store is shared by all requests, reusing its HTTP
+    connections to the host; a new one is made for any other.
+
+    :param host: The S3 service host
+    :param access_key: The S3 access key
+    :param secret_key: The S3 secret key
+    :param is_secure: Whether to connect over HTTPS
+    """
+    from boto.s3.connection import S3Connection
+
+    if not _is_configured_store(host, access_key, secret_key):
+        metrics.increment('s3.connections.created')
+        return S3Connection(access_key, secret_key, host=host,
+                            is_secure=is_secure)
+
+    key = (host, access_key, secret_key, is_secure)
+    with _LOCK:
+        conn = _CONNECTIONS.get(key)
+        if conn is None:
+            conn = S3Connection(access_key, secret_key, host=host,
+                                is_secure=is_secure)
+            _CONNECTIONS[key] = conn
+            metrics.increment('s3.connections.created')
+        else:
+            metrics.increment('s3.connections.reused')
+    return conn
+
+
+def clear_connections():
+    """Forget the S3 connections of the process and their buckets."""
+    with _LOCK:
+        _CONNECTIONS.clear()
+        _BUCKETS.clear()
+
+
+def get_bucket(conn, bucket_id, create_missing=False):
+    """
+    Get a bucket from an s3 connection. The handle is not checked against
+    S3, so a missing bucket is only found out by the requests for its keys.
+    The handle of the configured bucket on a shared connection is cached.
 
     :param conn: The ``boto.s3.connection.S3Connection``
     :param bucket_id: ID of the bucket to fetch
-    :raises ``glance.exception.NotFound`` if bucket is not found.
+    :param create_missing: Whether to check the bucket exists, creating
+                           it if ``s3_store_create_bucket_on_put`` is set,
+                           before its handle is first cached
     """
-
-    bucket = conn.get_bucket(bucket_id)
-    if not bucket:
-        msg = _("Could not find bucket with ID %(bucket_id)s") % locals()
-        LOG.error(msg)
-        raise exception.NotFound(msg)
-
+    with _LOCK:
+        cacheable = (bucket_id == CONF.s3_store_bucket and
+                     any(c is conn for c in _CONNECTIONS.values()))
+        key = (id(conn), create_missing)
+        bucket = _BUCKETS.get(key) if cacheable else None
+    if bucket is not None:
+        return bucket
+
+    if create_missing:
+        create_bucket_if_missing(bucket_id, conn)
+    bucket = conn.get_bucket(bucket_id, validate=False)
+
+    if cacheable:
+        with _LOCK:
+            _BUCKETS[key] = bucket
     return bucket
 
 
@@ -505,7 +564,7 @@ def get_key(bucket, obj):
     """
 
     key = bucket.get_key(obj)
-    if not key or not key.exists():
+    if not key:
         msg = _("Could not find key %(obj)s in bucket %(bucket)s") % locals()
         LOG.error(msg)
         raise exception.NotFound(msg)
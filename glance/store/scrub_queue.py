@@ -0,0 +1,198 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack, LLC
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Delayed delete queue shared by the API servers and the scrubber, kept in
+a SQLite database indexed by delete time.
+"""
+
+from __future__ import absolute_import
+from contextlib import contextmanager
+import os
+
+import sqlite3
+
+from glance.common import exception
+from glance.common.sqlite import SqliteConnection
+from glance.common import utils
+from glance.openstack.common import cfg
+import glance.openstack.common.log as logging
+
+LOG = logging.getLogger(__name__)
+
+scrub_queue_opts = [
+    cfg.StrOpt('scrubber_queue_db', default='scrub_queue.db'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(scrub_queue_opts)
+
+_QUEUES = {}
+
+
+def get_scrub_queue(datadir=None):
+    """
+    Returns the queue kept in the supplied directory, or in the configured
+    scrubber_datadir, setting up its database only the first time it is
+    asked for.
+    """
+    datadir = datadir or CONF.scrubber_datadir
+    queue = _QUEUES.get(datadir)
+    if queue is None or not os.path.exists(queue.db_path):
+        queue = _QUEUES[datadir] = ScrubQueue(datadir)
+    return queue
+
+
+class ScrubQueue(object):
+
+    """
+    Queue of image locations waiting to be deleted from their backend
+    store. Entries are keyed by image id and indexed by delete time, so
+    collecting the work that is due never needs to look at entries that
+    are not.
+    """
+
+    def __init__(self, datadir=None):
+        self.datadir = datadir or CONF.scrubber_datadir
+        self.db_path = os.path.join(self.datadir, CONF.scrubber_queue_db)
+        utils.safe_mkdirs(self.datadir)
+        self.initialize_db()
+
+    def initialize_db(self):
+        try:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                                   factory=SqliteConnection)
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS scrub_queue (
+                    image_id TEXT PRIMARY KEY,
+                    uri TEXT NOT NULL,
+                    delete_time INTEGER NOT NULL,
+                    attempts INTEGER DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS ix_scrub_queue_delete_time
+                    ON scrub_queue (delete_time);
+            """)
+            conn.close()
+            # Queued locations can embed the credentials of the stores
+            os.chmod(self.db_path, 0600)
+        except sqlite3.DatabaseError, e:
+            msg = _("Failed to initialize the scrubber queue database. "
+                    "Got error: %s") % e
+            LOG.error(msg)
+            raise exception.BadStoreConfiguration(store_name='scrubber',
+                                                  reason=msg)
+
+    @contextmanager
+    def get_db(self):
+        """
+        Returns a context manager that produces a database connection that
+        self-closes and calls rollback if an error occurs while using the
+        database connection
+        """
+        conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                               factory=SqliteConnection)
+        conn.text_factory = str
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        try:
+            yield conn
+        except sqlite3.IntegrityError:
+            # Left to the caller, which knows what the constraint means
+            conn.rollback()
+            raise
+        except sqlite3.DatabaseError, e:
+            msg = _("Error executing SQLite call. Got error: %s") % e
+            LOG.error(msg)
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def add(self, image_id, uri, delete_time):
+        """
+        Queue the deletion of an image's data.
+
+        :param image_id: Image ID
+        :param uri: Location of the image data in its backend store
+        :param delete_time: Time (seconds since the epoch) after which the
+                            data may be deleted
+        :raises `glance.common.exception.Duplicate` if the image is
+                already queued
+        """
+        try:
+            with self.get_db() as db:
+                db.execute("""INSERT INTO scrub_queue
+                           (image_id, uri, delete_time)
+                           VALUES (?, ?, ?)""",
+                           (str(image_id), uri, int(delete_time)))
+                db.commit()
+        except sqlite3.IntegrityError:
+            msg = _("Image id %(image_id)s already queued for delete") % {
+                    'image_id': image_id}
+            raise exception.Duplicate(msg)
+
+    def requeue(self, image_id, uri, delete_time):
+        """
+        Queue, or re-queue after a failed attempt, the deletion of an
+        image's data.
+        """
+        with self.get_db() as db:
+            cur = db.execute("""UPDATE scrub_queue
+                             SET uri = ?, delete_time = ?,
+                                 attempts = attempts + 1
+                             WHERE image_id = ?""",
+                             (uri, int(delete_time), str(image_id)))
+            if not cur.rowcount:
+                db.execute("""INSERT INTO scrub_queue
+                           (image_id, uri, delete_time, attempts)
+                           VALUES (?, ?, ?, 1)""",
+                           (str(image_id), uri, int(delete_time)))
+            db.commit()
+
+    def get_due(self, now, limit=None):
+        """
+        Returns a list of (image_id, uri, delete_time) tuples for the
+        queued deletes whose delete time has passed, oldest first.
+
+        :param now: Current time (seconds since the epoch)
+        :param limit: Optional maximum number of entries to return
+        """
+        query = """SELECT image_id, uri, delete_time FROM scrub_queue
+                   WHERE delete_time <= ? ORDER BY delete_time"""
+        params = (int(now),)
+        if limit is not None:
+            query += " LIMIT ?"
+            params += (int(limit),)
+        with self.get_db() as db:
+            return [tuple(row) for row in db.execute(query, params)]
+
+    def remove(self, image_ids):
+        """
+        Remove the supplied image ids from the queue.
+
+        :param image_ids: Iterable of image IDs
+        """
+        with self.get_db() as db:
+            db.executemany("""DELETE FROM scrub_queue WHERE image_id = ?""",
+                           [(str(image_id),) for image_id in image_ids])
+            db.commit()
+
+    def depth(self):
+        """Returns the number of queued deletes, due or not."""
+        with self.get_db() as db:
+            return db.execute("""SELECT COUNT(*) FROM scrub_queue"""
+                              ).fetchone()[0]
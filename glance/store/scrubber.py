@@ -19,23 +19,27 @@ import calendar
 import eventlet
 import os
 import time
+import urlparse
 
+from glance.api import uploads
 from glance import context
+from glance.common import exception
 from glance.common import utils
 from glance.openstack.common import cfg
 import glance.openstack.common.log as logging
 from glance import registry
 from glance import store
-import glance.store.filesystem
-import glance.store.http
-import glance.store.s3
-import glance.store.swift
+from glance.store import scrub_queue
 
 LOG = logging.getLogger(__name__)
 
 scrubber_opts = [
     cfg.BoolOpt('cleanup_scrubber', default=False),
-    cfg.IntOpt('cleanup_scrubber_time', default=86400)
+    cfg.IntOpt('cleanup_scrubber_time', default=86400),
+    cfg.IntOpt('scrubber_store_concurrency', default=10),
+    cfg.FloatOpt('scrubber_store_rate_limit', default=0.0),
+    cfg.ListOpt('scrubber_store_limits', default=[]),
+    cfg.IntOpt('scrubber_registry_batch_size', default=100),
     ]
 
 CONF = cfg.CONF
@@ -67,6 +71,60 @@ class Daemon(object):
         LOG.debug(_("Next run scheduled in %s seconds") % self.wakeup_time)
 
 
+class StoreThrottle(object):
+
+    """
+    Bounds the number of deletes in flight against a single backend store
+    and, optionally, the rate at which new deletes are started.
+    """
+
+    def __init__(self, concurrency, rate=0):
+        """
+        :param concurrency: Maximum number of concurrent deletes
+        :param rate: Maximum number of deletes started per second, or 0
+                     for no limit
+        """
+        self.semaphore = eventlet.semaphore.Semaphore(max(concurrency, 1))
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self.next_start = 0
+
+    def __enter__(self):
+        self.semaphore.acquire()
+        if self.interval:
+            now = time.time()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+            if start > now:
+                eventlet.sleep(start - now)
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.semaphore.release()
+
+
+def parse_store_limits(limits):
+    """
+    Parse `scrubber_store_limits` entries of the form
+    <scheme>:<concurrency>[:<deletes per second>] into a mapping
+    of scheme to (concurrency, rate).
+    """
+    store_limits = {}
+    for limit in limits:
+        parts = limit.strip().split(':')
+        try:
+            if len(parts) not in (2, 3):
+                raise ValueError(limit)
+            rate = float(parts[2]) if len(parts) == 3 else 0
+            store_limits[parts[0]] = (int(parts[1]), rate)
+        except ValueError:
+            msg = _("Invalid scrubber_store_limits entry '%s'. Expected "
+                    "<scheme>:<concurrency>[:<rate>]") % limit
+            LOG.error(msg)
+            raise exception.BadStoreConfiguration(store_name='scrubber',
+                                                  reason=msg)
+    return store_limits
+
+
 class Scrubber(object):
     CLEANUP_FILE = ".cleanup"
 
@@ -74,6 +132,8 @@ class Scrubber(object):
         self.datadir = CONF.scrubber_datadir
         self.cleanup = CONF.cleanup_scrubber
         self.cleanup_time = CONF.cleanup_scrubber_time
+        self.batch_size = max(CONF.scrubber_registry_batch_size, 1)
+        self.store_limits = parse_store_limits(CONF.scrubber_store_limits)
         # configs for registry API store auth
         self.admin_user = CONF.admin_user
         self.admin_tenant = CONF.admin_tenant_name
@@ -90,7 +150,9 @@ class Scrubber(object):
         ctx = context.RequestContext()
         self.registry = registry.get_registry_client(ctx)
 
-        utils.safe_mkdirs(self.datadir)
+        self.queue = scrub_queue.ScrubQueue(self.datadir)
+        self.throttles = {}
+        self.stats = {}
 
         store.create_stores()
 
@@ -101,48 +163,134 @@ class Scrubber(object):
             LOG.info(_("%s does not exist") % self.datadir)
             return
 
-        delete_work = []
-        for root, dirs, files in os.walk(self.datadir):
-            for id in files:
-                if id == self.CLEANUP_FILE:
-                    continue
-
-                file_name = os.path.join(root, id)
-                delete_time = os.stat(file_name).st_mtime
-
-                if delete_time > now:
-                    continue
-
-                uri, delete_time = read_queue_file(file_name)
+        self._import_queue_files()
 
-                if delete_time > now:
-                    continue
-
-                delete_work.append((id, uri, now))
+        delete_work = [(id, uri, now)
+                       for id, uri, delete_time in self.queue.get_due(now)]
 
         LOG.info(_("Deleting %s images") % len(delete_work))
-        pool.starmap(self._delete, delete_work)
+        self.stats = self._scrub(pool, delete_work)
 
         if self.cleanup:
             self._cleanup(pool)
 
+        reaped = uploads.reap()
+        if reaped:
+            LOG.info(_("Discarded %s abandoned uploads") % reaped)
+
+    def _import_queue_files(self):
+        """
+        Move delete requests queued as one file per image, as done by
+        earlier releases, into the queue database.
+        """
+        for id in os.listdir(self.datadir):
+            if not utils.is_uuid_like(id):
+                continue
+
+            file_path = os.path.join(self.datadir, id)
+            try:
+                uri, delete_time = read_queue_file(file_path)
+                self.queue.add(id, uri, delete_time)
+            except exception.Duplicate:
+                pass
+            except (IOError, ValueError):
+                msg = _("Ignoring unreadable scrubber queue file %s")
+                LOG.warn(msg % file_path)
+                continue
+            utils.safe_remove(file_path)
+
+    def _get_throttle(self, uri):
+        scheme = urlparse.urlparse(uri).scheme
+        if scheme not in self.throttles:
+            default = (CONF.scrubber_store_concurrency,
+                       CONF.scrubber_store_rate_limit)
+            concurrency, rate = self.store_limits.get(scheme, default)
+            self.throttles[scheme] = StoreThrottle(concurrency, rate)
+        return self.throttles[scheme]
+
+    def _scrub(self, pool, delete_work):
+        """
+        Delete the supplied images from their stores, marking those that
+        were removed as deleted in the registry in batches.
+
+        :param pool: GreenPool to run the deletes in
+        :param delete_work: List of (id, uri, now) tuples
+        :retval A mapping of statistics about the run
+        """
+        start = time.time()
+        latencies = []
+        deleted = []
+        for id, latency in pool.starmap(self._delete, delete_work):
+            if latency is None:
+                continue
+            latencies.append(latency)
+            deleted.append(id)
+            if len(deleted) >= self.batch_size:
+                self._mark_deleted(deleted)
+                deleted = []
+        if deleted:
+            self._mark_deleted(deleted)
+
+        stats = {'queue_depth': self.queue.depth(),
+                 'due': len(delete_work),
+                 'deleted': len(latencies),
+                 'failed': len(delete_work) - len(latencies),
+                 'run_time': time.time() - start,
+                 'delete_latency_avg': 0.0,
+                 'delete_latency_max': 0.0}
+        if latencies:
+            stats['delete_latency_avg'] = sum(latencies) / len(latencies)
+            stats['delete_latency_max'] = max(latencies)
+
+        LOG.info(_("Scrubbed %(deleted)d of %(due)d images (%(failed)d "
+                   "failed) in %(run_time).2fs, %(queue_depth)d remain "
+                   "queued. Delete latency: avg %(delete_latency_avg).3fs, "
+                   "max %(delete_latency_max).3fs") % stats)
+        return stats
+
     def _delete(self, id, uri, now):
-        file_path = os.path.join(self.datadir, str(id))
+        """
+        Delete an image's data from its backend store.
+
+        :retval A tuple of the image id and the time taken to delete it,
+                or None in place of the time if the delete failed and has
+                been queued for another attempt.
+        """
+        LOG.debug(_("Deleting %(uri)s") % {'uri': uri})
+        # Here we create a request context with credentials to support
+        # delayed delete when using multi-tenant backend storage
+        ctx = context.RequestContext(auth_tok=self.registry.auth_tok,
+                                     user=self.admin_user,
+                                     tenant=self.admin_tenant)
+        with self._get_throttle(uri):
+            start = time.time()
+            try:
+                store.delete_from_backend(ctx, uri)
+            except exception.NotFound:
+                msg = _("Image %(id)s was already gone from store "
+                        "(%(uri)s).")
+                LOG.warn(msg % {'id': id, 'uri': uri})
+            except Exception:
+                msg = _("Failed to delete image from store (%(uri)s).")
+                LOG.exception(msg % {'uri': uri})
+                self.queue.requeue(id, uri, now)
+                return id, None
+            return id, time.time() - start
+
+    def _mark_deleted(self, ids):
+        """
+        Set the status of a batch of scrubbed images to deleted with a
+        single registry request, then drop them from the queue.
+        """
         try:
-            LOG.debug(_("Deleting %(uri)s") % {'uri': uri})
-            # Here we create a request context with credentials to support
-            # delayed delete when using multi-tenant backend storage
-            ctx = context.RequestContext(auth_tok=self.registry.auth_tok,
-                                         user=self.admin_user,
-                                         tenant=self.admin_tenant)
-            store.delete_from_backend(ctx, uri)
-        except store.UnsupportedBackend:
-            msg = _("Failed to delete image from store (%(uri)s).")
-            LOG.error(msg % {'uri': uri})
-            write_queue_file(file_path, uri, now)
-
-        self.registry.update_image(id, {'status': 'deleted'})
-        utils.safe_remove(file_path)
+            self.registry.update_images([{'id': id, 'status': 'deleted'}
+                                         for id in ids])
+        except Exception:
+            msg = _("Failed to mark %d scrubbed images as deleted, "
+                    "they will be retried on the next run")
+            LOG.exception(msg % len(ids))
+            return
+        self.queue.remove(ids)
 
     def _cleanup(self, pool):
         now = time.time()
@@ -184,7 +332,7 @@ class Scrubber(object):
                                 now))
 
         LOG.info(_("Deleting %s images") % len(delete_work))
-        pool.starmap(self._delete, delete_work)
+        self._scrub(pool, delete_work)
 
 
 def read_queue_file(file_path):
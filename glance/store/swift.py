@@ -19,24 +19,28 @@
 
 from __future__ import absolute_import
 
+import contextlib
 import hashlib
 import httplib
 import math
+import time
 import urllib
 import urlparse
 
+from eventlet import semaphore
+
 from glance.common import auth
+from glance.common import checksum as checksum_utils
 from glance.common import exception
+from glance.common import metrics
+from glance.common import utils
 from glance.openstack.common import cfg
 import glance.openstack.common.log as logging
 import glance.store
 import glance.store.base
 import glance.store.location
 
-try:
-    import swiftclient
-except ImportError:
-    pass
+swiftclient = utils.LazyModule('swiftclient')
 
 LOG = logging.getLogger(__name__)
 
@@ -45,6 +49,10 @@ DEFAULT_LARGE_OBJECT_SIZE = 5 * 1024  # 5GB
 DEFAULT_LARGE_OBJECT_CHUNK_SIZE = 200  # 200M
 ONE_MB = 1000 * 1024
 
+# Seconds an idle connection is kept, which should be less than the time
+# after which the Swift proxy or a load balancer in front of it drops it
+IDLE_TIMEOUT = 30
+
 swift_opts = [
     cfg.BoolOpt('swift_enable_snet', default=False),
     cfg.StrOpt('swift_store_auth_address'),
@@ -60,6 +68,8 @@ swift_opts = [
     cfg.BoolOpt('swift_store_create_container_on_put', default=False),
     cfg.BoolOpt('swift_store_multi_tenant', default=False),
     cfg.ListOpt('swift_store_admin_tenants', default=[]),
+    cfg.IntOpt('swift_store_auth_token_ttl', default=3600),
+    cfg.IntOpt('swift_store_connection_pool_size', default=10),
     ]
 
 CONF = cfg.CONF
@@ -202,6 +212,161 @@ class StoreLocation(glance.store.location.StoreLocation):
         return full_url
 
 
+class Session(object):
+
+    """
+    The auth token of a Swift account and idle connections to its storage
+    URL, shared by the requests of a server process so that they neither
+    authenticate nor connect to Swift each time. A token is reused until
+    `swift_store_auth_token_ttl` seconds after it was issued, or until
+    Swift rejects it, when the connection using it authenticates again.
+    """
+
+    def __init__(self):
+        self.lock = semaphore.Semaphore()
+        self.url = None
+        self.token = None
+        self.expires = 0
+        self.idle = []
+
+    def checkout(self, make_connection, storage_url=None, token=None):
+        """
+        Returns an idle connection, or a new one made by make_connection,
+        authenticated with the cached token unless one is given.
+        """
+        conn = None
+        stale = []
+        with self.lock:
+            now = time.time()
+            while self.idle and conn is None:
+                conn, idle_since = self.idle.pop()
+                if now - idle_since > IDLE_TIMEOUT:
+                    stale.append(conn)
+                    conn = None
+            if token is None and now < self.expires:
+                storage_url, token = self.url, self.token
+                metrics.increment('swift.auth.hits')
+            elif token is None:
+                metrics.increment('swift.auth.misses')
+        for stale_conn in stale:
+            _close(stale_conn)
+        if conn is None:
+            conn = make_connection()
+            metrics.increment('swift.connections.created')
+        else:
+            metrics.increment('swift.connections.reused')
+        conn.session = self
+        conn.url, conn.token = storage_url, token
+        conn.checkout_token = token
+        return conn
+
+    def checkin(self, conn, reusable=True):
+        """
+        Takes back a connection, caching any token it got, and keeps it
+        alive for the next request unless reusable is False, as when it
+        failed part way through a response, or the pool is full.
+        """
+        with self.lock:
+            if conn.token and conn.token != conn.checkout_token:
+                if conn.checkout_token:
+                    metrics.increment('swift.auth.refreshes')
+                self.url, self.token = conn.url, conn.token
+                self.expires = time.time() + CONF.swift_store_auth_token_ttl
+            if (reusable and
+                len(self.idle) < CONF.swift_store_connection_pool_size):
+                self.idle.append((conn, time.time()))
+                return
+        _close(conn)
+
+
+def _close(conn):
+    if conn.http_conn:
+        try:
+            conn.http_conn[1].close()
+        except Exception:
+            pass
+        conn.http_conn = None
+
+
+_SESSIONS = {}
+_SESSIONS_LOCK = semaphore.Semaphore()
+
+
+def get_session(key):
+    """Returns the session of the account or storage URL key identifies."""
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(key)
+        if session is None:
+            session = _SESSIONS[key] = Session()
+        return session
+
+
+def clear_sessions():
+    """Forgets all cached tokens and closes idle connections."""
+    with _SESSIONS_LOCK:
+        sessions = _SESSIONS.values()
+        _SESSIONS.clear()
+    for session in sessions:
+        for conn, _idle_since in session.idle:
+            _close(conn)
+
+
+@contextlib.contextmanager
+def checked_out(conn):
+    """
+    Returns a connection to its session after the block using it, keeping
+    it alive unless the block failed with other than an error response
+    from Swift, which is read in full.
+    """
+    try:
+        yield conn
+    except swiftclient.ClientException:
+        conn.session.checkin(conn)
+        raise
+    except Exception:
+        conn.session.checkin(conn, reusable=False)
+        raise
+    else:
+        conn.session.checkin(conn)
+
+
+class ResponseIndexable(glance.store.Indexable):
+
+    """
+    The contents of an object, which return the connection they are read
+    from to its session once read. It can only be reused if they have all
+    been read.
+    """
+
+    def __init__(self, wrapped, size, conn):
+        super(ResponseIndexable, self).__init__(wrapped, size)
+        self.conn = conn
+
+    def _checkin(self, reusable):
+        if self.conn is not None:
+            self.conn.session.checkin(self.conn, reusable=reusable)
+            self.conn = None
+
+    def __iter__(self):
+        finished = False
+        try:
+            for self.chunk in self.wrapped:
+                yield self.chunk
+            finished = True
+        finally:
+            self._checkin(finished)
+
+    def another(self):
+        try:
+            return self.wrapped.next()
+        except StopIteration:
+            self._checkin(True)
+            return ''
+        except Exception:
+            self._checkin(False)
+            raise
+
+
 class Store(glance.store.base.Store):
     """An implementation of the swift backend adapter."""
 
@@ -289,22 +454,19 @@ class Store(glance.store.base.Store):
                 container=loc.container, obj=loc.obj,
                 resp_chunk_size=self.CHUNKSIZE)
         except swiftclient.ClientException, e:
+            swift_conn.session.checkin(swift_conn)
             if e.http_status == httplib.NOT_FOUND:
                 uri = location.get_store_uri()
                 raise exception.NotFound(_("Swift could not find image at "
                                          "uri %(uri)s") % locals())
             else:
                 raise
-
-        class ResponseIndexable(glance.store.Indexable):
-            def another(self):
-                try:
-                    return self.wrapped.next()
-                except StopIteration:
-                    return ''
-
+        except Exception:
+            swift_conn.session.checkin(swift_conn, reusable=False)
+            raise
+        # The connection is in use until the contents have been read
         length = resp_headers.get('content-length')
-        return (ResponseIndexable(resp_body, length), length)
+        return (ResponseIndexable(resp_body, length, swift_conn), length)
 
     def get_size(self, location):
         """
@@ -319,8 +481,9 @@ class Store(glance.store.base.Store):
         swift_conn = self._swift_connection_for_location(loc)
 
         try:
-            resp_headers = swift_conn.head_object(container=loc.container,
-                                                  obj=loc.obj)
+            with checked_out(swift_conn):
+                resp_headers = swift_conn.head_object(
+                        container=loc.container, obj=loc.obj)
             return resp_headers.get('content-length', 0)
         except Exception:
             return 0
@@ -342,7 +505,9 @@ class Store(glance.store.base.Store):
     def _make_swift_connection(self, auth_url, user, key, storage_url=None,
                                token=None):
         """
-        Creates a connection using the Swift client library.
+        Checks out a connection, made using the Swift client library, from
+        the session of the account or storage URL. It must be returned
+        with `Session.checkin` once the request using it is done.
 
         :param auth_url The authentication for v1 style Swift auth or
                         v2 style Keystone auth.
@@ -371,13 +536,24 @@ class Store(glance.store.base.Store):
 
         if self.multi_tenant:
             #NOTE: multi-tenant supports v2 auth only
-            return swiftclient.Connection(
-                None, user, None, preauthurl=storage_url, preauthtoken=token,
-                snet=snet, tenant_name=tenant_name, auth_version='2')
+            def make_connection():
+                return swiftclient.Connection(
+                    None, user, None, preauthurl=storage_url,
+                    preauthtoken=token, snet=snet, tenant_name=tenant_name,
+                    auth_version='2')
+
+            # The token is the user's own, so only connections are shared
+            session = get_session((storage_url,))
+            return session.checkout(make_connection, storage_url, token)
         else:
-            return swiftclient.Connection(
-                full_auth_url, user, key, snet=snet,
-                tenant_name=tenant_name, auth_version=auth_version)
+            def make_connection():
+                return swiftclient.Connection(
+                    full_auth_url, user, key, snet=snet,
+                    tenant_name=tenant_name, auth_version=auth_version)
+
+            session = get_session((full_auth_url, user, key, tenant_name,
+                                   auth_version, snet))
+            return session.checkout(make_connection)
 
     def _option_get(self, param):
         result = getattr(CONF, param)
@@ -427,7 +603,11 @@ class Store(glance.store.base.Store):
         swift_conn = self._make_swift_connection(
             self.full_auth_address, self.user, self.key,
             storage_url=self.storage_url, token=self.token)
+        with checked_out(swift_conn):
+            return self._add_object(swift_conn, image_id, image_file,
+                                    image_size)
 
+    def _add_object(self, swift_conn, image_id, image_file, image_size):
         obj_name = str(image_id)
         if self.multi_tenant:
             # NOTE: When using multi-tenant we create containers for each
@@ -471,7 +651,7 @@ class Store(glance.store.base.Store):
                                 "segmented object to Swift."))
                     total_chunks = '?'
 
-                checksum = hashlib.md5()
+                checksum = checksum_utils.Checksum()
                 combined_chunks_size = 0
                 while True:
                     chunk_size = self.large_object_chunk_size
@@ -526,6 +706,9 @@ class Store(glance.store.base.Store):
                 swift_conn.put_object(container, obj_name,
                                       None, headers=headers)
                 obj_etag = checksum.hexdigest()
+                LOG.debug(_("Wrote %(image_size)d bytes to Swift object "
+                            "%(obj_name)s with checksums %(checksum)s") %
+                          locals())
 
             # NOTE: We return the user and key here! Have to because
             # location is used by the API server to return the actual
@@ -556,44 +739,49 @@ class Store(glance.store.base.Store):
         loc = location.store_location
         swift_conn = self._swift_connection_for_location(loc)
 
-        try:
-            # We request the manifest for the object. If one exists,
-            # that means the object was uploaded in chunks/segments,
-            # and we need to delete all the chunks as well as the
-            # manifest.
-            manifest = None
+        with checked_out(swift_conn):
             try:
-                headers = swift_conn.head_object(loc.container, loc.obj)
-                manifest = headers.get('x-object-manifest')
-            except swiftclient.ClientException, e:
-                if e.http_status != httplib.NOT_FOUND:
-                    raise
-            if manifest:
-                # Delete all the chunks before the object manifest itself
-                obj_container, obj_prefix = manifest.split('/', 1)
-                for segment in swift_conn.get_container(obj_container,
-                                                        prefix=obj_prefix)[1]:
-                    # TODO(jaypipes): This would be an easy area to parallelize
-                    # since we're simply sending off parallelizable requests
-                    # to Swift to delete stuff. It's not like we're going to
-                    # be hogging up network or file I/O here...
-                    swift_conn.delete_object(obj_container, segment['name'])
+                # We request the manifest for the object. If one exists,
+                # that means the object was uploaded in chunks/segments,
+                # and we need to delete all the chunks as well as the
+                # manifest.
+                manifest = None
+                try:
+                    headers = swift_conn.head_object(loc.container, loc.obj)
+                    manifest = headers.get('x-object-manifest')
+                except swiftclient.ClientException, e:
+                    if e.http_status != httplib.NOT_FOUND:
+                        raise
+                if manifest:
+                    # Delete all the chunks before the object manifest itself
+                    obj_container, obj_prefix = manifest.split('/', 1)
+                    segments = swift_conn.get_container(obj_container,
+                                                        prefix=obj_prefix)[1]
+                    for segment in segments:
+                        # TODO(jaypipes): This would be an easy area to
+                        # parallelize since we're simply sending off
+                        # parallelizable requests to Swift to delete stuff.
+                        # It's not like we're going to be hogging up network
+                        # or file I/O here...
+                        swift_conn.delete_object(obj_container,
+                                                 segment['name'])
 
-            else:
-                swift_conn.delete_object(loc.container, loc.obj)
+                else:
+                    swift_conn.delete_object(loc.container, loc.obj)
 
-            if self.multi_tenant:
-                #NOTE: In multi-tenant mode containers are specific to
-                # each object (Glance image)
-                swift_conn.delete_container(loc.container)
+                if self.multi_tenant:
+                    #NOTE: In multi-tenant mode containers are specific to
+                    # each object (Glance image)
+                    swift_conn.delete_container(loc.container)
 
-        except swiftclient.ClientException, e:
-            if e.http_status == httplib.NOT_FOUND:
-                uri = location.get_store_uri()
-                raise exception.NotFound(_("Swift could not find image at "
-                                         "uri %(uri)s") % locals())
-            else:
-                raise
+            except swiftclient.ClientException, e:
+                if e.http_status == httplib.NOT_FOUND:
+                    uri = location.get_store_uri()
+                    raise exception.NotFound(_("Swift could not find "
+                                               "image at uri %(uri)s") %
+                                             locals())
+                else:
+                    raise
 
     def set_acls(self, location, public=False, read_tenants=[],
                      write_tenants=[]):
@@ -611,7 +799,6 @@ class Store(glance.store.base.Store):
         """
         if self.multi_tenant:
             loc = location.store_location
-            swift_conn = self._swift_connection_for_location(loc)
             headers = {}
             if public:
                 headers['X-Container-Read'] = ".r:*"
@@ -626,8 +813,10 @@ class Store(glance.store.base.Store):
             else:
                 headers['X-Container-Write'] = ''
 
+            swift_conn = self._swift_connection_for_location(loc)
             try:
-                swift_conn.post_container(loc.container, headers=headers)
+                with checked_out(swift_conn):
+                    swift_conn.post_container(loc.container, headers=headers)
             except swiftclient.ClientException, e:
                 if e.http_status == httplib.NOT_FOUND:
                     uri = location.get_store_uri()
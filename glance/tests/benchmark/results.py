@@ -0,0 +1,266 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack, LLC
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Recording, summarizing and comparing benchmark results
+"""
+
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+RESULTS_VERSION = 1
+
+# Summary values where a larger number is an improvement; for the others
+# (latencies, CPU time) a smaller number is
+HIGHER_IS_BETTER = ('throughput_mb_s', 'requests_per_s')
+
+
+def percentile(values, pct):
+    """
+    Returns the pct'th percentile of a list of numbers, interpolating
+    between the closest ranks, or None for an empty list.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = (len(values) - 1) * pct / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+def process_cpu_time(pid):
+    """
+    Returns the user plus system CPU seconds used so far by a process,
+    or None if that cannot be determined (process gone, no /proc).
+    """
+    try:
+        with open('/proc/%d/stat' % pid) as stat_file:
+            # The command name may contain spaces, so split after it
+            fields = stat_file.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / float(
+            os.sysconf('SC_CLK_TCK'))
+    except (IOError, IndexError, ValueError):
+        return None
+
+
+class Recorder(object):
+
+    """
+    Collects the samples of one benchmark scenario: a latency and a
+    number of bytes per request, plus the CPU time used by this process
+    (and the commands it ran) and by the servers while recording, and
+    any calls the scenario counts (registry requests, for instance).
+
+    Recording may be started and stopped several times, for scenarios
+    that have set up work between their measured steps.
+    """
+
+    def __init__(self, name, **params):
+        self.name = name
+        self.params = params
+        self.latencies = []
+        self.bytes = 0
+        self.errors = 0
+        self.processes = {}
+        self.cpu = {}
+        self.calls = {}
+        self.wall_time = 0.0
+        self._started = None
+
+    def watch(self, name, pid):
+        """Include the CPU time of a server process in the results."""
+        self.processes[name] = pid
+
+    def _cpu_times(self):
+        times = {'client': sum(os.times()[:4])}
+        for name, pid in self.processes.items():
+            times[name] = process_cpu_time(pid)
+        return times
+
+    def start(self):
+        self._started = (time.time(), self._cpu_times())
+
+    def stop(self):
+        started_at, start_cpu = self._started
+        self.wall_time += time.time() - started_at
+        end_cpu = self._cpu_times()
+        for name, start in start_cpu.items():
+            if name in self.cpu and self.cpu[name] is None:
+                continue
+            if start is None or end_cpu.get(name) is None:
+                self.cpu[name] = None
+            else:
+                self.cpu[name] = (self.cpu.get(name, 0.0) +
+                                  end_cpu[name] - start)
+
+    def record(self, latency, nbytes=0):
+        self.latencies.append(latency)
+        self.bytes += nbytes
+
+    def error(self):
+        self.errors += 1
+
+    def count(self, name, calls):
+        """Add to the number of calls of some kind made while recording."""
+        self.calls[name] = self.calls.get(name, 0) + calls
+
+    def summary(self):
+        requests = len(self.latencies)
+        summary = {'params': self.params,
+                   'requests': requests,
+                   'errors': self.errors,
+                   'bytes': self.bytes,
+                   'wall_time': self.wall_time}
+        summary['latency'] = {
+            'p50': percentile(self.latencies, 50),
+            'p99': percentile(self.latencies, 99),
+            'mean': (sum(self.latencies) / requests if requests else None),
+            'max': max(self.latencies) if requests else None}
+        if self.wall_time:
+            summary['requests_per_s'] = requests / self.wall_time
+            summary['throughput_mb_s'] = (self.bytes / self.wall_time /
+                                          (1024 * 1024))
+        else:
+            summary['requests_per_s'] = summary['throughput_mb_s'] = None
+        summary['cpu_per_request'] = dict(
+            (name, (cpu / requests if cpu is not None and requests
+                    else None))
+            for name, cpu in self.cpu.items())
+        if self.calls:
+            summary['calls_per_request'] = dict(
+                (name, (float(calls) / requests if requests else None))
+                for name, calls in self.calls.items())
+        return summary
+
+
+def skipped(reason):
+    """Returns the summary of a scenario that could not be run."""
+    return {'skipped': reason}
+
+
+def get_commit():
+    """Returns the git commit of the tree being benchmarked, if any."""
+    try:
+        process = subprocess.Popen(['git', 'rev-parse', 'HEAD'],
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+        out, _err = process.communicate()
+        if process.returncode == 0:
+            return out.strip()
+    except OSError:
+        pass
+    return None
+
+
+def build_results(scenarios, options):
+    """
+    Returns the JSON-serializable results of a benchmark run.
+
+    :param scenarios: Mapping of scenario name to summary
+    :param options: Mapping of the options the run was made with
+    """
+    return {'version': RESULTS_VERSION,
+            'commit': get_commit(),
+            'date': datetime.datetime.utcnow().isoformat(),
+            'host': platform.node(),
+            'python': sys.version.split()[0],
+            'options': options,
+            'scenarios': scenarios}
+
+
+def save(results, path):
+    with open(path, 'w') as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+
+
+def load(path):
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+def _metrics(summary):
+    metrics = {}
+    for key in HIGHER_IS_BETTER:
+        metrics[key] = summary.get(key)
+    for key, value in summary.get('latency', {}).items():
+        metrics['latency_%s' % key] = value
+    for key, value in summary.get('cpu_per_request', {}).items():
+        metrics['cpu_%s' % key] = value
+    for key, value in summary.get('calls_per_request', {}).items():
+        metrics['calls_%s' % key] = value
+    return metrics
+
+
+def compare(baseline, current, threshold=10.0):
+    """
+    Compares two sets of results, scenario by scenario.
+
+    :param baseline: Results as returned by `build_results` or `load`
+    :param current: Results to compare against the baseline
+    :param threshold: Percentage by which a metric has to get worse to be
+                      reported as a regression
+    :retval A list of (scenario, metric, baseline, current, change,
+            regressed) tuples, where change is the percentage change
+    """
+    rows = []
+    for name in sorted(current['scenarios']):
+        before = baseline['scenarios'].get(name)
+        after = current['scenarios'][name]
+        if not before or 'skipped' in before or 'skipped' in after:
+            continue
+        before_metrics = _metrics(before)
+        for metric, value in sorted(_metrics(after).items()):
+            old = before_metrics.get(metric)
+            if not old or value is None:
+                continue
+            change = (value - old) * 100.0 / old
+            if metric in HIGHER_IS_BETTER:
+                regressed = change < -threshold
+            else:
+                regressed = change > threshold
+            rows.append((name, metric, old, value, change, regressed))
+    return rows
+
+
+def format_summary(name, summary):
+    if 'skipped' in summary:
+        return '%-24s skipped: %s' % (name, summary['skipped'])
+
+    def fmt(value, scale=1, unit=''):
+        if value is None:
+            return '-'
+        return '%.2f%s' % (value * scale, unit)
+
+    latency = summary['latency']
+    cpu = summary['cpu_per_request']
+    cpu_text = ' '.join('%s=%s' % (key, fmt(cpu[key], 1000, 'ms'))
+                        for key in sorted(cpu))
+    text = ('%-24s n=%d err=%d p50=%s p99=%s %s MB/s cpu/req: %s' %
+            (name, summary['requests'], summary['errors'],
+             fmt(latency['p50'], 1000, 'ms'), fmt(latency['p99'], 1000, 'ms'),
+             fmt(summary['throughput_mb_s']), cpu_text))
+    calls = summary.get('calls_per_request')
+    if calls:
+        text += ' calls/req: ' + ' '.join('%s=%s' % (key, fmt(calls[key]))
+                                          for key in sorted(calls))
+    return text
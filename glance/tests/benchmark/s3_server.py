@@ -0,0 +1,134 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack, LLC
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+A local stand-in for S3, serving objects held in memory, so that the S3
+store can be benchmarked without an S3 account.
+
+boto addresses a bucket by host name, as <bucket>.<host>, which does not
+resolve for a local server, so clients reach the stand-in as their HTTP
+proxy instead. It runs in a thread of its own, as boto's sockets block.
+"""
+
+import BaseHTTPServer
+import SocketServer
+import threading
+import urlparse
+
+# The S3 host name clients are configured with
+HOST = 's3.local'
+
+LIST_BUCKET = ('<?xml version="1.0" encoding="UTF-8"?>'
+               '<ListBucketResult '
+               'xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+               '<Name>%s</Name><IsTruncated>false</IsTruncated>'
+               '</ListBucketResult>')
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.count('connections')
+
+    def log_message(self, format, *args):
+        pass
+
+    def _target(self):
+        """Returns the bucket and object name the request is for."""
+        url = urlparse.urlparse(self.path)
+        host = (url.netloc or self.headers.get('Host', '')).split(':')[0]
+        path = url.path.lstrip('/')
+        if host.endswith('.' + HOST):
+            return host[:-len(HOST) - 1], path
+        bucket, _sep, name = path.partition('/')
+        return bucket, name
+
+    def _respond(self, status, body='', headers=None, send_body=True):
+        self.server.count('requests')
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def _read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def do_GET(self, send_body=True):
+        bucket, name = self._target()
+        if not name:
+            self._respond(200, LIST_BUCKET % bucket,
+                          {'Content-Type': 'application/xml'}, send_body)
+            return
+        data = self.server.objects.get((bucket, name))
+        if data is None:
+            self._respond(404, send_body=send_body)
+        else:
+            headers = {'ETag': '"stand-in"',
+                       'Content-Type': 'application/octet-stream'}
+            self._respond(200, data, headers, send_body)
+
+    def do_HEAD(self):
+        self.do_GET(send_body=False)
+
+    def do_PUT(self):
+        bucket, name = self._target()
+        data = self._read_body()
+        if name:
+            self.server.objects[(bucket, name)] = data
+        self._respond(200)
+
+    def do_DELETE(self):
+        bucket, name = self._target()
+        self.server.objects.pop((bucket, name), None)
+        self._respond(204)
+
+
+class S3Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    """
+    The stand-in server. `objects` maps (bucket, name) to the data of an
+    object, and `requests` and `connections` count what it has served.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), Handler)
+        self.port = self.server_address[1]
+        self.objects = {}
+        self.requests = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    def count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
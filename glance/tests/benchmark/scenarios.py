@@ -0,0 +1,652 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack, LLC
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark scenarios run against real API and Registry servers
+
+Each scenario starts its own servers, so that one scenario's leftovers
+(images, cache contents, database rows) do not affect another's numbers,
+and returns a summary as built by `glance.tests.benchmark.results`. The
+checksum, s3-first-byte, v2 schema and context scenarios are the
+exception: they measure hashing, S3 reads, the v2 API's validation and
+serialization of images, and the parsing of requests' identity headers in
+process. The startup scenarios time the programs in bin/ until they have
+imported their modules and parsed their options.
+"""
+
+import datetime
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+import uuid
+
+import eventlet
+from eventlet.green import httplib
+import webob
+
+from glance.api.middleware import context as context_middleware
+from glance.api.v2 import images as v2_images
+from glance.common import checksum as checksum_utils
+# Registers the options the v2 API reads
+from glance.common import config
+from glance.store import location
+from glance.store import s3
+from glance.tests.benchmark import results
+from glance.tests.benchmark import s3_server
+from glance.tests import functional
+from glance.tests.functional import store_utils
+
+READ_CHUNK_SIZE = 65536
+
+# Size of the images uploaded by the small upload scenario, where the
+# registry requests made for each upload dominate its latency
+SMALL_IMAGE_SIZE = 4096
+
+# The digests and buffer sizes the checksum scenarios are run with
+CHECKSUM_ALGORITHMS = (['md5'], ['md5', 'sha256'])
+CHECKSUM_BUFFER_SIZES = (4096, 65536, 1024 * 1024)
+
+# Images in each page of the v2 serialization scenario, and the custom
+# properties of each image
+V2_PAGE_SIZE = 1000
+V2_PROPERTIES = {'kernel_id': str(uuid.uuid4()), 'os_distro': 'ubuntu',
+                 'os_version': '12.04', 'architecture': 'x86_64'}
+
+# The services and regions of the service catalog of the context scenarios'
+# requests, which keystone sends in the X-Service-Catalog header
+CATALOG_SERVICES = ('compute', 'image', 'identity', 'object-store', 'volume',
+                    'ec2', 'network', 'metering')
+CATALOG_REGIONS = 4
+
+# The directory of the programs the startup scenarios run, and the most
+# times each is run, as each run takes a good fraction of a second
+BIN_DIR = 'bin'
+STARTUP_RUNS = 20
+
+# The access log lines of the servers' requests
+REQUEST_LOG_RE = re.compile(r'"(GET|HEAD|POST|PUT|DELETE) /')
+
+# How long, and how often, the registry log is read before its count of
+# requests is taken to be complete
+LOG_SETTLE_TIMEOUT = 5
+LOG_SETTLE_INTERVAL = 0.2
+
+
+class Environment(functional.FunctionalTest):
+
+    """
+    A set of running API and Registry servers to benchmark against.
+
+    This reuses the functional test fixtures, which is why it is a test
+    case; it is driven by hand rather than by a test runner.
+    """
+
+    def runTest(self):
+        pass
+
+    def start(self, store='file', flavor='', log_registry_requests=False):
+        """
+        Start the servers, storing images in the given store.
+
+        The registry only logs the requests it serves, for
+        `count_registry_requests`, if log_registry_requests is set, as
+        that logging is itself measurable.
+
+        :retval None if the servers were started, or the reason why the
+                store is unavailable
+        """
+        self.setUp()
+        if store == 'swift':
+            store_utils.setup_swift(self)
+        elif store == 's3':
+            store_utils.setup_s3(self)
+        if self.disabled:
+            self.tearDown()
+            return self.disabled_message
+
+        self.default_store = store
+        for server in (self.api_server, self.registry_server):
+            # Debug logging would be most of what we measure
+            server.debug = server.verbose = False
+        if log_registry_requests:
+            self.registry_server.conf_base = (
+                self.registry_server.conf_base.replace(
+                    '[paste_deploy]',
+                    'default_log_levels = eventlet.wsgi.server=DEBUG\n'
+                    '[paste_deploy]'))
+        self.api_server.deployment_flavor = flavor
+        self.start_servers(**self.__dict__.copy())
+
+    def stop(self):
+        if self.default_store == 's3':
+            store_utils.teardown_s3(self)
+        self.stop_servers()
+        self.tearDown()
+
+    def watch(self, recorder):
+        """Record the CPU time of the servers into the recorder."""
+        for name, server in (('api', self.api_server),
+                             ('registry', self.registry_server)):
+            with open(server.pid_file) as pid_file:
+                recorder.watch(name, int(pid_file.read().strip()))
+
+    def _read_registry_requests(self):
+        with open(self.registry_server.log_file) as log_file:
+            return sum(1 for line in log_file if REQUEST_LOG_RE.search(line))
+
+    def count_registry_requests(self):
+        """
+        Returns the number of requests the registry has served so far. The
+        registry logs a request after responding to it, so the log is read
+        until the count stops changing.
+        """
+        deadline = time.time() + LOG_SETTLE_TIMEOUT
+        count = self._read_registry_requests()
+        while time.time() < deadline:
+            time.sleep(LOG_SETTLE_INTERVAL)
+            latest = self._read_registry_requests()
+            if latest == count:
+                break
+            count = latest
+        return count
+
+
+def request(port, method, path, body=None, headers=None, keep_body=True):
+    """
+    Make an HTTP request to a local server.
+
+    :retval A tuple of (status, body, bytes sent and received, latency),
+            where body is None unless keep_body is set
+    """
+    conn = httplib.HTTPConnection('127.0.0.1', port)
+    start = time.time()
+    try:
+        conn.request(method, path, body, headers or {})
+        response = conn.getresponse()
+        chunks = []
+        received = 0
+        while True:
+            chunk = response.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            received += len(chunk)
+            if keep_body:
+                chunks.append(chunk)
+    finally:
+        conn.close()
+    latency = time.time() - start
+    content = ''.join(chunks) if keep_body else None
+    return response.status, content, len(body or '') + received, latency
+
+
+def upload_image(port, name, data):
+    headers = {'Content-Type': 'application/octet-stream',
+               'X-Image-Meta-Name': name,
+               'X-Image-Meta-Is-Public': 'True',
+               'X-Image-Meta-Disk-Format': 'raw',
+               'X-Image-Meta-Container-Format': 'ovf'}
+    return request(port, 'POST', '/v1/images', data, headers)
+
+
+def create_images(env, count, size):
+    """Upload count images of the given size, returning their IDs."""
+    data = '*' * size
+    image_ids = []
+    for i in xrange(count):
+        status, body, _nbytes, _latency = upload_image(env.api_port,
+                                                       'bench-%d' % i, data)
+        if status != 201:
+            raise RuntimeError("Failed to create image: %s %s" %
+                               (status, body))
+        image_ids.append(json.loads(body)['image']['id'])
+    return image_ids
+
+
+def measure(recorder, func, args_list, concurrency, expected_status=200):
+    """
+    Call func with each argument tuple in args_list, at most concurrency
+    calls at a time, recording each call that returns the expected status.
+    func must return a tuple as returned by `request`.
+    """
+    pool = eventlet.GreenPool(concurrency)
+    recorder.start()
+    for status, _body, nbytes, latency in pool.starmap(func, args_list):
+        if status == expected_status:
+            recorder.record(latency, nbytes)
+        else:
+            recorder.error()
+    recorder.stop()
+    return recorder.summary()
+
+
+def upload(options, store='file'):
+    """Concurrent image uploads."""
+    env = Environment()
+    reason = env.start(store)
+    if reason:
+        return results.skipped(reason)
+    try:
+        recorder = results.Recorder('upload', store=store,
+                                    size=options.size,
+                                    concurrency=options.concurrency)
+        env.watch(recorder)
+        data = '*' * options.size
+        args = [(env.api_port, 'bench-%d' % i, data)
+                for i in xrange(options.requests)]
+        return measure(recorder, upload_image, args, options.concurrency,
+                       expected_status=201)
+    finally:
+        env.stop()
+
+
+def upload_small(options):
+    """
+    Concurrent uploads of small images, counting the registry requests
+    each makes.
+    """
+    env = Environment()
+    env.start(log_registry_requests=True)
+    try:
+        recorder = results.Recorder('upload_small', size=SMALL_IMAGE_SIZE,
+                                    concurrency=options.concurrency)
+        env.watch(recorder)
+        data = '*' * SMALL_IMAGE_SIZE
+        args = [(env.api_port, 'bench-%d' % i, data)
+                for i in xrange(options.requests)]
+        registry_requests = env.count_registry_requests()
+        measure(recorder, upload_image, args, options.concurrency,
+                expected_status=201)
+        recorder.count('registry', (env.count_registry_requests() -
+                                    registry_requests))
+        return recorder.summary()
+    finally:
+        env.stop()
+
+
+def download(options, store='file'):
+    """Concurrent image downloads."""
+    env = Environment()
+    reason = env.start(store)
+    if reason:
+        return results.skipped(reason)
+    try:
+        image_ids = create_images(env, options.images, options.size)
+        recorder = results.Recorder('download', store=store,
+                                    size=options.size,
+                                    concurrency=options.concurrency)
+        env.watch(recorder)
+        args = [(env.api_port, 'GET',
+                 '/v1/images/%s' % image_ids[i % len(image_ids)],
+                 None, None, False)
+                for i in xrange(options.requests)]
+        return measure(recorder, request, args, options.concurrency)
+    finally:
+        env.stop()
+
+
+def _registry_storm(options, path_for):
+    env = Environment()
+    env.start()
+    try:
+        image_ids = create_images(env, options.images, 0)
+        recorder = results.Recorder('registry',
+                                    images=options.images,
+                                    concurrency=options.concurrency)
+        env.watch(recorder)
+        args = [(env.registry_port, 'GET', path_for(image_ids, i))
+                for i in xrange(options.requests)]
+        return measure(recorder, request, args, options.concurrency)
+    finally:
+        env.stop()
+
+
+def registry_list(options):
+    """Concurrent detailed image listings against the registry."""
+    return _registry_storm(options,
+                           lambda image_ids, i: '/images/detail?limit=1000')
+
+
+def registry_show(options):
+    """Concurrent single image lookups against the registry."""
+    return _registry_storm(options, lambda image_ids, i: (
+        '/images/%s' % image_ids[i % len(image_ids)]))
+
+
+def cache(options, hit=True):
+    """
+    Concurrent downloads through the image cache, either all served from
+    the cache or all missing it (and so populating it).
+    """
+    env = Environment()
+    env.start(flavor='caching')
+    try:
+        count = options.images if hit else options.requests
+        image_ids = create_images(env, count, options.size)
+        if hit:
+            # Populate the cache
+            for image_id in image_ids:
+                request(env.api_port, 'GET', '/v1/images/%s' % image_id,
+                        keep_body=False)
+        recorder = results.Recorder('cache_hit' if hit else 'cache_miss',
+                                    size=options.size,
+                                    concurrency=options.concurrency)
+        env.watch(recorder)
+        args = [(env.api_port, 'GET',
+                 '/v1/images/%s' % image_ids[i % len(image_ids)],
+                 None, None, False)
+                for i in xrange(options.requests)]
+        return measure(recorder, request, args, options.concurrency)
+    finally:
+        env.stop()
+
+
+def replicate(options):
+    """
+    Runs of glance-replicator livecopy from a populated master to an
+    empty slave. Each run is one sample; its bytes are the image data
+    copied.
+    """
+    recorder = results.Recorder('replicate', images=options.images,
+                                size=options.size)
+    for run in xrange(options.replicator_runs):
+        master = Environment()
+        slave = Environment()
+        master.start()
+        slave.start()
+        try:
+            create_images(master, options.images, options.size)
+            cmd = ('bin/glance-replicator livecopy 127.0.0.1:%d 127.0.0.1:%d'
+                   % (master.api_port, slave.api_port))
+            recorder.start()
+            start = time.time()
+            exitcode, _out, _err = functional.execute(cmd, raise_error=False)
+            latency = time.time() - start
+            recorder.stop()
+            if exitcode == 0:
+                recorder.record(latency, options.images * options.size)
+            else:
+                recorder.error()
+        finally:
+            master.stop()
+            slave.stop()
+    return recorder.summary()
+
+
+def hash_image(data, buffer_size, algorithms, thread_min_size):
+    """
+    Checksum data as the stores do, buffer_size bytes at a time.
+
+    :retval A tuple as returned by `request`
+    """
+    start = time.time()
+    hasher = checksum_utils.Checksum(algorithms,
+                                     thread_min_size=thread_min_size)
+    for offset in xrange(0, len(data), buffer_size):
+        hasher.update(data[offset:offset + buffer_size])
+    hasher.hexdigests()
+    return 200, None, len(data), time.time() - start
+
+
+def checksum(options, algorithms, buffer_size):
+    """
+    Concurrent checksumming of images, buffer_size bytes at a time, with
+    the configured `checksum_thread_min_size`.
+    """
+    thread_min_size = checksum_utils.CONF.checksum_thread_min_size
+    recorder = results.Recorder('checksum', algorithms=algorithms,
+                                buffer_size=buffer_size,
+                                thread_min_size=thread_min_size,
+                                size=options.size,
+                                concurrency=options.concurrency)
+    data = '*' * options.size
+    args = [(data, buffer_size, algorithms, thread_min_size)
+            for i in xrange(options.requests)]
+    return measure(recorder, hash_image, args, options.concurrency)
+
+
+def read_first_byte(store, loc):
+    """
+    Read an image from a store, timing the arrival of its first byte.
+
+    :retval A tuple as returned by `request`
+    """
+    start = time.time()
+    image, _size = store.get(loc)
+    chunks = iter(image)
+    received = len(next(chunks, ''))
+    latency = time.time() - start
+    for chunk in chunks:
+        received += len(chunk)
+    return 200, None, received, latency
+
+
+def s3_first_byte(options):
+    """
+    Time to the first byte of images read, one at a time, from the S3
+    store in process, backed by a local stand-in for S3. The requests and
+    connections each read makes to S3 are counted.
+    """
+    server = s3_server.S3Server()
+    server.start()
+    old_proxy = os.environ.get('http_proxy')
+    os.environ['http_proxy'] = 'http://127.0.0.1:%d' % server.port
+    for name, value in (('s3_store_host', s3_server.HOST),
+                        ('s3_store_access_key', 'key'),
+                        ('s3_store_secret_key', 'secret'),
+                        ('s3_store_bucket', 'glance')):
+        s3.CONF.set_override(name, value)
+    s3.clear_connections()
+    try:
+        store = s3.Store()
+        data = '*' * options.size
+        locations = []
+        for i in xrange(options.images):
+            name = 'bench-%d' % i
+            server.objects[('glance', name)] = data
+            uri = 's3://key:secret@%s/glance/%s' % (s3_server.HOST, name)
+            locations.append(location.Location('s3', s3.StoreLocation,
+                                               uri=uri))
+        recorder = results.Recorder('s3_first_byte', size=options.size)
+        args = [(store, locations[i % len(locations)])
+                for i in xrange(options.requests)]
+        requests, connections = server.requests, server.connections
+        measure(recorder, read_first_byte, args, 1)
+        recorder.count('s3_requests', server.requests - requests)
+        recorder.count('s3_connections', server.connections - connections)
+        return recorder.summary()
+    finally:
+        s3.clear_connections()
+        s3.CONF.reset()
+        if old_proxy is None:
+            del os.environ['http_proxy']
+        else:
+            os.environ['http_proxy'] = old_proxy
+        server.stop()
+
+
+def v2_image(index):
+    """Returns an image as the v2 API reads it from the database."""
+    now = datetime.datetime.utcnow()
+    return {'id': str(uuid.uuid4()), 'name': 'image-%d' % index,
+            'disk_format': 'qcow2', 'container_format': 'bare',
+            'size': 1024, 'status': 'active', 'is_public': True,
+            'checksum': 'ca425b88f047ce8ec45ee90e813ada91',
+            'tags': ['one', 'two'], 'protected': False, 'min_ram': 0,
+            'min_disk': 0, 'created_at': now, 'updated_at': now,
+            'location': None, 'properties': dict(V2_PROPERTIES)}
+
+
+def serialize_page(serializer, page):
+    """
+    Serialize a page of images as the v2 API lists them.
+
+    :retval A tuple as returned by `request`
+    """
+    start = time.time()
+    response = webob.Response(request=webob.Request.blank('/v2/images'))
+    # The serializer may reuse the properties of the images it is given
+    images = [dict(image, properties=dict(image['properties']))
+              for image in page]
+    serializer.index(response, {'images': images})
+    return 200, None, len(response.body), time.time() - start
+
+
+def v2_serialize(options):
+    """
+    Serialization of pages of V2_PAGE_SIZE images by the v2 API, with
+    each page timed as one request.
+    """
+    serializer = v2_images.ResponseSerializer()
+    recorder = results.Recorder('v2_serialize', page_size=V2_PAGE_SIZE)
+    page = [v2_image(i) for i in xrange(V2_PAGE_SIZE)]
+    args = [(serializer, page) for i in xrange(options.requests)]
+    return measure(recorder, serialize_page, args, 1)
+
+
+def validate_image(schema, body):
+    """
+    Validate the body of a v2 image create request against the schema.
+
+    :retval A tuple as returned by `request`
+    """
+    start = time.time()
+    schema.validate(body)
+    return 200, None, 0, time.time() - start
+
+
+def v2_validate(options):
+    """Validation of v2 image create requests against the image schema."""
+    schema = v2_images.get_schema()
+    body = dict(V2_PROPERTIES, name='image', disk_format='qcow2',
+                container_format='bare', visibility='public',
+                tags=['one', 'two'])
+    recorder = results.Recorder('v2_validate')
+    args = [(schema, body)] * options.requests
+    return measure(recorder, validate_image, args, 1)
+
+
+def service_catalog():
+    """Returns a service catalog as keystone sends it, in JSON."""
+    catalog = []
+    for service in CATALOG_SERVICES:
+        endpoints = []
+        for region in xrange(CATALOG_REGIONS):
+            url = 'http://%s.region%d.example.com:8000/v1/%s' % (
+                service, region, uuid.uuid4().hex)
+            endpoints.append({'region': 'region%d' % region,
+                              'publicURL': url, 'internalURL': url,
+                              'adminURL': url})
+        catalog.append({'type': service, 'name': service,
+                        'endpoints': endpoints})
+    return json.dumps(catalog)
+
+
+def parse_context(middleware, headers):
+    """
+    Make a request context from a request's identity headers.
+
+    :retval A tuple as returned by `request`
+    """
+    req = webob.Request.blank('/v1/images/detail', headers=headers)
+    start = time.time()
+    middleware.process_request(req)
+    return 200, None, 0, time.time() - start
+
+
+def parse_contexts(options, cached):
+    """
+    Parsing of the identity headers of requests made with one token, as by
+    a compute node, with or without the context middleware's cache.
+    """
+    middleware = context_middleware.ContextMiddleware(None)
+    if not cached:
+        # A cache of no tokens parses the headers of every request
+        middleware.identities.size = 0
+    headers = {'X-Identity-Status': 'Confirmed',
+               'X-Auth-Token': uuid.uuid4().hex,
+               'X-User-Id': uuid.uuid4().hex,
+               'X-Tenant-Id': uuid.uuid4().hex,
+               'X-Roles': 'Member, _member_, admin',
+               'X-Service-Catalog': service_catalog()}
+    recorder = results.Recorder('context', cached=cached)
+    args = [(middleware, headers)] * options.requests
+    return measure(recorder, parse_context, args, 1)
+
+
+def run_program(path):
+    """
+    Run a program with --help, which it exits with once it has imported
+    its modules and parsed its options.
+
+    :retval A tuple as returned by `request`
+    """
+    start = time.time()
+    with open(os.devnull, 'w') as devnull:
+        status = subprocess.call([sys.executable, path, '--help'],
+                                 stdout=devnull, stderr=devnull)
+    return 200 if status == 0 else status, None, 0, time.time() - start
+
+
+def startup(options, program):
+    """Startup of a program in bin/, up to parsing its options."""
+    recorder = results.Recorder('startup', program=program)
+    args = [(os.path.join(BIN_DIR, program),)]
+    return measure(recorder, run_program,
+                   args * min(options.requests, STARTUP_RUNS), 1)
+
+
+def get_scenarios(stores):
+    """
+    Returns a list of (name, function) pairs for every scenario, with
+    the upload and download scenarios repeated for each store, and the
+    startup scenario for each program.
+    """
+    scenarios = []
+    for store in stores:
+        scenarios.append(('upload-%s' % store,
+                          lambda options, store=store: upload(options, store)))
+        scenarios.append(('download-%s' % store,
+                          lambda options, store=store: download(options,
+                                                                store)))
+    scenarios.extend([
+        ('upload-small', upload_small),
+        ('registry-list', registry_list),
+        ('registry-show', registry_show),
+        ('cache-hit', lambda options: cache(options, hit=True)),
+        ('cache-miss', lambda options: cache(options, hit=False)),
+        ('replicate', replicate),
+        ('s3-first-byte', s3_first_byte),
+        ('v2-serialize', v2_serialize),
+        ('v2-validate', v2_validate),
+        ('context-cached', lambda options: parse_contexts(options, True)),
+        ('context-uncached', lambda options: parse_contexts(options, False)),
+        ])
+    for algorithms in CHECKSUM_ALGORITHMS:
+        for buffer_size in CHECKSUM_BUFFER_SIZES:
+            name = 'checksum-%s-%dk' % ('+'.join(algorithms),
+                                        buffer_size / 1024)
+            scenarios.append((name, lambda options, algorithms=algorithms,
+                              buffer_size=buffer_size: checksum(
+                                  options, algorithms, buffer_size)))
+    for program in sorted(os.listdir(BIN_DIR)):
+        scenarios.append(('startup-%s' % program,
+                          lambda options, program=program: startup(options,
+                                                                   program)))
+    return scenarios
@@ -34,6 +34,7 @@ import socket
 import time
 import urlparse
 
+import httplib2
 from sqlalchemy import create_engine
 
 from glance.common import utils
@@ -263,24 +264,32 @@ show_image_direct_url = %(show_image_direct_url)s
 flavor = %(deployment_flavor)s
 """
         self.paste_conf_base = """[pipeline:glance-api]
-pipeline = versionnegotiation unauthenticated-context rootapp
+pipeline = versionnegotiation admission unauthenticated-context metrics rootapp
 
 [pipeline:glance-api-caching]
-pipeline = versionnegotiation unauthenticated-context cache rootapp
+pipeline =
+    versionnegotiation
+    admission
+    unauthenticated-context
+    metrics
+    cache
+    rootapp
 
 [pipeline:glance-api-cachemanagement]
 pipeline =
     versionnegotiation
+    admission
     unauthenticated-context
+    metrics
     cache
     cache_manage
     rootapp
 
 [pipeline:glance-api-fakeauth]
-pipeline = versionnegotiation fakeauth context rootapp
+pipeline = versionnegotiation admission fakeauth context metrics rootapp
 
 [pipeline:glance-api-noauth]
-pipeline = versionnegotiation context rootapp
+pipeline = versionnegotiation admission context metrics rootapp
 
 [composite:rootapp]
 use = egg:Paste#urlmap
@@ -301,6 +310,10 @@ paste.app_factory = glance.api.v2.router:API.factory
 paste.filter_factory =
  glance.api.middleware.version_negotiation:VersionNegotiationFilter.factory
 
+[filter:admission]
+paste.filter_factory =
+ glance.api.middleware.admission:AdmissionMiddleware.factory
+
 [filter:cache]
 paste.filter_factory = glance.api.middleware.cache:CacheFilter.factory
 
@@ -315,6 +328,10 @@ paste.filter_factory = glance.api.middleware.context:ContextMiddleware.factory
 paste.filter_factory =
  glance.api.middleware.context:UnauthenticatedContextMiddleware.factory
 
+[filter:metrics]
+paste.filter_factory =
+ glance.api.middleware.metrics:MetricsMiddleware.factory
+
 [filter:fakeauth]
 paste.filter_factory = glance.tests.utils:FakeAuthMiddleware.factory
 """
@@ -356,10 +373,10 @@ owner_is_tenant = %(owner_is_tenant)s
 flavor = %(deployment_flavor)s
 """
         self.paste_conf_base = """[pipeline:glance-registry]
-pipeline = unauthenticated-context registryapp
+pipeline = unauthenticated-context metrics registryapp
 
 [pipeline:glance-registry-fakeauth]
-pipeline = fakeauth context registryapp
+pipeline = fakeauth context metrics registryapp
 
 [app:registryapp]
 paste.app_factory = glance.registry.api.v1:API.factory
@@ -371,6 +388,10 @@ paste.filter_factory = glance.api.middleware.context:ContextMiddleware.factory
 paste.filter_factory =
  glance.api.middleware.context:UnauthenticatedContextMiddleware.factory
 
+[filter:metrics]
+paste.filter_factory =
+ glance.api.middleware.metrics:MetricsMiddleware.factory
+
 [filter:fakeauth]
 paste.filter_factory = glance.tests.utils:FakeAuthMiddleware.factory
 """
@@ -670,6 +691,26 @@ class FunctionalTest(test_utils.BaseTestCase):
 
         return msg if expect_launch else None
 
+    def wait_for_import(self, image_id, timeout=10):
+        """
+        Wait for the background import of an image's data to finish,
+        returning the final import status.
+
+        :param image_id: The image being imported
+        :param timeout: Optional, seconds to wait before giving up
+        """
+        path = "http://%s:%d/v1/images/%s/import" % ("127.0.0.1",
+                                                     self.api_port, image_id)
+        timeout_time = time.time() + timeout
+        while True:
+            response, content = httplib2.Http().request(path, 'GET')
+            self.assertEqual(response.status, 200, content)
+            job = json.loads(content)['import']
+            if (job['status'] in ('succeeded', 'failed') or
+                time.time() > timeout_time):
+                return job
+            time.sleep(0.1)
+
     def stop_server(self, server, name):
         """
         Called to stop a single server in a normal fashion using the
@@ -135,6 +135,31 @@ class BaseTestCase(object):
         self.assertEqual(expected, actual)
         self.assertNotEqual(image['created_at'], image['updated_at'])
 
+    def test_image_update_all(self):
+        images = self.db_api.image_update_all(self.adm_context,
+                [(UUID1, {'status': 'killed'}),
+                 (utils.generate_uuid(), {'status': 'killed'}),
+                 (UUID2, {'status': 'queued', 'min_ram': 128})])
+        self.assertEqual([UUID1, UUID2], [image['id'] for image in images])
+        self.assertEqual(128, images[1]['min_ram'])
+        image = self.db_api.image_get(self.adm_context, UUID1)
+        self.assertEqual('killed', image['status'])
+
+    def test_image_update_all_returns_properties(self):
+        images = self.db_api.image_update_all(self.adm_context,
+                [(UUID1, {'properties': {'foo': 'baz', 'ping': 'pong'}})])
+        properties = dict((p['name'], p['value'])
+                          for p in images[0]['properties']
+                          if not p['deleted'])
+        self.assertEqual({'foo': 'baz', 'ping': 'pong'}, properties)
+
+    def test_image_update_all_skips_unmodifiable(self):
+        images = self.db_api.image_update_all(self.context,
+                [(UUID1, {'status': 'killed'})])
+        self.assertEqual([], images)
+        image = self.db_api.image_get(self.adm_context, UUID1)
+        self.assertEqual('active', image['status'])
+
     def test_image_property_delete(self):
         fixture = {'name': 'ping', 'value': 'pong', 'image_id': UUID1}
         prop = self.db_api.image_property_create(self.context, fixture)
@@ -374,3 +399,30 @@ class BaseTestCase(object):
         self.assertNotEqual(None, member['deleted_at'])
         self.assertTrue(isinstance(member['deleted_at'], datetime.datetime))
         self.assertTrue(member['deleted'])
+
+    def test_image_member_set_all(self):
+        TENANT1, TENANT2, TENANT3 = [utils.generate_uuid() for x in range(3)]
+        self.db_api.image_member_create(self.context, {'member': TENANT1,
+                                                       'image_id': UUID1,
+                                                       'can_share': True})
+        self.db_api.image_member_create(self.context, {'member': TENANT2,
+                                                       'image_id': UUID1})
+
+        def _members():
+            members = self.db_api.image_member_find(self.context,
+                                                    image_id=UUID1)
+            return dict((m['member'], m['can_share']) for m in members
+                        if not m['deleted'])
+
+        self.db_api.image_member_set_all(self.context, UUID1,
+                [{'member': TENANT1, 'can_share': None},
+                 {'member': TENANT3, 'can_share': None}])
+        self.assertEqual({TENANT1: True, TENANT3: False}, _members())
+
+        self.db_api.image_member_set_all(self.context, UUID1,
+                [{'member': TENANT1, 'can_share': False},
+                 {'member': TENANT2, 'can_share': True}])
+        self.assertEqual({TENANT1: False, TENANT2: True}, _members())
+
+        self.db_api.image_member_set_all(self.context, UUID1, [])
+        self.assertEqual({}, _members())
@@ -14,6 +14,7 @@
 #    under the License.
 
 
+from glance.common import exception
 import glance.db.simple.api
 import glance.tests.functional.db as tests
 from glance.tests.unit import base
@@ -30,3 +31,19 @@ class TestSimpleDriver(base.IsolatedUnitTest, tests.BaseTestCase):
 
     def reset(self):
         self.db_api.reset()
+
+    def test_image_update_all_failure_rolls_back(self):
+        image_update = self.db_api.image_update
+
+        def fake_image_update(context, image_id, values):
+            if image_id == tests.UUID2:
+                raise exception.Invalid()
+            return image_update(context, image_id, values)
+
+        self.stubs.Set(self.db_api, 'image_update', fake_image_update)
+        self.assertRaises(exception.Invalid, self.db_api.image_update_all,
+                          self.adm_context,
+                          [(tests.UUID1, {'status': 'killed'}),
+                           (tests.UUID2, {'status': 'killed'})])
+        image = self.db_api.image_get(self.adm_context, tests.UUID1)
+        self.assertEqual('active', image['status'])
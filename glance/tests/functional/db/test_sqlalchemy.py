@@ -14,6 +14,7 @@
 #    under the License.
 
 
+from glance.common import exception
 import glance.db.sqlalchemy.api
 from glance.db.sqlalchemy import models as db_models
 import glance.tests.functional.db as tests
@@ -36,3 +37,11 @@ class TestSqlalchemyDriver(base.IsolatedUnitTest, tests.BaseTestCase):
     def reset(self):
         db_models.unregister_models(self.db_api._ENGINE)
         db_models.register_models(self.db_api._ENGINE)
+
+    def test_image_update_all_invalid_rolls_back(self):
+        self.assertRaises(exception.Invalid, self.db_api.image_update_all,
+                          self.adm_context,
+                          [(tests.UUID1, {'status': 'killed'}),
+                           (tests.UUID2, {'status': 'bogus'})])
+        image = self.db_api.image_get(self.adm_context, tests.UUID1)
+        self.assertEqual('active', image['status'])
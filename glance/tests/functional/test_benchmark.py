@@ -0,0 +1,62 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack, LLC
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Functional test that the benchmark scenarios run"""
+
+from glance.tests.benchmark import scenarios
+from glance.tests import utils as test_utils
+
+
+class Options(object):
+    requests = 4
+    concurrency = 2
+    size = 1024
+    images = 2
+    replicator_runs = 1
+
+
+class TestBenchmarkScenarios(test_utils.BaseTestCase):
+
+    def test_download(self):
+        summary = scenarios.download(Options())
+        self.assertEqual(4, summary['requests'])
+        self.assertEqual(0, summary['errors'])
+        self.assertEqual(4 * 1024, summary['bytes'])
+        self.assertTrue(summary['latency']['p99'] >=
+                        summary['latency']['p50'])
+
+    def test_upload_small_counts_registry_requests(self):
+        summary = scenarios.upload_small(Options())
+        self.assertEqual(4, summary['requests'])
+        self.assertEqual(0, summary['errors'])
+        # One request to reserve each image and one to activate it
+        self.assertEqual(2, summary['calls_per_request']['registry'])
+
+    def test_registry_show(self):
+        summary = scenarios.registry_show(Options())
+        self.assertEqual(4, summary['requests'])
+        self.assertEqual(0, summary['errors'])
+
+    def test_checksum(self):
+        summary = scenarios.checksum(Options(), ['md5', 'sha256'], 256)
+        self.assertEqual(4, summary['requests'])
+        self.assertEqual(0, summary['errors'])
+        self.assertEqual(4 * 1024, summary['bytes'])
+        self.assertEqual(256, summary['params']['buffer_size'])
+
+    def test_unconfigured_store_is_skipped(self):
+        self.assertTrue('skipped' in scenarios.upload(Options(), 's3'))
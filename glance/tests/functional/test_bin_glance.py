@@ -271,12 +271,17 @@ class TestBinGlance(functional.FunctionalTest):
         image_id = data['image']['id']
 
         # 2. Update image with external source
+        copying = source == 'copy_from'
         source = '%s=%s' % (source, get_http_uri(self, 'foobar'))
         cmd = "bin/glance update %s %s -p %d" % (image_id, source, api_port)
         exitcode, out, err = execute(cmd, raise_error=False)
 
         self.assertEqual(0, exitcode)
         self.assertTrue(out.strip().endswith('Updated image %s' % image_id))
+        if copying:
+            # The data is copied in the background
+            self.assertEqual('succeeded',
+                             self.wait_for_import(image_id)['status'])
 
         # 3. Verify image is now active and of the correct size
         cmd = "bin/glance --port=%d show %s" % (api_port, image_id)
@@ -1054,6 +1059,47 @@ class TestBinGlance(functional.FunctionalTest):
         self.assertEqual(0, exitcode)
         self.assertEqual('Deleted image %s' % image_id, out.strip())
 
+    def test_download_image(self):
+        self.cleanup()
+        self.start_servers(**self.__dict__.copy())
+
+        api_port = self.api_port
+
+        # 1. Add public image
+        image_data = ''.join('%08d' % i for i in xrange(4096))
+        with tempfile.NamedTemporaryFile() as image_file:
+            image_file.write(image_data)
+            image_file.flush()
+            suffix = ' --silent-upload < %s' % image_file.name
+            cmd = minimal_add_command(api_port, 'MyImage', suffix)
+
+            exitcode, out, err = execute(cmd)
+
+        self.assertEqual(0, exitcode)
+        image_id = out.strip().rsplit(' ', 1)[1]
+
+        # 2. Download it and verify the data
+        path = os.path.join(self.test_dir, 'download')
+        cmd = ("bin/glance --port=%d --verbose --streams=2 download %s %s" %
+               (api_port, image_id, path))
+
+        exitcode, out, err = execute(cmd)
+
+        self.assertEqual(0, exitcode)
+        self.assertTrue(out.startswith('Downloaded 32768 bytes'))
+        with open(path) as image_file:
+            self.assertEqual(image_data, image_file.read())
+
+        # 3. Verify a missing image fails
+        cmd = ("bin/glance --port=%d download %s %s" %
+               (api_port, '8a4f5ab6-02d3-4ee7-a2c8-3b2bc47d5a39', path))
+
+        exitcode, out, err = execute(cmd, raise_error=False)
+
+        self.assertNotEqual(0, exitcode)
+
+        self.stop_servers()
+
     def test_protected_image(self):
         """
         We test the following:
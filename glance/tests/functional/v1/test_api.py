@@ -1408,3 +1408,41 @@ class TestApi(functional.FunctionalTest):
         self.assertEqual('tenant2', response['x-image-meta-owner'])
 
         self.stop_servers()
+
+    @skip_if_disabled
+    def test_metrics(self):
+        """
+        We test the following:
+
+        0. GET /v1/images
+        - Verify 200
+        1. GET /metrics from the API and registry servers
+        - Verify the requests for the image list are recorded
+        """
+        self.cleanup()
+        self.start_servers(**self.__dict__.copy())
+
+        # 0. GET /v1/images
+        path = "http://%s:%d/v1/images" % ("127.0.0.1", self.api_port)
+        http = httplib2.Http()
+        response, content = http.request(path, 'GET')
+        self.assertEqual(response.status, 200)
+
+        # 1. GET /metrics
+        path = "http://%s:%d/metrics" % ("127.0.0.1", self.api_port)
+        http = httplib2.Http()
+        response, content = http.request(path, 'GET')
+        self.assertEqual(response.status, 200)
+        data = json.loads(content)
+        self.assertEqual(1, data['timers']['request.GET.v1.images']['count'])
+        self.assertEqual(1, data['timers']['registry.GET.images']['count'])
+
+        path = "http://%s:%d/metrics" % ("127.0.0.1", self.registry_port)
+        http = httplib2.Http()
+        response, content = http.request(path, 'GET')
+        self.assertEqual(response.status, 200)
+        data = json.loads(content)
+        self.assertEqual(1, data['timers']['request.GET.images']['count'])
+        self.assertTrue(data['timers']['db.select']['count'] > 0)
+
+        self.stop_servers()
@@ -230,6 +230,15 @@ log_file = %(log_file)s
         self.assertEqual(0, exitcode)
         self.assertTrue(ids[1] in out, 'Image %s was not cached!' % ids[1])
 
+        # Verify the prefetcher reported its progress
+        cmd = "bin/glance-cache-manage --port=%d prefetch-status" % api_port
+
+        exitcode, out, err = execute(cmd)
+
+        self.assertEqual(0, exitcode)
+        self.assertTrue('Prefetcher finished' in out, out)
+        self.assertTrue('1 of 1 images cached' in out, out)
+
         # Queue third image and then delete it from queue
         cmd = "bin/glance-cache-manage --port=%d --force queue-image %s" % (
                 api_port, ids[2])
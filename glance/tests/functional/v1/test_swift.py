@@ -476,10 +476,13 @@ class TestSwift(test_api.TestApi):
         path = "http://%s:%d/v1/images" % ("127.0.0.1", self.api_port)
         http = httplib2.Http()
         response, content = http.request(path, 'POST', headers=headers)
-        self.assertEqual(response.status, 201, content)
+        self.assertEqual(response.status, 202, content)
         data = json.loads(content)
+        self.assertEqual(data['image']['status'], 'saving')
 
         copy_image_id = data['image']['id']
+        self.assertEqual('succeeded',
+                         self.wait_for_import(copy_image_id)['status'])
         self.assertNotEqual(copy_image_id, original_image_id)
 
         # GET image and make sure image content is as expected
@@ -568,10 +571,13 @@ class TestSwift(test_api.TestApi):
         path = "http://%s:%d/v1/images" % ("127.0.0.1", self.api_port)
         http = httplib2.Http()
         response, content = http.request(path, 'POST', headers=headers)
-        self.assertEqual(response.status, 201, content)
+        self.assertEqual(response.status, 202, content)
         data = json.loads(content)
+        self.assertEqual(data['image']['status'], 'saving')
 
         copy_image_id = data['image']['id']
+        self.assertEqual('succeeded',
+                         self.wait_for_import(copy_image_id)['status'])
 
         # GET image and make sure image content is as expected
         path = "http://%s:%d/v1/images/%s" % ("127.0.0.1", self.api_port,
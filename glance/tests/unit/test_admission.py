@@ -0,0 +1,141 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack, LLC
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import eventlet
+import webob
+
+from glance.api.middleware import admission
+from glance.common import metrics
+from glance.tests import utils as test_utils
+
+IMAGE_PATH = '/v1/images/71c675ab-d94f-49cd-a114-e12490b328d9'
+
+
+class TestAdmissionMiddleware(test_utils.BaseTestCase):
+
+    def setUp(self):
+        super(TestAdmissionMiddleware, self).setUp()
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        self.config(admission_data_limit=1, admission_metadata_limit=1,
+                    admission_queue_size=1, admission_queue_timeout=5,
+                    admission_retry_after=3)
+
+    def _app(self, environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return ['abc']
+
+    def _call(self, middleware, path, method='GET', body=None):
+        """
+        Makes a request, returning its status and headers, and its body
+        unread and unclosed, so that the request keeps its turn.
+        """
+        req = webob.Request.blank(path, method=method)
+        if body is not None:
+            req.body = body
+        response = []
+
+        def start_response(status, headers, exc_info=None):
+            response.extend([status, dict(headers)])
+
+        app_iter = middleware(req.environ, start_response)
+        return response[0], response[1], app_iter
+
+    def _counters(self):
+        return metrics.snapshot()['counters']
+
+    def test_requests_classified(self):
+        middleware = admission.AdmissionMiddleware(self._app)
+        for method, path, body, budget in (
+                ('GET', IMAGE_PATH, None, 'data'),
+                ('HEAD', IMAGE_PATH, None, 'metadata'),
+                ('PUT', IMAGE_PATH, 'data', 'data'),
+                ('PUT', IMAGE_PATH, None, 'metadata'),
+                ('POST', '/v1/images', 'data', 'data'),
+                ('POST', '/v1/images', None, 'metadata'),
+                ('GET', '/v1/images/detail', None, 'metadata'),
+                ('GET', IMAGE_PATH.replace('v1', 'v2') + '/file', None,
+                 'data'),
+                ('POST', IMAGE_PATH + '/upload', None, 'data'),
+                ('GET', '/v2/images', None, 'metadata')):
+            req = webob.Request.blank(path, method=method)
+            if body is not None:
+                req.body = body
+            self.assertEqual(budget, middleware._budget(req.environ).name,
+                             '%s %s' % (method, path))
+
+    def test_full_queue_rejected(self):
+        self.config(admission_queue_size=0)
+        middleware = admission.AdmissionMiddleware(self._app)
+        status, headers, download = self._call(middleware, IMAGE_PATH)
+        self.assertEqual('200 OK', status)
+
+        status, headers, body = self._call(middleware, IMAGE_PATH)
+        self.assertEqual('503 Service Unavailable', status)
+        self.assertEqual('3', headers['Retry-After'])
+
+        # Metadata requests have a limit of their own
+        status, headers, body = self._call(middleware, '/v1/images/detail')
+        self.assertEqual('200 OK', status)
+        body.close()
+
+        # The turn ends once the response body is closed
+        self.assertEqual(['abc'], list(download))
+        download.close()
+        status, headers, body = self._call(middleware, IMAGE_PATH)
+        self.assertEqual('200 OK', status)
+        body.close()
+
+        counters = self._counters()
+        self.assertEqual(2, counters['admission.data.admitted'])
+        self.assertEqual(1, counters['admission.data.rejected'])
+        self.assertEqual(1, counters['admission.metadata.admitted'])
+
+    def test_queued_request_admitted(self):
+        middleware = admission.AdmissionMiddleware(self._app)
+        status, headers, first = self._call(middleware, '/v1/images')
+        queued = eventlet.spawn(self._call, middleware, '/v1/images')
+        eventlet.sleep(0)
+        self.assertEqual(1, middleware.metadata.waiting)
+
+        first.close()
+        status, headers, body = queued.wait()
+        self.assertEqual('200 OK', status)
+        body.close()
+        counters = self._counters()
+        self.assertEqual(2, counters['admission.metadata.admitted'])
+        self.assertEqual(1, counters['admission.metadata.queued'])
+        self.assertEqual(0, metrics.snapshot()['gauges']
+                                              ['admission.metadata.running'])
+
+    def test_queue_timeout(self):
+        self.config(admission_queue_timeout=0)
+        middleware = admission.AdmissionMiddleware(self._app)
+        self._call(middleware, '/v1/images')
+        status, headers, body = self._call(middleware, '/v1/images')
+        self.assertEqual('503 Service Unavailable', status)
+        self.assertEqual(0, middleware.metadata.waiting)
+        counters = self._counters()
+        self.assertEqual(1, counters['admission.metadata.queued'])
+        self.assertEqual(1, counters['admission.metadata.rejected'])
+
+    def test_no_limit(self):
+        self.config(admission_metadata_limit=0)
+        middleware = admission.AdmissionMiddleware(self._app)
+        for i in range(3):
+            status, headers, body = self._call(middleware, '/v1/images')
+            self.assertEqual('200 OK', status)
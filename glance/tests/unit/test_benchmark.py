@@ -0,0 +1,89 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack, LLC
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+import os
+import shutil
+
+from glance.tests.benchmark import results
+from glance.tests import utils as test_utils
+
+
+class TestBenchmarkResults(test_utils.BaseTestCase):
+
+    def test_percentile(self):
+        values = range(1, 101)
+        self.assertEqual(None, results.percentile([], 50))
+        self.assertEqual(50.5, results.percentile(values, 50))
+        self.assertAlmostEqual(99.01, results.percentile(values, 99))
+        self.assertEqual(7, results.percentile([7], 99))
+
+    def test_process_cpu_time(self):
+        if not os.path.exists('/proc/self/stat'):
+            return
+        self.assertTrue(results.process_cpu_time(os.getpid()) >= 0)
+        self.assertEqual(None, results.process_cpu_time(-1))
+
+    def test_recorder_summary(self):
+        recorder = results.Recorder('download', size=1024 * 1024)
+        recorder.start()
+        for latency in (0.1, 0.2, 0.3):
+            recorder.record(latency, 1024 * 1024)
+        recorder.error()
+        recorder.count('registry', 6)
+        recorder.stop()
+        summary = recorder.summary()
+
+        self.assertEqual(3, summary['requests'])
+        self.assertEqual(1, summary['errors'])
+        self.assertEqual({'size': 1024 * 1024}, summary['params'])
+        self.assertAlmostEqual(0.2, summary['latency']['p50'])
+        self.assertAlmostEqual(0.3, summary['latency']['max'])
+        self.assertTrue(summary['throughput_mb_s'] > 0)
+        self.assertTrue('client' in summary['cpu_per_request'])
+        self.assertEqual({'registry': 2.0}, summary['calls_per_request'])
+        # Results must be machine readable
+        json.dumps(summary)
+
+    def test_compare(self):
+        def run(p50, throughput):
+            return {'scenarios': {
+                'download-file': {'latency': {'p50': p50},
+                                  'throughput_mb_s': throughput},
+                'upload-swift': results.skipped('not configured')}}
+
+        rows = results.compare(run(0.1, 100.0), run(0.2, 95.0))
+        changes = dict((metric, (change, regressed))
+                       for name, metric, old, new, change, regressed in rows)
+        self.assertEqual((100.0, True), changes['latency_p50'])
+        self.assertEqual((-5.0, False), changes['throughput_mb_s'])
+        self.assertEqual(['download-file'],
+                         list(set(row[0] for row in rows)))
+
+    def test_save_and_load(self):
+        test_id, test_dir = test_utils.get_isolated_test_env()
+        try:
+            path = os.path.join(test_dir, 'results.json')
+            run = results.build_results({'registry-show': {'requests': 1}},
+                                        {'concurrency': 1})
+            results.save(run, path)
+            loaded = results.load(path)
+            self.assertEqual(results.RESULTS_VERSION, loaded['version'])
+            self.assertEqual({'requests': 1},
+                             loaded['scenarios']['registry-show'])
+        finally:
+            shutil.rmtree(test_dir)
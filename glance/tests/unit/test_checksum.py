@@ -0,0 +1,89 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack, LLC
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import hashlib
+
+import eventlet
+import stubout
+
+from glance.common import checksum
+from glance.common import exception
+from glance.tests import utils as test_utils
+
+
+class TestChecksum(test_utils.BaseTestCase):
+
+    def _check(self, chunks, **kwargs):
+        hasher = checksum.Checksum(['sha256', 'sha1'], **kwargs)
+        for chunk in chunks:
+            hasher.update(chunk)
+        data = ''.join(chunks)
+        self.assertEqual(hashlib.md5(data).hexdigest(), hasher.hexdigest())
+        self.assertEqual({'md5': hashlib.md5(data).hexdigest(),
+                          'sha256': hashlib.sha256(data).hexdigest(),
+                          'sha1': hashlib.sha1(data).hexdigest()},
+                         hasher.hexdigests())
+
+    def test_inline(self):
+        self._check(['abc', 'def', ''], thread_min_size=0)
+
+    def test_threaded(self):
+        chunks = [chr(i) * (64 * 1024 + i) for i in xrange(8)]
+        self._check(chunks, thread_min_size=1024)
+
+    def test_mixed_sizes_keep_order(self):
+        chunks = ['a' * 4096, 'b', 'c' * 4096, 'd' * 10, 'e' * 4096]
+        self._check(chunks, thread_min_size=1024)
+
+    def test_small_updates_batched(self):
+        batches = []
+
+        def execute(func, data):
+            batches.append(len(data))
+            return func(data)
+
+        stubs = stubout.StubOutForTesting()
+        self.addCleanup(stubs.UnsetAll)
+        stubs.Set(checksum.tpool, 'execute', execute)
+        self._check(['a' * 400] * 7, thread_min_size=1024)
+        self.assertEqual([1200, 1200], batches)
+
+    def test_concurrent(self):
+        chunks = [str(i) * 100000 for i in xrange(10)]
+        pool = eventlet.GreenPool(4)
+        for _ in pool.imap(lambda c: self._check(c, thread_min_size=1024),
+                           [chunks] * 4):
+            pass
+
+    def test_algorithms(self):
+        self.assertEqual(['md5'], checksum.get_algorithms())
+        self.assertEqual(['md5', 'sha256', 'sha512'],
+                         checksum.get_algorithms(['SHA256', 'md5',
+                                                  ' sha512 ']))
+        self.assertEqual(['md5'],
+                         [name for name, _hash in checksum.Checksum().hashes])
+
+    def test_image_checksum_always_computed(self):
+        hasher = checksum.Checksum(['sha256'])
+        hasher.update('data')
+        self.assertEqual(hashlib.md5('data').hexdigest(), hasher.hexdigest())
+        self.assertEqual('md5:%s, sha256:%s' %
+                         (hashlib.md5('data').hexdigest(),
+                          hashlib.sha256('data').hexdigest()), str(hasher))
+
+    def test_unsupported_algorithm(self):
+        self.assertRaises(exception.Invalid, checksum.Checksum, ['crc99'])
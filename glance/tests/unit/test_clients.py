@@ -16,8 +16,11 @@
 #    under the License.
 
 import datetime
+import hashlib
 import os
+import StringIO
 import tempfile
+import zlib
 
 from glance import client
 from glance.common import client as base_client
@@ -208,6 +211,13 @@ class TestRegistryClient(base.IsolatedUnitTest):
         for k, v in fixture.items():
             self.assertEquals(v, images[0][k])
 
+    def test_get_image_details_gzipped(self):
+        """Test that gzipped responses are decoded"""
+        self.config(gzip_min_size=0)
+        images = self.client.get_images_detailed()
+        self.assertEquals(1, len(images))
+        self.assertEquals(UUID2, images[0]['id'])
+
     def test_create_image_with_null_min_disk_min_ram(self):
         UUID3 = _gen_uuid()
         extra_fixture = {
@@ -1132,6 +1142,19 @@ class TestRegistryClient(base.IsolatedUnitTest):
                           _gen_uuid(),
                           fixture)
 
+    def test_update_images(self):
+        """Tests that several images are updated in one registry request"""
+        fixture = [{'id': UUID1, 'status': 'pending_delete'},
+                   {'id': UUID2, 'status': 'pending_delete'}]
+
+        updated = self.client.update_images(fixture)
+        self.assertEquals(set([UUID1, UUID2]),
+                          set(image['id'] for image in updated))
+
+        for image_id in (UUID1, UUID2):
+            data = self.client.get_image(image_id)
+            self.assertEquals('pending_delete', data['status'])
+
     def test_delete_image(self):
         """Tests that image metadata is deleted properly"""
         # Grab the original number of images
@@ -1249,6 +1272,96 @@ class TestClient(base.IsolatedUnitTest):
         db_models.unregister_models(db_api._ENGINE)
         db_models.register_models(db_api._ENGINE)
 
+    def _download(self, checksum=None, **kwargs):
+        if checksum:
+            db_api.image_update(self.context, UUID2, {'checksum': checksum})
+        path = os.path.join(self.test_dir, 'download')
+        meta = self.client.download_image(UUID2, path, **kwargs)
+        self.assertEquals(UUID2, meta['id'])
+        with open(path, 'rb') as image_file:
+            return image_file.read()
+
+    def test_download_image(self):
+        """Test an image is downloaded in ranges"""
+        checksum = hashlib.md5('chunk00000remainder').hexdigest()
+        for range_size in (4, 19, None):
+            self.assertEquals('chunk00000remainder',
+                              self._download(checksum, streams=1,
+                                             range_size=range_size))
+
+    def test_download_image_retries_ranges(self):
+        """Test a failed range is retried without the others"""
+        requested = []
+        do_request = self.client.do_request
+
+        def flaky_do_request(method, action, headers=None, **kwargs):
+            byte_range = (headers or {}).get('Range')
+            requested.append(byte_range)
+            if byte_range == 'bytes=8-15' and requested.count(byte_range) < 3:
+                raise exception.ClientConnectionError()
+            return do_request(method, action, headers=headers, **kwargs)
+
+        self.stubs.Set(self.client, 'do_request', flaky_do_request)
+        self.assertEquals('chunk00000remainder',
+                          self._download(streams=1, range_size=8, retries=2))
+        self.assertEquals([None, 'bytes=0-7', 'bytes=8-15', 'bytes=8-15',
+                           'bytes=8-15', 'bytes=16-18'], requested)
+
+    def test_download_image_checksum_mismatch(self):
+        """Test a download not matching the image's checksum fails"""
+        self.assertRaises(exception.ChecksumMismatch, self._download,
+                          hashlib.md5('other').hexdigest(), streams=1,
+                          range_size=4)
+
+    def _upload(self, data, **kwargs):
+        self.config(upload_staging_dir=os.path.join(self.test_dir,
+                                                    'staging'))
+        image_id = self.client.add_image({'name': 'fake image #3',
+                                          'disk_format': 'raw',
+                                          'container_format': 'bare'})['id']
+        image_meta = self.client.upload_image(image_id,
+                                              StringIO.StringIO(data),
+                                              **kwargs)
+        self.assertEquals('active', image_meta['status'])
+        self.assertEquals(len(data), image_meta['size'])
+        self.assertEquals(hashlib.md5(data).hexdigest(),
+                          image_meta['checksum'])
+        image_meta, image_chunks = self.client.get_image(image_id)
+        self.assertEquals(data, ''.join(image_chunks))
+
+    def test_upload_image(self):
+        """Test an image's data is uploaded in parts"""
+        for part_size in (4, 19, None):
+            self._upload('chunk00000remainder', part_size=part_size)
+
+    def test_upload_image_resumes_parts(self):
+        """Test a failed part is resumed from the last committed byte"""
+        sent = []
+        do_request = self.client.do_request
+
+        def flaky_do_request(method, action, body=None, headers=None,
+                             **kwargs):
+            content_range = (headers or {}).get('content-range')
+            sent.append(content_range)
+            if content_range == 'bytes 8-15/19':
+                # The connection drops after half the part is sent
+                headers['content-range'] = 'bytes 8-11/19'
+                do_request(method, action, body[:4], headers, **kwargs)
+                raise exception.ClientConnectionError()
+            return do_request(method, action, body, headers, **kwargs)
+
+        self.stubs.Set(self.client, 'do_request', flaky_do_request)
+        self._upload('chunk00000remainder', part_size=8)
+        self.assertEquals(['bytes 0-7/19', 'bytes 8-15/19', 'bytes 12-15/19',
+                           'bytes 16-18/19'],
+                          [content_range for content_range in sent
+                           if content_range])
+
+    def test_upload_image_unseekable(self):
+        """Test resumable uploads refuse data they cannot re-read"""
+        self.assertRaises(exception.Invalid, self.client.upload_image,
+                          UUID2, iter(['chunk00000remainder']))
+
     def test_get_image(self):
         """Test a simple file backend retrieval works as expected"""
         expected_image = 'chunk00000remainder'
@@ -2161,3 +2274,39 @@ class TestConfigureClientFromURL(test_utils.BaseTestCase):
             use_ssl=True,
             doc_root='/prefix/v1'
         )
+
+
+class TestGzipResponse(test_utils.BaseTestCase):
+
+    def _gzip(self, data):
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+
+    def _response(self, data):
+        body = self._gzip(data)
+        response = test_utils.FakeHTTPResponse(data=body, headers={
+            'content-type': 'application/json',
+            'content-encoding': 'gzip',
+            'content-length': len(body)})
+        return base_client.GzipResponse(response)
+
+    def test_read(self):
+        data = '{"images": [%s]}' % ', '.join(['{"id": 1}'] * 1000)
+        self.assertEquals(data, self._response(data).read())
+
+    def test_read_chunks(self):
+        data = os.urandom(100000) + '*' * 100000
+        response = self._response(data)
+        chunks = list(base_client.ImageBodyIterator(response))
+        self.assertTrue(all(len(chunk) <= base_client.CHUNKSIZE
+                            for chunk in chunks))
+        self.assertEquals(data, ''.join(chunks))
+
+    def test_headers(self):
+        response = self._response('{}')
+        self.assertEquals('application/json',
+                          response.getheader('Content-Type'))
+        self.assertEquals(None, response.getheader('Content-Encoding'))
+        self.assertEquals(None, response.getheader('Content-Length'))
+        self.assertEquals([('content-type', 'application/json')],
+                          response.getheaders())
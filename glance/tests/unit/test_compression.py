@@ -0,0 +1,138 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack, LLC
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import hashlib
+import os
+import StringIO
+
+from glance.common import compression
+from glance.common import exception
+from glance.tests import utils as test_utils
+
+
+class TestCompression(test_utils.BaseTestCase):
+
+    def setUp(self):
+        super(TestCompression, self).setUp()
+        # Compressible text, then random data that is stored as is
+        self.data = (''.join('%08d' % i for i in xrange(4096)) +
+                     os.urandom(5000))
+
+    def _compress(self, chunks, block_size=1024):
+        fp = StringIO.StringIO()
+        writer = compression.CompressedWriter(fp, block_size=block_size)
+        for chunk in chunks:
+            writer.write(chunk)
+        writer.flush()
+        return writer, StringIO.StringIO(fp.getvalue())
+
+    def test_round_trip(self):
+        writer, fp = self._compress([self.data[i:i + 3000]
+                                     for i in xrange(0, len(self.data), 3000)])
+        reader = compression.open_reader(fp, True)
+
+        self.assertTrue(isinstance(reader, compression.CompressedReader))
+        self.assertEqual(len(self.data), reader.size)
+        self.assertEqual(hashlib.md5(self.data).hexdigest(), reader.checksum)
+        self.assertEqual(self.data, ''.join(compression.chunkiter(reader)))
+
+        stats = writer.stats()
+        self.assertEqual(len(self.data), stats['size'])
+        self.assertTrue(stats['compressed_size'] < len(self.data))
+        self.assertTrue(stats['ratio'] > 1)
+
+    def test_ranges(self):
+        _writer, fp = self._compress([self.data])
+        reader = compression.open_reader(fp, True)
+        for start, end in ((0, 1), (1000, 1024), (1023, 1025), (500, 9000),
+                           (len(self.data) - 10, len(self.data) + 10),
+                           (40000, 30000)):
+            self.assertEqual(self.data[start:end],
+                             ''.join(reader.iter_chunks(start, end)))
+
+        reader.seek(2000)
+        self.assertEqual(self.data[2000:2100], reader.read(100))
+        self.assertEqual(2100, reader.tell())
+        reader.seek(-50, os.SEEK_END)
+        self.assertEqual(self.data[-50:], reader.read())
+        self.assertEqual('', reader.read())
+
+    def test_write_after_flush(self):
+        fp = StringIO.StringIO()
+        writer = compression.CompressedWriter(fp, block_size=1024)
+        writer.write(self.data[:1500])
+        writer.flush()
+        writer.write(self.data[1500:])
+        writer.flush()
+        writer.flush()
+
+        reader = compression.open_reader(StringIO.StringIO(fp.getvalue()),
+                                          True)
+        self.assertEqual(self.data, reader.read())
+        self.assertEqual(hashlib.md5(self.data).hexdigest(), reader.checksum)
+
+    def test_empty(self):
+        _writer, fp = self._compress([])
+        reader = compression.open_reader(fp, True)
+        self.assertEqual(0, reader.size)
+        self.assertEqual('', reader.read())
+
+    def test_uncompressed_files_read_as_is(self):
+        _writer, compressed_fp = self._compress([self.data])
+        for data in (self.data, compressed_fp.getvalue(), ''):
+            fp = StringIO.StringIO(data)
+            self.assertEqual(fp, compression.open_reader(fp, False))
+            self.assertEqual(data, fp.read())
+
+    def test_not_compressed(self):
+        for data in (self.data, compression.MAGIC + self.data, ''):
+            self.assertRaises(exception.CorruptCompressedFile,
+                              compression.open_reader,
+                              StringIO.StringIO(data), True)
+
+    def _corrupt_index(self, data, offset, start):
+        """Rewrites the index of compressed data as a single block."""
+        trailer = list(compression.TRAILER.unpack(
+                data[-compression.TRAILER.size:]))
+        index_offset = trailer[0]
+        trailer[1:3] = [start, 1]
+        return StringIO.StringIO(data[:index_offset] +
+                                 compression.INDEX_ENTRY.pack(offset, 0) +
+                                 compression.TRAILER.pack(*trailer))
+
+    def test_block_decompressed_within_indexed_size(self):
+        """
+        Test that a block that decompresses to more than its indexed size
+        is rejected without decompressing all of it
+        """
+        _writer, fp = self._compress(['\0' * 1024 * 1024],
+                                     block_size=1024 * 1024)
+        reader = compression.open_reader(
+                self._corrupt_index(fp.getvalue(), len(compression.MAGIC),
+                                    10), True)
+        self.assertEqual(10, reader.size)
+        self.assertRaises(exception.CorruptCompressedFile, reader.read)
+
+    def test_inconsistent_index(self):
+        _writer, fp = self._compress([self.data], block_size=len(self.data))
+        for offset, start in ((0, len(self.data)),
+                              (len(compression.MAGIC) + 1, len(self.data)),
+                              (len(compression.MAGIC), 0)):
+            self.assertRaises(exception.CorruptCompressedFile,
+                              compression.open_reader,
+                              self._corrupt_index(fp.getvalue(), offset,
+                                                  start), True)
@@ -2,6 +2,7 @@
 import webob
 
 from glance.api.middleware import context
+from glance.common import metrics
 import glance.context
 from glance.tests.unit import base
 
@@ -105,6 +106,52 @@ class TestContextMiddleware(base.IsolatedUnitTest):
         self.assertRaises(webob.exc.HTTPInternalServerError,
                           middleware.process_request, req)
 
+    def test_identity_cached(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        middleware = self._build_middleware()
+        contexts = []
+        for i in range(2):
+            req = self._build_request(service_catalog='[{"type": "image"}]')
+            middleware.process_request(req)
+            contexts.append(req.context)
+        self.assertEqual(['role1', 'role2'], contexts[1].roles)
+        self.assertNotEqual(contexts[0].request_id, contexts[1].request_id)
+        self.assertEqual([{'type': 'image'}], contexts[1].service_catalog)
+        self.assertEqual(list, type(contexts[1].to_dict()['service_catalog']))
+
+        # Requests with other headers for the token are parsed again
+        req = self._build_request(roles=['admin'])
+        middleware.process_request(req)
+        self.assertTrue(req.context.is_admin)
+        self.assertEqual(None, req.context.service_catalog)
+
+        counters = metrics.snapshot()['counters']
+        self.assertEqual(1, counters['context.cache.hits'])
+        self.assertEqual(2, counters['context.cache.misses'])
+        timers = metrics.snapshot()['timers']
+        self.assertEqual(1, timers['context.catalog.parse']['count'])
+
+    def test_identity_cache_bounded(self):
+        self.config(context_cache_size=2)
+        middleware = self._build_middleware()
+        for token in ('token1', 'token2', 'token3'):
+            req = self._build_request()
+            req.headers['x-auth-token'] = token
+            middleware.process_request(req)
+            self.assertEqual(token, req.context.auth_tok)
+        self.assertEqual(2, len(middleware.identities.identities))
+
+    def test_identity_cache_expiry(self):
+        self.config(context_cache_ttl=-1)
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        middleware = self._build_middleware()
+        for i in range(2):
+            middleware.process_request(self._build_request())
+        counters = metrics.snapshot()['counters']
+        self.assertEqual(2, counters['context.cache.misses'])
+
 
 class TestUnauthenticatedContextMiddleware(base.IsolatedUnitTest):
     def test_request(self):
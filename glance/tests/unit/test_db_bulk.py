@@ -0,0 +1,115 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack, LLC
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import sqlalchemy
+
+from glance import context
+from glance.db.sqlalchemy import api as db_api
+from glance.db.sqlalchemy import models
+from glance.tests import utils as test_utils
+
+
+class TestBulkWrites(test_utils.IsolatedDBTestCase):
+
+    """
+    Bounds the statements run to write many image properties and members,
+    which must not grow with their number.
+    """
+
+    def setUp(self):
+        super(TestBulkWrites, self).setUp()
+        self.configure_db(sql_connection=self.db_url('glance'))
+        models.register_models(db_api._ENGINE)
+
+        self.statements = []
+        sqlalchemy.event.listen(db_api._ENGINE, 'before_cursor_execute',
+                                self._count)
+        self.context = context.RequestContext(is_admin=True)
+        self.image = db_api.image_create(self.context,
+                                         {'status': 'queued'})
+
+    def _count(self, conn, cursor, statement, parameters, context,
+               executemany):
+        self.statements.append(statement.split(None, 1)[0].upper())
+
+    def _properties(self):
+        image = db_api.image_get(self.context, self.image['id'])
+        return dict((prop['name'], prop['value'])
+                    for prop in image['properties'] if not prop['deleted'])
+
+    def _members(self):
+        members = db_api.image_member_find(self.context,
+                                           image_id=self.image['id'])
+        return dict((memb['member'], memb['can_share'])
+                    for memb in members if not memb['deleted'])
+
+    def test_set_properties(self):
+        properties = dict(('key%d' % i, 'value') for i in range(100))
+        del self.statements[:]
+        db_api.image_update(self.context, self.image['id'],
+                            {'properties': properties})
+        self.assertEqual(1, self.statements.count('INSERT'))
+        self.assertTrue(len(self.statements) <= 5, self.statements)
+        self.assertEqual(properties, self._properties())
+
+        properties = dict(('key%d' % i, 'changed') for i in range(50, 150))
+        del self.statements[:]
+        db_api.image_update(self.context, self.image['id'],
+                            {'properties': properties}, purge_props=True)
+        # One UPDATE of the image, and one each of the properties changed
+        # and deleted
+        self.assertEqual(3, self.statements.count('UPDATE'))
+        self.assertEqual(1, self.statements.count('INSERT'))
+        self.assertTrue(len(self.statements) <= 7, self.statements)
+        self.assertEqual(properties, self._properties())
+
+    def test_set_properties_revives_deleted(self):
+        db_api.image_update(self.context, self.image['id'],
+                            {'properties': {'a': '1', 'b': '2'}})
+        db_api.image_update(self.context, self.image['id'],
+                            {'properties': {'a': '1'}}, purge_props=True)
+        self.assertEqual({'a': '1'}, self._properties())
+        db_api.image_update(self.context, self.image['id'],
+                            {'properties': {'b': '2'}})
+        self.assertEqual({'a': '1', 'b': '2'}, self._properties())
+
+    def test_set_members(self):
+        tenants = ['tenant%d' % i for i in range(500)]
+        del self.statements[:]
+        db_api.image_member_set_all(self.context, self.image['id'],
+                                    [{'member': tenant, 'can_share': None}
+                                     for tenant in tenants])
+        self.assertEqual(['SELECT', 'INSERT'], self.statements)
+        self.assertEqual(dict((tenant, False) for tenant in tenants),
+                         self._members())
+
+        members = [{'member': tenant, 'can_share': True}
+                   for tenant in tenants[250:]]
+        del self.statements[:]
+        db_api.image_member_set_all(self.context, self.image['id'], members)
+        self.assertEqual(['SELECT', 'UPDATE', 'UPDATE'], self.statements)
+        self.assertEqual(dict((tenant, True) for tenant in tenants[250:]),
+                         self._members())
+
+        # Removed members are revived rather than duplicated
+        members = [{'member': tenant, 'can_share': None}
+                   for tenant in tenants]
+        db_api.image_member_set_all(self.context, self.image['id'], members)
+        members = self._members()
+        self.assertEqual(500, len(members))
+        self.assertFalse(members['tenant0'])
+        self.assertTrue(members['tenant499'])
@@ -0,0 +1,129 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack, LLC
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+
+import sqlalchemy
+import sqlalchemy.exc
+
+from glance.common import metrics
+from glance.db.sqlalchemy import api as db_api
+from glance.tests import utils as test_utils
+
+
+class FakeConnectionRecord(object):
+
+    def __init__(self, checkin_time=None):
+        self.info = {}
+        if checkin_time is not None:
+            self.info['checkin_time'] = checkin_time
+
+
+class FakeDBAPIConnection(object):
+
+    class OperationalError(Exception):
+        pass
+
+    def __init__(self, error=None):
+        self.error = error
+        self.statements = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, statement):
+        self.statements.append(statement)
+        if self.error:
+            raise self.error
+
+
+class TestPingListener(test_utils.BaseTestCase):
+
+    def setUp(self):
+        super(TestPingListener, self).setUp()
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        self.config(sql_ping_idle_time=60)
+
+    def test_new_connection_not_pinged(self):
+        conn = FakeDBAPIConnection()
+        db_api.ping_listener(conn, FakeConnectionRecord(), None)
+        self.assertEqual([], conn.statements)
+
+    def test_recently_used_connection_not_pinged(self):
+        conn = FakeDBAPIConnection()
+        record = FakeConnectionRecord(time.time() - 10)
+        db_api.ping_listener(conn, record, None)
+        self.assertEqual([], conn.statements)
+
+    def test_idle_connection_pinged(self):
+        conn = FakeDBAPIConnection()
+        record = FakeConnectionRecord(time.time() - 120)
+        db_api.ping_listener(conn, record, None)
+        self.assertEqual(['select 1'], conn.statements)
+        self.assertEqual(1, metrics.snapshot()['counters']['db.pool.pings'])
+
+    def test_idle_connection_gone_away(self):
+        error = FakeDBAPIConnection.OperationalError(2006, 'gone away')
+        conn = FakeDBAPIConnection(error)
+        record = FakeConnectionRecord(time.time() - 120)
+        self.assertRaises(sqlalchemy.exc.DisconnectionError,
+                          db_api.ping_listener, conn, record, None)
+
+    def test_every_checkout_pinged(self):
+        self.config(sql_ping_idle_time=-1)
+        conn = FakeDBAPIConnection()
+        db_api.ping_listener(conn, FakeConnectionRecord(time.time()), None)
+        self.assertEqual(['select 1'], conn.statements)
+
+
+class TestMeteredQueuePool(test_utils.BaseTestCase):
+
+    def setUp(self):
+        super(TestMeteredQueuePool, self).setUp()
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        self.engine = sqlalchemy.create_engine(
+                'sqlite://', poolclass=db_api.MeteredQueuePool, pool_size=1,
+                max_overflow=1, pool_timeout=1)
+        sqlalchemy.event.listen(self.engine, 'checkin',
+                                db_api.checkin_listener)
+
+    def test_pool_usage_recorded(self):
+        first = self.engine.connect()
+        self.assertEqual(1, metrics.snapshot()['gauges']
+                                             ['db.pool.checked_out'])
+        second = self.engine.connect()
+        gauges = metrics.snapshot()['gauges']
+        self.assertEqual(2, gauges['db.pool.checked_out'])
+        self.assertEqual(1, gauges['db.pool.overflow'])
+        self.assertRaises(sqlalchemy.exc.TimeoutError, self.engine.connect)
+
+        second.close()
+        first.close()
+        gauges = metrics.snapshot()['gauges']
+        self.assertEqual(0, gauges['db.pool.checked_out'])
+        self.assertEqual(0, gauges['db.pool.overflow'])
+        self.assertEqual(3, metrics.snapshot()['timers']
+                                              ['db.pool.wait']['count'])
+
+    def test_checkin_time_noted(self):
+        conn = self.engine.connect()
+        record = conn.connection._connection_record
+        self.assertFalse('checkin_time' in record.info)
+        conn.close()
+        self.assertTrue(record.info['checkin_time'] <= time.time())
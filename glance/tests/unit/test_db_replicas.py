@@ -0,0 +1,89 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack, LLC
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import sqlalchemy
+import sqlalchemy.orm
+
+from glance.common import metrics
+from glance import context
+from glance.db.sqlalchemy import api as db_api
+from glance.db.sqlalchemy import models
+from glance.tests import utils as test_utils
+
+
+class TestReadReplicas(test_utils.IsolatedDBTestCase):
+
+    """
+    Reads and writes of a primary database with two read replicas, all
+    SQLite files, which are not replicated: each holds its own images.
+    """
+
+    def setUp(self):
+        super(TestReadReplicas, self).setUp()
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+        self.engines = {}
+        for name in ('primary', 'replica1', 'replica2'):
+            self.engines[name] = sqlalchemy.create_engine(self.db_url(name))
+            models.register_models(self.engines[name])
+            self._create_image(name)
+        self.configure_db(sql_connection=self.db_url('primary'),
+                          sql_read_connections=[self.db_url('replica1'),
+                                                self.db_url('replica2')])
+
+    def _create_image(self, name):
+        """Creates an image named after the database it is created in."""
+        session = sqlalchemy.orm.sessionmaker(bind=self.engines[name])()
+        image = models.Image(name=name, status='active', is_public=True)
+        session.add(image)
+        session.commit()
+
+    def _names(self, ctxt):
+        return [image['name'] for image in db_api.image_get_all(ctxt)]
+
+    def test_reads_round_robin(self):
+        names = set()
+        for i in range(4):
+            names.update(self._names(context.RequestContext()))
+        self.assertEqual(set(['replica1', 'replica2']), names)
+        self.assertEqual(4, metrics.snapshot()['counters']
+                                              ['db.replica.reads'])
+
+    def test_reads_after_write_go_to_primary(self):
+        ctxt = context.RequestContext(is_admin=True)
+        image = db_api.image_create(ctxt, {'name': 'new',
+                                           'status': 'queued',
+                                           'is_public': True})
+        self.assertEqual('new', db_api.image_get(ctxt, image['id'])['name'])
+        self.assertEqual(set(['primary', 'new']), set(self._names(ctxt)))
+
+        self.assertTrue('primary' not in
+                        self._names(context.RequestContext()))
+
+    def test_read_falls_back_to_primary(self):
+        for name in ('replica1', 'replica2'):
+            models.unregister_models(self.engines[name])
+        self.assertEqual(['primary'], self._names(context.RequestContext()))
+        self.assertEqual(1, metrics.snapshot()['counters']
+                                              ['db.replica.fallbacks'])
+
+    def test_read_in_session_uses_session(self):
+        session = db_api.get_session()
+        images = db_api.image_get_all(context.RequestContext(),
+                                      session=session)
+        self.assertEqual(['primary'], [image['name'] for image in images])
@@ -19,10 +19,16 @@
 
 import errno
 import hashlib
+import os
 import StringIO
 
+from glance.common import compression
 from glance.common import exception
+from glance.common import metrics
 from glance.common import utils
+from glance import context
+import glance.store
+from glance.store import filesystem
 from glance.store.filesystem import Store, ChunkedFile
 from glance.store.location import get_location_from_uri
 from glance.tests.unit import base
@@ -112,6 +118,193 @@ class TestStore(base.IsolatedUnitTest):
         self.assertEquals(expected_file_contents, new_image_contents)
         self.assertEquals(expected_file_size, new_image_file_size)
 
+    def test_add_sparse(self):
+        """
+        Test that chunks of zeros are left as holes in the image file,
+        without changing the image's size, checksum or data
+        """
+        self.config(filesystem_store_sparse=True)
+        ChunkedFile.CHUNKSIZE = 65536
+        image_id = utils.generate_uuid()
+        contents = ("*" * 65536 + "\0" * 65536 * 8 + "*" * 100 +
+                    "\0" * 65536 * 2)
+        image_file = StringIO.StringIO(contents)
+
+        location, size, checksum = self.store.add(image_id, image_file,
+                                                  len(contents))
+
+        self.assertEquals(len(contents), size)
+        self.assertEquals(hashlib.md5(contents).hexdigest(), checksum)
+        info = os.stat(location[len("file://"):])
+        self.assertEquals(len(contents), info.st_size)
+        self.assertTrue(info.st_blocks * 512 < len(contents))
+
+        (new_image_file, new_image_size) = self.store.get(
+                get_location_from_uri(location))
+        self.assertEquals(contents, "".join(new_image_file))
+
+    def test_add_compressed(self):
+        """
+        Test that image data is compressed at rest, without changing the
+        image's size, checksum or data
+        """
+        datadir = self._use_datadir(filesystem_store_compress=True)
+        contents = "".join("%08d" % i for i in xrange(65536))
+        path = self._add(contents)
+
+        self.assertTrue(path.endswith(filesystem.COMPRESSED_SUFFIX))
+        self.assertTrue(os.path.getsize(path) < len(contents) / 2)
+        self.assertEqual(contents, self._read(path))
+
+        # Compressed files are deduplicated by their original data
+        other = self._add(contents)
+        files, duplicates, _freed = filesystem.deduplicate(datadir)
+        self.assertEqual((2, 1), (files, duplicates))
+        self.assertEqual(os.stat(path).st_ino, os.stat(other).st_ino)
+
+    def test_compressed_data_stored_as_is(self):
+        """
+        Test that uploaded data that looks like a compressed file is only
+        ever decompressed if the store compressed it
+        """
+        fp = StringIO.StringIO()
+        writer = compression.CompressedWriter(fp)
+        writer.write("\0" * 1024 * 1024)
+        writer.flush()
+        contents = fp.getvalue()
+
+        for compress in (False, True):
+            self._use_datadir(filesystem_store_compress=compress)
+            path = self._add(contents)
+            self.assertEqual(contents, self._read(path))
+
+    def test_get_range(self):
+        """Test that a range of an image file can be read"""
+        ChunkedFile.CHUNKSIZE = 10
+        for compress in (False, True):
+            self._use_datadir(filesystem_store_compress=compress)
+            contents = "".join("%08d" % i for i in xrange(1000))
+            path = self._add(contents)
+            (image_file, image_size) = self.store.get(
+                    get_location_from_uri("file://%s" % path))
+            self.assertEqual(contents[95:4321],
+                             "".join(image_file.iter_range(95, 4321)))
+            self.assertEqual(None, image_file.fp)
+
+    def _use_datadir(self, **kwargs):
+        datadir = os.path.join(self.test_dir, 'images')
+        self.config(filesystem_store_datadir=datadir, **kwargs)
+        self.store = Store()
+        return datadir
+
+    def _add(self, contents):
+        image_id = utils.generate_uuid()
+        location, size, checksum = self.store.add(
+                image_id, StringIO.StringIO(contents), len(contents))
+        return location[len("file://"):]
+
+    def _read(self, path):
+        (image_file, image_size) = self.store.get(
+                get_location_from_uri("file://%s" % path))
+        return "".join(image_file)
+
+    def test_get_from_backend_timed(self):
+        """Reading the data is timed, as well as opening it"""
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        image_id = utils.generate_uuid()
+        self.store.add(image_id, StringIO.StringIO("chunk00000remainder"), 19)
+        uri = "file://%s/%s" % (self.test_dir, image_id)
+
+        image_file, image_size = glance.store.get_from_backend(
+                context.RequestContext(), uri)
+        self.assertFalse('store.filesystem.get' in
+                         metrics.snapshot()['timers'])
+        self.assertEqual("chunk00000remainder", ''.join(image_file))
+        timers = metrics.snapshot()['timers']
+        self.assertEqual(1, timers['store.filesystem.get']['count'])
+
+        # Ranges read by the store's iterator itself are timed too
+        image_file, image_size = glance.store.get_from_backend(
+                context.RequestContext(), uri)
+        self.assertEqual("00000rem",
+                         ''.join(image_file.iter_range(5, 13)))
+        timers = metrics.snapshot()['timers']
+        self.assertEqual(2, timers['store.filesystem.get']['count'])
+        image_file.close()
+
+    def test_add_dedup(self):
+        """
+        Test that images with the same data share one file, which is
+        deleted along with the last image sharing it
+        """
+        datadir = self._use_datadir(filesystem_store_dedup=True)
+        contents = "*" * 1024 * 5
+        first = self._add(contents)
+        second = self._add(contents)
+        other = self._add("#" * 1024 * 5)
+
+        self.assertEqual(os.stat(first).st_ino, os.stat(second).st_ino)
+        self.assertNotEqual(os.stat(first).st_ino, os.stat(other).st_ino)
+        # Both images and the blob are links to the same data
+        self.assertEqual(3, os.stat(first).st_nlink)
+        self.assertEqual(contents, self._read(second))
+
+        blob_dir = os.path.join(datadir, filesystem.BLOB_DIR)
+        self.assertEqual(2, len(os.listdir(blob_dir)))
+
+        self.store.delete(get_location_from_uri("file://%s" % first))
+        self.assertEqual(contents, self._read(second))
+        self.assertEqual(2, os.stat(second).st_nlink)
+
+        self.store.delete(get_location_from_uri("file://%s" % second))
+        self.store.delete(get_location_from_uri("file://%s" % other))
+        self.assertEqual([], os.listdir(blob_dir))
+        self.assertEqual([], os.listdir(os.path.join(datadir,
+                                                     filesystem.REF_DIR)))
+
+    def test_add_dedup_compares_bytes(self):
+        """
+        Test that an image is not linked to a blob with the same key but
+        different data, as a digest collision would give it
+        """
+        datadir = self._use_datadir(filesystem_store_dedup=True)
+        self.stubs.Set(filesystem, '_get_blob_key',
+                       lambda digest, size: 'colliding-%d' % size)
+        first = self._add("*" * 1024 * 5)
+        second = self._add("#" * 1024 * 5)
+
+        self.assertNotEqual(os.stat(first).st_ino, os.stat(second).st_ino)
+        self.assertEqual("*" * 1024 * 5, self._read(first))
+        self.assertEqual("#" * 1024 * 5, self._read(second))
+        self.assertEqual(['colliding-5120'],
+                         os.listdir(os.path.join(datadir,
+                                                 filesystem.BLOB_DIR)))
+        self.assertFalse(os.path.exists(second + '.dedup'))
+
+    def test_deduplicate_datadir(self):
+        """Test that existing image files are deduplicated in place"""
+        datadir = self._use_datadir()
+        contents = "*" * 1024 * 5
+        paths = [self._add(contents) for i in xrange(3)]
+        other = self._add("#" * 1024 * 5)
+
+        files, duplicates, freed = filesystem.deduplicate(datadir,
+                                                          dry_run=True)
+        self.assertEqual((4, 2), (files, duplicates))
+        self.assertEqual(1, os.stat(paths[0]).st_nlink)
+
+        files, duplicates, freed = filesystem.deduplicate(datadir)
+        self.assertEqual((4, 2), (files, duplicates))
+        self.assertTrue(freed > 0)
+        self.assertEqual(4, os.stat(paths[0]).st_nlink)
+        self.assertEqual(2, os.stat(other).st_nlink)
+        for path in paths:
+            self.assertEqual(contents, self._read(path))
+
+        # Deduplicated files are skipped the next time round
+        self.assertEqual((0, 0, 0), filesystem.deduplicate(datadir))
+
     def test_add_already_existing(self):
         """
         Tests that adding an image with an existing identifier
@@ -149,6 +342,7 @@ class TestStore(base.IsolatedUnitTest):
         self.assertRaises(exception,
                           self.store.add,
                           image_id, image_file, 0)
+        self.assertFalse(os.path.exists(location[len("file://"):]))
 
     def test_add_storage_full(self):
         """
@@ -178,6 +372,29 @@ class TestStore(base.IsolatedUnitTest):
         """
         self._do_test_add_failure(errno.ENOTDIR, IOError)
 
+    def test_add_read_failure_cleans_up(self):
+        """
+        Tests that a failure reading the image data does not leave a
+        partial image file behind to block another attempt
+        """
+        ChunkedFile.CHUNKSIZE = 1024
+        image_id = utils.generate_uuid()
+        file_contents = "*" * 1024 * 5
+
+        def broken_reader():
+            yield file_contents[:1024]
+            raise RuntimeError("connection reset")
+
+        self.assertRaises(RuntimeError, self.store.add, image_id,
+                          utils.CooperativeReader(broken_reader()), 0)
+        self.assertFalse(os.path.exists(os.path.join(self.test_dir,
+                                                     image_id)))
+
+        location, size, checksum = self.store.add(
+                image_id, StringIO.StringIO(file_contents),
+                len(file_contents))
+        self.assertEqual(len(file_contents), size)
+
     def test_delete(self):
         """
         Test we can delete an existing image in the filesystem store
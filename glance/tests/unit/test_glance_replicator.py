@@ -20,6 +20,7 @@ import json
 import os
 import StringIO
 import sys
+import zlib
 
 from glance.tests import utils as test_utils
 
@@ -138,14 +139,19 @@ class ImageServiceTestCase(test_utils.BaseTestCase):
         c = glance_replicator.ImageService(FakeHTTPConnection(), 'noauth')
 
         # Two images, one of which is queued
+        # The first page of the listing is gzipped
         resp = {'images': [IMG_RESPONSE_ACTIVE, IMG_RESPONSE_QUEUED]}
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        body = compressor.compress(json.dumps(resp)) + compressor.flush()
         c.conn.prime_request('GET', 'v1/images/detail?is_public=None', '',
-                             {'x-auth-token': 'noauth'},
-                             json.dumps(resp), {})
+                             {'x-auth-token': 'noauth',
+                              'accept-encoding': 'gzip'},
+                             body, {'content-encoding': 'gzip'})
         c.conn.prime_request('GET',
                              ('v1/images/detail?marker=%s&is_public=None'
                               % IMG_RESPONSE_QUEUED['id']),
-                             '', {'x-auth-token': 'noauth'},
+                             '', {'x-auth-token': 'noauth',
+                                  'accept-encoding': 'gzip'},
                              json.dumps({'images': []}), {})
 
         imgs = list(c.get_images())
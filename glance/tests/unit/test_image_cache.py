@@ -21,11 +21,16 @@ import os
 import random
 import shutil
 import StringIO
+import time
 
+import eventlet
 import stubout
 
+from glance.common import compression
 from glance.common import utils
 from glance import image_cache
+from glance.image_cache import prefetcher
+from glance.image_cache import warmer
 from glance.tests import utils as test_utils
 from glance.tests.utils import skip_if_disabled, xattr_writes_supported
 
@@ -222,6 +227,87 @@ class ImageCacheTestCase(object):
         self.assertEqual(self.cache.get_queued_images(),
                          ['0', '1', '2'])
 
+    @skip_if_disabled
+    def test_queue_priority(self):
+        """
+        Test that the priority an image is queued with is kept
+        """
+        self.assertTrue(self.cache.queue_image(1))
+        self.assertTrue(self.cache.queue_image(2, priority=10))
+
+        entries = self.cache.get_queue_entries()
+        self.assertEqual(['1', '2'], [e['image_id'] for e in entries])
+        self.assertEqual([0, 10], [e['priority'] for e in entries])
+
+    @skip_if_disabled
+    def test_prefetch_status(self):
+        """
+        Test that prefetch progress is recorded outside of the cache data
+        """
+        self.assertEqual({}, self.cache.get_prefetch_status())
+
+        status = {'state': 'running', 'total': 3, 'cached': 1}
+        self.cache.set_prefetch_status(status)
+        self.assertEqual(status, self.cache.get_prefetch_status())
+        self.assertEqual(0, self.cache.get_cache_size())
+
+    @skip_if_disabled
+    def test_sparse(self):
+        """
+        Test that chunks of zeros are left as holes in cached image files,
+        and read back as zeros
+        """
+        self.config(image_cache_sparse=True)
+        chunks = ['a' * 100, '\0' * 65536 * 4, 'b' * 100, '\0' * 65536 * 2]
+        data = ''.join(chunks)
+        self.assertTrue(self.cache.cache_image_iter('1', iter(chunks)))
+
+        self.assertEqual(len(data), self.cache.get_image_size('1'))
+        path = self.cache.driver.get_image_filepath('1')
+        self.assertTrue(os.stat(path).st_blocks * 512 < len(data))
+        with self.cache.open_for_read('1') as cache_file:
+            self.assertEqual(data,
+                             ''.join(utils.sparse_chunkiter(cache_file)))
+
+    def test_compressed(self):
+        """
+        Test that cached image files are compressed, and read back as
+        the original data
+        """
+        self.config(image_cache_compress=True)
+        chunks = ['%08d' % i for i in xrange(65536)]
+        data = ''.join(chunks)
+        self.assertTrue(self.cache.cache_image_iter('1', iter(chunks)))
+
+        self.assertEqual(len(data), self.cache.get_image_size('1'))
+        path = self.cache.driver.get_image_filepath('1')
+        self.assertTrue(os.path.getsize(path) < len(data) / 2)
+        with self.cache.open_for_read('1') as cache_file:
+            self.assertEqual(data[:10], cache_file.read(10))
+            self.assertEqual(data[10:], cache_file.read())
+
+    def test_compressed_data_cached_as_is(self):
+        """
+        Test that image data that looks like a compressed file is only
+        ever decompressed if the cache compressed it
+        """
+        fp = StringIO.StringIO()
+        writer = compression.CompressedWriter(fp)
+        writer.write('\0' * 1024 * 1024)
+        writer.flush()
+        data = fp.getvalue()
+
+        self.assertTrue(self.cache.cache_image_iter('1', iter([data])))
+        self.config(image_cache_compress=True)
+        self.assertTrue(self.cache.cache_image_iter('2', iter([data])))
+
+        for image_id in ('1', '2'):
+            self.assertEqual(len(data), self.cache.get_image_size(image_id))
+            with self.cache.open_for_read(image_id) as cache_file:
+                self.assertEqual(data, cache_file.read())
+        self.assertFalse(self.cache.driver.is_compressed('1'))
+        self.assertTrue(self.cache.driver.is_compressed('2'))
+
     def test_open_for_write_good(self):
         """
         Test to see if open_for_write works in normal case
@@ -370,6 +456,122 @@ class TestImageCacheXattr(test_utils.BaseTestCase,
         if os.path.exists(self.cache_dir):
             shutil.rmtree(self.cache_dir)
 
+    @skip_if_disabled
+    def test_index_avoids_directory_walk(self):
+        """
+        Once the index is built, sizing, listing and pruning the cache
+        are served from it rather than by walking the cache directory
+        """
+        self._setup_fixture_file()
+        self.cache.driver.get_index()
+
+        stubs = stubout.StubOutForTesting()
+        try:
+            def fake_walk(path):
+                self.fail("Cache directory walked")
+
+            from glance.image_cache.drivers import xattr as xattr_driver
+            stubs.Set(xattr_driver, 'get_all_regular_files', fake_walk)
+
+            with self.cache.open_for_read(1) as cache_file:
+                for chunk in cache_file:
+                    pass
+
+            self.assertEqual(FIXTURE_LENGTH, self.cache.get_cache_size())
+            self.assertEqual(1, self.cache.get_hit_count(1))
+            cached = self.cache.get_cached_images()
+            self.assertEqual(['1'], [entry['image_id'] for entry in cached])
+            self.assertEqual(1, cached[0]['hits'])
+            self.assertEqual(('1', FIXTURE_LENGTH),
+                             self.cache.driver.get_least_recently_accessed())
+
+            self.cache.delete_cached_image(1)
+            self.assertEqual(0, self.cache.get_cache_size())
+        finally:
+            stubs.UnsetAll()
+
+    def _other_process_cache(self):
+        """
+        Returns a cache with an index of its own, as another process
+        sharing the cache directory has.
+        """
+        other = image_cache.ImageCache()
+        other.driver.index = {'entries': {}, 'loaded_at': None,
+                              'generation': None, 'offset': 0, 'records': 0}
+        return other
+
+    @skip_if_disabled
+    def test_index_shared_through_journal(self):
+        """
+        Entries cached, read and deleted by another process show up
+        without the cache directory being walked again
+        """
+        self.cache.driver.get_index()
+        other = self._other_process_cache()
+
+        stubs = stubout.StubOutForTesting()
+        try:
+            def fake_walk(path):
+                self.fail("Cache directory walked")
+
+            from glance.image_cache.drivers import xattr as xattr_driver
+            stubs.Set(xattr_driver, 'get_all_regular_files', fake_walk)
+
+            other.cache_image_file(1, StringIO.StringIO(FIXTURE_DATA))
+            with other.open_for_read(1) as cache_file:
+                for chunk in cache_file:
+                    pass
+            self.assertEqual(FIXTURE_LENGTH, self.cache.get_cache_size())
+            self.assertEqual(1, self.cache.get_cached_images()[0]['hits'])
+
+            # A new process loads the index from the journal
+            self.assertEqual(1, self._other_process_cache().get_hit_count(1))
+
+            other.delete_cached_image(1)
+            self.assertEqual(0, self.cache.get_cache_size())
+        finally:
+            stubs.UnsetAll()
+
+    @skip_if_disabled
+    def test_journal_compacted(self):
+        """
+        The journal is rewritten with one record per entry once it has
+        many more records than entries
+        """
+        self.stubs = stubout.StubOutForTesting()
+        self.addCleanup(self.stubs.UnsetAll)
+        from glance.image_cache.drivers import xattr as xattr_driver
+        self.stubs.Set(xattr_driver, 'JOURNAL_MIN_RECORDS', 5)
+        self._setup_fixture_file()
+        for x in xrange(6):
+            with self.cache.open_for_read(1) as cache_file:
+                for chunk in cache_file:
+                    pass
+        self.cache.get_cache_size()
+
+        self.assertTrue(self.cache.driver.index['records'] <= 5)
+        self.assertEqual(6, self._other_process_cache().get_hit_count(1))
+
+    @skip_if_disabled
+    def test_index_reconciled_with_disk(self):
+        """
+        Files changed outside of Glance show up when the index is
+        reconciled, keeping the hits recorded in the journal
+        """
+        self._setup_fixture_file()
+        with self.cache.open_for_read(1) as cache_file:
+            for chunk in cache_file:
+                pass
+        with open(os.path.join(self.cache_dir, '2'), 'wb') as image_file:
+            image_file.write(FIXTURE_DATA)
+
+        self.config(image_cache_index_reconcile_interval=0)
+        # Make sure the reconcile interval of 0 seconds has passed
+        time.sleep(0.01)
+
+        self.assertEqual(FIXTURE_LENGTH * 2, self.cache.get_cache_size())
+        self.assertEqual(1, self.cache.get_hit_count(1))
+
 
 class TestImageCacheSqlite(test_utils.BaseTestCase,
                            ImageCacheTestCase):
@@ -499,3 +701,196 @@ class TestImageCacheNoDep(test_utils.BaseTestCase):
 
         caching_iter = cache.get_caching_iter('dummy_id', None, iter(data))
         self.assertEqual(list(caching_iter), data)
+
+
+class TestPrefetcher(test_utils.BaseTestCase):
+
+    def setUp(self):
+        super(TestPrefetcher, self).setUp()
+        self.cache_dir = os.path.join("/", "tmp", "test.cache.%d" %
+                                      random.randint(0, 1000000))
+        self.config(image_cache_dir=self.cache_dir,
+                    image_cache_driver='sqlite',
+                    image_cache_max_size=FIXTURE_LENGTH * 3,
+                    image_cache_prefetch_concurrency=2,
+                    registry_host='127.0.0.1',
+                    registry_port=9191)
+        self.stubs = stubout.StubOutForTesting()
+
+        self.images = {}
+        self.active = 0
+        self.peak = 0
+
+        def fake_get_image_metadata(context, image_id):
+            return self.images[image_id]
+
+        def fake_get_from_backend(context, location):
+            def chunks():
+                self.active += 1
+                self.peak = max(self.peak, self.active)
+                for i in xrange(4):
+                    eventlet.sleep(0)
+                    yield FIXTURE_DATA[:FIXTURE_LENGTH / 4]
+                self.active -= 1
+            return chunks(), FIXTURE_LENGTH
+
+        self.stubs.Set(prefetcher.registry, 'get_image_metadata',
+                       fake_get_image_metadata)
+        self.stubs.Set(prefetcher, 'get_from_backend', fake_get_from_backend)
+        self.prefetcher = prefetcher.Prefetcher()
+
+    def tearDown(self):
+        self.stubs.UnsetAll()
+        super(TestPrefetcher, self).tearDown()
+        if os.path.exists(self.cache_dir):
+            shutil.rmtree(self.cache_dir)
+
+    def _queue(self, image_id, size=FIXTURE_LENGTH, priority=0):
+        self.images[image_id] = {'id': image_id, 'status': 'active',
+                                 'size': size, 'location': 'fake://'}
+        self.prefetcher.cache.queue_image(image_id, priority)
+
+    def test_order_queue(self):
+        self.prefetcher.popularity = {'c': 5}
+        entries = [{'image_id': 'a', 'queued_at': 1, 'priority': 0},
+                   {'image_id': 'b', 'queued_at': 2, 'priority': 1},
+                   {'image_id': 'c', 'queued_at': 3, 'priority': 0},
+                   {'image_id': 'd', 'queued_at': 0, 'priority': 0}]
+        self.assertEqual(['b', 'c', 'd', 'a'],
+                         self.prefetcher.order_queue(entries))
+
+    def test_run_bounded_concurrency(self):
+        for x in xrange(3):
+            self._queue(str(x))
+
+        self.assertTrue(self.prefetcher.run())
+
+        self.assertEqual(2, self.peak)
+        for x in xrange(3):
+            self.assertTrue(self.prefetcher.cache.is_cached(str(x)))
+
+        status = self.prefetcher.cache.get_prefetch_status()
+        self.assertEqual('finished', status['state'])
+        self.assertEqual(3, status['cached'])
+        self.assertEqual(FIXTURE_LENGTH * 3, status['bytes_fetched'])
+        self.assertEqual({}, status['in_progress'])
+
+    def test_run_skips_images_that_do_not_fit(self):
+        self._queue('small')
+        self._queue('big', size=FIXTURE_LENGTH * 4, priority=1)
+
+        # Skipped images are not failures
+        self.assertTrue(self.prefetcher.run())
+
+        cache = self.prefetcher.cache
+        self.assertTrue(cache.is_cached('small'))
+        self.assertFalse(cache.is_cached('big'))
+        self.assertTrue(cache.is_queued('big'))
+        self.assertEqual(1, cache.get_prefetch_status()['skipped'])
+
+    def test_run_skips_images_being_cached(self):
+        self._queue('a')
+        self.stubs.Set(self.prefetcher.cache.driver, 'is_cacheable',
+                       lambda image_id: False)
+
+        self.assertTrue(self.prefetcher.run())
+
+        status = self.prefetcher.cache.get_prefetch_status()
+        self.assertEqual(1, status['skipped'])
+        self.assertEqual(0, status['failed'])
+
+    def test_run_fails_inactive_images(self):
+        self._queue('a')
+        self.images['a']['status'] = 'killed'
+
+        self.assertFalse(self.prefetcher.run())
+        self.assertEqual(1,
+                         self.prefetcher.cache.get_prefetch_status()['failed'])
+
+    def test_bandwidth_limiter(self):
+        limiter = prefetcher.BandwidthLimiter(1000)
+        start = time.time()
+        data = list(limiter.throttle(['x' * 50] * 4))
+        self.assertEqual(4, len(data))
+        # 150 bytes must wait for the limiter after the first chunk
+        self.assertTrue(time.time() - start >= 0.14)
+
+
+class TestWarmer(test_utils.BaseTestCase):
+
+    def setUp(self):
+        super(TestWarmer, self).setUp()
+        self.cache_dir = os.path.join("/", "tmp", "test.cache.%d" %
+                                      random.randint(0, 1000000))
+        self.config(image_cache_dir=self.cache_dir,
+                    image_cache_driver='sqlite',
+                    image_cache_max_size=FIXTURE_LENGTH * 10,
+                    image_cache_warmer_peers=['peer1:9292'],
+                    image_cache_warmer_top_n=2,
+                    image_cache_warmer_budget=FIXTURE_LENGTH * 3,
+                    registry_host='127.0.0.1',
+                    registry_port=9191)
+        self.stubs = stubout.StubOutForTesting()
+        self.peer_records = []
+        self.fetched = []
+
+        test = self
+
+        class FakeClient(object):
+            def get_cached_images(self):
+                return test.peer_records
+
+        def fake_fetch(image_id):
+            self.fetched.append(image_id)
+            return prefetcher.CACHED
+
+        self.warmer = warmer.Warmer()
+        self.stubs.Set(self.warmer, 'get_peer_client',
+                       lambda peer: FakeClient())
+        self.stubs.Set(self.warmer, 'fetch_image_into_cache', fake_fetch)
+
+    def tearDown(self):
+        self.stubs.UnsetAll()
+        super(TestWarmer, self).tearDown()
+        if os.path.exists(self.cache_dir):
+            shutil.rmtree(self.cache_dir)
+
+    def _record(self, image_id, hits, size=FIXTURE_LENGTH):
+        return {'image_id': image_id, 'hits': hits, 'size': size}
+
+    def test_update_ranking_is_incremental(self):
+        self.peer_records = [self._record('a', 10), self._record('b', 4)]
+        ranking = self.warmer.update_ranking(self.warmer.observe())
+        self.assertEqual({'a': 10, 'b': 4}, ranking['scores'])
+
+        # Only hits since the last run count, on top of decayed scores
+        self.peer_records = [self._record('a', 10), self._record('b', 12)]
+        ranking = self.warmer.update_ranking(self.warmer.observe())
+        self.assertEqual({'a': 5, 'b': 10}, ranking['scores'])
+
+        # A peer that pruned and re-cached an image restarts its count
+        self.peer_records = [self._record('a', 3)]
+        ranking = self.warmer.update_ranking(self.warmer.observe())
+        self.assertEqual({'a': 5.5, 'b': 5}, ranking['scores'])
+
+    def test_unreachable_peer_is_skipped(self):
+        def fail(peer):
+            raise IOError('unreachable')
+
+        self.stubs.Set(self.warmer, 'get_peer_client', fail)
+        self.assertEqual(['local'], self.warmer.observe().keys())
+
+    def test_select_within_budget(self):
+        ranking = {'scores': {'a': 10, 'b': 8, 'c': 6, 'd': 4},
+                   'sizes': {'a': FIXTURE_LENGTH,
+                             'b': FIXTURE_LENGTH * 3,
+                             'c': FIXTURE_LENGTH,
+                             'd': FIXTURE_LENGTH}}
+        # 'b' does not fit next to 'a', and top_n stops after two images
+        self.assertEqual(['a', 'c'], self.warmer.select(ranking))
+
+    def test_run_prefetches_most_popular(self):
+        self.peer_records = [self._record('a', 1), self._record('b', 9),
+                             self._record('c', 5)]
+        self.assertTrue(self.warmer.run())
+        self.assertEqual(['b', 'c'], self.fetched)
@@ -0,0 +1,218 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack, LLC
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+import socket
+
+import routes
+import routes.middleware
+import webob
+
+from glance.api.middleware import metrics as metrics_middleware
+from glance.common import metrics
+import glance.context
+from glance.tests import utils as test_utils
+
+
+class TestMetrics(test_utils.BaseTestCase):
+
+    def setUp(self):
+        super(TestMetrics, self).setUp()
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_histogram(self):
+        histogram = metrics.Histogram()
+        self.assertEqual(None, histogram.percentile(50))
+        for value in range(1, 101):
+            histogram.observe(value)
+
+        summary = histogram.to_dict()
+        self.assertEqual(100, summary['count'])
+        self.assertEqual(5050, summary['sum'])
+        self.assertEqual(1, summary['min'])
+        self.assertEqual(100, summary['max'])
+        self.assertEqual(50.5, summary['mean'])
+        self.assertEqual(50, summary['p50'])
+        self.assertEqual(100, summary['p90'])
+        self.assertEqual(100, summary['p99'])
+        self.assertEqual(1, summary['buckets']['1'])
+        self.assertEqual(50, summary['buckets']['100'])
+        self.assertEqual(0, summary['buckets']['inf'])
+
+        histogram.observe(60000)
+        self.assertEqual(60000, histogram.percentile(100))
+        self.assertEqual(1, histogram.to_dict()['buckets']['inf'])
+
+    def test_snapshot_and_reset(self):
+        metrics.increment('a.count')
+        metrics.increment('a.count', 2)
+        metrics.gauge('a.size', 10)
+        metrics.gauge('a.size', 7)
+        metrics.timing('a.time', 12)
+        with metrics.timer('a.block'):
+            pass
+
+        snapshot = metrics.snapshot()
+        self.assertEqual({'a.count': 3}, snapshot['counters'])
+        self.assertEqual({'a.size': 7}, snapshot['gauges'])
+        self.assertEqual(1, snapshot['timers']['a.time']['count'])
+        self.assertEqual(12, snapshot['timers']['a.time']['max'])
+        self.assertEqual(1, snapshot['timers']['a.block']['count'])
+
+        metrics.reset()
+        self.assertEqual({'counters': {}, 'gauges': {}, 'timers': {}},
+                         metrics.snapshot())
+
+    def test_timed_records_failures(self):
+        @metrics.timed('failing')
+        def fail():
+            raise ValueError()
+
+        self.assertRaises(ValueError, fail)
+        self.assertEqual(1, metrics.snapshot()['timers']['failing']['count'])
+
+    def test_disabled(self):
+        self.config(metrics_enabled=False)
+        metrics.increment('a.count')
+        metrics.timing('a.time', 1)
+        self.assertEqual({'counters': {}, 'gauges': {}, 'timers': {}},
+                         metrics.snapshot())
+
+    def test_statsd(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.addCleanup(sock.close)
+        sock.bind(('127.0.0.1', 0))
+        sock.settimeout(5)
+        self.config(statsd_host='127.0.0.1',
+                    statsd_port=sock.getsockname()[1],
+                    statsd_prefix='glance-api')
+
+        metrics.increment('a.count', 2)
+        metrics.gauge('a.size', 7)
+        metrics.timing('a.time', 1.5)
+
+        self.assertEqual('glance-api.a.count:2|c', sock.recv(512))
+        self.assertEqual('glance-api.a.size:7|g', sock.recv(512))
+        self.assertEqual('glance-api.a.time:1.500|ms', sock.recv(512))
+
+    def test_route_name(self):
+        image_id = '71c675ab-d94f-49cd-a114-e12490b328d9'
+        for method, path, name in (
+                ('GET', '/', 'GET'),
+                ('GET', '/v1/images', 'GET.v1.images'),
+                ('GET', '/v1/images/detail', 'GET.v1.images.detail'),
+                ('HEAD', '/v1/images/%s' % image_id, 'HEAD.v1.images.id'),
+                ('PUT', '/v1/images/%s/members/tenant1' % image_id,
+                 'PUT.v1.images.id.members.id'),
+                ('PUT', '/v2/images/%s/file' % image_id,
+                 'PUT.v2.images.id.file'),
+                ('GET', '/images/detail', 'GET.images.detail'),
+                ('DELETE', '/v2/images/%s/tags/Foo Bar' % image_id,
+                 'DELETE.v2.images.id.tags.id')):
+            self.assertEqual(name, metrics.route_name(method, path))
+
+
+class TestMetricsMiddleware(test_utils.BaseTestCase):
+
+    def setUp(self):
+        super(TestMetricsMiddleware, self).setUp()
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def _app(self, environ, start_response):
+        start_response('201 Created', [('Content-Type', 'text/plain')])
+        return ['abc', 'defg']
+
+    def _router(self):
+        mapper = routes.Mapper()
+        mapper.connect('/images')
+        mapper.connect('/images/{id}')
+        return routes.middleware.RoutesMiddleware(self._app, mapper)
+
+    def _request(self, path, method='GET', is_admin=False, body=None,
+                 script_name='/v1'):
+        req = webob.Request.blank(path, method=method)
+        req.script_name = script_name
+        if body is not None:
+            req.body = body
+        req.context = glance.context.RequestContext(is_admin=is_admin)
+        return req.get_response(metrics_middleware.MetricsMiddleware(
+                self._router()))
+
+    def test_records_requests(self):
+        res = self._request('/images/123', method='PUT', body='12345')
+        self.assertEqual(201, res.status_int)
+        self.assertEqual('abcdefg', res.body)
+
+        snapshot = metrics.snapshot()
+        name = 'request.PUT.v1.images.id'
+        self.assertEqual(1, snapshot['timers'][name]['count'])
+        self.assertEqual(1, snapshot['counters'][name + '.status.2xx'])
+        self.assertEqual(7, snapshot['counters'][name + '.bytes_out'])
+        self.assertEqual(5, snapshot['counters'][name + '.bytes_in'])
+
+    def test_negotiated_version(self):
+        self.assertEqual('abcdefg',
+                         self._request('/images', script_name='/v1/v1').body)
+        snapshot = metrics.snapshot()
+        self.assertEqual(['request.GET.v1.images'],
+                         snapshot['timers'].keys())
+
+    def test_unversioned_route(self):
+        self.assertEqual('abcdefg',
+                         self._request('/images', script_name='').body)
+        snapshot = metrics.snapshot()
+        self.assertEqual(['request.GET.images'], snapshot['timers'].keys())
+
+    def test_unknown_requests_named_other(self):
+        for path, method in (('/images/123/foo', 'GET'),
+                             ('/images/123/bar', 'GET'),
+                             ('/images/123', 'FOO'),
+                             ('/images/123', 'BAR')):
+            # The request is recorded once its body has been read
+            self._request(path, method=method).body
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(['request.GET.other', 'request.other.v1.images.id'],
+                         sorted(snapshot['timers'].keys()))
+        self.assertEqual(2, snapshot['timers']['request.GET.other']['count'])
+
+    def test_route_path_of_request_served_before_router(self):
+        environ = {'REQUEST_METHOD': 'GET',
+                   metrics.ROUTE_PATH: '/v2/images/{id}/file'}
+        self.assertEqual('GET.v2.images.id.file',
+                         metrics.request_name(environ))
+
+    def test_show_metrics_admin_only(self):
+        # The request is recorded once its body has been sent
+        self.assertEqual('abcdefg', self._request('/images').body)
+
+        res = self._request('/metrics')
+        self.assertEqual(403, res.status_int)
+
+        res = self._request('/metrics', is_admin=True)
+        self.assertEqual(200, res.status_int)
+        self.assertEqual('application/json', res.content_type)
+        snapshot = json.loads(res.body)
+        self.assertEqual(1, snapshot['timers']['request.GET.v1.images']
+                                     ['count'])
+
+    def test_show_metrics_get_only(self):
+        res = self._request('/metrics', method='POST', is_admin=True)
+        self.assertEqual(405, res.status_int)
+        self.assertEqual('GET', res.headers['Allow'])
@@ -162,7 +162,9 @@ class TestRabbitNotifier(utils.BaseTestCase):
             raise MyException('meow')
 
         self.notify_kombu.RabbitStrategy._connect = _connect
-        self.assertRaises(MyException, notifier.Notifier)
+        # The strategy connects when the first message is sent
+        notifier_ = notifier.Notifier()
+        self.assertRaises(MyException, notifier_.error, 'a', 'b')
 
     def test_timeout_on_connect_reconnects(self):
         info = {'num_called': 0}
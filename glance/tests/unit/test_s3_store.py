@@ -24,9 +24,11 @@ import boto.s3.connection
 import stubout
 
 from glance.common import exception
+from glance.common import metrics
 from glance.common import utils
 from glance.openstack.common import cfg
 from glance.store.location import get_location_from_uri
+import glance.store.s3
 from glance.store.s3 import Store, get_s3_location
 from glance.store import UnsupportedBackend
 from glance.tests.unit import base
@@ -109,10 +111,7 @@ def stub_out_s3(stubs):
             del self.keys[key]
 
         def get_key(self, key_name, **kwargs):
-            key = self.keys.get(key_name)
-            if not key:
-                return FakeKey(self, key_name)
-            return key
+            return self.keys.get(key_name)
 
         def new_key(self, key_name):
             new_key = FakeKey(self, key_name)
@@ -129,7 +128,7 @@ def stub_out_s3(stubs):
         if host.startswith('http://') or host.startswith('https://'):
             raise UnsupportedBackend(host)
 
-    def fake_get_bucket(conn, bucket_id):
+    def fake_get_bucket(conn, bucket_id, validate=True, headers=None):
         bucket = fixture_buckets.get(bucket_id)
         if not bucket:
             bucket = FakeBucket(bucket_id)
@@ -165,12 +164,16 @@ class TestStore(base.StoreClearingUnitTest):
         super(TestStore, self).setUp()
         self.stubs = stubout.StubOutForTesting()
         stub_out_s3(self.stubs)
+        glance.store.s3.clear_connections()
+        metrics.reset()
         self.store = Store()
 
     def tearDown(self):
         """Clear the test environment"""
         super(TestStore, self).tearDown()
         self.stubs.UnsetAll()
+        glance.store.s3.clear_connections()
+        metrics.reset()
 
     def test_get(self):
         """Test a "normal" retrieval of an image in chunks"""
@@ -187,6 +190,56 @@ class TestStore(base.StoreClearingUnitTest):
             data += chunk
         self.assertEqual(expected_data, data)
 
+    def test_connection_and_bucket_reused(self):
+        """
+        Test that requests share a connection and bucket handle, and the
+        bucket is not validated against S3
+        """
+        get_bucket_calls = []
+        fake_get_bucket = boto.s3.connection.S3Connection.get_bucket
+
+        def counting_get_bucket(conn, bucket_id, validate=True, headers=None):
+            get_bucket_calls.append(validate)
+            return fake_get_bucket(conn, bucket_id, validate, headers)
+
+        self.stubs.Set(boto.s3.connection.S3Connection,
+                       'get_bucket', counting_get_bucket)
+        loc = get_location_from_uri(
+            "s3://user:key@localhost:8080/glance/%s" % FAKE_UUID)
+        self.assertEqual(FIVE_KB, self.store.get_size(loc))
+        self.assertEqual(FIVE_KB, self.store.get_size(loc))
+        (image_s3, image_size) = self.store.get(loc)
+        self.assertEqual("*" * FIVE_KB, ''.join(image_s3))
+
+        self.assertEqual([False], get_bucket_calls)
+        counters = metrics.snapshot()['counters']
+        self.assertEqual(1, counters['s3.connections.created'])
+        self.assertEqual(2, counters['s3.connections.reused'])
+
+        # A bucket written to is checked, once
+        self.store.add(utils.generate_uuid(), StringIO.StringIO('*'), 1)
+        self.store.add(utils.generate_uuid(), StringIO.StringIO('*'), 1)
+        self.assertEqual([False, True, False], get_bucket_calls)
+
+    def test_other_stores_not_cached(self):
+        """
+        Test that connections with other hosts or credentials, and other
+        buckets, are not cached
+        """
+        for uri, size in (("s3://user:key@auth_address/glance/%s", FIVE_KB),
+                          ("s3://user:other@localhost:8080/glance/%s",
+                           FIVE_KB),
+                          ("s3://user:key@localhost:8080/other/%s", 0)):
+            loc = get_location_from_uri(uri % FAKE_UUID)
+            self.assertEqual(size, self.store.get_size(loc))
+            self.assertEqual(size, self.store.get_size(loc))
+
+        counters = metrics.snapshot()['counters']
+        self.assertEqual(5, counters['s3.connections.created'])
+        self.assertEqual(1, counters['s3.connections.reused'])
+        self.assertEqual(1, len(glance.store.s3._CONNECTIONS))
+        self.assertEqual(0, len(glance.store.s3._BUCKETS))
+
     def test_get_non_existing(self):
         """
         Test that trying to retrieve a s3 that doesn't exist
@@ -52,6 +52,18 @@ class TestBasicSchema(test_utils.BaseTestCase):
         actual = set(self.schema.raw()['properties'].keys())
         self.assertEqual(actual, expected)
 
+    def test_validator_compiled_once(self):
+        validator = self.schema.validator()
+        self.schema.validate({'ham': 'no'})
+        self.assertTrue(validator is self.schema.validator())
+
+    def test_validator_recompiled_after_merge(self):
+        self.schema.validate({'ham': 'no'})
+        self.schema.merge_properties({'bacon': {'type': 'integer'}})
+        self.schema.validate({'bacon': 2})  # No exception raised
+        self.assertRaises(exception.InvalidObject, self.schema.validate,
+                          {'bacon': 'crispy'})
+
     def test_merge_conflicting_properties(self):
         conflicts = {'eggs': {'type': 'integer'}}
         self.assertRaises(exception.SchemaLoadError,
@@ -0,0 +1,213 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack, LLC
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import stat
+import time
+
+import eventlet
+import stubout
+
+from glance.common import exception
+from glance.common import utils
+from glance import store
+from glance.store import scrub_queue
+from glance.store import scrubber
+from glance.tests import utils as test_utils
+
+
+class FakeRegistry(object):
+
+    auth_tok = None
+
+    def __init__(self):
+        self.batches = []
+
+    def update_images(self, images):
+        self.batches.append(images)
+        return images
+
+
+class TestScrubQueue(test_utils.BaseTestCase):
+
+    def setUp(self):
+        super(TestScrubQueue, self).setUp()
+        self.test_id, self.test_dir = test_utils.get_isolated_test_env()
+        self.queue = scrub_queue.ScrubQueue(self.test_dir)
+        self.stubs = stubout.StubOutForTesting()
+
+    def tearDown(self):
+        self.stubs.UnsetAll()
+        super(TestScrubQueue, self).tearDown()
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_add_and_get_due(self):
+        """Due entries come back oldest first, future ones not at all"""
+        now = int(time.time())
+        self.queue.add('a', 'file:///a', now - 10)
+        self.queue.add('b', 'file:///b', now - 20)
+        self.queue.add('c', 'file:///c', now + 60)
+
+        due = self.queue.get_due(now)
+        self.assertEqual([('b', 'file:///b', now - 20),
+                          ('a', 'file:///a', now - 10)], due)
+        self.assertEqual(1, len(self.queue.get_due(now, limit=1)))
+        self.assertEqual(3, self.queue.depth())
+
+    def test_add_duplicate(self):
+        now = time.time()
+        self.queue.add('a', 'file:///a', now)
+        errors = []
+        self.stubs.Set(scrub_queue.LOG, 'error', errors.append)
+        self.assertRaises(exception.Duplicate,
+                          self.queue.add, 'a', 'file:///a', now)
+        self.assertEqual([], errors)
+
+    def test_db_private_to_owner(self):
+        """Queued locations may hold store credentials"""
+        mode = os.stat(self.queue.db_path).st_mode
+        self.assertEqual(0600, stat.S_IMODE(mode))
+
+    def test_requeue_and_remove(self):
+        now = int(time.time())
+        self.queue.add('a', 'file:///a', now + 60)
+        self.queue.requeue('a', 'file:///a', now)
+        self.queue.requeue('b', 'file:///b', now)
+        self.assertEqual(2, len(self.queue.get_due(now)))
+
+        self.queue.remove(['a', 'b'])
+        self.assertEqual(0, self.queue.depth())
+
+    def test_queue_shared_between_instances(self):
+        """The API and the scrubber see the same queue"""
+        self.queue.add('a', 'file:///a', time.time())
+        other = scrub_queue.ScrubQueue(self.test_dir)
+        self.assertEqual(1, other.depth())
+
+    def test_get_scrub_queue_reused(self):
+        queue = scrub_queue.get_scrub_queue(self.test_dir)
+        self.assertTrue(queue is scrub_queue.get_scrub_queue(self.test_dir))
+
+
+class TestStoreThrottle(test_utils.BaseTestCase):
+
+    def test_concurrency_bounded(self):
+        throttle = scrubber.StoreThrottle(2)
+        active = []
+        peak = []
+
+        def work():
+            with throttle:
+                active.append(1)
+                peak.append(len(active))
+                eventlet.sleep(0.01)
+                active.pop()
+
+        pool = eventlet.greenpool.GreenPool(10)
+        for i in xrange(6):
+            pool.spawn_n(work)
+        pool.waitall()
+        self.assertEqual(2, max(peak))
+
+    def test_rate_limited(self):
+        throttle = scrubber.StoreThrottle(10, rate=50)
+        start = time.time()
+        for i in xrange(6):
+            with throttle:
+                pass
+        # Five intervals of 1/50th of a second between six starts
+        self.assertTrue(time.time() - start >= 0.09)
+
+    def test_parse_store_limits(self):
+        limits = scrubber.parse_store_limits(['swift:20:50', 's3:5'])
+        self.assertEqual({'swift': (20, 50.0), 's3': (5, 0)}, limits)
+        self.assertRaises(exception.BadStoreConfiguration,
+                          scrubber.parse_store_limits, ['swift'])
+
+
+class TestScrubber(test_utils.BaseTestCase):
+
+    def setUp(self):
+        super(TestScrubber, self).setUp()
+        self.test_id, self.test_dir = test_utils.get_isolated_test_env()
+        self.stubs = stubout.StubOutForTesting()
+        self.config(scrubber_datadir=self.test_dir,
+                    scrubber_registry_batch_size=2)
+
+        self.registry = FakeRegistry()
+        self.stubs.Set(scrubber.registry, 'configure_registry_client',
+                       lambda: None)
+        self.stubs.Set(scrubber.registry, 'configure_registry_admin_creds',
+                       lambda: None)
+        self.stubs.Set(scrubber.registry, 'get_registry_client',
+                       lambda ctx: self.registry)
+        self.deleted = []
+
+        def fake_delete(context, uri):
+            if uri.endswith('missing'):
+                raise exception.NotFound()
+            if uri.endswith('broken'):
+                raise store.UnsupportedBackend()
+            self.deleted.append(uri)
+
+        self.stubs.Set(store, 'delete_from_backend', fake_delete)
+        self.scrubber = scrubber.Scrubber()
+
+    def tearDown(self):
+        self.stubs.UnsetAll()
+        super(TestScrubber, self).tearDown()
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_run(self):
+        now = time.time()
+        queue = self.scrubber.queue
+        queue.add('1', 'file:///1', now - 10)
+        queue.add('2', 'file:///2', now - 10)
+        queue.add('3', 'file:///missing', now - 10)
+        queue.add('4', 'file:///broken', now - 10)
+        queue.add('5', 'file:///5', now + 600)
+
+        self.scrubber.run(eventlet.greenpool.GreenPool(10))
+
+        self.assertEqual(['file:///1', 'file:///2'], sorted(self.deleted))
+        statuses = [image for batch in self.registry.batches
+                    for image in batch]
+        self.assertEqual(['1', '2', '3'],
+                         sorted(image['id'] for image in statuses))
+        self.assertTrue(all(len(b) <= 2 for b in self.registry.batches))
+
+        # The failed delete and the future one stay queued
+        self.assertEqual(2, queue.depth())
+        self.assertEqual(3, self.scrubber.stats['deleted'])
+        self.assertEqual(1, self.scrubber.stats['failed'])
+        self.assertEqual(2, self.scrubber.stats['queue_depth'])
+
+    def test_run_imports_queue_files(self):
+        """Queue files written by earlier releases are picked up"""
+        image_id = utils.generate_uuid()
+        file_path = os.path.join(self.test_dir, image_id)
+        scrubber.write_queue_file(file_path, 'file:///legacy',
+                                  time.time() - 10)
+
+        self.scrubber.run(eventlet.greenpool.GreenPool(10))
+
+        self.assertEqual(['file:///legacy'], self.deleted)
+        self.assertFalse(os.path.exists(file_path))
+        self.assertEqual(0, self.scrubber.queue.depth())
@@ -362,3 +362,35 @@ class TestStoreLocation(base.StoreClearingUnitTest):
                               glance.store.get_store_from_scheme,
                               ctx,
                               store)
+
+    def test_known_store_schemes(self):
+        """
+        Test that the schemes the stores Glance ships are registered with
+        are those the stores handle, without loading the stores
+        """
+        known_stores = [opt.default for opt in glance.store.store_opts
+                        if opt.name == 'known_stores'][0]
+        self.assertEqual(sorted(known_stores),
+                         sorted(glance.store.STORE_SCHEMES.keys()))
+
+        ctx = context.RequestContext()
+        for store_entry, schemes in glance.store.STORE_SCHEMES.items():
+            for scheme in schemes:
+                scheme_info = location.SCHEME_TO_CLS_MAP[scheme]
+                self.assertEqual(store_entry, scheme_info['store_entry'])
+                self.assertFalse('store_class' in scheme_info)
+
+            store = glance.store.get_store_from_scheme(ctx, schemes[0])
+            self.assertEqual(sorted(schemes), sorted(store.get_schemes()))
+            self.assertEqual(store.get_store_location_class(),
+                             location.SCHEME_TO_CLS_MAP[schemes[-1]]
+                                                       ['location_class'])
+
+    def test_unloadable_store_scheme(self):
+        """A store that cannot be imported is as if it were unknown"""
+        location.register_scheme_map(
+                {'fake': {'store_entry': 'glance.store.missing.Store'}})
+        self.assertRaises(exception.UnknownScheme,
+                          location.get_scheme_info, 'fake')
+        self.assertRaises(exception.UnknownScheme,
+                          location.get_location_from_uri, 'fake://image')
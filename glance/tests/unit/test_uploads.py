@@ -0,0 +1,162 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack, LLC
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import StringIO
+import tempfile
+import time
+
+from glance.api import uploads
+import glance.common.config
+from glance.common import exception
+from glance.tests import utils as test_utils
+
+
+class InterruptedFile(object):
+    """A part whose connection drops after some bytes."""
+
+    def __init__(self, data, fail_after):
+        self.data = StringIO.StringIO(data)
+        self.fail_after = fail_after
+
+    def read(self, size):
+        if self.data.tell() >= self.fail_after:
+            raise IOError("Connection reset by peer")
+        return self.data.read(min(size, self.fail_after - self.data.tell()))
+
+
+class TestUploads(test_utils.BaseTestCase):
+
+    def setUp(self):
+        super(TestUploads, self).setUp()
+        self.staging_dir = tempfile.mkdtemp()
+        self.config(upload_staging_dir=self.staging_dir)
+        self.upload = uploads.get_upload('image-id')
+        self.data = ''.join('%08d' % i for i in xrange(20000))
+
+    def tearDown(self):
+        super(TestUploads, self).tearDown()
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+    def _write(self, start, end, size=None):
+        return self.upload.write_part(
+                StringIO.StringIO(self.data[start:end]), start, end, size)
+
+    def _read(self):
+        image_file, size = self.upload.open()
+        with image_file:
+            self.assertEqual(len(self.data), size)
+            return image_file.read()
+
+    def test_parse_content_range(self):
+        self.assertEqual((0, 100, 1000),
+                         uploads.parse_content_range('bytes 0-99/1000', 100))
+        self.assertEqual((100, 200, None),
+                         uploads.parse_content_range('bytes 100-199/*'))
+        self.assertEqual((0, 19, 19),
+                         uploads.parse_content_range(None, 19))
+        self.assertEqual((0, None, None),
+                         uploads.parse_content_range(None, None))
+        for value, content_length in (('bytes 0-99/1000', 99),
+                                      ('bytes 10-9/100', None),
+                                      ('bytes 0-99/50', None),
+                                      ('bytes=0-99', None),
+                                      ('0-99/100', None)):
+            self.assertRaises(exception.Invalid, uploads.parse_content_range,
+                              value, content_length)
+
+    def test_parts_out_of_order(self):
+        size = len(self.data)
+        status = self._write(100000, size, size)
+        self.assertFalse(status['complete'])
+        self.assertEqual(0, status['offset'])
+        self.assertEqual([[100000, size - 1]], status['ranges'])
+        self._write(50000, 100000)
+        status = self._write(0, 50000)
+        self.assertTrue(status['complete'])
+        self.assertEqual(size, status['offset'])
+        self.assertEqual(size, status['committed'])
+        self.assertEqual([[0, size - 1]], status['ranges'])
+        self.assertEqual(self.data, self._read())
+
+    def test_overlapping_parts(self):
+        self._write(0, 70000, len(self.data))
+        self._write(60000, 120000)
+        self._write(30000, len(self.data))
+        self.assertEqual(self.data, self._read())
+
+    def test_size_learnt_from_last_part(self):
+        self._write(0, 1000)
+        status = self.upload.write_part(StringIO.StringIO(self.data[1000:]),
+                                        1000)
+        self.assertEqual(len(self.data), status['size'])
+        self.assertTrue(status['complete'])
+        self.assertEqual(self.data, self._read())
+
+    def test_interrupted_part_resumes(self):
+        size = len(self.data)
+        part = InterruptedFile(self.data, 12345)
+        self.assertRaises(IOError, self.upload.write_part, part, 0, size,
+                          size)
+        status = uploads.get_upload('image-id').status()
+        self.assertEqual(12345, status['offset'])
+        self.assertFalse(status['complete'])
+        self.assertRaises(exception.Invalid, self.upload.open)
+
+        self._write(status['offset'], size)
+        self.assertEqual(self.data, self._read())
+
+    def test_invalid_parts(self):
+        size = len(self.data)
+        self._write(0, 1000, size)
+        self.assertRaises(exception.Invalid, self._write, 1000, 2000, 5000)
+        self.assertRaises(exception.Invalid, self.upload.write_part,
+                          StringIO.StringIO('x' * 100), 0, 50)
+        self.config(image_size_cap=size - 1)
+        self.assertRaises(exception.ImageSizeLimitExceeded,
+                          self._write, 0, size, size)
+
+    def test_delete(self):
+        self._write(0, 1000)
+        self.assertTrue(self.upload.exists())
+        uploads.discard('image-id')
+        self.assertFalse(self.upload.exists())
+        self.assertEqual([], os.listdir(self.staging_dir))
+        uploads.discard('image-id')
+
+    def test_reap(self):
+        """Test that only uploads without a part written lately are reaped"""
+        self._write(0, 100)
+        other = uploads.get_upload('other-id')
+        other.write_part(StringIO.StringIO('data'), 0, 4, 4)
+        old = time.time() - 3600
+        for path in (other.path, other.state_path):
+            os.utime(path, (old, old))
+
+        self.assertEqual(0, uploads.reap(max_age=0))
+        self.assertEqual(1, uploads.reap(max_age=1800))
+        self.assertTrue(self.upload.exists())
+        self.assertFalse(other.exists())
+        self.assertEqual(['image-id', 'image-id.json', 'image-id.lock'],
+                         sorted(os.listdir(self.staging_dir)))
+
+        self.config(upload_staging_max_age=1)
+        for path in (self.upload.path, self.upload.state_path):
+            os.utime(path, (old, old))
+        self.assertEqual(1, uploads.reap())
+        self.assertEqual([], os.listdir(self.staging_dir))
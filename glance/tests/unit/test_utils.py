@@ -15,6 +15,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import os
+import sys
 import tempfile
 
 from glance.common import exception
@@ -87,3 +89,58 @@ class TestUtils(test_utils.BaseTestCase):
             if i == 8:
                 break
         self.assertRaises(exception.ImageSizeLimitExceeded, fap.next)
+
+    def test_is_zeros(self):
+        self.assertTrue(utils.is_zeros(''))
+        self.assertTrue(utils.is_zeros('\0' * 1024))
+        self.assertFalse(utils.is_zeros('\0' * 512 + 'x' + '\0' * 511))
+        self.assertFalse(utils.is_zeros('x' * 1024))
+
+    def test_sparse_writer(self):
+        chunks = ['a' * 4096, '\0' * 65536, '\0' * 65536, 'b' * 10,
+                  '\0' * 65536]
+        with tempfile.NamedTemporaryFile() as fp:
+            writer = utils.SparseWriter(fp)
+            for chunk in chunks:
+                writer.write(chunk)
+            writer.flush()
+
+            info = os.fstat(fp.fileno())
+            self.assertEqual(sum(len(chunk) for chunk in chunks),
+                             info.st_size)
+            # Holes are not allocated, where the filesystem supports them
+            self.assertTrue(info.st_blocks * 512 < info.st_size)
+
+            fp.seek(0)
+            self.assertEqual(''.join(chunks), fp.read())
+            fp.seek(0)
+            data = ''.join(utils.sparse_chunkiter(fp, 65536))
+            self.assertEqual(''.join(chunks), data)
+
+    def test_sparse_chunkiter(self):
+        with tempfile.NamedTemporaryFile() as fp:
+            fp.write('a' * 100)
+            fp.truncate(100 + 65536 * 3)
+            fp.flush()
+
+            chunks = list(utils.sparse_chunkiter(fp, 65536))
+            data = ''.join(chunks)
+            self.assertEqual(100 + 65536 * 3, len(data))
+            self.assertTrue(data == 'a' * 100 + '\0' * 65536 * 3)
+            self.assertTrue(max(len(c) for c in chunks) <= 65536)
+
+            # An empty file has no chunks
+            fp.truncate(0)
+            self.assertEqual([], list(utils.sparse_chunkiter(fp)))
+
+    def test_lazy_module(self):
+        orig = sys.modules.pop('colorsys', None)
+        if orig is not None:
+            self.addCleanup(sys.modules.__setitem__, 'colorsys', orig)
+        colorsys = utils.LazyModule('colorsys')
+        self.assertFalse('colorsys' in sys.modules)
+        self.assertEqual((0, 0, 1), colorsys.rgb_to_hsv(1, 1, 1))
+        self.assertTrue('colorsys' in sys.modules)
+
+        missing = utils.LazyModule('glance.tests.no_such_module')
+        self.assertRaises(ImportError, getattr, missing, 'attr')
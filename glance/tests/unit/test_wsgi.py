@@ -15,6 +15,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import logging
+import time
+import zlib
+
 import webob
 
 from glance.common import exception
@@ -144,6 +148,56 @@ class JSONResponseSerializerTest(test_utils.BaseTestCase):
         self.assertEqual(response.body, '{"key": "value"}')
 
 
+class GzipResponseTest(test_utils.BaseTestCase):
+
+    def setUp(self):
+        super(GzipResponseTest, self).setUp()
+        self.config(gzip_min_size=100)
+        self.body = '{"images": [%s]}' % ', '.join(['{"id": 1}'] * 20)
+
+    def _respond(self, body, accept_encoding='gzip, deflate',
+                 content_type='application/json'):
+        request = wsgi.Request.blank('/')
+        if accept_encoding:
+            request.headers['Accept-Encoding'] = accept_encoding
+        response = webob.Response(request=request)
+        response.content_type = content_type
+        response.body = body
+        wsgi.gzip_response(request, response)
+        return response
+
+    def test_gzipped(self):
+        response = self._respond(self.body)
+        self.assertEqual('gzip', response.content_encoding)
+        self.assertEqual(('Accept-Encoding',), tuple(response.vary))
+        self.assertTrue(len(response.body) < len(self.body))
+        self.assertEqual(len(response.body), response.content_length)
+        self.assertEqual(self.body,
+                         zlib.decompress(response.body, 16 + zlib.MAX_WBITS))
+
+    def test_small_body_not_gzipped(self):
+        response = self._respond('{"id": 1}')
+        self.assertEqual(None, response.content_encoding)
+        self.assertEqual('{"id": 1}', response.body)
+        self.assertEqual(('Accept-Encoding',), tuple(response.vary))
+
+    def test_gzip_not_accepted(self):
+        for accept_encoding in (None, 'identity', 'gzip;q=0'):
+            response = self._respond(self.body, accept_encoding)
+            self.assertEqual(None, response.content_encoding)
+            self.assertEqual(self.body, response.body)
+
+    def test_not_json(self):
+        response = self._respond(self.body,
+                                 content_type='application/octet-stream')
+        self.assertEqual(None, response.content_encoding)
+
+    def test_disabled(self):
+        self.config(gzip_json_responses=False)
+        response = self._respond(self.body)
+        self.assertEqual(None, response.content_encoding)
+
+
 class JSONRequestDeserializerTest(test_utils.BaseTestCase):
 
     def test_has_body_no_content_length(self):
@@ -192,6 +246,83 @@ class JSONRequestDeserializerTest(test_utils.BaseTestCase):
         self.assertEqual(actual, expected)
 
 
+class FakeServer(wsgi.Server):
+
+    """A Server whose workers are not forked nor signalled."""
+
+    def __init__(self):
+        super(FakeServer, self).__init__()
+        self.logger = logging.getLogger('glance.tests')
+        self.next_pid = 100
+        self.drained = []
+
+    def run_child(self):
+        self.next_pid += 1
+        self.children[self.next_pid] = time.time()
+
+    def _drain_children(self, pids):
+        self.drained.extend(pids)
+
+
+class ServerTest(test_utils.BaseTestCase):
+
+    def setUp(self):
+        super(ServerTest, self).setUp()
+        self.config(workers=2, worker_respawn_max_delay=30)
+        self.server = FakeServer()
+        self.server.run_child()
+        self.server.run_child()
+
+    def _exit(self, pid, code=1):
+        self.server._child_exited(pid, code << 8)
+
+    def test_dead_child_respawned_with_backoff(self):
+        delays = []
+        for pid in range(101, 108):
+            self._exit(pid)
+            delays.append(round(self.server._next_respawn()))
+            self.server.respawns = []
+            self.server.run_child()
+        self.assertEqual([1, 2, 4, 8, 16, 30, 30], delays)
+
+        # A child which ran for a while is replaced at once
+        self.server.children[108] -= 60
+        self._exit(108)
+        self.assertEqual(0, self.server._next_respawn())
+        self.server._respawn_children()
+        self.assertEqual([109, 110], sorted(self.server.children))
+
+    def test_child_unable_to_start_not_respawned(self):
+        self._exit(101, code=2)
+        self._exit(102, code=2)
+        self.assertEqual([], self.server.respawns)
+        self.assertFalse(self.server.running)
+
+    def test_reload(self):
+        self.server.reloader = lambda: 'new app'
+        self.config(workers=3)
+        self.server.reload()
+        self.assertEqual('new app', self.server.application)
+        self.assertEqual([103, 104, 105], sorted(self.server.children))
+        self.assertEqual([101, 102], sorted(self.server.drained))
+
+        # Drained children are not replaced
+        self._exit(101, code=0)
+        self.assertEqual([102], self.server.draining)
+        self.assertEqual([], self.server.respawns)
+
+    def test_reload_failure_keeps_children(self):
+        def reloader():
+            raise RuntimeError()
+
+        self.server.application = 'app'
+        self.server.reloader = reloader
+        self.server.reload()
+        self.assertEqual('app', self.server.application)
+        self.assertEqual([101, 102], sorted(self.server.children))
+        self.assertEqual([], self.server.drained)
+
+
 class TestHelpers(test_utils.BaseTestCase):
 
     def test_headers_are_unicode(self):
@@ -109,6 +109,12 @@ class FakeStoreAPI(object):
         checksum = 'Z'
         return (image_id, size, checksum)
 
+    def delete_from_backend(self, context, location):
+        del self.data[location]
+
+    def schedule_delete_from_backend(self, location, context, image_id):
+        del self.data[location]
+
 
 class FakePolicyEnforcer(object):
     def __init__(self, *_args, **kwargs):
@@ -19,6 +19,7 @@ import datetime
 import hashlib
 import httplib
 import json
+import os
 import StringIO
 
 import routes
@@ -38,6 +39,7 @@ from glance.db.sqlalchemy import models as db_models
 from glance.openstack.common import cfg
 from glance.openstack.common import timeutils
 from glance.registry.api import v1 as rserver
+import glance.registry.client
 import glance.store.filesystem
 from glance.tests.unit import base
 from glance.tests import utils as test_utils
@@ -1778,6 +1780,58 @@ class TestRegistryAPI(base.IsolatedUnitTest):
         self.assertEquals(res.status_int,
                           webob.exc.HTTPNotFound.code)
 
+    def test_update_images(self):
+        """Tests that the /images PUT registry API updates several images"""
+        fixture = [{'id': UUID1, 'status': 'killed'},
+                   {'id': UUID2, 'status': 'killed', 'min_ram': 128},
+                   {'id': _gen_uuid(), 'status': 'killed'}]
+
+        req = webob.Request.blank('/images')
+
+        req.method = 'PUT'
+        req.content_type = 'application/json'
+        req.body = json.dumps(dict(images=fixture))
+
+        res = req.get_response(self.api)
+
+        self.assertEquals(res.status_int, 200)
+
+        res_dict = json.loads(res.body)
+        updated = dict((i['id'], i) for i in res_dict['images'])
+        self.assertEquals(set([UUID1, UUID2]), set(updated.keys()))
+        self.assertEquals('killed', updated[UUID1]['status'])
+        self.assertEquals(128, updated[UUID2]['min_ram'])
+
+    def test_update_images_with_bad_status(self):
+        """Tests that a bad status in a batch update is rejected"""
+        fixture = [{'id': UUID2, 'status': 'invalid'}]
+
+        req = webob.Request.blank('/images')
+
+        req.method = 'PUT'
+        req.content_type = 'application/json'
+        req.body = json.dumps(dict(images=fixture))
+
+        res = req.get_response(self.api)
+        self.assertEquals(res.status_int, webob.exc.HTTPBadRequest.code)
+
+    def test_update_images_invalid_updates_none(self):
+        """Tests that no image is updated if one update is invalid"""
+        fixture = [{'id': UUID1, 'status': 'killed'},
+                   {'id': UUID2, 'status': 'invalid'}]
+
+        req = webob.Request.blank('/images')
+
+        req.method = 'PUT'
+        req.content_type = 'application/json'
+        req.body = json.dumps(dict(images=fixture))
+
+        res = req.get_response(self.api)
+        self.assertEquals(res.status_int, webob.exc.HTTPBadRequest.code)
+
+        res = webob.Request.blank('/images/%s' % UUID1).get_response(self.api)
+        self.assertEquals('active', json.loads(res.body)['image']['status'])
+
     def test_update_image_with_bad_status(self):
         """Tests that exception raised trying to set a bad status"""
         fixture = {'status': 'invalid'}
@@ -2243,6 +2297,36 @@ class TestGlanceAPI(base.IsolatedUnitTest):
         res = req.get_response(self.api)
         self.assertEquals(res.status_int, webob.exc.HTTPBadRequest.code)
 
+        # No image is left saving data that will never come
+        req = webob.Request.blank("/images/detail?status=saving&"
+                                  "is_public=None")
+        res = req.get_response(self.api)
+        self.assertEquals(res.status_int, 200)
+        self.assertEqual([], json.loads(res.body)['images'])
+
+    def test_upload_bad_store_leaves_image_queued(self):
+        """Tests an upload to a bad store leaves the image queued"""
+        req = webob.Request.blank("/images")
+        req.method = 'POST'
+        req.headers['x-image-meta-name'] = 'fake image #3'
+        res = req.get_response(self.api)
+        self.assertEquals(res.status_int, 201)
+        image_id = json.loads(res.body)['image']['id']
+
+        req = webob.Request.blank("/images/%s" % image_id)
+        req.method = 'PUT'
+        req.headers['x-image-meta-store'] = 'bad'
+        req.headers['Content-Type'] = 'application/octet-stream'
+        req.body = "chunk00000remainder"
+        res = req.get_response(self.api)
+        self.assertEquals(res.status_int, webob.exc.HTTPBadRequest.code)
+
+        req = webob.Request.blank("/images/%s" % image_id)
+        req.method = 'HEAD'
+        res = req.get_response(self.api)
+        self.assertEquals(res.status_int, 200)
+        self.assertEqual('queued', res.headers['x-image-meta-status'])
+
     def test_add_image_basic_file_store(self):
         """Tests to add a basic image in the file store"""
         fixture_headers = {'x-image-meta-store': 'file',
@@ -2444,6 +2528,68 @@ class TestGlanceAPI(base.IsolatedUnitTest):
                         "Got headers: %r" % res.headers)
         self.assertEqual("active", res.headers['x-image-meta-status'])
 
+    def _count_registry_requests(self):
+        requests = []
+        orig_do_request = glance.registry.client.RegistryClient.do_request
+
+        def do_request(client, method, action, **kwargs):
+            requests.append((method, action.split('/')[1]))
+            return orig_do_request(client, method, action, **kwargs)
+
+        self.stubs.Set(glance.registry.client.RegistryClient, 'do_request',
+                       do_request)
+        return requests
+
+    def test_add_image_registry_round_trips(self):
+        """
+        Test that an image created with its data makes one registry
+        request to reserve it and one to activate it
+        """
+        requests = self._count_registry_requests()
+        req = webob.Request.blank("/images")
+        req.method = 'POST'
+        req.headers['x-image-meta-name'] = 'fake image #3'
+        req.headers['x-image-meta-disk-format'] = 'vhd'
+        req.headers['x-image-meta-container-format'] = 'ovf'
+        req.headers['Content-Type'] = 'application/octet-stream'
+        req.body = "chunk00000remainder"
+        res = req.get_response(self.api)
+        self.assertEquals(res.status_int, httplib.CREATED)
+        res_body = json.loads(res.body)['image']
+        self.assertEqual('active', res_body['status'])
+        self.assertEqual(19, res_body['size'])
+        self.assertEqual(hashlib.md5("chunk00000remainder").hexdigest(),
+                         res_body['checksum'])
+        self.assertEqual([('POST', 'images'), ('PUT', 'images')], requests)
+
+    def test_upload_registry_round_trips(self):
+        """
+        Test that uploading the data of a queued image makes one registry
+        request to look it up, one to start the upload and one to activate
+        the image
+        """
+        req = webob.Request.blank("/images")
+        req.method = 'POST'
+        req.headers['x-image-meta-name'] = 'fake image #3'
+        req.headers['x-image-meta-disk-format'] = 'vhd'
+        req.headers['x-image-meta-container-format'] = 'ovf'
+        res = req.get_response(self.api)
+        self.assertEquals(res.status_int, httplib.CREATED)
+        image_id = json.loads(res.body)['image']['id']
+
+        requests = self._count_registry_requests()
+        req = webob.Request.blank("/images/%s" % image_id)
+        req.method = 'PUT'
+        req.headers['Content-Type'] = 'application/octet-stream'
+        req.body = "chunk00000remainder"
+        res = req.get_response(self.api)
+        self.assertEquals(res.status_int, httplib.OK)
+        res_body = json.loads(res.body)['image']
+        self.assertEqual('active', res_body['status'])
+        self.assertEqual(19, res_body['size'])
+        self.assertEqual([('GET', 'images'), ('PUT', 'images'),
+                          ('PUT', 'images')], requests)
+
     def test_disable_purge_props(self):
         """
         Test the special x-glance-registry-purge-props header controls
@@ -2940,6 +3086,35 @@ class TestGlanceAPI(base.IsolatedUnitTest):
         self.assertEqual(res.content_type, 'application/octet-stream')
         self.assertEqual('chunk00000remainder', res.body)
 
+    def test_show_image_range(self):
+        for byte_range, content_range, body in (
+                ('bytes=5-9', 'bytes 5-9/19', '00000'),
+                ('bytes=10-', 'bytes 10-18/19', 'remainder'),
+                ('bytes=-4', 'bytes 15-18/19', 'nder'),
+                ('bytes=18-100', 'bytes 18-18/19', 'r')):
+            req = webob.Request.blank("/images/%s" % UUID2)
+            req.headers['Range'] = byte_range
+            res = req.get_response(self.api)
+            self.assertEqual(206, res.status_int)
+            self.assertEqual(content_range, res.headers['Content-Range'])
+            self.assertEqual(str(len(body)), res.headers['Content-Length'])
+            self.assertEqual(body, res.body)
+
+    def test_show_image_whole_for_unsupported_ranges(self):
+        for byte_range in ('bytes=0-2,5-9', 'bytes=100-', 'bytes=0-'):
+            req = webob.Request.blank("/images/%s" % UUID2)
+            req.headers['Range'] = byte_range
+            res = req.get_response(self.api)
+            self.assertEqual(200, res.status_int)
+            self.assertFalse('Content-Range' in res.headers)
+            self.assertEqual('chunk00000remainder', res.body)
+
+    def test_image_meta_accepts_ranges(self):
+        req = webob.Request.blank("/images/%s" % UUID2)
+        req.method = 'HEAD'
+        res = req.get_response(self.api)
+        self.assertEqual('bytes', res.headers['Accept-Ranges'])
+
     def test_show_non_exists_image(self):
         req = webob.Request.blank("/images/%s" % _gen_uuid())
         res = req.get_response(self.api)
@@ -2970,6 +3145,171 @@ class TestGlanceAPI(base.IsolatedUnitTest):
         res = req.get_response(self.api)
         self.assertEquals(res.status_int, webob.exc.HTTPNotFound.code)
 
+    def _reserve_for_upload(self):
+        self.config(upload_staging_dir=os.path.join(self.test_dir,
+                                                    'staging'))
+        req = webob.Request.blank("/images")
+        req.method = 'POST'
+        req.headers['x-image-meta-name'] = 'fake image #3'
+        req.headers['x-image-meta-disk-format'] = 'vhd'
+        req.headers['x-image-meta-container-format'] = 'ovf'
+        res = req.get_response(self.api)
+        self.assertEquals(res.status_int, httplib.CREATED)
+        return json.loads(res.body)['image']['id']
+
+    def _upload_request(self, image_id, method, body=None,
+                        content_range=None):
+        req = webob.Request.blank("/images/%s/upload" % image_id)
+        req.method = method
+        if body is not None:
+            req.headers['Content-Type'] = 'application/octet-stream'
+            req.body = body
+        if content_range:
+            req.headers['Content-Range'] = content_range
+        return req.get_response(self.api)
+
+    def test_resumable_upload(self):
+        image_id = self._reserve_for_upload()
+        res = self._upload_request(image_id, 'GET')
+        self.assertEquals(res.status_int, httplib.NOT_FOUND)
+
+        res = self._upload_request(image_id, 'PUT', 'remainder',
+                                   'bytes 10-18/19')
+        self.assertEquals(res.status_int, httplib.OK)
+        status = json.loads(res.body)['upload']
+        self.assertEquals([[10, 18]], status['ranges'])
+        self.assertEquals(0, status['offset'])
+
+        res = self._upload_request(image_id, 'POST')
+        self.assertEquals(res.status_int, httplib.CONFLICT)
+
+        res = self._upload_request(image_id, 'PUT', 'chunk00000',
+                                   'bytes 0-9/19')
+        self.assertEquals(res.status_int, httplib.OK)
+        res = self._upload_request(image_id, 'GET')
+        status = json.loads(res.body)['upload']
+        self.assertTrue(status['complete'])
+        self.assertEquals(19, status['offset'])
+
+        req = webob.Request.blank("/images/%s/upload" % image_id)
+        req.method = 'POST'
+        req.headers['x-image-meta-checksum'] = hashlib.md5(
+                "chunk00000remainder").hexdigest()
+        res = req.get_response(self.api)
+        self.assertEquals(res.status_int, httplib.OK)
+        image = json.loads(res.body)['image']
+        self.assertEquals('active', image['status'])
+        self.assertEquals(19, image['size'])
+        self.assertEquals([], os.listdir(CONF.upload_staging_dir))
+
+        req = webob.Request.blank("/images/%s" % image_id)
+        res = req.get_response(self.api)
+        self.assertEquals(res.status_int, httplib.OK)
+        self.assertEquals("chunk00000remainder", res.body)
+
+        res = self._upload_request(image_id, 'PUT', 'chunk00000',
+                                   'bytes 0-9/19')
+        self.assertEquals(res.status_int, httplib.CONFLICT)
+
+    def test_resumable_upload_checksum_mismatch(self):
+        image_id = self._reserve_for_upload()
+        res = self._upload_request(image_id, 'PUT', 'chunk00000remainder')
+        self.assertEquals(res.status_int, httplib.OK)
+
+        req = webob.Request.blank("/images/%s/upload" % image_id)
+        req.method = 'POST'
+        req.headers['x-image-meta-checksum'] = hashlib.md5(
+                "other").hexdigest()
+        res = req.get_response(self.api)
+        self.assertEquals(res.status_int, httplib.BAD_REQUEST)
+
+        # The image stays queued with its staged data, for the parts to
+        # be corrected and the upload completed again
+        req = webob.Request.blank("/images/%s" % image_id)
+        req.method = 'HEAD'
+        res = req.get_response(self.api)
+        self.assertEquals('queued', res.headers['x-image-meta-status'])
+        res = self._upload_request(image_id, 'POST')
+        self.assertEquals(res.status_int, httplib.OK)
+        self.assertEquals('active',
+                          json.loads(res.body)['image']['status'])
+        self.assertEquals([], os.listdir(CONF.upload_staging_dir))
+
+    def test_resumable_upload_kept_on_store_failure(self):
+        image_id = self._reserve_for_upload()
+        res = self._upload_request(image_id, 'PUT', 'chunk00000remainder')
+        self.assertEquals(res.status_int, httplib.OK)
+
+        add = glance.store.filesystem.Store.add
+        failures = []
+
+        def fail_once(store, *args, **kwargs):
+            if not failures:
+                failures.append(args)
+                raise IOError("Connection to store lost")
+            return add(store, *args, **kwargs)
+
+        self.stubs.Set(glance.store.filesystem.Store, 'add', fail_once)
+        res = self._upload_request(image_id, 'POST')
+        self.assertEquals(res.status_int, httplib.BAD_REQUEST)
+        req = webob.Request.blank("/images/%s" % image_id)
+        req.method = 'HEAD'
+        res = req.get_response(self.api)
+        self.assertEquals('queued', res.headers['x-image-meta-status'])
+        res = self._upload_request(image_id, 'GET')
+        self.assertTrue(json.loads(res.body)['upload']['complete'])
+
+        res = self._upload_request(image_id, 'POST')
+        self.assertEquals(res.status_int, httplib.OK)
+        self.assertEquals('active',
+                          json.loads(res.body)['image']['status'])
+        self.assertEquals([], os.listdir(CONF.upload_staging_dir))
+
+    def test_resumable_upload_invalid_parts(self):
+        image_id = self._reserve_for_upload()
+        for content_range in ('bytes 0-4/19', 'bytes 0-18/5', 'bytes=0-9'):
+            res = self._upload_request(image_id, 'PUT', 'chunk00000',
+                                       content_range)
+            self.assertEquals(res.status_int, httplib.BAD_REQUEST)
+
+        req = webob.Request.blank("/images/%s/upload" % image_id)
+        req.method = 'PUT'
+        req.body = 'chunk00000'
+        res = req.get_response(self.api)
+        self.assertEquals(res.status_int, httplib.BAD_REQUEST)
+
+    def test_abort_resumable_upload(self):
+        image_id = self._reserve_for_upload()
+        res = self._upload_request(image_id, 'PUT', 'chunk00000',
+                                   'bytes 0-9/19')
+        self.assertEquals(res.status_int, httplib.OK)
+        res = self._upload_request(image_id, 'DELETE')
+        self.assertEquals(res.status_int, httplib.NO_CONTENT)
+        res = self._upload_request(image_id, 'GET')
+        self.assertEquals(res.status_int, httplib.NOT_FOUND)
+
+    def test_delete_image_discards_upload(self):
+        image_id = self._reserve_for_upload()
+        res = self._upload_request(image_id, 'PUT', 'chunk00000',
+                                   'bytes 0-9/19')
+        self.assertEquals(res.status_int, httplib.OK)
+        req = webob.Request.blank("/images/%s" % image_id)
+        req.method = 'DELETE'
+        res = req.get_response(self.api)
+        self.assertEquals(res.status_int, httplib.OK)
+        self.assertEquals([], os.listdir(CONF.upload_staging_dir))
+
+    def test_resumable_upload_disabled_or_unqueued(self):
+        res = self._upload_request(UUID2, 'PUT', 'chunk00000',
+                                   'bytes 0-9/19')
+        self.assertEquals(res.status_int, httplib.SERVICE_UNAVAILABLE)
+
+        self.config(upload_staging_dir=os.path.join(self.test_dir,
+                                                    'staging'))
+        res = self._upload_request(UUID2, 'PUT', 'chunk00000',
+                                   'bytes 0-9/19')
+        self.assertEquals(res.status_int, httplib.CONFLICT)
+
     def test_delete_queued_image(self):
         """
         Here, we try to delete an image that is in the queued state.
@@ -3189,6 +3529,21 @@ class TestImageSerializer(base.IsolatedUnitTest):
 
         self.assertEqual(response.body, 'chunk67891123456789')
 
+    def test_update_accepted_only_when_importing(self):
+        """Updates of an image being saved are only 202 if they import"""
+        req = webob.Request.blank("/images/%s" % UUID2)
+        req.method = 'PUT'
+        req.context = self.context
+        self.FIXTURE['image_meta']['status'] = 'saving'
+
+        response = webob.Response(request=req)
+        self.serializer.update(response, self.FIXTURE)
+        self.assertEqual(200, response.status_int)
+
+        response = webob.Response(request=req)
+        self.serializer.update(response, dict(self.FIXTURE, importing=True))
+        self.assertEqual(202, response.status_int)
+
     def test_show_notify(self):
         """Make sure an eventlet posthook for notify_image_sent is added."""
         req = webob.Request.blank("/images/%s" % UUID2)
@@ -13,11 +13,18 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import shutil
 import StringIO
+import tempfile
 
+import stubout
 import webob
 
+import glance.api.import_jobs
+from glance.api import uploads
 import glance.api.v2.image_data
+import glance.common.config
+from glance.common import exception
 from glance.common import utils
 from glance.tests.unit import base
 import glance.tests.unit.utils as unit_test_utils
@@ -77,6 +84,231 @@ class TestImagesController(base.StoreClearingUnitTest):
         self.assertEqual(4, output['meta']['size'])
         self.assertEqual('YYYY', output['data'])
 
+    def _enable_uploads(self):
+        staging_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, staging_dir, True)
+        self.config(upload_staging_dir=staging_dir)
+
+    def _stage(self, request, image_id, parts):
+        for data, byte_range in parts:
+            status = self.controller.upload_part(
+                    request, image_id, StringIO.StringIO(data), byte_range)
+        return status
+
+    def test_resumable_upload(self):
+        request = unit_test_utils.get_fake_request()
+        self.assertRaises(webob.exc.HTTPServiceUnavailable,
+                          self.controller.upload_part, request,
+                          unit_test_utils.UUID2, StringIO.StringIO('YY'),
+                          (0, 2, 4))
+        self._enable_uploads()
+        status = self._stage(request, unit_test_utils.UUID2,
+                             [('YY', (2, 4, 4))])
+        self.assertEqual([[2, 3]], status['ranges'])
+        self.assertFalse(status['complete'])
+        self.assertRaises(webob.exc.HTTPConflict,
+                          self.controller.complete_upload, request,
+                          unit_test_utils.UUID2)
+
+        self._stage(request, unit_test_utils.UUID2, [('XY', (0, 2, None))])
+        status = self.controller.upload_status(request,
+                                               unit_test_utils.UUID2)
+        self.assertTrue(status['complete'])
+
+        store_api = self.controller.store_api
+        add_to_backend = store_api.add_to_backend
+
+        def read_and_add(context, scheme, image_id, data, size):
+            return add_to_backend(context, scheme, image_id, data.read(),
+                                  size)
+
+        store_api.add_to_backend = read_and_add
+        self.controller.complete_upload(request, unit_test_utils.UUID2)
+        output = self.controller.download(request, unit_test_utils.UUID2)
+        self.assertEqual(4, output['meta']['size'])
+        self.assertEqual('XYYY', output['data'])
+        self.assertRaises(webob.exc.HTTPNotFound,
+                          self.controller.upload_status, request,
+                          utils.generate_uuid())
+
+    def test_resumable_upload_checksum_mismatch(self):
+        request = unit_test_utils.get_fake_request()
+        self._enable_uploads()
+        self._stage(request, unit_test_utils.UUID2, [('YYYY', (0, 4, 4))])
+        self.assertRaises(webob.exc.HTTPBadRequest,
+                          self.controller.complete_upload, request,
+                          unit_test_utils.UUID2, checksum='X')
+        self.assertRaises(webob.exc.HTTPNotFound, self.controller.download,
+                          request, unit_test_utils.UUID2)
+
+        # The staged data is kept, so the parts can be corrected
+        status = self.controller.upload_status(request, unit_test_utils.UUID2)
+        self.assertTrue(status['complete'])
+        self.controller.complete_upload(request, unit_test_utils.UUID2,
+                                        checksum='Z')
+        self.assertFalse(uploads.get_upload(unit_test_utils.UUID2).exists())
+
+    def test_resumable_upload_kept_until_image_updated(self):
+        request = unit_test_utils.get_fake_request()
+        self._enable_uploads()
+        self._stage(request, unit_test_utils.UUID2, [('YYYY', (0, 4, 4))])
+        db_api = self.controller.db_api
+        image_update = db_api.image_update
+        failures = []
+
+        def fail_once(context, image_id, values, *args, **kwargs):
+            if 'location' in values and not failures:
+                failures.append(image_id)
+                raise exception.NotFound()
+            return image_update(context, image_id, values, *args, **kwargs)
+
+        db_api.image_update = fail_once
+        self.assertRaises(exception.NotFound,
+                          self.controller.complete_upload, request,
+                          unit_test_utils.UUID2)
+        self.assertFalse(unit_test_utils.UUID2 in
+                         self.controller.store_api.data)
+        status = self.controller.upload_status(request, unit_test_utils.UUID2)
+        self.assertTrue(status['complete'])
+
+        self.controller.complete_upload(request, unit_test_utils.UUID2)
+        output = self.controller.download(request, unit_test_utils.UUID2)
+        self.assertEqual(4, output['meta']['size'])
+        self.assertFalse(uploads.get_upload(unit_test_utils.UUID2).exists())
+
+    def test_resumable_upload_data_exists(self):
+        request = unit_test_utils.get_fake_request()
+        self._enable_uploads()
+        self.assertRaises(webob.exc.HTTPConflict, self._stage, request,
+                          unit_test_utils.UUID1, [('YYYY', (0, 4, 4))])
+
+    def test_abort_resumable_upload(self):
+        request = unit_test_utils.get_fake_request()
+        self._enable_uploads()
+        self._stage(request, unit_test_utils.UUID2, [('YY', (0, 2, 4))])
+        self.controller.abort_upload(request, unit_test_utils.UUID2)
+        self.assertRaises(webob.exc.HTTPNotFound,
+                          self.controller.upload_status, request,
+                          unit_test_utils.UUID2)
+
+    def test_import_image(self):
+        stubs = stubout.StubOutForTesting()
+        try:
+            stubs.Set(glance.api.v2, 'update_image_read_acl',
+                      lambda req, db_api, image: None)
+            importer = glance.api.import_jobs.Importer(retry_delay=0)
+            stubs.Set(glance.api.import_jobs, 'get_importer',
+                      lambda: importer)
+
+            request = unit_test_utils.get_fake_request()
+            source = 'swift+http://storeurl.com/container/%s' % (
+                    unit_test_utils.UUID1)
+            output = self.controller.import_image(
+                    request, unit_test_utils.UUID2, source)
+            self.assertEqual(unit_test_utils.UUID2, output['image_id'])
+            self.assertEqual('pending', output['status'])
+
+            # A second import is refused while the first is saving
+            self.assertRaises(webob.exc.HTTPConflict,
+                              self.controller.import_image,
+                              request, unit_test_utils.UUID2, source)
+
+            importer.pool.waitall()
+            output = self.controller.import_status(request,
+                                                   unit_test_utils.UUID2)
+            self.assertEqual('succeeded', output['status'])
+            output = self.controller.download(request, unit_test_utils.UUID2)
+            self.assertEqual('active', output['meta']['status'])
+            self.assertEqual(3, output['meta']['size'])
+        finally:
+            stubs.UnsetAll()
+
+    def test_import_image_not_owned(self):
+        image_id = utils.generate_uuid()
+        self.controller.db_api.image_create(
+                None, {'id': image_id, 'owner': unit_test_utils.TENANT2,
+                       'is_public': True, 'status': 'queued'})
+        request = unit_test_utils.get_fake_request()
+        source = 'swift+http://storeurl.com/container/%s' % (
+                unit_test_utils.UUID1)
+        self.assertRaises(webob.exc.HTTPForbidden,
+                          self.controller.import_image,
+                          request, image_id, source)
+        image = self.controller.db_api.image_get(None, image_id)
+        self.assertEqual('queued', image['status'])
+
+    def test_import_image_default_store(self):
+        self.config(default_store='swift')
+        stubs = stubout.StubOutForTesting()
+        try:
+            stubs.Set(glance.api.v2, 'update_image_read_acl',
+                      lambda req, db_api, image: None)
+            importer = glance.api.import_jobs.Importer(retry_delay=0)
+            stubs.Set(glance.api.import_jobs, 'get_importer',
+                      lambda: importer)
+            store_api = self.controller.store_api
+            add_to_backend = store_api.add_to_backend
+            schemes = []
+
+            def recording_add_to_backend(context, scheme, *args):
+                schemes.append(scheme)
+                return add_to_backend(context, scheme, *args)
+
+            stubs.Set(store_api, 'add_to_backend', recording_add_to_backend)
+
+            request = unit_test_utils.get_fake_request()
+            source = 'swift+http://storeurl.com/container/%s' % (
+                    unit_test_utils.UUID1)
+            self.controller.import_image(request, unit_test_utils.UUID2,
+                                         source)
+            importer.pool.waitall()
+            self.assertEqual(['swift'], schemes)
+        finally:
+            stubs.UnsetAll()
+
+    def test_import_retries_only_activation(self):
+        """
+        A retry after the data was stored only activates the image, as
+        storing it again would fail as a duplicate
+        """
+        stubs = stubout.StubOutForTesting()
+        try:
+            stubs.Set(glance.api.v2, 'update_image_read_acl',
+                      lambda req, db_api, image: None)
+            importer = glance.api.import_jobs.Importer(retry_delay=0)
+            stubs.Set(glance.api.import_jobs, 'get_importer',
+                      lambda: importer)
+            db_api = self.controller.db_api
+            image_update = db_api.image_update
+            failures = []
+
+            def flaky_image_update(context, image_id, values):
+                if values.get('status') == 'active' and not failures:
+                    failures.append(values)
+                    raise IOError('registry unavailable')
+                return image_update(context, image_id, values)
+
+            stubs.Set(db_api, 'image_update', flaky_image_update)
+
+            request = unit_test_utils.get_fake_request()
+            source = 'swift+http://storeurl.com/container/%s' % (
+                    unit_test_utils.UUID1)
+            self.controller.import_image(request, unit_test_utils.UUID2,
+                                         source)
+            importer.pool.waitall()
+            output = self.controller.import_status(request,
+                                                   unit_test_utils.UUID2)
+            self.assertEqual('succeeded', output['status'])
+            self.assertEqual(2, output['attempts'])
+        finally:
+            stubs.UnsetAll()
+
+    def test_import_status_not_importing(self):
+        request = unit_test_utils.get_fake_request()
+        self.assertRaises(webob.exc.HTTPNotFound,
+                          self.controller.import_status,
+                          request, unit_test_utils.UUID2)
+
 
 class TestImageDataDeserializer(test_utils.BaseTestCase):
 
@@ -141,6 +373,55 @@ class TestImageDataDeserializer(test_utils.BaseTestCase):
         self.assertRaises(webob.exc.HTTPUnsupportedMediaType,
             self.deserializer.upload, request)
 
+    def test_upload_part(self):
+        request = unit_test_utils.get_fake_request()
+        request.headers['Content-Type'] = 'application/octet-stream'
+        request.headers['Content-Range'] = 'bytes 3-5/10'
+        request.body = 'YYY'
+        output = self.deserializer.upload_part(request)
+        self.assertEqual('YYY', output.pop('data').read())
+        self.assertEqual({'byte_range': (3, 6, 10)}, output)
+
+    def test_upload_part_invalid_range(self):
+        request = unit_test_utils.get_fake_request()
+        request.headers['Content-Type'] = 'application/octet-stream'
+        request.headers['Content-Range'] = 'bytes 3-9/10'
+        request.body = 'YYY'
+        self.assertRaises(webob.exc.HTTPBadRequest,
+                          self.deserializer.upload_part, request)
+
+    def test_complete_upload(self):
+        request = unit_test_utils.get_fake_request()
+        self.assertEqual({}, self.deserializer.complete_upload(request))
+        request.headers['Content-MD5'] = 'B0UGSRi0lpPMpk1rahPSig=='
+        self.assertEqual({'checksum': '0745064918b49693cca64d6b6a13d28a'},
+                         self.deserializer.complete_upload(request))
+
+    def test_complete_upload_invalid_content_md5(self):
+        request = unit_test_utils.get_fake_request()
+        for value in ('0745064918b49693cca64d6b6a13d28a', 'YWJj', '!!!'):
+            request.headers['Content-MD5'] = value
+            self.assertRaises(webob.exc.HTTPBadRequest,
+                              self.deserializer.complete_upload, request)
+
+    def test_import_image(self):
+        request = unit_test_utils.get_fake_request()
+        request.body = '{"copy_from": "http://example.com/image"}'
+        output = self.deserializer.import_image(request)
+        self.assertEqual({'copy_from': 'http://example.com/image'}, output)
+
+    def test_import_image_without_source(self):
+        request = unit_test_utils.get_fake_request()
+        request.body = '{}'
+        self.assertRaises(webob.exc.HTTPBadRequest,
+                          self.deserializer.import_image, request)
+
+    def test_import_image_from_file(self):
+        request = unit_test_utils.get_fake_request()
+        request.body = '{"copy_from": "file:///etc/passwd"}'
+        self.assertRaises(webob.exc.HTTPBadRequest,
+                          self.deserializer.import_image, request)
+
 
 class TestImageDataSerializer(test_utils.BaseTestCase):
 
@@ -189,3 +470,9 @@ class TestImageDataSerializer(test_utils.BaseTestCase):
         self.serializer.upload(response, {})
         self.assertEqual(201, response.status_int)
         self.assertEqual('0', response.headers['Content-Length'])
+
+    def test_import_image(self):
+        response = webob.Response()
+        self.serializer.import_image(response, {'status': 'pending'})
+        self.assertEqual(202, response.status_int)
+        self.assertEqual('{"import": {"status": "pending"}}', response.body)
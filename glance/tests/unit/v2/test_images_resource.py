@@ -1015,6 +1015,16 @@ class TestImagesSerializerWithExtendedSchema(test_utils.BaseTestCase):
         self.serializer.show(response, self.fixture)
         self.assertEqual(expected, json.loads(response.body))
 
+    def test_show_after_schema_change(self):
+        response = webob.Response()
+        self.serializer.show(response, self.fixture)
+        self.assertFalse('mood' in json.loads(response.body))
+
+        self.serializer.schema.merge_properties({'mood': {'type': 'string'}})
+        response = webob.Response()
+        self.serializer.show(response, self.fixture)
+        self.assertEqual('grouchy', json.loads(response.body)['mood'])
+
 
 class TestImagesSerializerWithAdditionalProperties(test_utils.BaseTestCase):
 
@@ -21,9 +21,11 @@ import errno
 import functools
 import os
 import random
+import shutil
 import socket
 import StringIO
 import subprocess
+import tempfile
 import unittest
 
 import nose.plugins.skip
@@ -31,6 +33,7 @@ import nose.plugins.skip
 from glance.common import utils
 from glance.common import wsgi
 from glance import context
+from glance.db.sqlalchemy import api as db_api
 from glance.openstack.common import cfg
 
 CONF = cfg.CONF
@@ -75,6 +78,37 @@ class BaseTestCase(unittest.TestCase):
             CONF.set_override(k, v, group)
 
 
+class IsolatedDBTestCase(BaseTestCase):
+
+    """
+    Runs each test against databases of its own, in SQLite files in
+    `test_dir`, restoring the database the process was using afterwards.
+    """
+
+    def setUp(self):
+        super(IsolatedDBTestCase, self).setUp()
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+
+        orig = (db_api._ENGINE, db_api._MAKER, db_api._READ_MAKERS)
+
+        def restore():
+            db_api._ENGINE, db_api._MAKER, db_api._READ_MAKERS = orig
+
+        self.addCleanup(restore)
+        db_api._ENGINE = db_api._MAKER = None
+
+    def db_url(self, name):
+        """Returns the URL of the test's database file of a name."""
+        return 'sqlite:///%s' % os.path.join(self.test_dir,
+                                             '%s.sqlite' % name)
+
+    def configure_db(self, **kw):
+        """Overrides the given options and connects to the database."""
+        self.config(**kw)
+        db_api.configure_db()
+
+
 class skip_test(object):
     """Decorator that skips a test."""
     def __init__(self, msg):
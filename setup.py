@@ -50,7 +50,9 @@ setuptools.setup(
              'bin/glance-cache-pruner',
              'bin/glance-cache-manage',
              'bin/glance-cache-cleaner',
+             'bin/glance-cache-warmer',
              'bin/glance-control',
+             'bin/glance-dedup',
              'bin/glance-manage',
              'bin/glance-registry',
              'bin/glance-replicator',
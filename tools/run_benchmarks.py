@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack, LLC
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Run the end-to-end benchmarks and save or compare their results.
+
+Run from the top of the source tree, like the functional tests:
+
+    tools/run_benchmarks.py -o before.json
+    ... change things ...
+    tools/run_benchmarks.py -o after.json --compare before.json
+
+The Swift and S3 scenarios use the same GLANCE_TEST_SWIFT_CONF and
+GLANCE_TEST_S3_CONF configuration files as the functional tests, and are
+skipped when those are not set. The s3-first-byte scenario needs neither,
+as it reads from a local stand-in for S3. The startup-<program> scenarios
+time each program in bin/ until it has parsed its options.
+"""
+
+import gettext
+import optparse
+import os
+import sys
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'glance', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+gettext.install('glance', unicode=1)
+
+from glance.tests.benchmark import results
+from glance.tests.benchmark import scenarios
+
+
+def main(argv):
+    parser = optparse.OptionParser(usage="%prog [options] [scenario ...]")
+    parser.add_option('-n', '--requests', type='int', default=100,
+                      help="Requests per scenario")
+    parser.add_option('-c', '--concurrency', type='int', default=10,
+                      help="Requests in flight at once")
+    parser.add_option('-s', '--size', type='int', default=1024 * 1024,
+                      help="Image size in bytes")
+    parser.add_option('-i', '--images', type='int', default=10,
+                      help="Images created before download, registry, "
+                           "cache hit and replication scenarios")
+    parser.add_option('-r', '--replicator-runs', type='int', default=3,
+                      help="Replicator runs")
+    parser.add_option('--stores', default='file,swift,s3',
+                      help="Comma separated stores to upload to and "
+                           "download from")
+    parser.add_option('-o', '--output', default=None,
+                      help="File to save the JSON results to")
+    parser.add_option('--compare', default=None,
+                      help="JSON results to compare these results against")
+    parser.add_option('--threshold', type='float', default=10.0,
+                      help="Percentage change reported as a regression")
+    parser.add_option('-l', '--list', action='store_true', default=False,
+                      help="List the scenarios and exit")
+    options, args = parser.parse_args(argv)
+
+    stores = [store.strip() for store in options.stores.split(',')
+              if store.strip()]
+    available = scenarios.get_scenarios(stores)
+    if options.list:
+        for name, _func in available:
+            print name
+        return 0
+
+    unknown = set(args) - set(name for name, _func in available)
+    if unknown:
+        parser.error("Unknown scenarios: %s" % ', '.join(sorted(unknown)))
+
+    summaries = {}
+    for name, func in available:
+        if args and name not in args:
+            continue
+        summaries[name] = func(options)
+        print results.format_summary(name, summaries[name])
+
+    run_options = dict((key, getattr(options, key))
+                       for key in ('requests', 'concurrency', 'size',
+                                   'images', 'replicator_runs'))
+    run_results = results.build_results(summaries, run_options)
+    if options.output:
+        results.save(run_results, options.output)
+
+    if options.compare:
+        regressed = False
+        rows = results.compare(results.load(options.compare), run_results,
+                               options.threshold)
+        for name, metric, old, new, change, worse in rows:
+            regressed = regressed or worse
+            print ('%-24s %-20s %12.4f %12.4f %+8.1f%%%s' %
+                   (name, metric, old, new, change,
+                    '  REGRESSION' if worse else ''))
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))